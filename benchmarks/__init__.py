@@ -0,0 +1,30 @@
+"""
+性能基准测试
+
+用合成数据构建接近生产规模的数据库（及可选的 Redis 流量日志队列），对数据库读取
+接口、流量日志入库、积分结算和月度聚合等路径计时，结果以 JSON 保存，便于对比
+两次运行（如修改前后）的差异。
+
+用法（在仓库根目录执行）:
+    # 生成数据集并运行全部数据库场景，结果写入 before.json
+    PYTHONPATH=src python -m benchmarks run --traffic-rows 1000000 --output before.json
+
+    # 复用已生成的数据库，只运行部分场景
+    PYTHONPATH=src python -m benchmarks generate --out /tmp/bench.db --traffic-rows 3000000
+    PYTHONPATH=src python -m benchmarks run --db /tmp/bench.db -k traffic --output after.json
+
+    # 对比两次结果，耗时增加超过阈值时返回非零退出码
+    PYTHONPATH=src python -m benchmarks compare before.json after.json --threshold 0.1
+
+数据库始终在临时目录中创建（DATA_DIR 指向该目录），不会读写正式数据。
+
+依赖 Redis 的场景（流量日志入库、完整积分结算、流量计数校准）需要加 --redis 才会
+运行，会向 REDIS_HOST/REDIS_PORT 的 db 0/3/15 写入测试数据，请只对一次性的 Redis
+实例使用。
+
+启动被测应用并模拟上游服务的全链路压测见 loadtest.py。
+"""
+
+# 数据集中的线路，运行时通过环境变量设为 STREAM_BACKEND / PREMIUM_STREAM_BACKEND
+NORMAL_LINES = ["hk", "jp", "us", "sg"]
+PREMIUM_LINES = ["premium1", "premium2"]
@@ -0,0 +1,150 @@
+import argparse
+import json
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+from benchmarks import NORMAL_LINES, PREMIUM_LINES
+
+
+def _add_dataset_arguments(parser: argparse.ArgumentParser):
+    group = parser.add_argument_group("数据集")
+    group.add_argument("--users", type=int, default=1000, help="Plex/Emby 用户数")
+    group.add_argument(
+        "--traffic-rows", type=int, default=200000, help="原始流量记录数"
+    )
+    group.add_argument("--months", type=int, default=2, help="流量记录覆盖的月数")
+    group.add_argument("--wheel-spins", type=int, default=50000, help="转盘抽奖记录数")
+    group.add_argument("--auctions", type=int, default=200, help="竞拍数")
+    group.add_argument("--bids-per-auction", type=int, default=10)
+    group.add_argument("--seed", type=int, default=0)
+
+
+def _dataset_params(args) -> dict:
+    if args.months < 2:
+        raise SystemExit("--months 至少为 2（月度聚合场景需要上个月的数据）")
+    return {
+        "users": args.users,
+        "traffic_rows": args.traffic_rows,
+        "months": args.months,
+        "wheel_spins": args.wheel_spins,
+        "auctions": args.auctions,
+        "bids_per_auction": args.bids_per_auction,
+        "seed": args.seed,
+    }
+
+
+def _setup_environment(data_dir: str):
+    """导入 app 前设置环境变量：数据目录指向临时目录，线路与数据集一致"""
+    os.environ["DATA_DIR"] = data_dir
+    os.environ["STREAM_BACKEND"] = json.dumps(NORMAL_LINES + PREMIUM_LINES)
+    os.environ["PREMIUM_STREAM_BACKEND"] = json.dumps(PREMIUM_LINES)
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+
+def cmd_generate(args, workdir: str):
+    from benchmarks.runner import generate
+
+    out = Path(args.out)
+    if out.exists():
+        raise SystemExit(f"{out} 已存在")
+    elapsed = generate(out, _dataset_params(args))
+    print(f"已生成 {out}，耗时 {elapsed:.1f}s")
+
+
+def cmd_run(args, workdir: str):
+    from benchmarks.runner import copy_database, generate, run
+
+    db_path = Path(workdir) / "data.db"
+    if args.db:
+        copy_database(Path(args.db), db_path)
+    else:
+        elapsed = generate(db_path, _dataset_params(args))
+        print(f"已生成数据集，耗时 {elapsed:.1f}s")
+
+    result = run(
+        db_path,
+        keywords=args.keyword,
+        repeat=args.repeat,
+        warmup=args.warmup,
+        with_redis=args.redis,
+    )
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"结果已保存到 {args.output}")
+
+
+def cmd_list(args, workdir: str):
+    from benchmarks.scenarios import SCENARIOS
+
+    for item in SCENARIOS.values():
+        print(f"{item.name:<36}{item.group}")
+
+
+def cmd_compare(args, workdir: str):
+    from benchmarks.runner import compare
+
+    with open(args.base, encoding="utf-8") as f:
+        base = json.load(f)
+    with open(args.new, encoding="utf-8") as f:
+        new = json.load(f)
+    regressions = compare(base, new, args.threshold, args.metric)
+    if regressions:
+        print(f"\n{len(regressions)} 个场景变慢超过 {args.threshold:.0%}")
+        sys.exit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks")
+    parser.add_argument("--workdir", help="临时数据目录所在位置，默认为系统临时目录")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    generate_parser = subparsers.add_parser("generate", help="生成数据集")
+    generate_parser.add_argument("--out", required=True, help="数据库文件路径")
+    _add_dataset_arguments(generate_parser)
+    generate_parser.set_defaults(func=cmd_generate)
+
+    run_parser = subparsers.add_parser("run", help="运行基准测试")
+    run_parser.add_argument("--db", help="使用 generate 生成的数据库（会先复制）")
+    run_parser.add_argument(
+        "-k",
+        "--keyword",
+        action="append",
+        default=[],
+        help="只运行名称包含该字符串的场景",
+    )
+    run_parser.add_argument("--repeat", type=int, default=20, help="每个场景的计时次数")
+    run_parser.add_argument("--warmup", type=int, default=1, help="不计时的预热次数")
+    run_parser.add_argument(
+        "--redis", action="store_true", help="运行依赖 Redis 的场景"
+    )
+    run_parser.add_argument("--output", help="结果 JSON 文件路径")
+    _add_dataset_arguments(run_parser)
+    run_parser.set_defaults(func=cmd_run)
+
+    list_parser = subparsers.add_parser("list", help="列出所有场景")
+    list_parser.set_defaults(func=cmd_list)
+
+    compare_parser = subparsers.add_parser("compare", help="对比两次运行的结果")
+    compare_parser.add_argument("base")
+    compare_parser.add_argument("new")
+    compare_parser.add_argument(
+        "--threshold", type=float, default=0.1, help="判定为变慢的相对阈值"
+    )
+    compare_parser.add_argument(
+        "--metric",
+        default="median_ms",
+        choices=["median_ms", "mean_ms", "p95_ms", "min_ms"],
+    )
+    compare_parser.set_defaults(func=cmd_compare)
+
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory(dir=args.workdir) as workdir:
+        _setup_environment(workdir)
+        args.func(args, workdir)
+
+
+if __name__ == "__main__":
+    main()
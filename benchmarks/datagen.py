@@ -0,0 +1,331 @@
+"""
+基准测试数据生成
+
+所有数据由 seed 决定，相同参数生成的数据集完全一致，两次运行的结果才有可比性。
+流量记录按时间顺序写入（与生产环境一致），用户活跃度近似 Zipf 分布：少数用户
+贡献大部分流量。
+"""
+
+import json
+import random
+import time
+from datetime import datetime, timedelta
+
+from app.config import settings
+from app.db import DB
+from benchmarks import NORMAL_LINES, PREMIUM_LINES
+
+PLEX_USERNAME = "PlexUser{}"
+EMBY_USERNAME = "EmbyUser{}"
+PLEX_TOKEN = "bench-plex-token-{}"
+EMBY_API_KEY = "bench-emby-key-{}"
+TG_ID_BASE = 10000
+# 管理员（竞拍创建者）
+ADMIN_TG_ID = 1
+LINES = NORMAL_LINES + PREMIUM_LINES
+WHEEL_ITEMS = [
+    ("谢谢参与", 0),
+    ("积分 +5", 5),
+    ("积分 +10", 10),
+    ("积分 -5", -5),
+    ("积分 +50", 50),
+    ("邀请码", -30),
+]
+# 每批写入的流量记录数
+CHUNK_SIZE = 50000
+
+
+def _user_weights(users: int) -> list[float]:
+    """各用户活跃度的累积权重（Zipf 分布，s=0.8）"""
+    cum_weights, total = [], 0.0
+    for rank in range(users):
+        total += 1 / (rank + 1) ** 0.8
+        cum_weights.append(total)
+    return cum_weights
+
+
+def generate_users(db: DB, users: int, rnd: random.Random):
+    """生成 Plex/Emby 用户、statistics 及邀请码，一半的 tg 用户同时绑定两种账户"""
+    now = datetime.now(settings.TZ)
+    plex_rows, emby_rows, stats_rows, code_rows = [], [], [], []
+    for i in range(users):
+        tg_id = TG_ID_BASE + i
+        is_premium = int(rnd.random() < 0.1)
+        expiry = (
+            (now + timedelta(days=rnd.randint(-5, 60))).isoformat()
+            if is_premium
+            else None
+        )
+        line = rnd.choice(LINES) if rnd.random() < 0.3 else None
+        plex_rows.append(
+            (
+                i,
+                tg_id,
+                round(rnd.uniform(0, 500), 2),
+                f"User{i}@Example.com",
+                PLEX_USERNAME.format(i),
+                int(rnd.random() < 0.2),
+                None,
+                round(rnd.uniform(0, 2000), 2),
+                line,
+                is_premium,
+                expiry,
+            )
+        )
+        emby_rows.append(
+            (
+                EMBY_USERNAME.format(i),
+                f"emby-{i}",
+                tg_id if i % 2 == 0 else None,
+                int(rnd.random() < 0.2),
+                None,
+                round(rnd.uniform(0, 2000), 2),
+                round(rnd.uniform(0, 500), 2),
+                line,
+                is_premium,
+                expiry,
+            )
+        )
+        stats_rows.append(
+            (tg_id, rnd.choice((0, 0, 0, 10, 50, 100)), round(rnd.uniform(0, 800), 2))
+        )
+        for n in range(rnd.randint(0, 3)):
+            used_by = TG_ID_BASE + rnd.randrange(users) if rnd.random() < 0.5 else None
+            code_rows.append(
+                (f"code-{i}-{n}", tg_id, int(used_by is not None), used_by)
+            )
+
+    with db.con:
+        db.cur.executemany(
+            "INSERT INTO user VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", plex_rows
+        )
+        db.cur.executemany(
+            "INSERT INTO emby_user VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", emby_rows
+        )
+        db.cur.executemany("INSERT INTO statistics VALUES (?, ?, ?)", stats_rows)
+        db.cur.executemany("INSERT INTO invitation VALUES (?, ?, ?, ?)", code_rows)
+
+
+def generate_wheel_stats(db: DB, users: int, spins: int, rnd: random.Random):
+    """生成最近 90 天的转盘抽奖记录"""
+    now = time.time()
+    rows = []
+    for _ in range(spins):
+        ts = int(now - rnd.uniform(0, 90 * 86400))
+        item_name, credits_change = rnd.choice(WHEEL_ITEMS)
+        date = datetime.fromtimestamp(ts, settings.TZ).strftime("%Y-%m-%d")
+        rows.append(
+            (TG_ID_BASE + rnd.randrange(users), item_name, credits_change, ts, date)
+        )
+    with db.con:
+        db.cur.executemany(
+            "INSERT INTO wheel_stats (tg_id, item_name, credits_change, timestamp, date) "
+            "VALUES (?, ?, ?, ?, ?)",
+            rows,
+        )
+
+
+def generate_auctions(
+    db: DB, users: int, auctions: int, bids_per_auction: int, rnd: random.Random
+):
+    """生成竞拍及出价记录，约 1/5 的竞拍仍在进行中"""
+    now = int(time.time())
+    with db.con:
+        for i in range(auctions):
+            created_at = now - rnd.randint(3600, 180 * 86400)
+            active = rnd.random() < 0.2
+            end_time = (
+                now + rnd.randint(3600, 7 * 86400) if active else created_at + 3 * 86400
+            )
+            starting_price = rnd.choice((10, 50, 100, 200))
+            price, bid_time, winner, bids = starting_price, created_at, None, []
+            for _ in range(rnd.randint(0, bids_per_auction * 2)):
+                price += rnd.randint(1, 20)
+                bid_time += rnd.randint(60, 3600)
+                winner = TG_ID_BASE + rnd.randrange(users)
+                bids.append((winner, price, bid_time))
+            auction_id = db.cur.execute(
+                "INSERT INTO auctions (title, description, starting_price, current_price, "
+                "end_time, created_by, created_at, is_active, winner_id, bid_count) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    f"竞拍 {i}",
+                    "基准测试数据",
+                    starting_price,
+                    price,
+                    end_time,
+                    ADMIN_TG_ID,
+                    created_at,
+                    int(active),
+                    None if active else winner,
+                    len(bids),
+                ),
+            ).lastrowid
+            db.cur.executemany(
+                "INSERT INTO auction_bids (auction_id, bidder_id, bid_amount, bid_time) "
+                "VALUES (?, ?, ?, ?)",
+                [(auction_id, *bid) for bid in bids],
+            )
+
+
+def iter_traffic_rows(users: int, rows: int, months: int, rnd: random.Random):
+    """按时间顺序生成 (line, send_bytes, service, username, user_id, timestamp)"""
+    cum_weights = _user_weights(users)
+    population = range(users)
+    end = datetime.now(settings.TZ)
+    # 从 months - 1 个月前的月初开始，保证有完整的历史月份可供聚合
+    start = end.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    for _ in range(months - 1):
+        start = (start - timedelta(days=1)).replace(day=1)
+    span = (end - start).total_seconds()
+
+    for n in range(rows):
+        i = rnd.choices(population, cum_weights=cum_weights)[0]
+        if rnd.random() < 0.5:
+            service, username, user_id = "plex", PLEX_USERNAME.format(i), str(i)
+        else:
+            service, username, user_id = "emby", EMBY_USERNAME.format(i), f"emby-{i}"
+        if rnd.random() < 0.2:
+            # 日志中的用户名大小写不一定与数据库一致
+            username = username.lower()
+        ts = start + timedelta(seconds=(n + rnd.random()) * span / rows)
+        yield (
+            rnd.choice(LINES),
+            int(rnd.lognormvariate(15, 1.5)),
+            service,
+            username,
+            user_id,
+            ts.isoformat(),
+        )
+
+
+def generate_traffic(db: DB, users: int, rows: int, months: int, rnd: random.Random):
+    """生成原始流量记录，最后一次性重建分钟/小时/天汇总表"""
+    insert_sql = (
+        "INSERT INTO line_traffic_stats (line, send_bytes, service, username, user_id, timestamp) "
+        "VALUES (?, ?, ?, ?, ?, ?)"
+    )
+    chunk = []
+    for row in iter_traffic_rows(users, rows, months, rnd):
+        chunk.append(row)
+        if len(chunk) >= CHUNK_SIZE:
+            with db.con:
+                db.cur.executemany(insert_sql, chunk)
+            chunk = []
+    if chunk:
+        with db.con:
+            db.cur.executemany(insert_sql, chunk)
+    db.rebuild_traffic_rollups()
+
+
+def generate_database(
+    db: DB,
+    users: int = 1000,
+    traffic_rows: int = 200000,
+    months: int = 2,
+    wheel_spins: int = 50000,
+    auctions: int = 200,
+    bids_per_auction: int = 10,
+    seed: int = 0,
+):
+    """
+    生成完整的基准测试数据集
+
+    Args:
+        db: 目标数据库（应为空库）
+        users: Plex/Emby 用户数（各 users 个）
+        traffic_rows: 原始流量记录数
+        months: 流量记录覆盖的月数（含当月）
+        wheel_spins: 转盘抽奖记录数
+        auctions: 竞拍数
+        bids_per_auction: 每个竞拍的平均出价数
+        seed: 随机数种子
+    """
+    rnd = random.Random(seed)
+    generate_users(db, users, rnd)
+    generate_wheel_stats(db, users, wheel_spins, rnd)
+    generate_auctions(db, users, auctions, bids_per_auction, rnd)
+    generate_traffic(db, users, traffic_rows, months, rnd)
+    db.cur.execute("ANALYZE")
+    db.con.commit()
+
+
+def _traffic_log(token_param: str, line: str, send_bytes: int, status: int, path: str):
+    now = datetime.now(settings.TZ)
+    access_time = now.strftime("%d/%b/%Y:%H:%M:%S %z")
+    url = f"{path}?{token_param}&line={line}"
+    return json.dumps(
+        {
+            "@timestamp": now.isoformat(),
+            "backend": line,
+            "message": f'203.0.113.7 - - [{access_time}] "GET {url} HTTP/1.1" '
+            f'{status} {send_bytes} "-"',
+        }
+    )
+
+
+def prime_token_caches(users: int):
+    """写入所有用户的 Plex token / Emby API key 缓存，入库时无需请求 Emby"""
+    from app.cache import emby_api_key_cache, plex_token_cache
+
+    plex_token_cache.put_many(
+        {PLEX_TOKEN.format(i): PLEX_USERNAME.format(i) for i in range(users)}
+    )
+    emby_api_key_cache.put_many(
+        {EMBY_API_KEY.format(i): EMBY_USERNAME.format(i) for i in range(users)}
+    )
+
+
+def fill_traffic_queue(users: int, count: int, seed: int = 0) -> int:
+    """
+    向 filebeat_nginx_stream_logs 队列写入 count 条模拟的 nginx stream 日志
+
+    约 5% 的日志为非流媒体请求或非 2xx 响应（入库时会被过滤）
+
+    Returns:
+        队列长度
+    """
+    from app.cache import stream_traffic_cache
+    from app.traffic import TRAFFIC_LOG_QUEUE
+
+    rnd = random.Random(seed)
+    cum_weights = _user_weights(users)
+    population = range(users)
+    redis_client = stream_traffic_cache.redis_client
+    pipeline = redis_client.pipeline(transaction=False)
+    for n in range(count):
+        i = rnd.choices(population, cum_weights=cum_weights)[0]
+        if rnd.random() < 0.5:
+            token_param = f"service=plex&token={PLEX_TOKEN.format(i)}"
+        else:
+            token_param = f"service=emby&token={EMBY_API_KEY.format(i)}"
+        status, path = 200, "/stream/video.mkv"
+        roll = rnd.random()
+        if roll < 0.02:
+            status = 404
+        elif roll < 0.05:
+            path = "/library/metadata/1"
+        pipeline.rpush(
+            TRAFFIC_LOG_QUEUE,
+            _traffic_log(
+                token_param,
+                rnd.choice(LINES),
+                int(rnd.lognormvariate(15, 1.5)),
+                status,
+                path,
+            ),
+        )
+        if (n + 1) % 5000 == 0:
+            pipeline.execute()
+    pipeline.execute()
+    return redis_client.llen(TRAFFIC_LOG_QUEUE)
+
+
+def clear_redis_fixture(users: int):
+    """删除基准测试写入的队列及 token 缓存"""
+    from app.cache import emby_api_key_cache, plex_token_cache, stream_traffic_cache
+    from app.traffic import TRAFFIC_LOG_QUEUE
+
+    stream_traffic_cache.redis_client.delete(TRAFFIC_LOG_QUEUE)
+    plex_token_cache.delete_many([PLEX_TOKEN.format(i) for i in range(users)])
+    emby_api_key_cache.delete_many([EMBY_API_KEY.format(i) for i in range(users)])
@@ -0,0 +1,602 @@
+"""
+压测用的模拟上游服务
+
+在一个 aiohttp 服务中挂载 Emby、Tautulli、Plex（含 plex.tv）及 Telegram Bot API
+的模拟实现，只实现应用实际调用的接口，返回与 datagen 生成的数据集一致的数据：
+- Plex 用户 id 为 i，用户名 PlexUser{i}，邮箱 User{i}@Example.com
+- Emby 用户 id 为 emby-{i}，用户名 EmbyUser{i}
+
+每个服务可单独设置延迟（均值及抖动比例）和错误率，用于观察上游变慢或出错时
+整个应用的表现。Telegram 出错时返回 429 及 retry_after，其余服务返回 503。
+
+服务运行在独立线程的事件循环中，不会与压测客户端争用同一个事件循环。
+"""
+
+import asyncio
+import json
+import random
+import threading
+import time
+from collections import Counter
+from typing import Optional
+from xml.sax.saxutils import quoteattr
+
+from aiohttp import web
+
+from benchmarks import datagen
+
+SERVICES = ("emby", "tautulli", "plex", "plextv", "telegram")
+PLEX_SERVER_NAME = "BenchPlex"
+PLEX_MACHINE_ID = "bench-machine-id"
+PLEX_SERVER_SHARE_ID = 100
+# 管理员的 Plex id，避免与用户 id 冲突
+PLEX_ADMIN_ID = 1000000
+PLEX_LIBRARIES = ["Movies", "TV Shows", "Anime", "Music", "Documentary", "NSFW"]
+EMBY_LIBRARIES = ["Movies", "TV Shows", "Anime", "NSFW"]
+
+
+class UpstreamProfile:
+    """单个上游服务的延迟及错误率设置"""
+
+    def __init__(
+        self, latency: float = 0.0, jitter: float = 0.5, error_rate: float = 0.0
+    ):
+        # 平均延迟（秒）
+        self.latency = latency
+        # 延迟的标准差与均值之比
+        self.jitter = jitter
+        # 返回错误的概率
+        self.error_rate = error_rate
+
+    @classmethod
+    def parse(
+        cls, spec: str, default: "UpstreamProfile"
+    ) -> tuple[str, "UpstreamProfile"]:
+        """
+        解析 SERVICE:LATENCY_MS[:ERROR_RATE]，如 emby:200:0.05
+
+        Returns:
+            (服务名, 设置)
+        """
+        parts = spec.split(":")
+        name = parts[0]
+        if name not in SERVICES or not 2 <= len(parts) <= 3:
+            raise ValueError(
+                f"无效的上游设置 {spec!r}，格式为 SERVICE:LATENCY_MS[:ERROR_RATE]"
+            )
+        return name, cls(
+            latency=float(parts[1]) / 1000,
+            jitter=default.jitter,
+            error_rate=float(parts[2]) if len(parts) == 3 else default.error_rate,
+        )
+
+    def to_dict(self) -> dict:
+        return {
+            "latency_ms": self.latency * 1000,
+            "jitter": self.jitter,
+            "error_rate": self.error_rate,
+        }
+
+
+class FakeService:
+    """一个模拟服务：注入延迟及错误，并按路由统计请求数"""
+
+    def __init__(self, name: str, profile: UpstreamProfile, seed: int = 0):
+        self.name = name
+        self.profile = profile
+        self.rnd = random.Random(f"{name}-{seed}")
+        self.requests = Counter()
+        self.errors = Counter()
+        self.app = web.Application(middlewares=[self.middleware])
+
+    def _error_response(self) -> web.Response:
+        if self.name == "telegram":
+            return web.json_response(
+                {
+                    "ok": False,
+                    "error_code": 429,
+                    "description": "Too Many Requests: retry after 1",
+                    "parameters": {"retry_after": 1},
+                },
+                status=429,
+            )
+        return web.Response(status=503, text="Service Unavailable")
+
+    @web.middleware
+    async def middleware(self, request: web.Request, handler):
+        resource = request.match_info.route.resource
+        key = f"{request.method} {resource.canonical if resource else request.path}"
+        self.requests[key] += 1
+
+        profile = self.profile
+        if profile.latency > 0:
+            delay = self.rnd.gauss(profile.latency, profile.latency * profile.jitter)
+            await asyncio.sleep(max(0.0, delay))
+        if profile.error_rate > 0 and self.rnd.random() < profile.error_rate:
+            self.errors[key] += 1
+            return self._error_response()
+        return await handler(request)
+
+    def stats(self) -> dict:
+        return {
+            key: {"requests": count, "errors": self.errors.get(key, 0)}
+            for key, count in sorted(self.requests.items())
+        }
+
+
+def _xml(tag: str, attrs: dict, children: str = "") -> str:
+    attr_text = " ".join(
+        f"{key}={quoteattr(str(value))}" for key, value in attrs.items()
+    )
+    if children:
+        return f"<{tag} {attr_text}>{children}</{tag}>"
+    return f"<{tag} {attr_text}/>"
+
+
+def _xml_response(text: str) -> web.Response:
+    return web.Response(
+        text=f'<?xml version="1.0" encoding="UTF-8"?>\n{text}',
+        content_type="application/xml",
+    )
+
+
+class FakeEmby(FakeService):
+    """Emby API：用户查询、创建、权限、认证、会话及播放时长统计"""
+
+    def __init__(self, users: int, profile: UpstreamProfile, seed: int = 0):
+        super().__init__("emby", profile, seed)
+        self.users: dict[str, dict] = {}
+        created = "2024-01-01T00:00:00.0000000Z"
+        for i in range(users):
+            self._add_user(datagen.EMBY_USERNAME.format(i), f"emby-{i}", created)
+        self._next_id = users
+        # 按名称排序的用户名列表，模拟 NameStartsWithOrGreater 查询
+        self._sorted_names: Optional[list[str]] = None
+        rnd = random.Random(seed)
+        self.play_time = [
+            [user["Id"], rnd.randint(0, 2000 * 3600)] for user in self.users.values()
+        ]
+
+        routes = [
+            web.get("/Users/Query", self.users_query),
+            web.post("/Users/New", self.users_new),
+            web.post("/Users/AuthenticateByName", self.authenticate),
+            web.get("/Users/{user_id}", self.user_detail),
+            web.post("/Users/{user_id}/Policy", self.no_content),
+            web.post("/Users/{user_id}/Password", self.no_content),
+            web.get("/Library/SelectableMediaFolders", self.media_folders),
+            web.get("/Sessions", self.sessions),
+            web.get("/Devices", self.devices),
+            web.post("/user_usage_stats/submit_custom_query", self.custom_query),
+        ]
+        self.app.add_routes(routes)
+
+    def _add_user(self, name: str, user_id: str, created: str) -> dict:
+        user = {
+            "Name": name,
+            "Id": user_id,
+            "DateCreated": created,
+            "PrimaryImageTag": f"tag-{user_id}",
+            "Policy": {"IsHidden": False, "IsDisabled": False},
+        }
+        self.users[name.lower()] = user
+        self._sorted_names = None
+        return user
+
+    async def users_query(self, request: web.Request):
+        prefix = request.query.get("NameStartsWithOrGreater")
+        limit = request.query.get("Limit")
+        if prefix is None:
+            items = list(self.users.values())
+        else:
+            if self._sorted_names is None:
+                self._sorted_names = sorted(self.users)
+            names = self._sorted_names
+            lo, hi, prefix = 0, len(names), prefix.lower()
+            while lo < hi:
+                mid = (lo + hi) // 2
+                if names[mid] < prefix:
+                    lo = mid + 1
+                else:
+                    hi = mid
+            end = len(names) if limit is None else lo + int(limit)
+            items = [self.users[name] for name in names[lo:end]]
+        return web.json_response({"Items": items, "TotalRecordCount": len(self.users)})
+
+    async def users_new(self, request: web.Request):
+        data = json.loads(await request.text())
+        name = data.get("Name", "")
+        if not name or name.lower() in self.users:
+            return web.Response(status=400, text="User already exists")
+        user_id = f"emby-new-{self._next_id}"
+        self._next_id += 1
+        user = self._add_user(name, user_id, time.strftime("%Y-%m-%dT%H:%M:%SZ"))
+        return web.json_response(user)
+
+    async def authenticate(self, request: web.Request):
+        data = json.loads(await request.text())
+        user = self.users.get(str(data.get("Username", "")).lower())
+        if user is None:
+            return web.Response(status=401, text="Invalid username or password")
+        return web.json_response(
+            {"User": user, "AccessToken": f"token-{user['Id']}", "ServerId": "bench"}
+        )
+
+    async def user_detail(self, request: web.Request):
+        user_id = request.match_info["user_id"]
+        policy = {
+            "EnableAllFolders": False,
+            "EnabledFolders": [f"guid-{name}" for name in EMBY_LIBRARIES[:-1]],
+            "ExcludedSubFolders": [],
+        }
+        return web.json_response({"Id": user_id, "Policy": policy})
+
+    async def no_content(self, request: web.Request):
+        await request.read()
+        return web.Response(status=204)
+
+    async def media_folders(self, request: web.Request):
+        return web.json_response(
+            [
+                {
+                    "Name": name,
+                    "Id": str(n),
+                    "Guid": f"guid-{name}",
+                    "SubFolders": [
+                        {"Id": str(n * 10), "Name": name, "Path": f"/{name}"}
+                    ],
+                }
+                for n, name in enumerate(EMBY_LIBRARIES, start=1)
+            ]
+        )
+
+    async def sessions(self, request: web.Request):
+        api_key = request.query.get("api_key", "")
+        prefix = datagen.EMBY_API_KEY.format("")
+        if not api_key.startswith(prefix):
+            return web.json_response([])
+        name = datagen.EMBY_USERNAME.format(api_key[len(prefix) :])
+        return web.json_response([{"UserName": name, "Client": "Emby Web"}])
+
+    async def devices(self, request: web.Request):
+        return web.json_response({"Items": [], "TotalRecordCount": 0})
+
+    async def custom_query(self, request: web.Request):
+        await request.read()
+        return web.json_response(
+            {"colums": ["UserId", "PlayDuration"], "results": self.play_time}
+        )
+
+
+class FakeTautulli(FakeService):
+    """Tautulli API v2：get_home_stats 返回各 Plex 用户的观看时长"""
+
+    def __init__(self, users: int, profile: UpstreamProfile, seed: int = 0):
+        super().__init__("tautulli", profile, seed)
+        rnd = random.Random(seed)
+        self.rows = [
+            {
+                "user_id": i,
+                "user": datagen.PLEX_USERNAME.format(i),
+                "total_duration": rnd.randint(0, 2000 * 3600),
+            }
+            for i in range(users)
+        ]
+        self.app.add_routes([web.get("/api/v2", self.api)])
+
+    async def api(self, request: web.Request):
+        cmd = request.query.get("cmd")
+        if cmd == "get_home_stats":
+            data = {"stat_id": request.query.get("stat_id"), "rows": self.rows}
+        else:
+            data = {}
+        return web.json_response(
+            {"response": {"result": "success", "message": None, "data": data}}
+        )
+
+
+class FakePlex(FakeService):
+    """Plex Media Server：服务器信息及资料库列表"""
+
+    def __init__(self, profile: UpstreamProfile, seed: int = 0):
+        super().__init__("plex", profile, seed)
+        self.app.add_routes(
+            [
+                web.get("/", self.root),
+                web.get("/library", self.library),
+                web.get("/library/sections", self.sections),
+            ]
+        )
+
+    async def root(self, request: web.Request):
+        return _xml_response(
+            _xml(
+                "MediaContainer",
+                {
+                    "friendlyName": PLEX_SERVER_NAME,
+                    "machineIdentifier": PLEX_MACHINE_ID,
+                    "myPlexUsername": "admin",
+                    "platform": "Linux",
+                    "version": "1.40.0.7998",
+                },
+            )
+        )
+
+    async def library(self, request: web.Request):
+        return _xml_response(
+            _xml("MediaContainer", {"identifier": "com.plexapp.plugins.library"})
+        )
+
+    async def sections(self, request: web.Request):
+        directories = "".join(
+            _xml(
+                "Directory",
+                {
+                    "key": key,
+                    "type": "movie",
+                    "title": title,
+                    "agent": "tv.plex.agents.movie",
+                    "scanner": "Plex Movie",
+                    "language": "en-US",
+                    "uuid": f"uuid-{key}",
+                },
+            )
+            for key, title in enumerate(PLEX_LIBRARIES, start=1)
+        )
+        return _xml_response(
+            _xml("MediaContainer", {"size": len(PLEX_LIBRARIES)}, directories)
+        )
+
+
+class FakePlexTv(FakeService):
+    """plex.tv：管理员账户、共享用户列表、共享资料库及邀请"""
+
+    def __init__(self, users: int, profile: UpstreamProfile, seed: int = 0):
+        super().__init__("plextv", profile, seed)
+        server = _xml(
+            "Server",
+            {
+                "id": PLEX_SERVER_SHARE_ID,
+                "serverId": "1",
+                "machineIdentifier": PLEX_MACHINE_ID,
+                "name": PLEX_SERVER_NAME,
+                "numLibraries": len(PLEX_LIBRARIES) - 1,
+                "allLibraries": "0",
+                "owned": "0",
+                "pending": "0",
+            },
+        )
+        # 用户列表较大且不变，预先生成
+        self.users_xml = _xml(
+            "MediaContainer",
+            {"friendlyName": "myPlex", "size": users},
+            "".join(
+                _xml(
+                    "User",
+                    {
+                        "id": i,
+                        "title": datagen.PLEX_USERNAME.format(i),
+                        "username": datagen.PLEX_USERNAME.format(i),
+                        "email": f"User{i}@Example.com",
+                        "thumb": f"https://plex.tv/users/{i}/avatar",
+                        "home": "0",
+                        "restricted": "0",
+                    },
+                    server,
+                )
+                for i in range(users)
+            ),
+        )
+        self.invited: set[str] = set()
+        self.app.add_routes(
+            [
+                web.get("/users/account", self.account),
+                web.get("/api/users/", self.users),
+                web.get("/api/servers/{machine_id}", self.server_sections),
+                web.post("/api/servers/{machine_id}/shared_servers", self.invite),
+                web.get(
+                    "/api/servers/{machine_id}/shared_servers/{server_id}",
+                    self.shared_sections,
+                ),
+                web.put("/api/friends/{user_id}", self.ok),
+            ]
+        )
+
+    async def account(self, request: web.Request):
+        subscription = _xml(
+            "subscription", {"active": "1", "status": "Active", "plan": "lifetime"}
+        )
+        return _xml_response(
+            _xml(
+                "user",
+                {
+                    "id": PLEX_ADMIN_ID,
+                    "uuid": "bench-admin",
+                    "email": "admin@example.com",
+                    "username": "admin",
+                    "title": "admin",
+                    "authenticationToken": request.query.get("X-Plex-Token", "bench"),
+                    "thumb": "https://plex.tv/users/admin/avatar",
+                },
+                subscription + "<roles/><entitlements/>",
+            )
+        )
+
+    async def users(self, request: web.Request):
+        return _xml_response(self.users_xml)
+
+    def _sections_xml(self, shared: bool) -> str:
+        return "".join(
+            _xml(
+                "Section",
+                {
+                    "id": 10 + key,
+                    "key": key,
+                    "title": title,
+                    "type": "movie",
+                    "shared": int(shared and title != "NSFW"),
+                },
+            )
+            for key, title in enumerate(PLEX_LIBRARIES, start=1)
+        )
+
+    async def server_sections(self, request: web.Request):
+        server = _xml(
+            "Server",
+            {"name": PLEX_SERVER_NAME, "machineIdentifier": PLEX_MACHINE_ID},
+            self._sections_xml(False),
+        )
+        return _xml_response(_xml("MediaContainer", {"size": 1}, server))
+
+    async def shared_sections(self, request: web.Request):
+        server = _xml(
+            "SharedServer",
+            {"id": request.match_info["server_id"], "name": PLEX_SERVER_NAME},
+            self._sections_xml(True),
+        )
+        return _xml_response(_xml("MediaContainer", {"size": 1}, server))
+
+    async def invite(self, request: web.Request):
+        data = json.loads(await request.text() or "{}")
+        email = data.get("shared_server", {}).get("invited_email")
+        if email:
+            self.invited.add(email.lower())
+        return _xml_response(_xml("MediaContainer", {"size": 0}))
+
+    async def ok(self, request: web.Request):
+        await request.read()
+        return _xml_response(_xml("MediaContainer", {"size": 0}))
+
+
+class FakeTelegram(FakeService):
+    """Telegram Bot API：发送消息、获取用户信息及头像"""
+
+    def __init__(self, profile: UpstreamProfile, seed: int = 0):
+        super().__init__("telegram", profile, seed)
+        self.messages = 0
+        self.app.add_routes(
+            [
+                web.post("/bot{token}/sendMessage", self.send_message),
+                web.route("*", "/bot{token}/getChat", self.get_chat),
+                web.route("*", "/bot{token}/getUserProfilePhotos", self.profile_photos),
+                web.route("*", "/bot{token}/{method}", self.other),
+            ]
+        )
+
+    @staticmethod
+    async def _params(request: web.Request) -> dict:
+        params = dict(request.query)
+        if request.can_read_body:
+            if request.content_type == "application/json":
+                params.update(await request.json())
+            else:
+                params.update(await request.post())
+        return params
+
+    @staticmethod
+    def _ok(result) -> web.Response:
+        return web.json_response({"ok": True, "result": result})
+
+    async def send_message(self, request: web.Request):
+        params = await self._params(request)
+        self.messages += 1
+        return self._ok(
+            {
+                "message_id": self.messages,
+                "date": int(time.time()),
+                "chat": {"id": int(params.get("chat_id", 0)), "type": "private"},
+                "text": params.get("text", ""),
+            }
+        )
+
+    async def get_chat(self, request: web.Request):
+        params = await self._params(request)
+        chat_id = int(params.get("chat_id", 0))
+        return self._ok(
+            {
+                "id": chat_id,
+                "type": "private",
+                "first_name": f"Tg{chat_id}",
+                "username": f"tg_user_{chat_id}",
+            }
+        )
+
+    async def profile_photos(self, request: web.Request):
+        await self._params(request)
+        return self._ok({"total_count": 0, "photos": []})
+
+    async def other(self, request: web.Request):
+        await self._params(request)
+        return self._ok(True)
+
+
+class FakeUpstreams:
+    """在后台线程中运行全部模拟服务"""
+
+    def __init__(
+        self,
+        users: int,
+        profiles: dict[str, UpstreamProfile],
+        host: str = "127.0.0.1",
+        port: int = 0,
+        seed: int = 0,
+    ):
+        # 比数据集多出的 Plex 用户尚未与 tg 账户绑定，用于压测绑定流程
+        self.plex_users = users + max(100, users // 10)
+        default = UpstreamProfile()
+        self.services: dict[str, FakeService] = {
+            "emby": FakeEmby(users, profiles.get("emby", default), seed),
+            "tautulli": FakeTautulli(
+                self.plex_users, profiles.get("tautulli", default), seed
+            ),
+            "plex": FakePlex(profiles.get("plex", default), seed),
+            "plextv": FakePlexTv(
+                self.plex_users, profiles.get("plextv", default), seed
+            ),
+            "telegram": FakeTelegram(profiles.get("telegram", default), seed),
+        }
+        self.host = host
+        self.port = port
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._runner: Optional[web.AppRunner] = None
+        self._thread: Optional[threading.Thread] = None
+        self._started = threading.Event()
+
+    def url(self, service: str) -> str:
+        return f"http://{self.host}:{self.port}/{service}"
+
+    async def _start(self):
+        root = web.Application()
+        for name, service in self.services.items():
+            root.add_subapp(f"/{name}", service.app)
+        # 压测时会有大量并发连接，调大 backlog
+        self._runner = web.AppRunner(root, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port, backlog=1024)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+
+    def _run(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._loop.run_until_complete(self._start())
+        self._started.set()
+        self._loop.run_forever()
+        self._loop.run_until_complete(self._runner.cleanup())
+        self._loop.close()
+
+    def start(self) -> "FakeUpstreams":
+        self._thread = threading.Thread(
+            target=self._run, name="fake-upstreams", daemon=True
+        )
+        self._thread.start()
+        self._started.wait()
+        return self
+
+    def stop(self):
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join(timeout=10)
+
+    def stats(self) -> dict:
+        return {name: service.stats() for name, service in self.services.items()}
@@ -0,0 +1,79 @@
+"""
+生成带签名的 Telegram Mini App initData
+
+签名算法与 app.webapp.auth.verify_telegram_data 一致：
+secret = HMAC_SHA256(key="WebAppData", msg=bot_token)，
+hash = HMAC_SHA256(key=secret, msg=按键名排序的 "key=value" 以换行连接)
+
+用法（手动调试接口）:
+    python -m benchmarks.initdata --token 123:abc --user-id 10001
+    curl -H "X-Telegram-Init-Data: $(python -m benchmarks.initdata ...)" ...
+"""
+
+import argparse
+import hashlib
+import hmac
+import json
+import time
+from typing import Optional
+from urllib.parse import urlencode
+
+
+def sign_init_data(fields: dict, token: str) -> str:
+    """对 initData 字段签名，返回 URL 编码的 initData 字符串"""
+    data_check_string = "\n".join(f"{key}={fields[key]}" for key in sorted(fields))
+    secret = hmac.new(b"WebAppData", token.encode(), digestmod=hashlib.sha256).digest()
+    signature = hmac.new(
+        secret, data_check_string.encode(), digestmod=hashlib.sha256
+    ).hexdigest()
+    return urlencode({**fields, "hash": signature})
+
+
+def make_init_data(
+    user_id: int,
+    token: str,
+    first_name: Optional[str] = None,
+    username: Optional[str] = None,
+    auth_date: Optional[int] = None,
+) -> str:
+    """
+    生成指定 Telegram 用户的 initData
+
+    Args:
+        user_id: Telegram 用户 id
+        token: Bot token，需与被测应用的 TG_API_TOKEN 一致
+        first_name: 默认为 Tg{user_id}
+        username: 默认为 tg_user_{user_id}
+        auth_date: 签发时间戳，默认为当前时间
+    """
+    user = {
+        "id": user_id,
+        "first_name": first_name or f"Tg{user_id}",
+        "username": username or f"tg_user_{user_id}",
+        "language_code": "zh-hans",
+    }
+    fields = {
+        "query_id": f"bench-{user_id}",
+        "user": json.dumps(user, ensure_ascii=False, separators=(",", ":")),
+        "auth_date": str(auth_date or int(time.time())),
+    }
+    return sign_init_data(fields, token)
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.initdata")
+    parser.add_argument("--token", required=True, help="Bot token")
+    parser.add_argument("--user-id", type=int, required=True)
+    parser.add_argument("--first-name")
+    parser.add_argument("--username")
+    parser.add_argument("--auth-date", type=int, help="签发时间戳，默认为当前时间")
+    args = parser.parse_args()
+    print(
+        make_init_data(
+            args.user_id, args.token, args.first_name, args.username, args.auth_date
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
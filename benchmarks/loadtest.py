@@ -0,0 +1,799 @@
+"""
+全链路压测
+
+在一台机器上启动模拟的上游服务（Emby、Tautulli、Plex、plex.tv、Telegram Bot API，
+见 fakes.py）、生成合成数据集，以子进程运行被测应用（WebApp 及可选的定时任务，
+见 serve.py），再用 asyncio 模拟 Mini App 用户按真实比例访问各接口，输出各接口的
+吞吐量及延迟分布、上游请求数以及定时任务的执行情况。
+
+用法（在仓库根目录执行）:
+    # 200 个虚拟用户、平均思考时间 1s，压测 60s
+    PYTHONPATH=src python -m benchmarks.loadtest --concurrency 200 --duration 60
+
+    # 固定到达率 300 req/s，Emby 平均延迟 200ms、错误率 5%，同时运行流量入库任务
+    PYTHONPATH=src python -m benchmarks.loadtest --rate 300 --upstream emby:200:0.05 \\
+        --job update_line_traffic_stats=10 --traffic-rate 500 --output load.json
+
+被测应用会读写 REDIS_HOST/REDIS_PORT 上的 Redis（缓存、排行榜、通知发件箱等），
+请只对一次性的 Redis 实例使用。数据库及 DATA_DIR 始终在临时目录中创建。
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import math
+import os
+import random
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Callable, Optional
+
+import aiohttp
+
+from benchmarks import NORMAL_LINES, PREMIUM_LINES
+from benchmarks.initdata import make_init_data
+
+ROOT = Path(__file__).resolve().parent.parent
+BOT_TOKEN = "123456:bench-bot-token"
+METRICS_TOKEN = "bench-metrics-token"
+ADMIN_CHAT_ID = 1
+# 绑定及注册流程中使用的新 tg 用户从该 id 开始分配
+NEW_TG_ID_BASE = 900000000
+
+
+class VirtualUser:
+    """一个打开 Mini App 的已注册用户"""
+
+    def __init__(self, index: int, tg_id: int):
+        self.index = index
+        self.tg_id = tg_id
+
+
+class LoadContext:
+    """压测期间各虚拟用户共享的状态"""
+
+    def __init__(
+        self,
+        users: int,
+        plex_users: int,
+        tg_id_base: int,
+        unused_codes: list[str],
+        active_auctions: list[int],
+        seed: int = 0,
+    ):
+        self.users = users
+        self.plex_users = plex_users
+        self.tg_id_base = tg_id_base
+        self.unused_codes = unused_codes
+        self.active_auctions = active_auctions
+        self.rnd = random.Random(seed)
+        # 用户活跃度与数据集一致，近似 Zipf 分布
+        self._cum_weights = list(
+            itertools.accumulate(1 / (rank + 1) ** 0.8 for rank in range(users))
+        )
+        self._init_data: dict[int, str] = {}
+        self._counters = Counter()
+
+    def random_user(self) -> VirtualUser:
+        index = self.rnd.choices(range(self.users), cum_weights=self._cum_weights)[0]
+        return VirtualUser(index, self.tg_id_base + index)
+
+    def next(self, name: str) -> int:
+        """按名称递增的序号，用于生成不重复的用户名、邮箱等"""
+        n = self._counters[name]
+        self._counters[name] += 1
+        return n
+
+    def new_tg_id(self) -> int:
+        return NEW_TG_ID_BASE + self.next("tg_id")
+
+    def init_data(self, tg_id: int) -> str:
+        """每个 tg 用户只签名一次，与真实客户端一样复用同一份 initData"""
+        init_data = self._init_data.get(tg_id)
+        if init_data is None:
+            init_data = self._init_data[tg_id] = make_init_data(tg_id, BOT_TOKEN)
+        return init_data
+
+
+class Request:
+    def __init__(
+        self,
+        method: str,
+        path: str,
+        body: Optional[dict] = None,
+        tg_id: Optional[int] = None,
+    ):
+        self.method = method
+        self.path = path
+        self.body = body
+        # 不为空时以该 tg 用户的身份发送（如新用户绑定账户）
+        self.tg_id = tg_id
+
+
+class Task:
+    def __init__(self, name: str, weight: float, func: Callable):
+        self.name = name
+        self.weight = weight
+        self.func = func
+
+
+TASKS: dict[str, Task] = {}
+
+
+def task(name: str, weight: float):
+    def decorator(func):
+        TASKS[name] = Task(name, weight, func)
+        return func
+
+    return decorator
+
+
+def _get(name: str, path: str, weight: float):
+    """注册只需 GET 一个固定路径的任务"""
+    TASKS[name] = Task(name, weight, lambda ctx, vu: Request("GET", path))
+
+
+### Mini App 的访问比例 ###
+# 打开 Mini App 时加载用户信息，其余为排行榜、活动及系统状态等页面
+_get("user_info", "/api/user/info", 20)
+_get("rankings_credits", "/api/rankings/credits", 6)
+_get("rankings_donation", "/api/rankings/donation", 3)
+_get("rankings_watched_plex", "/api/rankings/watched-time/plex", 4)
+_get("rankings_watched_emby", "/api/rankings/watched-time/emby", 4)
+_get("rankings_traffic_plex", "/api/rankings/traffic/plex", 4)
+_get("rankings_traffic_emby", "/api/rankings/traffic/emby", 4)
+_get("system_status", "/api/system/status", 4)
+_get("system_stats", "/api/system/stats", 3)
+_get("traffic_overview", "/api/system/traffic-overview", 2)
+_get("invite_points_info", "/api/invite/points-info", 3)
+_get("register_status", "/api/invite/register-status", 2)
+_get("premium_price_info", "/api/premium/price-info", 2)
+_get("premium_line_traffic", "/api/premium/line-traffic-stats", 1)
+_get("plex_lines", "/api/user/plex_lines", 2)
+_get("emby_lines", "/api/user/emby_lines", 2)
+_get("luckywheel_config", "/api/luckywheel/config", 5)
+_get("luckywheel_status", "/api/luckywheel/user-status", 4)
+_get("auction_list", "/api/auction/list", 4)
+
+
+@task("luckywheel_spin", 3)
+def luckywheel_spin(ctx: LoadContext, vu: VirtualUser) -> Request:
+    return Request("POST", "/api/luckywheel/spin")
+
+
+@task("auction_stats", 0.5)
+def auction_stats(ctx: LoadContext, vu: VirtualUser) -> Request:
+    """管理员查看竞拍统计"""
+    return Request("GET", "/api/auction/stats", tg_id=ADMIN_CHAT_ID)
+
+
+@task("auction_bid", 1)
+def auction_bid(ctx: LoadContext, vu: VirtualUser) -> Request:
+    auction_id = ctx.rnd.choice(ctx.active_auctions) if ctx.active_auctions else 1
+    return Request(
+        "POST",
+        "/api/auction/bid",
+        {"auction_id": auction_id, "bid_amount": ctx.rnd.randint(1, 1000)},
+    )
+
+
+@task("bind_plex", 0.5)
+def bind_plex(ctx: LoadContext, vu: VirtualUser) -> Request:
+    """新用户绑定尚未绑定的 Plex 账户，全部绑定后为重复绑定"""
+    n = ctx.users + ctx.next("bind_plex") % (ctx.plex_users - ctx.users)
+    return Request(
+        "POST",
+        "/api/user/bind/plex",
+        {"email": f"User{n}@Example.com"},
+        ctx.new_tg_id(),
+    )
+
+
+@task("bind_emby", 0.5)
+def bind_emby(ctx: LoadContext, vu: VirtualUser) -> Request:
+    """新用户绑定尚未绑定 tg 的 Emby 账户（数据集中序号为奇数的用户）"""
+    n = (2 * ctx.next("bind_emby") + 1) % ctx.users
+    return Request(
+        "POST", "/api/user/bind/emby", {"username": f"EmbyUser{n}"}, ctx.new_tg_id()
+    )
+
+
+def _invitation_code(ctx: LoadContext) -> str:
+    """依次使用数据集中未使用的邀请码，用完后为已使用的邀请码"""
+    if not ctx.unused_codes:
+        return "code-0-0"
+    return ctx.unused_codes[ctx.next("code") % len(ctx.unused_codes)]
+
+
+@task("redeem_emby", 0.25)
+def redeem_emby(ctx: LoadContext, vu: VirtualUser) -> Request:
+    return Request(
+        "POST",
+        "/api/invite/redeem/emby",
+        {
+            "code": _invitation_code(ctx),
+            "username": f"BenchNew{ctx.next('redeem_emby')}",
+            "password": "bench-password",
+            "bindToTelegram": True,
+        },
+        ctx.new_tg_id(),
+    )
+
+
+@task("redeem_plex", 0.25)
+def redeem_plex(ctx: LoadContext, vu: VirtualUser) -> Request:
+    return Request(
+        "POST",
+        "/api/invite/redeem/plex",
+        {
+            "code": _invitation_code(ctx),
+            "email": f"invitee{ctx.next('redeem_plex')}@example.com",
+            "bindToTelegram": True,
+        },
+        ctx.new_tg_id(),
+    )
+
+
+def select_tasks(keywords: list[str]) -> list[Task]:
+    tasks = [
+        item
+        for item in TASKS.values()
+        if not keywords or any(keyword in item.name for keyword in keywords)
+    ]
+    if not tasks:
+        raise SystemExit("没有匹配的任务")
+    return tasks
+
+
+### 压测 ###
+def _percentile(values: list[float], p: float) -> float:
+    return values[max(0, math.ceil(len(values) * p) - 1)]
+
+
+def summarize(values: list[float], statuses: Counter, rejected: int, elapsed: float):
+    """耗时（毫秒）及吞吐量统计"""
+    values = sorted(v * 1000 for v in values)
+    errors = sum(n for status, n in statuses.items() if not status.startswith("2"))
+    return {
+        "requests": len(values),
+        "rps": round(len(values) / elapsed, 2),
+        "errors": errors,
+        "rejected": rejected,
+        "statuses": dict(statuses),
+        "mean_ms": round(sum(values) / len(values), 2),
+        "p50_ms": round(_percentile(values, 0.5), 2),
+        "p90_ms": round(_percentile(values, 0.9), 2),
+        "p99_ms": round(_percentile(values, 0.99), 2),
+        "max_ms": round(values[-1], 2),
+    }
+
+
+class LoadStats:
+    """各任务的耗时、状态码及业务失败（success=false）统计"""
+
+    def __init__(self):
+        self.latencies: dict[str, list[float]] = {}
+        self.statuses: dict[str, Counter] = {}
+        self.rejected = Counter()
+
+    def record(self, name: str, elapsed: float, status: str, rejected: bool):
+        self.latencies.setdefault(name, []).append(elapsed)
+        self.statuses.setdefault(name, Counter())[status] += 1
+        if rejected:
+            self.rejected[name] += 1
+
+    def summary(self, elapsed: float) -> dict:
+        endpoints = {
+            name: summarize(values, self.statuses[name], self.rejected[name], elapsed)
+            for name, values in sorted(self.latencies.items())
+        }
+        if not endpoints:
+            return {"duration_s": round(elapsed, 2), "total": {}, "endpoints": {}}
+        statuses = sum(self.statuses.values(), Counter())
+        values = [value for values in self.latencies.values() for value in values]
+        return {
+            "duration_s": round(elapsed, 2),
+            "total": summarize(values, statuses, sum(self.rejected.values()), elapsed),
+            "endpoints": endpoints,
+        }
+
+
+class LoadDriver:
+    """
+    按权重随机选择任务发送请求
+
+    - 闭环模式（默认）：concurrency 个虚拟用户各自循环「发送请求 -> 思考时间」，
+      在预热时间内逐步启动
+    - 开环模式（rate > 0）：按泊松过程以固定到达率发送，最多 concurrency 个并发请求，
+      超出时排队，排队时间计入延迟
+
+    预热期间完成的请求不计入统计。
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        ctx: LoadContext,
+        tasks: list[Task],
+        concurrency: int,
+        duration: float,
+        warmup: float = 0.0,
+        think_time: float = 1.0,
+        rate: float = 0.0,
+        timeout: float = 30.0,
+    ):
+        self.base_url = base_url
+        self.ctx = ctx
+        self.tasks = tasks
+        self.weights = [item.weight for item in tasks]
+        self.concurrency = concurrency
+        self.duration = duration
+        self.warmup = warmup
+        self.think_time = think_time
+        self.rate = rate
+        self.timeout = timeout
+        self.stats = LoadStats()
+        self._record_after = 0.0
+        self._deadline = 0.0
+
+    async def _send(
+        self,
+        session: aiohttp.ClientSession,
+        vu: VirtualUser,
+        queued_at: Optional[float] = None,
+    ):
+        item = self.ctx.rnd.choices(self.tasks, weights=self.weights)[0]
+        request = item.func(self.ctx, vu)
+        headers = {
+            "X-Telegram-Init-Data": self.ctx.init_data(request.tg_id or vu.tg_id)
+        }
+        start = queued_at or time.perf_counter()
+        rejected = False
+        try:
+            async with session.request(
+                request.method,
+                self.base_url + request.path,
+                json=request.body,
+                headers=headers,
+            ) as response:
+                body = await response.read()
+                status = str(response.status)
+                if (
+                    response.status == 200
+                    and response.content_type == "application/json"
+                ):
+                    data = json.loads(body)
+                    rejected = isinstance(data, dict) and data.get("success") is False
+        except asyncio.TimeoutError:
+            status = "timeout"
+        except aiohttp.ClientError as e:
+            status = type(e).__name__
+        end = time.perf_counter()
+        if end >= self._record_after:
+            self.stats.record(item.name, end - start, status, rejected)
+
+    async def _virtual_user(self, session: aiohttp.ClientSession, delay: float):
+        await asyncio.sleep(delay)
+        vu = self.ctx.random_user()
+        while time.perf_counter() < self._deadline:
+            await self._send(session, vu)
+            if self.think_time > 0:
+                await asyncio.sleep(self.ctx.rnd.expovariate(1 / self.think_time))
+
+    async def _open_loop(self, session: aiohttp.ClientSession):
+        semaphore = asyncio.Semaphore(self.concurrency)
+        pending = set()
+
+        async def send(queued_at: float):
+            async with semaphore:
+                await self._send(session, self.ctx.random_user(), queued_at)
+
+        next_at = time.perf_counter()
+        while next_at < self._deadline:
+            delay = next_at - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            request_task = asyncio.create_task(send(next_at))
+            pending.add(request_task)
+            request_task.add_done_callback(pending.discard)
+            next_at += self.ctx.rnd.expovariate(self.rate)
+        if pending:
+            await asyncio.wait(pending)
+
+    async def run(self) -> dict:
+        connector = aiohttp.TCPConnector(limit=self.concurrency)
+        timeout = aiohttp.ClientTimeout(total=self.timeout)
+        async with aiohttp.ClientSession(
+            connector=connector, timeout=timeout
+        ) as session:
+            self._record_after = time.perf_counter() + self.warmup
+            self._deadline = self._record_after + self.duration
+            if self.rate > 0:
+                await self._open_loop(session)
+            else:
+                await asyncio.gather(
+                    *(
+                        self._virtual_user(session, self.warmup * n / self.concurrency)
+                        for n in range(self.concurrency)
+                    )
+                )
+            elapsed = time.perf_counter() - self._record_after
+        return self.stats.summary(elapsed)
+
+
+async def feed_traffic_logs(users: int, rate: float, stop: asyncio.Event):
+    """每秒向流量日志队列写入 rate 条模拟日志"""
+    from benchmarks import datagen
+
+    for seed in itertools.count(1):
+        start = time.perf_counter()
+        await asyncio.to_thread(datagen.fill_traffic_queue, users, int(rate), seed)
+        try:
+            await asyncio.wait_for(
+                stop.wait(), max(0.0, 1 - (time.perf_counter() - start))
+            )
+            return
+        except asyncio.TimeoutError:
+            pass
+
+
+### 被测应用 ###
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def app_environment(workdir: str, upstreams) -> dict:
+    """被测应用的环境变量：上游全部指向模拟服务"""
+    return {
+        "DATA_DIR": workdir,
+        "LOG_LEVEL": os.environ.get("LOG_LEVEL", "WARNING"),
+        "STREAM_BACKEND": json.dumps(NORMAL_LINES + PREMIUM_LINES),
+        "PREMIUM_STREAM_BACKEND": json.dumps(PREMIUM_LINES),
+        "TG_API_TOKEN": BOT_TOKEN,
+        "TG_API_BASE_URL": upstreams.url("telegram"),
+        "EMBY_BASE_URL": upstreams.url("emby"),
+        "EMBY_API_TOKEN": "bench-emby-token",
+        "PLEX_BASE_URL": upstreams.url("plex"),
+        "PLEX_API_TOKEN": "bench-plex-token",
+        "PLEX_REGISTER": "true",
+        "PREMIUM_UNLOCK_ENABLED": "true",
+        "EMBY_REGISTER": "true",
+        "TAUTULLI_URL": upstreams.url("tautulli"),
+        "TAUTULLI_APIKEY": "bench-tautulli-key",
+        "BENCH_PLEX_TV_URL": upstreams.url("plextv"),
+        "WEBAPP_METRICS_TOKEN": METRICS_TOKEN,
+    }
+
+
+def start_app(workdir: str, upstreams, port: int, jobs: list[str]) -> subprocess.Popen:
+    env = {**os.environ, **app_environment(workdir, upstreams)}
+    env["PYTHONPATH"] = os.pathsep.join(
+        filter(None, [str(ROOT), str(ROOT / "src"), os.environ.get("PYTHONPATH")])
+    )
+    # 管理员 id 与生产环境一样写在数据目录的 .env 中，以便按整数载入
+    Path(workdir, ".env").write_text(f"TG_ADMIN_CHAT_ID={ADMIN_CHAT_ID}\n")
+    args = [sys.executable, "-m", "benchmarks.serve", "--port", str(port)]
+    for job in jobs:
+        args += ["--job", job]
+    # 在空目录中运行，避免 pydantic-settings 读取仓库或数据目录中的 .env
+    cwd = Path(workdir, "run")
+    cwd.mkdir(exist_ok=True)
+    return subprocess.Popen(args, env=env, cwd=cwd)
+
+
+def stop_app(process: subprocess.Popen):
+    process.terminate()
+    try:
+        process.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+async def wait_for_app(base_url: str, process: subprocess.Popen, timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    async with aiohttp.ClientSession() as session:
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise SystemExit(f"被测应用已退出，退出码 {process.returncode}")
+            try:
+                async with session.get(f"{base_url}/health") as response:
+                    if response.status == 200:
+                        return
+            except aiohttp.ClientError:
+                pass
+            await asyncio.sleep(0.2)
+    raise SystemExit("等待被测应用启动超时")
+
+
+METRIC_PREFIXES = (
+    "scheduler_job_duration_seconds_sum",
+    "scheduler_job_duration_seconds_count",
+    "scheduler_job_runs_total",
+    "telegram_messages_total",
+    "traffic_log_queue_length",
+    "notification_outbox_length",
+)
+
+
+async def scrape_metrics(base_url: str) -> dict:
+    """从 /metrics 读取定时任务、通知及队列相关的指标"""
+    try:
+        async with aiohttp.ClientSession() as session:
+            async with session.get(
+                f"{base_url}/metrics",
+                headers={"Authorization": f"Bearer {METRICS_TOKEN}"},
+            ) as response:
+                text = await response.text()
+    except aiohttp.ClientError:
+        return {}
+    metrics = {}
+    for line in text.splitlines():
+        if line.startswith(METRIC_PREFIXES):
+            name, _, value = line.rpartition(" ")
+            metrics[name] = float(value)
+    return metrics
+
+
+def load_fixture(db_path: Path) -> tuple[list[str], list[int]]:
+    """读取未使用的邀请码及进行中的竞拍"""
+    con = sqlite3.connect(db_path)
+    try:
+        codes = [
+            row[0]
+            for row in con.execute(
+                "SELECT code FROM invitation WHERE is_used = 0 ORDER BY code"
+            )
+        ]
+        auctions = [
+            row[0]
+            for row in con.execute(
+                "SELECT id FROM auctions WHERE is_active = 1 AND end_time > ?",
+                (int(time.time()),),
+            )
+        ]
+    finally:
+        con.close()
+    return codes, auctions
+
+
+async def run(args, workdir: str, profiles: dict, tasks: list[Task]) -> dict:
+    from app.db import DB, get_pool
+    from benchmarks import datagen
+    from benchmarks.fakes import FakeUpstreams
+    from benchmarks.runner import copy_database, generate, load_dataset_params
+
+    db_path = Path(workdir) / "data.db"
+    if args.db:
+        copy_database(Path(args.db), db_path)
+    else:
+        params = {
+            "users": args.users,
+            "traffic_rows": args.traffic_rows,
+            "months": 2,
+            "wheel_spins": args.users * 20,
+            "auctions": 50,
+            "bids_per_auction": 10,
+            "seed": args.seed,
+        }
+        elapsed = await asyncio.to_thread(generate, db_path, params)
+        print(f"已生成数据集，耗时 {elapsed:.1f}s")
+    db = DB(db_path)
+    try:
+        dataset = load_dataset_params(db)
+    finally:
+        db.close()
+        # 数据库只由被测应用读写
+        get_pool(db_path).close_all()
+    users = dataset["users"]
+    unused_codes, active_auctions = load_fixture(db_path)
+
+    upstreams = FakeUpstreams(users, profiles, seed=args.seed).start()
+    port = _free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    process = start_app(workdir, upstreams, port, args.job)
+    stop_feed = asyncio.Event()
+    feeder = None
+    try:
+        await wait_for_app(base_url, process)
+        if args.traffic_rate > 0:
+            datagen.prime_token_caches(users)
+            feeder = asyncio.create_task(
+                feed_traffic_logs(users, args.traffic_rate, stop_feed)
+            )
+
+        ctx = LoadContext(
+            users,
+            upstreams.plex_users,
+            datagen.TG_ID_BASE,
+            unused_codes,
+            active_auctions,
+            args.seed,
+        )
+        driver = LoadDriver(
+            base_url,
+            ctx,
+            tasks,
+            concurrency=args.concurrency,
+            duration=args.duration,
+            warmup=args.warmup,
+            think_time=args.think_time,
+            rate=args.rate,
+        )
+        mode = (
+            f"到达率 {args.rate:g} req/s"
+            if args.rate
+            else f"思考时间 {args.think_time:g}s"
+        )
+        print(
+            f"压测中：并发 {args.concurrency}，{mode}，"
+            f"预热 {args.warmup:g}s + {args.duration:g}s"
+        )
+        load = await driver.run()
+        metrics = await scrape_metrics(base_url)
+    finally:
+        stop_feed.set()
+        if feeder is not None:
+            await feeder
+            datagen.clear_redis_fixture(users)
+        stop_app(process)
+        upstreams.stop()
+
+    return {
+        "meta": {
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "dataset": dataset,
+            "concurrency": args.concurrency,
+            "rate": args.rate,
+            "think_time": args.think_time,
+            "warmup": args.warmup,
+            "jobs": args.job,
+            "traffic_rate": args.traffic_rate,
+            "upstreams": {name: item.to_dict() for name, item in profiles.items()},
+            "tasks": {item.name: item.weight for item in tasks},
+        },
+        "load": load,
+        "upstreams": upstreams.stats(),
+        "metrics": metrics,
+    }
+
+
+def print_report(result: dict):
+    load = result["load"]
+    print(
+        f"\n{'endpoint':<26}{'req':>8}{'rps':>9}{'err':>6}{'rej':>6}"
+        f"{'p50':>9}{'p90':>9}{'p99':>9}{'max':>9}"
+    )
+    rows = list(load["endpoints"].items())
+    if load["total"]:
+        rows.append(("TOTAL", load["total"]))
+    for name, item in rows:
+        print(
+            f"{name:<26}{item['requests']:>8}{item['rps']:>9.1f}{item['errors']:>6}"
+            f"{item['rejected']:>6}{item['p50_ms']:>9.1f}{item['p90_ms']:>9.1f}"
+            f"{item['p99_ms']:>9.1f}{item['max_ms']:>9.1f}"
+        )
+    print("延迟单位为 ms；err 为非 2xx 响应及连接错误，rej 为 success=false 的业务失败")
+
+    print(f"\n{'upstream request':<64}{'req':>8}{'err':>6}")
+    for service, routes in result["upstreams"].items():
+        for route, item in routes.items():
+            print(
+                f"{service + ' ' + route:<64}{item['requests']:>8}{item['errors']:>6}"
+            )
+
+    if result["metrics"]:
+        print()
+        for name, value in sorted(result["metrics"].items()):
+            print(f"{name:<96}{value:>12g}")
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.loadtest")
+    parser.add_argument("--workdir", help="临时数据目录所在位置，默认为系统临时目录")
+    parser.add_argument(
+        "--db", help="使用 benchmarks generate 生成的数据库（会先复制）"
+    )
+    parser.add_argument("--output", help="结果 JSON 文件路径")
+    parser.add_argument("--list", action="store_true", help="列出所有任务及权重")
+
+    group = parser.add_argument_group("数据集")
+    group.add_argument("--users", type=int, default=1000, help="Plex/Emby 用户数")
+    group.add_argument("--traffic-rows", type=int, default=100000)
+    group.add_argument("--seed", type=int, default=0)
+
+    group = parser.add_argument_group("负载")
+    group.add_argument(
+        "--concurrency",
+        type=int,
+        default=100,
+        help="虚拟用户数（开环模式下为最大并发数）",
+    )
+    group.add_argument(
+        "--duration", type=float, default=30, help="计入统计的时长（秒）"
+    )
+    group.add_argument("--warmup", type=float, default=5, help="预热时长（秒）")
+    group.add_argument(
+        "--think-time", type=float, default=1.0, help="两次请求之间的平均间隔（秒）"
+    )
+    group.add_argument(
+        "--rate", type=float, default=0, help="开环模式的到达率（req/s）"
+    )
+    group.add_argument(
+        "-k",
+        "--keyword",
+        action="append",
+        default=[],
+        help="只发送名称包含该字符串的任务",
+    )
+
+    group = parser.add_argument_group("上游及定时任务")
+    group.add_argument(
+        "--upstream-latency", type=float, default=20, help="上游平均延迟（ms）"
+    )
+    group.add_argument(
+        "--upstream-jitter", type=float, default=0.5, help="延迟标准差与均值之比"
+    )
+    group.add_argument("--upstream-error-rate", type=float, default=0.0)
+    group.add_argument(
+        "--upstream",
+        action="append",
+        default=[],
+        help="单独设置某个上游：SERVICE:LATENCY_MS[:ERROR_RATE]，如 emby:200:0.05",
+    )
+    group.add_argument(
+        "--job",
+        action="append",
+        default=[],
+        help="被测应用中运行的定时任务 NAME=SECONDS（见 serve.py）",
+    )
+    group.add_argument(
+        "--traffic-rate", type=float, default=0, help="每秒写入流量日志队列的日志数"
+    )
+    args = parser.parse_args()
+
+    if args.list:
+        for item in TASKS.values():
+            print(f"{item.name:<26}{item.weight:g}")
+        return
+    tasks = select_tasks(args.keyword)
+
+    with tempfile.TemporaryDirectory(dir=args.workdir) as workdir:
+        # 与 __main__ 一致，导入 app 前设置环境变量
+        os.environ["DATA_DIR"] = workdir
+        os.environ["STREAM_BACKEND"] = json.dumps(NORMAL_LINES + PREMIUM_LINES)
+        os.environ["PREMIUM_STREAM_BACKEND"] = json.dumps(PREMIUM_LINES)
+        os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+        from benchmarks.fakes import SERVICES, UpstreamProfile
+
+        default = UpstreamProfile(
+            args.upstream_latency / 1000, args.upstream_jitter, args.upstream_error_rate
+        )
+        profiles = {name: default for name in SERVICES}
+        try:
+            profiles.update(
+                UpstreamProfile.parse(spec, default) for spec in args.upstream
+            )
+        except ValueError as e:
+            raise SystemExit(str(e)) from None
+        result = asyncio.run(run(args, workdir, profiles, tasks))
+
+    print_report(result)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"\n结果已保存到 {args.output}")
+
+
+if __name__ == "__main__":
+    main()
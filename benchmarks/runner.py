@@ -0,0 +1,211 @@
+"""
+基准测试的执行及结果对比
+
+导入本模块前需先设置好 DATA_DIR 等环境变量（见 __main__.py）
+"""
+
+import json
+import math
+import platform
+import sqlite3
+import statistics
+import subprocess
+import sys
+import time
+import traceback
+from datetime import datetime
+from pathlib import Path
+
+from app.config import settings
+from app.db import DB
+from benchmarks import datagen
+from benchmarks.scenarios import SCENARIOS, BenchContext, Scenario
+
+DATASET_TABLE = "benchmark_dataset"
+
+
+def save_dataset_params(db: DB, params: dict):
+    """将数据集参数保存在数据库中，复用数据库时无需重复指定"""
+    with db.con:
+        db.cur.execute(
+            f"CREATE TABLE IF NOT EXISTS {DATASET_TABLE}(key PRIMARY KEY, value)"
+        )
+        db.cur.executemany(
+            f"INSERT OR REPLACE INTO {DATASET_TABLE} VALUES (?, ?)",
+            [(key, json.dumps(value)) for key, value in params.items()],
+        )
+
+
+def load_dataset_params(db: DB) -> dict:
+    try:
+        rows = db.cur.execute(f"SELECT key, value FROM {DATASET_TABLE}").fetchall()
+    except sqlite3.OperationalError:
+        raise SystemExit("数据库中没有数据集参数，请使用 generate 命令生成") from None
+    return {key: json.loads(value) for key, value in rows}
+
+
+def generate(path: Path, params: dict) -> float:
+    """生成数据集，返回耗时（秒）"""
+    start = time.perf_counter()
+    db = DB(path)
+    try:
+        datagen.generate_database(db, **params)
+        save_dataset_params(db, params)
+    finally:
+        db.close()
+    return time.perf_counter() - start
+
+
+def copy_database(src: Path, dst: Path):
+    src_con, dst_con = sqlite3.connect(src), sqlite3.connect(dst)
+    try:
+        src_con.backup(dst_con)
+    finally:
+        src_con.close()
+        dst_con.close()
+
+
+def summarize(durations: list[float]) -> dict:
+    """耗时统计（毫秒）"""
+    values = sorted(d * 1000 for d in durations)
+    return {
+        "repeat": len(values),
+        "mean_ms": round(statistics.fmean(values), 4),
+        "median_ms": round(statistics.median(values), 4),
+        "min_ms": round(values[0], 4),
+        "p95_ms": round(values[math.ceil(len(values) * 0.95) - 1], 4),
+        "max_ms": round(values[-1], 4),
+        "stdev_ms": round(statistics.stdev(values), 4) if len(values) > 1 else 0.0,
+    }
+
+
+def run_scenario(ctx: BenchContext, item: Scenario, repeat: int, warmup: int) -> dict:
+    repeat = item.repeat or repeat
+    durations = []
+    for n in range(warmup + repeat):
+        state = item.setup(ctx) if item.setup else None
+        args = (ctx,) if item.setup is None else (ctx, state)
+        try:
+            start = time.perf_counter()
+            item.func(*args)
+            elapsed = time.perf_counter() - start
+        finally:
+            if item.teardown:
+                item.teardown(ctx, state)
+        if n >= warmup:
+            durations.append(elapsed)
+    return summarize(durations)
+
+
+def select_scenarios(keywords: list[str], with_redis: bool) -> list[Scenario]:
+    selected = []
+    for item in SCENARIOS.values():
+        if item.group == "redis" and not with_redis:
+            continue
+        if keywords and not any(keyword in item.name for keyword in keywords):
+            continue
+        selected.append(item)
+    return selected
+
+
+def _git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=Path(__file__).parent,
+        ).stdout.strip()
+    except Exception:
+        return ""
+
+
+def run(
+    db_path: Path,
+    keywords: list[str],
+    repeat: int,
+    warmup: int,
+    with_redis: bool,
+) -> dict:
+    """运行选中的场景，返回包含环境信息及各场景耗时统计的结果"""
+    db = DB(db_path)
+    try:
+        dataset = load_dataset_params(db)
+    finally:
+        db.close()
+
+    scenarios = select_scenarios(keywords, with_redis)
+    if with_redis:
+        datagen.prime_token_caches(dataset["users"])
+
+    ctx = BenchContext(db_path, dataset["users"], dataset["months"])
+    results = {}
+    try:
+        for item in scenarios:
+            print(f"{item.name:<36}", end="", flush=True)
+            try:
+                result = run_scenario(ctx, item, repeat, warmup)
+            except Exception as e:
+                traceback.print_exc()
+                results[item.name] = {"error": str(e)}
+                print("failed")
+                continue
+            results[item.name] = result
+            print(
+                f"median {result['median_ms']:>10.3f} ms   "
+                f"p95 {result['p95_ms']:>10.3f} ms   (n={result['repeat']})"
+            )
+    finally:
+        ctx.close()
+        if with_redis:
+            datagen.clear_redis_fixture(dataset["users"])
+
+    return {
+        "meta": {
+            "created_at": datetime.now(settings.TZ).isoformat(),
+            "git_revision": _git_revision(),
+            "python": sys.version.split()[0],
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "repeat": repeat,
+            "warmup": warmup,
+            "redis": with_redis,
+            "dataset": dataset,
+        },
+        "results": results,
+    }
+
+
+def compare(base: dict, new: dict, threshold: float, metric: str = "median_ms"):
+    """
+    对比两次运行的结果
+
+    Returns:
+        耗时增加超过 threshold（相对值）的场景名列表
+    """
+    for label, result in (("base", base), ("new", new)):
+        meta = result["meta"]
+        print(
+            f"{label}: {meta['created_at']} {meta['git_revision'] or '-'} "
+            f"dataset={json.dumps(meta['dataset'], sort_keys=True)}"
+        )
+    if base["meta"]["dataset"] != new["meta"]["dataset"]:
+        print("警告: 两次运行的数据集参数不同，结果不具有可比性")
+
+    regressions = []
+    print(f"\n{'scenario':<36}{'base (ms)':>12}{'new (ms)':>12}{'change':>10}")
+    for name, base_result in base["results"].items():
+        new_result = new["results"].get(name)
+        if new_result is None or metric not in base_result or metric not in new_result:
+            continue
+        before, after = base_result[metric], new_result[metric]
+        change = (after - before) / before if before else 0.0
+        flag = ""
+        if change > threshold:
+            flag = "  slower"
+            regressions.append(name)
+        elif change < -threshold:
+            flag = "  faster"
+        print(f"{name:<36}{before:>12.3f}{after:>12.3f}{change:>+10.1%}{flag}")
+    return regressions
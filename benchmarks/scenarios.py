@@ -0,0 +1,318 @@
+"""
+基准测试场景
+
+每个场景是一个接收 BenchContext 的函数，用 @scenario 注册：
+- group="db": 只依赖 SQLite
+- group="redis": 还依赖 Redis（需 --redis）
+
+setup 在每次计时前执行且不计入耗时，其返回值作为场景函数的第二个参数；
+teardown 在每次计时后执行。会修改数据的场景应在 setup 中准备独立的数据。
+"""
+
+import asyncio
+import os
+import random
+import sqlite3
+import tempfile
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Callable, Optional
+
+from app.config import settings
+from app.db import DB, get_pool
+from benchmarks import datagen
+
+
+class BenchContext:
+    """场景共享的数据库连接及数据集参数"""
+
+    def __init__(self, db_path: Path, users: int, months: int):
+        self.db_path = db_path
+        self.users = users
+        self.months = months
+        self.db = DB(db_path)
+        self.rnd = random.Random(0)
+
+    def random_index(self) -> int:
+        return self.rnd.randrange(self.users)
+
+    def random_tg_id(self) -> int:
+        return datagen.TG_ID_BASE + self.random_index()
+
+    @property
+    def month_start(self) -> datetime:
+        return datetime.now(settings.TZ).replace(
+            day=1, hour=0, minute=0, second=0, microsecond=0
+        )
+
+    @property
+    def last_month(self) -> str:
+        return (self.month_start - timedelta(days=1)).strftime("%Y-%m")
+
+    def close(self):
+        self.db.close()
+
+
+class Scenario:
+    def __init__(
+        self,
+        name: str,
+        func: Callable,
+        group: str = "db",
+        repeat: Optional[int] = None,
+        setup: Optional[Callable] = None,
+        teardown: Optional[Callable] = None,
+    ):
+        self.name = name
+        self.func = func
+        self.group = group
+        self.repeat = repeat
+        self.setup = setup
+        self.teardown = teardown
+
+
+SCENARIOS: dict[str, Scenario] = {}
+
+
+def scenario(name: str, **kwargs):
+    def decorator(func):
+        SCENARIOS[name] = Scenario(name, func, **kwargs)
+        return func
+
+    return decorator
+
+
+def _add(name: str, func: Callable, **kwargs):
+    """注册只需调用一次 DB 方法的场景"""
+    SCENARIOS[name] = Scenario(name, func, **kwargs)
+
+
+### 流量统计 ###
+_add("traffic_statistics", lambda ctx: ctx.db.get_traffic_statistics())
+_add(
+    "premium_line_traffic_statistics",
+    lambda ctx: ctx.db.get_premium_line_traffic_statistics(),
+)
+_add(
+    "plex_traffic_rank_month",
+    lambda ctx: ctx.db.get_plex_traffic_rank(ctx.month_start),
+)
+_add(
+    "emby_traffic_rank_month",
+    lambda ctx: ctx.db.get_emby_traffic_rank(ctx.month_start),
+)
+_add("plex_traffic_rank_today", lambda ctx: ctx.db.get_plex_traffic_rank())
+_add(
+    "user_daily_traffic",
+    lambda ctx: ctx.db.get_user_daily_traffic(
+        datagen.PLEX_USERNAME.format(ctx.random_index()).lower(), "plex"
+    ),
+)
+_add(
+    "user_daily_traffic_premium",
+    lambda ctx: ctx.db.get_user_daily_traffic(
+        datagen.EMBY_USERNAME.format(ctx.random_index()).lower(),
+        "emby",
+        premium_only=True,
+    ),
+)
+_add(
+    "daily_traffic_by_user",
+    lambda ctx: ctx.db.get_daily_traffic_by_user(
+        (datetime.now(settings.TZ) - timedelta(days=1)).strftime("%Y-%m-%d")
+    ),
+)
+_add("user_id_map", lambda ctx: ctx.db.get_user_id_map("emby"))
+
+### 排行榜 ###
+_add("credits_rank", lambda ctx: ctx.db.get_credits_rank())
+_add("donation_rank", lambda ctx: ctx.db.get_donation_rank())
+_add("plex_watched_time_rank", lambda ctx: ctx.db.get_plex_watched_time_rank())
+_add("emby_watched_time_rank", lambda ctx: ctx.db.get_emby_watched_time_rank())
+_add(
+    "plex_rank_info_by_ids",
+    lambda ctx: ctx.db.get_plex_rank_info_by_ids(
+        [ctx.random_index() for _ in range(100)]
+    ),
+)
+_add(
+    "emby_rank_info_by_ids",
+    lambda ctx: ctx.db.get_emby_rank_info_by_ids(
+        [f"emby-{ctx.random_index()}" for _ in range(100)]
+    ),
+)
+
+### 用户信息 ###
+_add(
+    "plex_info_by_tg_id", lambda ctx: ctx.db.get_plex_info_by_tg_id(ctx.random_tg_id())
+)
+_add(
+    "plex_info_by_username",
+    lambda ctx: ctx.db.get_plex_info_by_plex_username(
+        datagen.PLEX_USERNAME.format(ctx.random_index()).lower()
+    ),
+)
+_add(
+    "plex_info_by_email",
+    lambda ctx: ctx.db.get_plex_info_by_plex_email(
+        f"user{ctx.random_index()}@example.com"
+    ),
+)
+_add(
+    "emby_info_by_tg_id", lambda ctx: ctx.db.get_emby_info_by_tg_id(ctx.random_tg_id())
+)
+_add(
+    "emby_info_by_username",
+    lambda ctx: ctx.db.get_emby_info_by_emby_username(
+        datagen.EMBY_USERNAME.format(ctx.random_index()).lower()
+    ),
+)
+_add("stats_by_tg_id", lambda ctx: ctx.db.get_stats_by_tg_id(ctx.random_tg_id()))
+_add("user_credits", lambda ctx: ctx.db.get_user_credits(ctx.random_tg_id()))
+_add(
+    "invitation_codes_by_owner",
+    lambda ctx: ctx.db.get_invitation_code_by_owner(ctx.random_tg_id()),
+)
+_add("plex_users_with_line", lambda ctx: ctx.db.get_plex_user_with_binded_line())
+_add("emby_users_with_line", lambda ctx: ctx.db.get_emby_user_with_binded_line())
+
+### 幸运转盘 ###
+_add("wheel_stats", lambda ctx: ctx.db.get_wheel_stats())
+_add("user_wheel_stats", lambda ctx: ctx.db.get_user_wheel_stats(ctx.random_tg_id()))
+
+### 竞拍 ###
+_add("active_auctions", lambda ctx: ctx.db.get_active_auctions())
+_add("all_auctions", lambda ctx: ctx.db.get_all_auctions())
+_add("auction_stats", lambda ctx: ctx.db.get_auction_stats())
+_add("detailed_auction_stats", lambda ctx: ctx.db.get_detailed_auction_stats())
+_add(
+    "auction_bids",
+    lambda ctx: ctx.db.get_auction_bids(ctx.rnd.randint(1, 50)),
+)
+_add(
+    "user_auction_history",
+    lambda ctx: ctx.db.get_user_auction_history(ctx.random_tg_id()),
+)
+
+### Premium ###
+_add("premium_statistics", lambda ctx: ctx.db.get_premium_statistics())
+_add("expired_premium_users", lambda ctx: ctx.db.get_expired_premium_users())
+_add(
+    "premium_users_expiring_soon",
+    lambda ctx: ctx.db.get_premium_users_expiring_soon(),
+)
+
+
+### 写入及定时任务 ###
+@scenario(
+    "traffic_entries_insert",
+    setup=lambda ctx: list(
+        datagen.iter_traffic_rows(ctx.users, 1000, 1, random.Random(ctx.rnd.random()))
+    ),
+)
+def traffic_entries_insert(ctx: BenchContext, entries: list):
+    """流量日志入库的数据库部分：1000 条记录及汇总表在一个事务中写入"""
+    assert ctx.db.create_line_traffic_entries(entries)
+
+
+def _settlement_durations(ctx: BenchContext) -> dict:
+    """约 60% 的 Plex 用户昨日有观看记录"""
+    rnd = random.Random(1)
+    return {
+        i: round(rnd.uniform(0.1, 12), 2)
+        for i in range(ctx.users)
+        if rnd.random() < 0.6
+    }
+
+
+@scenario("credit_settlement_dry_run", setup=_settlement_durations)
+def credit_settlement_dry_run(ctx: BenchContext, durations: dict):
+    """积分结算：载入用户、总积分及昨日 premium 流量并计算积分变化（不写入）"""
+    from app.update_db import settle_credits
+
+    settle_credits("plex", durations, dry_run=True)
+
+
+def _copy_database(ctx: BenchContext) -> Path:
+    """用 SQLite backup 复制一份数据库，供会修改数据的场景使用"""
+    fd, path = tempfile.mkstemp(suffix=".db", dir=ctx.db_path.parent)
+    os.close(fd)
+    src = sqlite3.connect(ctx.db_path)
+    dst = sqlite3.connect(path)
+    try:
+        src.backup(dst)
+    finally:
+        src.close()
+        dst.close()
+    # 提前建立连接及初始化，避免计入耗时
+    DB(path).close()
+    return Path(path)
+
+
+def _remove_database(ctx: BenchContext, path: Path):
+    get_pool(path).close_all()
+    for suffix in ("", "-wal", "-shm"):
+        Path(f"{path}{suffix}").unlink(missing_ok=True)
+
+
+@scenario(
+    "monthly_aggregation",
+    repeat=3,
+    setup=_copy_database,
+    teardown=_remove_database,
+)
+def monthly_aggregation(ctx: BenchContext, path: Path):
+    """月度迁移：聚合上个月的流量数据并清理原始记录"""
+    db = DB(path)
+    try:
+        success, message = db.aggregate_monthly_traffic_data(ctx.last_month)
+        assert success, message
+        success, message = db.cleanup_monthly_traffic_data(ctx.last_month)
+        assert success, message
+    finally:
+        db.close()
+
+
+### 依赖 Redis 的场景 ###
+INGEST_BATCH_SIZE = settings.REDIS_LINE_TRAFFIC_STATS_HANDLE_SIZE
+
+
+@scenario(
+    "ingest_traffic_logs",
+    group="redis",
+    setup=lambda ctx: datagen.fill_traffic_queue(
+        ctx.users, INGEST_BATCH_SIZE, seed=ctx.rnd.randrange(2**32)
+    ),
+)
+def ingest_traffic_logs(ctx: BenchContext, queued: int):
+    """流量日志入库定时任务：从队列取出一批日志，解析、解析用户名并写入"""
+    from app.update_db import update_line_traffic_stats
+
+    stats = asyncio.run(update_line_traffic_stats(INGEST_BATCH_SIZE))
+    assert stats and stats["processed"], stats
+
+
+@scenario("credit_settlement", group="redis", setup=_settlement_durations)
+def credit_settlement(ctx: BenchContext, durations: dict):
+    """完整的积分结算：计算、批量写入并同步排行榜"""
+    from app.update_db import settle_credits
+
+    settle_credits("plex", durations)
+
+
+@scenario("reconcile_user_daily_traffic", group="redis")
+def reconcile_user_daily_traffic(ctx: BenchContext):
+    """以数据库为准校准今日及昨日的 Redis 用户流量计数"""
+    from app.update_db import reconcile_user_daily_traffic
+
+    reconcile_user_daily_traffic()
+
+
+@scenario("user_daily_traffic_cached", group="redis")
+def user_daily_traffic_cached(ctx: BenchContext):
+    """读取 Redis 中的用户每日流量计数（未命中时回退到数据库）"""
+    from app.traffic import get_user_daily_traffic
+
+    get_user_daily_traffic(
+        ctx.db, datagen.PLEX_USERNAME.format(ctx.random_index()), "plex"
+    )
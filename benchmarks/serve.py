@@ -0,0 +1,152 @@
+"""
+压测时被测应用的进程入口
+
+与 app.main 的结构一致：主线程的事件循环运行调度器（生产环境中为 Bot 的事件循环），
+WebApp 在单独的线程中由 uvicorn 运行；不启动 Telegram Bot 的轮询。
+
+由 loadtest 以子进程启动，所有设置通过环境变量传入，其中 BENCH_PLEX_TV_URL 用于将
+plexapi 中写死的 https://plex.tv 地址指向模拟服务。
+"""
+
+import argparse
+import asyncio
+import os
+import signal
+import threading
+
+# 可在压测期间以较短间隔运行的定时任务: 名称 -> (模块, 函数名, 是否为异步任务)
+JOBS = {
+    "update_line_traffic_stats": ("app.update_db", "update_line_traffic_stats", True),
+    "update_credits": ("app.update_db", "update_credits", True),
+    "update_plex_info": ("app.update_db", "update_plex_info", False),
+    "write_user_info_cache": ("app.update_db", "write_user_info_cache", False),
+    "rewrite_users_credits_to_redis": (
+        "app.update_db",
+        "rewrite_users_credits_to_redis",
+        False,
+    ),
+    "reconcile_user_daily_traffic": (
+        "app.update_db",
+        "reconcile_user_daily_traffic",
+        False,
+    ),
+    "rebuild_leaderboards": ("app.leaderboard", "rebuild_leaderboards", False),
+    "refresh_emby_user_info": ("app.utils.utils", "refresh_emby_user_info", False),
+    "refresh_tg_user_info": ("app.utils.utils", "refresh_tg_user_info", True),
+    # 常驻任务，间隔设为 0
+    "traffic_log_consumer": ("app.traffic", "run_traffic_log_consumer", True),
+}
+
+
+def redirect_plex_tv(url: str):
+    """将 plexapi.myplex 中各类的 plex.tv 地址常量替换为 url 开头的地址"""
+    import plexapi.myplex
+
+    url = url.rstrip("/")
+    for cls in vars(plexapi.myplex).values():
+        if not isinstance(cls, type) or cls.__module__ != plexapi.myplex.__name__:
+            continue
+        for name, value in list(vars(cls).items()):
+            if isinstance(value, str) and value.startswith("https://plex.tv"):
+                setattr(cls, name, url + value[len("https://plex.tv") :])
+
+
+def parse_jobs(specs: list[str]) -> dict[str, float]:
+    """解析 NAME=SECONDS 形式的任务列表"""
+    jobs = {}
+    for spec in specs:
+        name, _, interval = spec.partition("=")
+        if name not in JOBS:
+            raise SystemExit(f"未知的任务 {name}，可选: {', '.join(JOBS)}")
+        jobs[name] = float(interval or 60)
+    return jobs
+
+
+def add_jobs(jobs: dict[str, float]):
+    import importlib
+
+    from app.notifier import run_notification_dispatcher
+    from app.scheduler import Scheduler
+
+    scheduler = Scheduler()
+    # 与生产环境一致，通知统一由发件箱限速发送
+    scheduler.add_async_job(
+        func=run_notification_dispatcher,
+        trigger="date",
+        id="notification_dispatcher",
+        max_instances=1,
+    )
+    for name, interval in jobs.items():
+        module, func_name, is_async = JOBS[name]
+        func = getattr(importlib.import_module(module), func_name)
+        add_job = scheduler.add_async_job if is_async else scheduler.add_sync_job
+        if interval > 0:
+            add_job(
+                func=func,
+                trigger="interval",
+                id=name,
+                max_instances=1,
+                seconds=interval,
+            )
+        else:
+            # 间隔为 0 时作为常驻任务启动一次
+            add_job(func=func, trigger="date", id=name, max_instances=1)
+    return scheduler
+
+
+def start_api_server(host: str, port: int):
+    import uvicorn
+
+    uvicorn.run(
+        "app.webapp:app",
+        host=host,
+        port=port,
+        reload=False,
+        log_level="warning",
+        access_log=False,
+        # 与压测客户端的连接数相当，避免排队
+        backlog=4096,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.serve")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, required=True)
+    parser.add_argument(
+        "--job",
+        action="append",
+        default=[],
+        help="以 NAME=SECONDS 的间隔运行的定时任务，SECONDS 为 0 时作为常驻任务启动，可重复指定",
+    )
+    args = parser.parse_args()
+    jobs = parse_jobs(args.job)
+
+    plex_tv_url = os.environ.get("BENCH_PLEX_TV_URL")
+    if plex_tv_url:
+        redirect_plex_tv(plex_tv_url)
+
+    from app.cache import migrate_cache_namespaces
+    from app.db import init_db
+    from app.leaderboard import rebuild_leaderboards
+
+    init_db()
+    rebuild_leaderboards()
+    migrate_cache_namespaces()
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    add_jobs(jobs)
+
+    api_thread = threading.Thread(
+        target=start_api_server, args=(args.host, args.port), daemon=True
+    )
+    api_thread.start()
+
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, loop.stop)
+    loop.run_forever()
+
+
+if __name__ == "__main__":
+    main()
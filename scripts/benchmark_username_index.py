@@ -0,0 +1,128 @@
+"""
+小写用户名表达式索引的查询性能对比
+
+生成一个月的模拟流量数据，分别在旧索引（区分大小写的 username 索引）和
+新索引（LOWER(username) 表达式索引）下执行按用户名查询的语句并对比耗时。
+
+用法:
+    cd src && PYTHONPATH=. DATA_DIR=/tmp/pmsbench python ../scripts/benchmark_username_index.py
+"""
+
+import argparse
+import random
+import tempfile
+from datetime import datetime, timedelta
+from pathlib import Path
+from time import perf_counter
+
+from app.config import settings
+from app.db import DB
+
+# 迁移前的旧索引
+OLD_INDEXES = """
+DROP INDEX IF EXISTS idx_user_plex_username_lower;
+DROP INDEX IF EXISTS idx_user_plex_email_lower;
+DROP INDEX IF EXISTS idx_emby_user_username_lower;
+DROP INDEX IF EXISTS idx_line_traffic_service_username_lower_time;
+DROP INDEX IF EXISTS idx_daily_traffic_service_username_lower_bucket;
+CREATE INDEX idx_line_traffic_service_user_time ON line_traffic_stats(service, username, timestamp);
+CREATE INDEX idx_line_traffic_daily_query ON line_traffic_stats(service, username, date(timestamp));
+CREATE INDEX idx_daily_traffic_service_user_bucket ON line_traffic_daily_stats(service, username, bucket);
+"""
+
+
+def generate_month(db: DB, users: int, records_per_day: int, seed: int = 0):
+    """生成 users 个 Plex/Emby 用户及最近 30 天的流量记录"""
+    rnd = random.Random(seed)
+    lines = ["hk", "jp", "us", "sg", "premium1"]
+    for i in range(users):
+        db.cur.execute(
+            "INSERT INTO user (plex_id, tg_id, credits, plex_email, plex_username, is_premium) "
+            "VALUES (?, ?, 0, ?, ?, 0)",
+            (i, 10000 + i, f"User{i}@Example.com", f"PlexUser{i}"),
+        )
+        db.cur.execute(
+            "INSERT INTO emby_user (emby_username, emby_id, tg_id, is_premium) "
+            "VALUES (?, ?, ?, 0)",
+            (f"EmbyUser{i}", f"emby-{i}", 10000 + i),
+        )
+    db.con.commit()
+
+    now = datetime.now(settings.TZ)
+    for day in range(30):
+        entries = []
+        for _ in range(records_per_day):
+            service = rnd.choice(("plex", "emby"))
+            prefix = "PlexUser" if service == "plex" else "EmbyUser"
+            ts = now - timedelta(days=day, seconds=rnd.randint(0, 86399))
+            entries.append(
+                (
+                    rnd.choice(lines),
+                    rnd.randint(10**5, 10**8),
+                    service,
+                    f"{prefix}{rnd.randrange(users)}",
+                    None,
+                    ts.isoformat(),
+                )
+            )
+        db.create_line_traffic_entries(entries)
+
+
+def run_queries(db: DB, users: int, repeat: int) -> dict:
+    """执行各类按小写用户名匹配的查询，返回 {名称: 平均耗时 ms}"""
+    rnd = random.Random(1)
+    month_start = datetime.now(settings.TZ).replace(day=1)
+    cases = {
+        "user_daily_traffic": lambda: db.get_user_daily_traffic(
+            f"plexuser{rnd.randrange(users)}", "plex"
+        ),
+        "raw_traffic_by_user": lambda: db.cur.execute(
+            "SELECT SUM(send_bytes) FROM line_traffic_stats "
+            "WHERE service = ? AND LOWER(username) = ? AND timestamp >= ?",
+            ("emby", f"embyuser{rnd.randrange(users)}", month_start.isoformat()),
+        ).fetchone(),
+        "plex_user_by_email": lambda: db.get_plex_info_by_plex_email(
+            f"user{rnd.randrange(users)}@example.com"
+        ),
+        "emby_user_by_name": lambda: db.get_emby_info_by_emby_username(
+            f"embyuser{rnd.randrange(users)}"
+        ),
+        "plex_traffic_rank": lambda: db.get_plex_traffic_rank(month_start),
+        "emby_traffic_rank": lambda: db.get_emby_traffic_rank(month_start),
+    }
+    results = {}
+    for name, func in cases.items():
+        start = perf_counter()
+        for _ in range(repeat):
+            func()
+        results[name] = (perf_counter() - start) / repeat * 1000
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--users", type=int, default=300)
+    parser.add_argument("--records-per-day", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db = DB(Path(tmp) / "bench.db")
+        generate_month(db, args.users, args.records_per_day)
+
+        db.cur.executescript(OLD_INDEXES)
+        before = run_queries(db, args.users, args.repeat)
+        db.create_username_indexes()
+        after = run_queries(db, args.users, args.repeat)
+        db.close()
+
+    print(f"{'query':<24}{'before (ms)':>14}{'after (ms)':>14}{'speedup':>10}")
+    for name in before:
+        print(
+            f"{name:<24}{before[name]:>14.3f}{after[name]:>14.3f}"
+            f"{before[name] / after[name]:>9.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
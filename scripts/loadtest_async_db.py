@@ -0,0 +1,132 @@
+"""
+AsyncDB 压测：对比路由中直接调用同步 DB 与 await AsyncDB 时的请求延迟
+
+在同一个事件循环中并发请求一个耗时的流量排行接口和一个轻量的用户信息接口，
+统计轻量接口的 p50/p99 延迟。直接调用同步 DB 时，排行查询会阻塞事件循环，
+其他请求只能排队等待。
+
+用法:
+    cd src && PYTHONPATH=. DATA_DIR=/tmp/pmsbench python ../scripts/loadtest_async_db.py
+"""
+
+import argparse
+import asyncio
+import statistics
+import sys
+import tempfile
+from datetime import datetime
+from pathlib import Path
+
+import httpx
+from fastapi import FastAPI
+
+from app.config import settings
+from app.db import DB, AsyncDB
+
+sys.path.insert(0, str(Path(__file__).parent))
+from benchmark_username_index import generate_month  # noqa: E402
+
+
+def create_app(db_path: Path) -> FastAPI:
+    app = FastAPI()
+    month_start = datetime.now(settings.TZ).replace(day=1)
+
+    @app.get("/blocking/rank")
+    async def blocking_rank():
+        db = DB(db_path)
+        try:
+            return len(db.get_plex_traffic_rank(month_start))
+        finally:
+            db.close()
+
+    @app.get("/blocking/info/{tg_id}")
+    async def blocking_info(tg_id: int):
+        db = DB(db_path)
+        try:
+            return db.get_plex_info_by_tg_id(tg_id)
+        finally:
+            db.close()
+
+    @app.get("/async/rank")
+    async def async_rank():
+        db = AsyncDB(db_path)
+        try:
+            return len(await db.get_plex_traffic_rank(month_start))
+        finally:
+            await db.close()
+
+    @app.get("/async/info/{tg_id}")
+    async def async_info(tg_id: int):
+        db = AsyncDB(db_path)
+        try:
+            return await db.get_plex_info_by_tg_id(tg_id)
+        finally:
+            await db.close()
+
+    return app
+
+
+async def run_load(
+    client: httpx.AsyncClient, mode: str, users: int, duration: float, rps: int
+) -> list[float]:
+    """
+    按固定速率发起请求（开环），其中 1/10 为排行查询，返回用户信息接口的延迟（ms）
+
+    延迟从请求的计划发起时间开始计算，包含因事件循环阻塞而排队的时间
+    """
+    latencies = []
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+
+    async def request(i: int, scheduled: float):
+        if i % 10 == 0:
+            await client.get(f"/{mode}/rank")
+            return
+        response = await client.get(f"/{mode}/info/{10000 + i % users}")
+        latencies.append((loop.time() - scheduled) * 1000)
+        response.raise_for_status()
+
+    tasks = []
+    for i in range(int(duration * rps)):
+        scheduled = start + i / rps
+        await asyncio.sleep(max(0, scheduled - loop.time()))
+        tasks.append(asyncio.create_task(request(i, scheduled)))
+    await asyncio.gather(*tasks)
+    return latencies
+
+
+def percentile(values: list[float], pct: float) -> float:
+    return statistics.quantiles(values, n=100)[int(pct) - 1]
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--users", type=int, default=300)
+    parser.add_argument("--records-per-day", type=int, default=5000)
+    parser.add_argument("--duration", type=float, default=5, help="每轮压测时长（秒）")
+    parser.add_argument("--rps", type=int, default=100, help="每秒请求数")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = Path(tmp) / "loadtest.db"
+        db = DB(db_path)
+        generate_month(db, args.users, args.records_per_day)
+        db.close()
+
+        transport = httpx.ASGITransport(app=create_app(db_path))
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://loadtest"
+        ) as client:
+            print(f"{'mode':<10}{'p50 (ms)':>12}{'p99 (ms)':>12}{'max (ms)':>12}")
+            for mode in ("blocking", "async"):
+                latencies = await run_load(
+                    client, mode, args.users, args.duration, args.rps
+                )
+                print(
+                    f"{mode:<10}{percentile(latencies, 50):>12.2f}"
+                    f"{percentile(latencies, 99):>12.2f}{max(latencies):>12.2f}"
+                )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,10 +1,250 @@
+import json
+import threading
 import time
 import traceback
+from collections import OrderedDict
 from typing import Optional
 
 from app.log import logger
 from app.redis import Redis
 
+# put_many 每批写入的条目数，避免单个脚本执行时间过长阻塞 Redis
+PUT_MANY_BATCH_SIZE = 500
+
+# 用户每日流量计数的 Lua 脚本，计数哈希的字段：
+# total/premium: 计数；seq: 最近一次校准快照的批次号；
+# b:{批次号}: 校准后累加的批次增量 "total:premium"，下次校准时合并
+
+# KEYS: 用户每日流量计数键
+# ARGV: 批次号, ttl, 之后为 (total, premium) 对
+_INCR_USER_DAILY_TRAFFIC_LUA = """
+local batch = tonumber(ARGV[1])
+local ttl = tonumber(ARGV[2])
+for i, key in ipairs(KEYS) do
+    local total, premium = ARGV[1 + i * 2], ARGV[2 + i * 2]
+    local snapshot = tonumber(redis.call('HGET', key, 'seq') or '-1')
+    -- 已包含在校准快照中的批次，或重复累加的批次直接跳过
+    if batch > snapshot
+        and redis.call('HSETNX', key, 'b:' .. batch, total .. ':' .. premium) == 1 then
+        redis.call('HINCRBY', key, 'total', total)
+        redis.call('HINCRBY', key, 'premium', premium)
+    end
+    redis.call('EXPIRE', key, ttl)
+end
+return #KEYS
+"""
+
+# KEYS: 用户每日流量计数键
+# ARGV: 快照批次号, ttl, 之后为 (total, premium) 对
+_RECONCILE_USER_DAILY_TRAFFIC_LUA = """
+local seq = tonumber(ARGV[1])
+local ttl = tonumber(ARGV[2])
+local written = 0
+for i, key in ipairs(KEYS) do
+    local snapshot = tonumber(redis.call('HGET', key, 'seq') or '-1')
+    if seq >= snapshot then
+        local total = tonumber(ARGV[1 + i * 2])
+        local premium = tonumber(ARGV[2 + i * 2])
+        local fields = redis.call('HKEYS', key)
+        for _, field in ipairs(fields) do
+            if string.sub(field, 1, 2) == 'b:' then
+                if tonumber(string.sub(field, 3)) <= seq then
+                    -- 已包含在快照中
+                    redis.call('HDEL', key, field)
+                else
+                    -- 快照之后提交的批次，保留其增量
+                    local delta = redis.call('HGET', key, field)
+                    local sep = string.find(delta, ':', 1, true)
+                    total = total + tonumber(string.sub(delta, 1, sep - 1))
+                    premium = premium + tonumber(string.sub(delta, sep + 1))
+                end
+            end
+        end
+        redis.call('HSET', key, 'total', total, 'premium', premium, 'seq', seq)
+        written = written + 1
+    end
+    redis.call('EXPIRE', key, ttl)
+end
+return written
+"""
+
+# KEYS: 记录使用时间的有序集合（仅 track 为 1 时）, 之后为完整的缓存键
+# ARGV: ttl, skip_unchanged, track, capacity, now, 之后为 (键, 值) 对
+# 返回: {写入条数, 超出容量的条目数}
+_PUT_MANY_LUA = """
+local ttl = tonumber(ARGV[1])
+local skip_unchanged = ARGV[2] == '1'
+local track = ARGV[3] == '1'
+local capacity = tonumber(ARGV[4])
+local now = ARGV[5]
+local offset = track and 1 or 0
+local usage_key = KEYS[1]
+local written = 0
+for i = 1 + offset, #KEYS do
+    local cache_key = KEYS[i]
+    local n = i - offset
+    local member = ARGV[4 + n * 2]
+    local value = ARGV[5 + n * 2]
+    if skip_unchanged and redis.call('GET', cache_key) == value then
+        if ttl > 0 then
+            redis.call('EXPIRE', cache_key, ttl)
+        end
+    else
+        if ttl > 0 then
+            redis.call('SET', cache_key, value, 'EX', ttl)
+        else
+            redis.call('SET', cache_key, value)
+        end
+        written = written + 1
+    end
+    if track then
+        redis.call('ZADD', usage_key, now, member)
+    end
+end
+local overflow = 0
+if track and capacity > 0 then
+    overflow = math.max(redis.call('ZCARD', usage_key) - capacity, 0)
+end
+return {written, overflow}
+"""
+
+# 每次淘汰的最大条目数
+EVICT_BATCH_SIZE = 500
+
+# KEYS: 记录使用时间的有序集合
+# ARGV: capacity, 本次最多淘汰的条目数
+# 返回: 被移出使用记录的成员，由调用方删除对应的缓存键
+_EVICT_LUA = """
+local overflow = redis.call('ZCARD', KEYS[1]) - tonumber(ARGV[1])
+if overflow <= 0 then
+    return {}
+end
+local popped = redis.call('ZPOPMIN', KEYS[1], math.min(overflow, tonumber(ARGV[2])))
+local members = {}
+for i = 1, #popped, 2 do
+    members[#members + 1] = popped[i]
+end
+return members
+"""
+
+
+NEAR_CACHE_CHANNEL = "near_cache:invalidate"
+_MISSING = object()
+
+
+class NearCacheInvalidator:
+    """
+    通过 Redis pub/sub 在各进程间同步本地缓存的失效
+
+    监听线程在首次使用本地缓存时启动；未订阅成功（或连接断开）期间本地缓存不生效，
+    重新订阅后清空所有本地缓存，避免使用断线期间错过失效通知的数据。
+    """
+
+    def __init__(self, channel: str = NEAR_CACHE_CHANNEL):
+        self.channel = channel
+        self.subscribed = False
+        self._caches: dict[str, "NearCache"] = {}
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        # 发布与订阅共用连接池，订阅占用池中的一个独立连接
+        self.redis_client = Redis(db=0).get_connection()
+
+    def register(self, cache: "NearCache"):
+        self._caches[cache.namespace] = cache
+
+    def ensure_started(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(
+                        target=self._listen, name="near-cache-invalidator", daemon=True
+                    )
+                    self._thread.start()
+
+    def publish(self, namespace: str, keys: Optional[list] = None):
+        """通知所有进程使缓存失效，keys 为 None 时清空整个命名空间"""
+        message = json.dumps({"namespace": namespace, "keys": keys}, ensure_ascii=False)
+        try:
+            self.redis_client.publish(self.channel, message)
+        except Exception as e:
+            logger.error(f"发布缓存失效通知失败: {namespace}, error: {e}")
+
+    def _invalidate_all(self):
+        for cache in self._caches.values():
+            cache.invalidate()
+
+    def _listen(self):
+        while True:
+            pubsub = self.redis_client.pubsub(ignore_subscribe_messages=True)
+            try:
+                pubsub.subscribe(self.channel)
+                self._invalidate_all()
+                self.subscribed = True
+                for message in pubsub.listen():
+                    data = json.loads(message["data"])
+                    cache = self._caches.get(data.get("namespace"))
+                    if cache is not None:
+                        cache.invalidate(data.get("keys"))
+            except Exception as e:
+                logger.warning(f"缓存失效通知订阅中断，5 秒后重连: {e}")
+            finally:
+                # 归还连接，避免重连时在共用的连接池中累积断开的连接
+                pubsub.close()
+            self.subscribed = False
+            self._invalidate_all()
+            time.sleep(5)
+
+
+near_cache_invalidator = NearCacheInvalidator()
+
+
+class NearCache:
+    """
+    RedisCache 前的进程内 LRU 缓存，条目在 ttl 秒后过期，
+    写入方通过 near_cache_invalidator 通知所有进程立即失效
+    """
+
+    def __init__(self, namespace: str, maxsize: int, ttl: int):
+        self.namespace = namespace
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        # 每次失效后递增，防止把失效前读到的旧值写回缓存
+        self._generation = 0
+        near_cache_invalidator.register(self)
+
+    def get(self, key: str):
+        """返回 (命中的值或 _MISSING, 当前代数)"""
+        near_cache_invalidator.ensure_started()
+        with self._lock:
+            generation = self._generation
+            if not near_cache_invalidator.subscribed:
+                return _MISSING, generation
+            item = self._data.get(key)
+            if item is None or item[0] < time.monotonic():
+                return _MISSING, generation
+            self._data.move_to_end(key)
+            return item[1], generation
+
+    def set(self, key: str, value, generation: int):
+        with self._lock:
+            if generation != self._generation:
+                return
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self, keys: Optional[list] = None):
+        with self._lock:
+            self._generation += 1
+            if keys is None:
+                self._data.clear()
+            else:
+                for key in keys:
+                    self._data.pop(key, None)
+
 
 class RedisCache:
     def __init__(
@@ -14,6 +254,9 @@ class RedisCache:
         ttl_seconds: int = None,
         cache_key_prefix: str = "cache:",
         cache_usage_track: bool = False,
+        hash_namespace: bool = False,
+        near_cache_ttl: int = 0,
+        near_cache_size: int = 256,
     ):
         """
         初始化基于Redis的缓存
@@ -21,7 +264,15 @@ class RedisCache:
         Args:
             capacity: 缓存容量
             ttl_seconds: 缓存条目的存活时间（秒）
+            hash_namespace: 为 True 时整个命名空间保存在一个 HASH 中
+                （键名为去掉末尾冒号的前缀），读取全部或清空只需一条命令，
+                但不支持 TTL 及容量淘汰
+            near_cache_ttl: 大于 0 时在进程内缓存 get 的结果（秒），
+                适用于读多写少的配置，写入时通过 pub/sub 通知各进程失效
+            near_cache_size: 进程内缓存的最大条目数
         """
+        if hash_namespace and (ttl_seconds or capacity or cache_usage_track):
+            raise ValueError("HASH 存储的缓存不支持 TTL 及容量淘汰")
         self.capacity = capacity
         self.ttl_seconds = ttl_seconds
         self.redis_client = Redis(db=db).get_connection()
@@ -31,6 +282,19 @@ class RedisCache:
             if cache_usage_track
             else None
         )
+        self._put_many_script = self.redis_client.register_script(_PUT_MANY_LUA)
+        self._evict_script = self.redis_client.register_script(_EVICT_LUA)
+        self._hash_key = cache_key_prefix.removesuffix(":") if hash_namespace else None
+        self._near_cache = (
+            NearCache(f"{db}:{cache_key_prefix}", near_cache_size, near_cache_ttl)
+            if near_cache_ttl
+            else None
+        )
+
+    def _invalidate_near_cache(self, keys: Optional[list] = None):
+        if self._near_cache is not None:
+            self._near_cache.invalidate(keys)
+            near_cache_invalidator.publish(self._near_cache.namespace, keys)
 
     def _get_cache_key(self, key: str) -> str:
         """获取缓存键的完整Redis键名"""
@@ -40,13 +304,7 @@ class RedisCache:
         """
         获取所有缓存值
         """
-        values = []
-        pipeline = self.redis_client.pipeline()
-        for key in self.redis_client.scan_iter(match=f"{self._cache_key_prefix}*"):
-            pipeline.get(key)
-        results = pipeline.execute()
-        values = [val for val in results if val is not None]
-        return values
+        return list(self.get_all_key_values().values())
 
     def get_all_key_values(self) -> dict:
         """
@@ -55,21 +313,27 @@ class RedisCache:
         Returns:
             包含所有缓存键值对的字典
         """
-        key_values = {}
-        pipeline = self.redis_client.pipeline()
-        for key in self.redis_client.scan_iter(match=f"{self._cache_key_prefix}*"):
-            pipeline.get(key)
-        results = pipeline.execute()
-
-        for key, value in zip(
-            self.redis_client.scan_iter(match=f"{self._cache_key_prefix}*"), results
-        ):
-            if value is not None:
-                key_values[key.removeprefix(self._cache_key_prefix)] = value.decode(
-                    "utf-8"
-                )
+        if self._hash_key:
+            return self.redis_client.hgetall(self._hash_key)
 
-        return key_values
+        keys = list(self.redis_client.scan_iter(match=f"{self._cache_key_prefix}*"))
+        if not keys:
+            return {}
+        return {
+            key.removeprefix(self._cache_key_prefix): value
+            for key, value in zip(keys, self.redis_client.mget(keys))
+            if value is not None
+        }
+
+    def _touch(self, pipeline, keys):
+        """在管道中更新访问时间并重置过期时间"""
+        if self._cache_usage_key:
+            now = time.time()
+            # 只更新已有的使用记录，避免为未命中的键添加记录
+            pipeline.zadd(self._cache_usage_key, {key: now for key in keys}, xx=True)
+        if self.ttl_seconds:
+            for key in keys:
+                pipeline.expire(self._get_cache_key(key), self.ttl_seconds)
 
     def get(self, key: str) -> Optional[str]:
         """
@@ -81,19 +345,52 @@ class RedisCache:
         Returns:
             缓存的值，如果不存在或已过期则返回 None
         """
+        if self._near_cache is not None:
+            value, generation = self._near_cache.get(key)
+            if value is not _MISSING:
+                return value
+            value = self._get(key)
+            self._near_cache.set(key, value, generation)
+            return value
+        return self._get(key)
+
+    def _get(self, key: str) -> Optional[str]:
+        if self._hash_key:
+            return self.redis_client.hget(self._hash_key, key)
+
         cache_key = self._get_cache_key(key)
-        value = self.redis_client.get(cache_key)
+        if not (self._cache_usage_key or self.ttl_seconds):
+            return self.redis_client.get(cache_key)
 
-        if value is not None:
-            # 更新访问时间
-            pipeline = self.redis_client.pipeline()
-            if self._cache_usage_key:
-                pipeline.zadd(self._cache_usage_key, {key: time.time()})
-            if self.ttl_seconds:
-                pipeline.expire(cache_key, self.ttl_seconds)  # 重置过期时间
-            pipeline.execute()
+        # 读取与更新访问时间在同一次往返中完成
+        pipeline = self.redis_client.pipeline(transaction=False)
+        pipeline.get(cache_key)
+        self._touch(pipeline, [key])
+        return pipeline.execute()[0]
 
-        return value
+    def get_many(self, keys) -> dict:
+        """
+        批量获取缓存值（单次往返）
+
+        Args:
+            keys: 缓存键列表
+
+        Returns:
+            命中的键值对字典，未命中的键不包含在结果中
+        """
+        keys = list(dict.fromkeys(keys))
+        if not keys:
+            return {}
+
+        if self._hash_key:
+            values = self.redis_client.hmget(self._hash_key, keys)
+            return {key: value for key, value in zip(keys, values) if value is not None}
+
+        pipeline = self.redis_client.pipeline(transaction=False)
+        pipeline.mget([self._get_cache_key(key) for key in keys])
+        self._touch(pipeline, keys)
+        values = pipeline.execute()[0]
+        return {key: value for key, value in zip(keys, values) if value is not None}
 
     def put(self, key: str, value: str):
         """
@@ -103,54 +400,140 @@ class RedisCache:
             key: 缓存键
             value: 缓存值
         """
+        if self.put_many({key: value}) is not None:
+            logger.debug(f"Added key to cache: {key}")
+
+    def put_many(self, items: dict, skip_unchanged: bool = False) -> Optional[int]:
+        """
+        批量添加或更新缓存条目，写入及使用记录在 Redis 端的 Lua 脚本中完成，
+        每批一次往返；超出容量时再分批淘汰最久未使用的条目
+
+        Args:
+            items: {缓存键: 缓存值}
+            skip_unchanged: 为 True 时跳过与已缓存值相同的条目（仍会重置过期时间）
+
+        Returns:
+            实际写入的条目数，失败返回 None
+        """
+        if not items:
+            return 0
         try:
-            # 检查容量并清理过期项
-            if self.capacity > 0 and self._cache_usage_key:
-                current_size = self.redis_client.zcard(self._cache_usage_key)
-                if current_size >= self.capacity:
-                    # 获取最旧的项并删除
-                    oldest_items = self.redis_client.zrange(
-                        self._cache_usage_key, 0, current_size - self.capacity
-                    )
-                    if oldest_items:
-                        pipeline = self.redis_client.pipeline()
-                        for old_key in oldest_items:
-                            pipeline.delete(self._get_cache_key(old_key))
-                            pipeline.zrem(self._cache_usage_key, old_key)
-                        pipeline.execute()
-
-            # 添加新项
-            cache_key = self._get_cache_key(key)
-            pipeline = self.redis_client.pipeline()
-            pipeline.set(cache_key, value, ex=self.ttl_seconds)
-            if self._cache_usage_key:
-                pipeline.zadd(self._cache_usage_key, {key: time.time()})
-            pipeline.execute()
+            if self._hash_key:
+                return self._hash_put_many(items, skip_unchanged)
+            return self._put_many(items, skip_unchanged)
+        finally:
+            self._invalidate_near_cache([str(key) for key in items])
+
+    def _put_many(self, items: dict, skip_unchanged: bool) -> Optional[int]:
+        written = 0
+        try:
+            items = list(items.items())
+            usage_keys = [self._cache_usage_key] if self._cache_usage_key else []
+            overflow = 0
+            for i in range(0, len(items), PUT_MANY_BATCH_SIZE):
+                batch = items[i : i + PUT_MANY_BATCH_SIZE]
+                args = [
+                    self.ttl_seconds or 0,
+                    int(skip_unchanged),
+                    int(bool(usage_keys)),
+                    self.capacity if usage_keys else 0,
+                    time.time(),
+                ]
+                for key, value in batch:
+                    args.extend((key, value))
+                batch_written, overflow = self._put_many_script(
+                    keys=usage_keys + [self._get_cache_key(key) for key, _ in batch],
+                    args=args,
+                )
+                written += batch_written
+            if overflow:
+                self._evict()
+            return written
+        except Exception as e:
+            logger.error(f"Failed to add {len(items)} keys to cache, error: {e}")
+            logger.exception(traceback.format_exc())
+            return None
+
+    def _evict(self):
+        """超出容量时分批淘汰最久未使用的条目"""
+        while True:
+            members = self._evict_script(
+                keys=[self._cache_usage_key], args=[self.capacity, EVICT_BATCH_SIZE]
+            )
+            if members:
+                self.redis_client.delete(
+                    *[self._get_cache_key(member) for member in members]
+                )
+            if len(members) < EVICT_BATCH_SIZE:
+                break
 
-            logger.debug(f"Added key to cache: {key}")
+    def _hash_put_many(self, items: dict, skip_unchanged: bool) -> Optional[int]:
+        try:
+            if skip_unchanged:
+                keys = list(items)
+                current = self.redis_client.hmget(self._hash_key, keys)
+                # HASH 中的值均为字符串
+                items = {
+                    key: items[key]
+                    for key, value in zip(keys, current)
+                    if value != str(items[key])
+                }
+                if not items:
+                    return 0
+            self.redis_client.hset(self._hash_key, mapping=items)
+            return len(items)
         except Exception as e:
-            logger.error(f"Failed to add key to cache: {key}, error: {e}")
+            logger.error(f"Failed to add {len(items)} keys to cache, error: {e}")
             logger.exception(traceback.format_exc())
+            return None
 
     def delete(self, key: str):
         """删除缓存条目"""
-        cache_key = self._get_cache_key(key)
-
-        if self.redis_client.exists(cache_key):
-            pipeline = self.redis_client.pipeline()
-            pipeline.delete(cache_key)
-
-            if self._cache_usage_key:
-                pipeline.zrem(self._cache_usage_key, key)
-
-            pipeline.execute()
-
+        if self.delete_many([key]):
             logger.info(f"Deleted key from cache: {key}")
         else:
             logger.info(f"Key not found in cache: {key}")
 
+    def delete_many(self, keys) -> int:
+        """
+        批量删除缓存条目（单次往返）
+
+        Returns:
+            删除的条目数
+        """
+        keys = list(dict.fromkeys(keys))
+        if not keys:
+            return 0
+        try:
+            return self._delete_many(keys)
+        finally:
+            self._invalidate_near_cache(keys)
+
+    def _delete_many(self, keys: list) -> int:
+        if self._hash_key:
+            return self.redis_client.hdel(self._hash_key, *keys)
+        pipeline = self.redis_client.pipeline(transaction=False)
+        pipeline.delete(*[self._get_cache_key(key) for key in keys])
+        if self._cache_usage_key:
+            pipeline.zrem(self._cache_usage_key, *keys)
+        return pipeline.execute()[0]
+
     def clear(self):
         """清空缓存"""
+        try:
+            self._clear()
+        finally:
+            self._invalidate_near_cache()
+        logger.info("Cache cleared")
+
+    def _clear(self):
+        if self._hash_key:
+            self.redis_client.delete(self._hash_key)
+            return
+        if not self._cache_key_prefix:
+            # 前缀为空时会匹配并删除整个数据库的键
+            raise ValueError("未设置前缀的缓存不能清空")
+
         # 获取所有缓存键
         keys_pattern = f"{self._cache_key_prefix}*"
 
@@ -163,8 +546,6 @@ class RedisCache:
             pipeline.delete(self._cache_usage_key)
         pipeline.execute()
 
-        logger.info("Cache cleared")
-
     def get_stats(self) -> dict:
         """
         获取缓存统计信息
@@ -172,6 +553,14 @@ class RedisCache:
         Returns:
             包含缓存统计信息的字典
         """
+        if self._hash_key:
+            size = self.redis_client.hlen(self._hash_key)
+            return {
+                "total_entries": size,
+                "active_entries": size,
+                "capacity": self.capacity,
+            }
+
         # 获取未过期的键数量
         active_keys = sum(
             1 for _ in self.redis_client.scan_iter(match=f"{self._cache_key_prefix}*")
@@ -189,6 +578,36 @@ class RedisCache:
             "capacity": self.capacity,
         }
 
+    def migrate_to_hash(self) -> int:
+        """
+        将旧的按前缀存储的键迁移到 HASH 中并删除旧键，HASH 中已有的值优先
+
+        Returns:
+            迁移的条目数
+        """
+        if not self._hash_key:
+            return 0
+        keys = list(self.redis_client.scan_iter(match=f"{self._cache_key_prefix}*"))
+        if not keys:
+            return 0
+        migrated = 0
+        for i in range(0, len(keys), PUT_MANY_BATCH_SIZE):
+            batch = keys[i : i + PUT_MANY_BATCH_SIZE]
+            values = self.redis_client.mget(batch)
+            pipeline = self.redis_client.pipeline()
+            for key, value in zip(batch, values):
+                if value is not None:
+                    pipeline.hsetnx(
+                        self._hash_key, key.removeprefix(self._cache_key_prefix), value
+                    )
+                    migrated += 1
+            pipeline.delete(*batch)
+            pipeline.execute()
+        logger.info(
+            f"已将 {migrated} 个 {self._cache_key_prefix}* 键迁移到 {self._hash_key}"
+        )
+        return migrated
+
 
 # Emby Line Cache
 emby_user_defined_line_cache = RedisCache(
@@ -212,6 +631,7 @@ free_premium_lines_cache = RedisCache(
     db=2,
     cache_key_prefix="emby_free_premium_lines:",
     ttl_seconds=None,  # 持久化存储
+    near_cache_ttl=60,
 )
 
 # 线路标签管理
@@ -219,6 +639,8 @@ line_tags_cache = RedisCache(
     db=2,
     cache_key_prefix="emby_line_tags:",
     ttl_seconds=None,  # 持久化存储标签数据
+    hash_namespace=True,
+    near_cache_ttl=60,
 )
 
 
@@ -241,11 +663,157 @@ def get_line_tags(line_name: str) -> list[str]:
         return []
 
 
+# 用户每日流量计数，key: {service}:{username}:{YYYY-MM-DD}，
+# 入库时按批次 HINCRBY 累加，定时以数据库快照校准
+user_daily_traffic_cache = RedisCache(
+    db=0,
+    cache_key_prefix="traffic:",
+    ttl_seconds=3 * 24 * 3600,
+)
+_incr_user_daily_traffic_script = user_daily_traffic_cache.redis_client.register_script(
+    _INCR_USER_DAILY_TRAFFIC_LUA
+)
+_reconcile_user_daily_traffic_script = (
+    user_daily_traffic_cache.redis_client.register_script(
+        _RECONCILE_USER_DAILY_TRAFFIC_LUA
+    )
+)
+
+
+def _run_user_daily_traffic_script(script, seq: int, counters: dict) -> int:
+    """分批执行计数脚本，counters: {(service, username, date): (total, premium)}"""
+    cache = user_daily_traffic_cache
+    items = list(counters.items())
+    result = 0
+    for i in range(0, len(items), PUT_MANY_BATCH_SIZE):
+        batch = items[i : i + PUT_MANY_BATCH_SIZE]
+        keys = [
+            cache._get_cache_key(f"{service}:{username.lower()}:{date}")
+            for (service, username, date), _ in batch
+        ]
+        args = [seq, cache.ttl_seconds]
+        for _, (total, premium) in batch:
+            args.extend((total, premium))
+        result += script(keys=keys, args=args)
+    return result
+
+
+def incr_user_daily_traffic(seq: int, entries: list[tuple]):
+    """
+    按已写入数据库的一批流量记录累加用户每日流量计数
+
+    每个计数键一次 HINCRBY，并记录该批次的增量：批次号不大于最近一次校准快照的
+    批次已包含在快照中，不再累加；同一批次重复累加时也会被忽略
+
+    Args:
+        seq: 本批记录的批次号，见 DB.create_line_traffic_entries
+        entries: (line, send_bytes, service, username, user_id, timestamp) 元组列表
+    """
+    from app.config import settings
+
+    counters = {}
+    for line, send_bytes, service, username, _, timestamp in entries:
+        if not timestamp:
+            continue
+        key = (service, username.lower(), timestamp[:10])
+        total, premium = counters.get(key, (0, 0))
+        if line in settings.PREMIUM_STREAM_BACKEND:
+            premium += send_bytes
+        counters[key] = (total + send_bytes, premium)
+    _run_user_daily_traffic_script(_incr_user_daily_traffic_script, seq, counters)
+
+
+def invalidate_user_daily_traffic(dates):
+    """取消指定日期的校准标记，下次校准前读取计数时回退到数据库查询"""
+    cache = user_daily_traffic_cache
+    cache.redis_client.delete(
+        *[cache._get_cache_key(f"reconciled:{date}") for date in dates]
+    )
+
+
+def set_user_daily_traffic(date: str, seq: int, counters: dict) -> int:
+    """
+    用数据库快照校准指定日期的用户流量计数，并标记该日期已校准
+
+    计数设为快照值加上快照之后提交的批次的增量，与入库时的累加并发执行也不会
+    丢失或重复统计；快照批次号小于计数中已有的快照时不覆盖
+
+    Args:
+        date: 日期，格式 YYYY-MM-DD
+        seq: 快照对应的批次号，见 DB.get_daily_traffic_snapshot
+        counters: {(service, username): (total, premium)}
+
+    Returns:
+        实际更新的计数数量
+    """
+    cache = user_daily_traffic_cache
+    written = _run_user_daily_traffic_script(
+        _reconcile_user_daily_traffic_script,
+        seq,
+        {
+            (service, username, date): value
+            for (service, username), value in counters.items()
+        },
+    )
+    # 校准后，没有计数的用户当日流量即为 0
+    cache.redis_client.set(
+        cache._get_cache_key(f"reconciled:{date}"), 1, ex=cache.ttl_seconds
+    )
+    return written
+
+
+def get_cached_user_daily_traffic(
+    service: str, username: str, date: str
+) -> Optional[dict]:
+    """
+    从 Redis 获取用户指定日期的流量计数
+
+    Returns:
+        {"total": int, "premium": int}，该日期尚未校准时返回 None（需回退到数据库查询）
+    """
+    cache = user_daily_traffic_cache
+    pipeline = cache.redis_client.pipeline(transaction=False)
+    pipeline.hmget(
+        cache._get_cache_key(f"{service}:{username.lower()}:{date}"),
+        "total",
+        "premium",
+    )
+    pipeline.exists(cache._get_cache_key(f"reconciled:{date}"))
+    (total, premium), reconciled = pipeline.execute()
+    # 未校准的日期计数可能不完整（如刚上线或 Redis 数据丢失），不可信
+    if not reconciled:
+        return None
+    return {"total": int(total or 0), "premium": int(premium or 0)}
+
+
+def get_cached_daily_premium_traffic(
+    service: str, usernames: list, date: str
+) -> Optional[dict]:
+    """
+    从 Redis 批量获取用户指定日期的 premium 线路流量
+
+    Returns:
+        {小写用户名: premium 流量}，该日期尚未校准时返回 None（需回退到数据库查询）
+    """
+    cache = user_daily_traffic_cache
+    usernames = sorted({username.lower() for username in usernames if username})
+    pipeline = cache.redis_client.pipeline(transaction=False)
+    pipeline.exists(cache._get_cache_key(f"reconciled:{date}"))
+    for username in usernames:
+        pipeline.hget(cache._get_cache_key(f"{service}:{username}:{date}"), "premium")
+    reconciled, *values = pipeline.execute()
+    if not reconciled:
+        return None
+    return {username: int(value or 0) for username, value in zip(usernames, values)}
+
+
 # 幸运大转盘缓存
 lucky_wheel_config_cache = RedisCache(
     db=0,
     cache_key_prefix="luckywheel:",
     ttl_seconds=None,  # 持久化存储配置数据
+    hash_namespace=True,
+    near_cache_ttl=60,
 )
 
 # nginx stream url-based traffic
@@ -278,3 +846,12 @@ user_info_cache = RedisCache(
     db=2,
     cache_key_prefix="user_info:",
 )
+
+
+def migrate_cache_namespaces():
+    """将使用 HASH 存储的缓存中遗留的旧格式键迁移到 HASH（启动时执行）"""
+    for cache in (line_tags_cache, lucky_wheel_config_cache):
+        try:
+            cache.migrate_to_hash()
+        except Exception as e:
+            logger.error(f"迁移缓存 {cache._hash_key} 失败: {e}")
@@ -50,9 +50,14 @@ class Settings(BaseSettings):
 
     # TG
     TG_API_TOKEN: str = ""
+    TG_API_BASE_URL: str = "https://api.telegram.org"  # 可改为自建的 Bot API 服务
     TG_ADMIN_CHAT_ID: list[str] = []
     TG_GROUP: str = ""
     TG_CHANNEL: str = ""  # 可选的通知频道链接，如果不设置将使用群组链接
+    TG_API_RATE_LIMIT: float = 25  # 调用 Telegram Bot API 的每秒最大请求数
+    TG_REFRESH_CONCURRENCY: int = 8  # 刷新用户信息时的并发数
+    TG_NOTIFY_RATE_LIMIT: float = 25  # 发送通知消息的全局每秒最大条数
+    TG_NOTIFY_CONCURRENCY: int = 8  # 同时发送的通知消息数
 
     # WebApp
     WEBAPP_ENABLE: bool = True  # 是否启用 WebApp
@@ -65,6 +70,9 @@ class Settings(BaseSettings):
         else "/app/webapp-frontend/dist"
     )  # WebApp 前端静态文件目录
     SESSION_SECRET_KEY: str = ""  # 用于会话加密的密钥
+    WEBAPP_RESPONSE_CACHE: str = "redis"  # 接口响应缓存后端：redis / local / none
+    WEBAPP_INIT_DATA_MAX_AGE: int = 86400  # initData 有效期（秒），0 为不限制
+    WEBAPP_METRICS_TOKEN: str = ""  # /metrics 的 Bearer token，为空时不开放该接口
 
     # tautulli
     TAUTULLI_URL: str = ""
@@ -80,17 +88,29 @@ class Settings(BaseSettings):
     EMBY_ADMIN_USER: str = ""
     EMBY_USER_TEMPLATE: str = ""
     EMBY_USER_IS_HIDDEN: bool = True  # 新用户是否在登录界面隐藏
+    EMBY_API_CONCURRENCY: int = 8  # 批量调用 Emby API 时的最大并发请求数
 
     # 后端线路
     STREAM_BACKEND: list[str] = []
     PREMIUM_STREAM_BACKEND: list[str] = []
     PREMIUM_FREE: bool = False
 
+    # 数据库
+    DB_POOL_SIZE: int = 8  # 连接池中保留的空闲连接数
+    DB_BUSY_TIMEOUT: int = 10  # 数据库被锁定时的最长等待时间（秒）
+    DB_PROFILE: bool = False  # 是否统计每条 SQL 的耗时（慢查询分析）
+    DB_SLOW_QUERY_MS: int = 100  # 慢查询阈值（毫秒），超过时记录查询计划
+    DB_LARGE_TABLE_ROWS: int = 10000  # 超过该行数的表被全表扫描时告警
+
     # redis
     REDIS_HOST: str = "localhost"
     REDIS_PORT: int = 6379
     REDIS_PASSWORD: str = ""
     REDIS_LINE_TRAFFIC_STATS_HANDLE_SIZE: int = 1000  # Redis 流量统计单次处理条数
+    TRAFFIC_CONSUMER_ENABLE: bool = (
+        False  # 使用常驻消费者代替每分钟定时任务处理流量日志
+    )
+    TRAFFIC_CONSUMER_CONCURRENCY: int = 2  # 常驻消费者同时处理的批次数
 
     # redeem code
     PRIVILEGED_CODES: list[str] = []
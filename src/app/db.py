@@ -1,22 +1,151 @@
 #!/usr/bin/env python3
 
+import asyncio
 import sqlite3
+import threading
 import time
 import traceback
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
+from functools import partial
 from typing import List, Optional
 
 from app.config import settings
+from app.db_profiler import ProfilingConnection
+from app.leaderboard import (
+    credits_leaderboard,
+    donation_leaderboard,
+    emby_watched_time_leaderboard,
+    plex_watched_time_leaderboard,
+)
 from app.log import logger
-
-
+from app.metrics import db_query_duration_seconds, timed_methods
+
+# 积分结算涉及的表及字段: (表名, 账户 ID, 用户名, 账户积分, 观看时长)
+SETTLEMENT_COLUMNS = {
+    "plex": ("user", "plex_id", "plex_username", "credits", "watched_time"),
+    "emby": (
+        "emby_user",
+        "emby_id",
+        "emby_username",
+        "emby_credits",
+        "emby_watched_time",
+    ),
+}
+
+# 流量汇总表及其 bucket 长度（ISO 时间戳截取的前缀长度）
+TRAFFIC_ROLLUP_TABLES = (
+    ("line_traffic_minute_stats", 16),
+    ("line_traffic_hourly_stats", 13),
+    ("line_traffic_daily_stats", 10),
+)
+
+# 流量记录批次号，每次写入流量记录时在同一事务中加一
+TRAFFIC_BATCH_SEQUENCE = "line_traffic_batch"
+
+
+class ConnectionPool:
+    """
+    SQLite 连接池
+
+    每个 DB 实例独占一个连接，close() 时归还；连接统一开启 WAL 和 busy_timeout，
+    读写可以并发进行，写入冲突时等待而不是直接报 "database is locked"。
+    """
+
+    # 连接级别的性能参数
+    PRAGMAS = (
+        "PRAGMA synchronous = NORMAL",
+        "PRAGMA cache_size = -16000",  # 16 MB
+        "PRAGMA mmap_size = 268435456",  # 256 MB
+        "PRAGMA temp_store = MEMORY",
+    )
+
+    def __init__(self, path, size: int = settings.DB_POOL_SIZE):
+        self.path = path
+        self.size = size
+        self._idle: list[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+        self._schema_ready = False
+
+    def _connect(self) -> sqlite3.Connection:
+        con = sqlite3.connect(
+            self.path,
+            timeout=settings.DB_BUSY_TIMEOUT,  # busy_timeout
+            check_same_thread=False,  # 连接会在线程间复用，但同一时间只归一个 DB 实例使用
+            factory=ProfilingConnection if settings.DB_PROFILE else sqlite3.Connection,
+        )
+        for pragma in self.PRAGMAS:
+            con.execute(pragma)
+        return con
+
+    def acquire(self) -> sqlite3.Connection:
+        """取出一个空闲连接，没有则新建"""
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+        return self._connect()
+
+    def release(self, con: sqlite3.Connection):
+        """归还连接，未提交的事务会被回滚（与关闭连接的行为一致）"""
+        try:
+            if con.in_transaction:
+                con.rollback()
+        except sqlite3.Error:
+            con.close()
+            return
+        with self._lock:
+            if len(self._idle) < self.size:
+                self._idle.append(con)
+                return
+        con.close()
+
+    def init_schema(self, db: "DB"):
+        """每个数据库文件只在首次使用时建表和迁移"""
+        if self._schema_ready:
+            return
+        with self._lock:
+            if self._schema_ready:
+                return
+            # WAL 模式是持久化的，只需设置一次
+            db.cur.execute("PRAGMA journal_mode = WAL")
+            db.create_table()
+            self._schema_ready = True
+
+    def close_all(self):
+        """关闭所有空闲连接"""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for con in idle:
+            con.close()
+
+
+_pools: dict[str, ConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(db=settings.DATA_PATH / "data.db") -> ConnectionPool:
+    """获取数据库文件对应的连接池"""
+    key = str(db)
+    with _pools_lock:
+        if key not in _pools:
+            _pools[key] = ConnectionPool(key)
+        return _pools[key]
+
+
+def init_db(db=settings.DATA_PATH / "data.db"):
+    """启动时初始化数据库（建表、迁移、开启 WAL）"""
+    DB(db).close()
+
+
+@timed_methods(db_query_duration_seconds, exclude=("close",))
 class DB:
     """class DB"""
 
     def __init__(self, db=settings.DATA_PATH / "data.db"):
-        self.con = sqlite3.connect(db)
+        self._pool = get_pool(db)
+        self.con = self._pool.acquire()
         self.cur = self.con.cursor()
-        self.create_table()
+        self._pool.init_schema(self)
 
     def create_table(self):
         self.cur.executescript(
@@ -108,9 +237,7 @@ class DB:
 
             -- 索引优化：为 line_traffic_stats 表添加关键索引（当月数据）
             CREATE INDEX IF NOT EXISTS idx_line_traffic_timestamp ON line_traffic_stats(timestamp);
-            CREATE INDEX IF NOT EXISTS idx_line_traffic_service_user_time ON line_traffic_stats(service, username, timestamp);
             CREATE INDEX IF NOT EXISTS idx_line_traffic_line_time ON line_traffic_stats(line, timestamp);
-            CREATE INDEX IF NOT EXISTS idx_line_traffic_daily_query ON line_traffic_stats(service, username, date(timestamp));
             CREATE INDEX IF NOT EXISTS idx_line_traffic_line_stats ON line_traffic_stats(line, timestamp, send_bytes);
             -- 添加月份索引，用于快速识别和处理当月数据
             CREATE INDEX IF NOT EXISTS idx_line_traffic_month ON line_traffic_stats(date(timestamp, 'start of month'));
@@ -120,9 +247,86 @@ class DB:
             CREATE INDEX IF NOT EXISTS idx_monthly_traffic_line_month ON line_traffic_monthly_stats(line, year_month);
             CREATE INDEX IF NOT EXISTS idx_monthly_traffic_month ON line_traffic_monthly_stats(year_month);
             CREATE INDEX IF NOT EXISTS idx_monthly_traffic_line_stats ON line_traffic_monthly_stats(line, year_month, total_bytes);
+
+            -- 流量汇总表（分钟/小时/天），写入流量记录时同步更新
+            -- bucket 为北京时间: 分钟 'YYYY-MM-DDTHH:MM'，小时 'YYYY-MM-DDTHH'，天 'YYYY-MM-DD'
+            CREATE TABLE IF NOT EXISTS line_traffic_minute_stats(
+                bucket TEXT NOT NULL,
+                line TEXT NOT NULL,
+                service TEXT NOT NULL,
+                username TEXT NOT NULL,
+                user_id TEXT DEFAULT NULL,
+                total_bytes INTEGER NOT NULL,
+                record_count INTEGER NOT NULL,
+                PRIMARY KEY (bucket, line, service, username)
+            );
+
+            CREATE TABLE IF NOT EXISTS line_traffic_hourly_stats(
+                bucket TEXT NOT NULL,
+                line TEXT NOT NULL,
+                service TEXT NOT NULL,
+                username TEXT NOT NULL,
+                user_id TEXT DEFAULT NULL,
+                total_bytes INTEGER NOT NULL,
+                record_count INTEGER NOT NULL,
+                PRIMARY KEY (bucket, line, service, username)
+            );
+
+            CREATE TABLE IF NOT EXISTS line_traffic_daily_stats(
+                bucket TEXT NOT NULL,
+                line TEXT NOT NULL,
+                service TEXT NOT NULL,
+                username TEXT NOT NULL,
+                user_id TEXT DEFAULT NULL,
+                total_bytes INTEGER NOT NULL,
+                record_count INTEGER NOT NULL,
+                PRIMARY KEY (bucket, line, service, username)
+            );
+
+            CREATE INDEX IF NOT EXISTS idx_daily_traffic_line_bucket ON line_traffic_daily_stats(line, bucket);
+
+            -- 单调递增的序号，不随数据清理回退
+            CREATE TABLE IF NOT EXISTS sequences(
+                name TEXT PRIMARY KEY,
+                value INTEGER NOT NULL
+            );
             """
         )
         self.con.commit()
+        self._migrate()
+
+    def _migrate(self):
+        """按 PRAGMA user_version 依次执行数据迁移"""
+        version = self.cur.execute("PRAGMA user_version").fetchone()[0]
+        if version < 1:
+            # 根据现有的原始流量数据生成汇总表
+            self.rebuild_traffic_rollups()
+            self.cur.execute("PRAGMA user_version = 1")
+            self.con.commit()
+        if version < 2:
+            # 用户名按小写匹配，改用表达式索引（建索引时即完成已有数据的回填）
+            self.create_username_indexes()
+            self.cur.execute("PRAGMA user_version = 2")
+            self.con.commit()
+
+    def create_username_indexes(self):
+        """创建按小写用户名/邮箱查询的表达式索引，并删除不再使用的区分大小写的索引
+
+        查询条件需与索引表达式一致（如 LOWER(username) = ?）才能命中索引
+        """
+        self.cur.executescript(
+            """
+            DROP INDEX IF EXISTS idx_line_traffic_service_user_time;
+            DROP INDEX IF EXISTS idx_line_traffic_daily_query;
+            DROP INDEX IF EXISTS idx_daily_traffic_service_user_bucket;
+
+            CREATE INDEX IF NOT EXISTS idx_user_plex_username_lower ON user(LOWER(plex_username));
+            CREATE INDEX IF NOT EXISTS idx_user_plex_email_lower ON user(LOWER(plex_email));
+            CREATE INDEX IF NOT EXISTS idx_emby_user_username_lower ON emby_user(LOWER(emby_username));
+            CREATE INDEX IF NOT EXISTS idx_line_traffic_service_username_lower_time ON line_traffic_stats(service, LOWER(username), timestamp);
+            CREATE INDEX IF NOT EXISTS idx_daily_traffic_service_username_lower_bucket ON line_traffic_daily_stats(service, LOWER(username), bucket);
+            """
+        )
 
     def add_plex_user(
         self,
@@ -160,6 +364,7 @@ class DB:
             return False
         else:
             self.con.commit()
+            plex_watched_time_leaderboard.update({plex_id: watched_time})
         return True
 
     def add_emby_user(
@@ -196,6 +401,7 @@ class DB:
             return False
         else:
             self.con.commit()
+            emby_watched_time_leaderboard.update({emby_id: emby_watched_time})
         return True
 
     def add_overseerr_user(self, user_id: int, user_email: str, tg_id: int):
@@ -221,6 +427,8 @@ class DB:
             return False
         else:
             self.con.commit()
+            credits_leaderboard.update({tg_id: credits})
+            donation_leaderboard.update({tg_id: donation})
         return True
 
     def update_user_tg_id(self, tg_id, plex_id=None, emby_id=None):
@@ -283,6 +491,8 @@ class DB:
             return False
         else:
             self.con.commit()
+            if tg_id:
+                credits_leaderboard.update({tg_id: credits})
         return True
 
     def get_user_credits(self, tg_id):
@@ -310,6 +520,7 @@ class DB:
             return False
         else:
             self.con.commit()
+            donation_leaderboard.update({tg_id: donation})
         return True
 
     def update_invitation_status(self, code, used_by):
@@ -450,6 +661,28 @@ class DB:
             "SELECT emby_id,emby_username,emby_watched_time,is_premium,tg_id FROM emby_user ORDER BY emby_watched_time DESC"
         ).fetchall()
 
+    def get_plex_rank_info_by_ids(self, plex_ids: list) -> dict:
+        """批量获取排行榜展示所需的 Plex 用户信息，返回 {plex_id: (tg_id, plex_username, is_premium)}"""
+        if not plex_ids:
+            return {}
+        placeholders = ",".join("?" * len(plex_ids))
+        rows = self.cur.execute(
+            f"SELECT plex_id,tg_id,plex_username,is_premium FROM user WHERE plex_id IN ({placeholders})",
+            list(plex_ids),
+        ).fetchall()
+        return {row[0]: row[1:] for row in rows}
+
+    def get_emby_rank_info_by_ids(self, emby_ids: list) -> dict:
+        """批量获取排行榜展示所需的 Emby 用户信息，返回 {emby_id: (tg_id, emby_username, is_premium)}"""
+        if not emby_ids:
+            return {}
+        placeholders = ",".join("?" * len(emby_ids))
+        rows = self.cur.execute(
+            f"SELECT emby_id,tg_id,emby_username,is_premium FROM emby_user WHERE emby_id IN ({placeholders})",
+            list(emby_ids),
+        ).fetchall()
+        return {row[0]: row[1:] for row in rows}
+
     def verify_invitation_code_is_used(self, code):
         rslt = self.cur.execute(
             "SELECT is_used,owner FROM invitation WHERE code=?", (code,)
@@ -846,6 +1079,11 @@ class DB:
                 )
 
             self.con.commit()
+            for auction in finished_auctions:
+                if auction["credits_reduced"]:
+                    credits_leaderboard.incr(
+                        auction["winner_id"], -auction["final_price"]
+                    )
             return finished_auctions
         except Exception as e:
             logger.error(f"Error finishing expired auctions: {e}")
@@ -1074,6 +1312,8 @@ class DB:
             )
 
             self.con.commit()
+            if credits_reduced:
+                credits_leaderboard.incr(winner_id, -final_price)
             return True, {
                 "id": auction_id,
                 "title": auction["title"],
@@ -1316,8 +1556,12 @@ class DB:
             }
 
     def close(self):
+        """归还连接到连接池"""
+        if self.con is None:
+            return
         self.cur.close()
-        self.con.close()
+        self._pool.release(self.con)
+        self.con = None
 
     def get_expired_premium_users(self):
         """获取所有 Premium 已过期的用户"""
@@ -1506,95 +1750,214 @@ class DB:
         user_id: str,
         timestamp: str,
     ):
+        entry = (line, send_bytes, service, username, user_id, timestamp)
         try:
             self.cur.execute(
                 "INSERT INTO line_traffic_stats (line, send_bytes, service, username, user_id, timestamp) VALUES (?, ?, ?, ?, ?, ?)",
-                (line, send_bytes, service, username, user_id, timestamp),
+                entry,
             )
+            self._upsert_traffic_rollups([entry])
         except Exception as e:
+            self.con.rollback()
             logger.error(f"Error creating line traffic entry: {e}")
             return False
         else:
             self.con.commit()
             return True
 
-    def get_premium_line_traffic_statistics(self):
-        """获取Premium线路流量统计信息"""
-        try:
-            now = datetime.now(settings.TZ)
-            today_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
-            week_start = today_start - timedelta(days=now.weekday())
-            month_start = today_start.replace(day=1)
+    def create_line_traffic_entries(self, entries: List[tuple]) -> Optional[int]:
+        """批量写入线路流量记录，所有记录在同一个事务中提交
 
-            # 获取Premium线路列表
-            premium_lines = settings.PREMIUM_STREAM_BACKEND
+        同一事务中递增流量记录批次号，批次号按提交顺序递增，用于与 Redis 中的
+        每日流量计数对账（见 get_daily_traffic_snapshot）
 
-            line_stats = []
+        Args:
+            entries: (line, send_bytes, service, username, user_id, timestamp) 元组列表
 
-            for line in premium_lines:
-                # 计算今日流量
-                today_traffic_query = """
-                SELECT COALESCE(SUM(send_bytes), 0) as traffic
-                FROM line_traffic_stats 
-                WHERE line = ? AND timestamp >= ?
-                """
-                today_traffic = self.cur.execute(
-                    today_traffic_query, (line, today_start.isoformat())
+        Returns:
+            本批记录的批次号，没有记录时为 0，写入失败返回 None
+        """
+        if not entries:
+            return 0
+        try:
+            with self.con:
+                # 先递增批次号，同时取得写锁，其他写入需等待本事务提交
+                self.cur.execute(
+                    """
+                    INSERT INTO sequences (name, value) VALUES (?, 1)
+                    ON CONFLICT(name) DO UPDATE SET value = value + 1
+                    """,
+                    (TRAFFIC_BATCH_SEQUENCE,),
+                )
+                seq = self.cur.execute(
+                    "SELECT value FROM sequences WHERE name = ?",
+                    (TRAFFIC_BATCH_SEQUENCE,),
                 ).fetchone()[0]
+                self.cur.executemany(
+                    "INSERT INTO line_traffic_stats (line, send_bytes, service, username, user_id, timestamp) VALUES (?, ?, ?, ?, ?, ?)",
+                    entries,
+                )
+                self._upsert_traffic_rollups(entries)
+        except Exception as e:
+            logger.error(f"Error creating line traffic entries: {e}")
+            return None
+        return seq
+
+    def _upsert_traffic_rollups(self, entries: List[tuple]):
+        """将一批流量记录先在内存中合并，再累加到分钟/小时/天汇总表"""
+        for table, bucket_len in TRAFFIC_ROLLUP_TABLES:
+            rollups = {}
+            for line, send_bytes, service, username, user_id, timestamp in entries:
+                if not timestamp:
+                    continue
+                key = (timestamp[:bucket_len], line, service, username)
+                total_bytes, record_count, _user_id = rollups.get(key, (0, 0, None))
+                rollups[key] = (
+                    total_bytes + send_bytes,
+                    record_count + 1,
+                    user_id or _user_id,
+                )
+            self.cur.executemany(
+                f"""
+                INSERT INTO {table} (bucket, line, service, username, user_id, total_bytes, record_count)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(bucket, line, service, username) DO UPDATE SET
+                    total_bytes = total_bytes + excluded.total_bytes,
+                    record_count = record_count + excluded.record_count,
+                    user_id = COALESCE(excluded.user_id, user_id)
+                """,
+                [
+                    (*key, user_id, *values)
+                    for key, (*values, user_id) in rollups.items()
+                ],
+            )
 
-                # 计算本周流量
-                week_traffic_query = """
-                SELECT COALESCE(SUM(send_bytes), 0) as traffic
-                FROM line_traffic_stats 
-                WHERE line = ? AND timestamp >= ?
-                """
-                week_traffic = self.cur.execute(
-                    week_traffic_query, (line, week_start.isoformat())
-                ).fetchone()[0]
+    def rebuild_traffic_rollups(self, since: str = None):
+        """
+        根据原始流量数据重新生成汇总表
 
-                # 计算本月流量
-                month_traffic_query = """
-                SELECT COALESCE(SUM(send_bytes), 0) as traffic
-                FROM line_traffic_stats 
-                WHERE line = ? AND timestamp >= ?
-                """
-                month_traffic = self.cur.execute(
-                    month_traffic_query, (line, month_start.isoformat())
-                ).fetchone()[0]
+        Args:
+            since: 起始时间 (ISO 格式)，默认为原始数据中最早的时间；
+                   早于该时间的汇总数据（原始数据已被清理）保持不变
+        """
+        if since is None:
+            since = self.cur.execute(
+                "SELECT MIN(timestamp) FROM line_traffic_stats WHERE timestamp != ''"
+            ).fetchone()[0]
+            if not since:
+                return
+        with self.con:
+            for table, bucket_len in TRAFFIC_ROLLUP_TABLES:
+                self.cur.execute(
+                    f"DELETE FROM {table} WHERE bucket >= ?", (since[:bucket_len],)
+                )
+                self.cur.execute(
+                    f"""
+                    INSERT INTO {table} (bucket, line, service, username, user_id, total_bytes, record_count)
+                    SELECT substr(timestamp, 1, {bucket_len}), line, service, username,
+                           MAX(user_id), SUM(send_bytes), COUNT(*)
+                    FROM line_traffic_stats
+                    WHERE timestamp >= ?
+                    GROUP BY substr(timestamp, 1, {bucket_len}), line, service, username
+                    """,
+                    (since[:bucket_len],),
+                )
+        logger.info(f"已根据 {since} 之后的原始流量数据重建汇总表")
+
+    def cleanup_traffic_rollups(self, minute_days: int = 3, hour_days: int = 93):
+        """清理过期的分钟级和小时级流量汇总数据（天级汇总永久保留）"""
+        now = datetime.now(settings.TZ)
+        minute_cutoff = (now - timedelta(days=minute_days)).strftime("%Y-%m-%dT%H:%M")
+        hour_cutoff = (now - timedelta(days=hour_days)).strftime("%Y-%m-%dT%H")
+        with self.con:
+            minute_deleted = self.cur.execute(
+                "DELETE FROM line_traffic_minute_stats WHERE bucket < ?",
+                (minute_cutoff,),
+            ).rowcount
+            hour_deleted = self.cur.execute(
+                "DELETE FROM line_traffic_hourly_stats WHERE bucket < ?",
+                (hour_cutoff,),
+            ).rowcount
+        return minute_deleted, hour_deleted
+
+    def get_user_id_map(self, service: str) -> dict:
+        """获取指定服务的 {小写用户名: 用户 ID} 映射"""
+        if service == "plex":
+            query = "SELECT plex_username, plex_id FROM user WHERE plex_username IS NOT NULL"
+        elif service == "emby":
+            query = "SELECT emby_username, emby_id FROM emby_user WHERE emby_username IS NOT NULL"
+        else:
+            return {}
+        return {
+            str(username).lower(): user_id
+            for username, user_id in self.cur.execute(query).fetchall()
+        }
 
-                # 获取当前线路流量排名前五的用户（基于本月数据）
-                top_users_query = """
-                SELECT username, SUM(send_bytes) as total_traffic
-                FROM line_traffic_stats 
-                WHERE line = ? AND timestamp >= ?
-                GROUP BY username 
-                ORDER BY total_traffic DESC 
-                LIMIT 5
-                """
-                top_users_result = self.cur.execute(
-                    top_users_query, (line, month_start.isoformat())
-                ).fetchall()
+    def get_premium_line_traffic_statistics(self):
+        """获取Premium线路流量统计信息，查询失败时抛出异常"""
+        try:
+            now = datetime.now(settings.TZ)
+            today_start = now.strftime("%Y-%m-%d")
+            week_start = (now - timedelta(days=now.weekday())).strftime("%Y-%m-%d")
+            month_start = now.strftime("%Y-%m-01")
 
-                top_users = []
-                for user_data in top_users_result:
-                    username, traffic = user_data
-                    top_users.append({"username": username, "traffic": traffic})
+            # 获取Premium线路列表
+            premium_lines = settings.PREMIUM_STREAM_BACKEND
+            if not premium_lines:
+                return []
+            placeholders = ",".join("?" for _ in premium_lines)
+
+            # 从天级汇总表按线路和日期汇总流量
+            daily_traffic = self.cur.execute(
+                f"""
+                SELECT line, bucket, SUM(total_bytes)
+                FROM line_traffic_daily_stats
+                WHERE line IN ({placeholders}) AND bucket >= ?
+                GROUP BY line, bucket
+                """,
+                (*premium_lines, min(week_start, month_start)),
+            ).fetchall()
 
-                line_stats.append(
-                    {
-                        "line": line,
-                        "today_traffic": today_traffic,
-                        "week_traffic": week_traffic,
-                        "month_traffic": month_traffic,
-                        "top_users": top_users,
-                    }
-                )
+            # 获取各线路流量排名前五的用户（基于本月数据）
+            top_users_result = self.cur.execute(
+                f"""
+                SELECT line, username, SUM(total_bytes) as total_traffic
+                FROM line_traffic_daily_stats
+                WHERE line IN ({placeholders}) AND bucket >= ?
+                GROUP BY line, username
+                ORDER BY total_traffic DESC
+                """,
+                (*premium_lines, month_start),
+            ).fetchall()
 
-            return line_stats
+            line_stats = {
+                line: {
+                    "line": line,
+                    "today_traffic": 0,
+                    "week_traffic": 0,
+                    "month_traffic": 0,
+                    "top_users": [],
+                }
+                for line in premium_lines
+            }
+            for line, bucket, traffic in daily_traffic:
+                stats = line_stats[line]
+                if bucket >= today_start:
+                    stats["today_traffic"] += traffic
+                if bucket >= week_start:
+                    stats["week_traffic"] += traffic
+                if bucket >= month_start:
+                    stats["month_traffic"] += traffic
+            for line, username, traffic in top_users_result:
+                top_users = line_stats[line]["top_users"]
+                if len(top_users) < 5:
+                    top_users.append({"username": username, "traffic": traffic})
+
+            return list(line_stats.values())
 
         except Exception as e:
             logger.error(f"Error getting premium line traffic statistics: {e}")
-            return []
+            raise
 
     def get_user_daily_traffic(
         self,
@@ -1622,134 +1985,271 @@ class DB:
             else:
                 date = date.astimezone(settings.TZ)
 
-            # 计算指定日期的开始和结束时间
-            day_start = date.replace(hour=0, minute=0, second=0, microsecond=0)
-            day_end = date.replace(hour=23, minute=59, second=59, microsecond=999999)
-
-            # 判断查询日期是否为当月
-            now = datetime.now(settings.TZ)
-            current_month_start = now.replace(
-                day=1, hour=0, minute=0, second=0, microsecond=0
-            )
-
-            if date >= current_month_start:
-                # 当月数据，从 line_traffic_stats 表查询
-                # 构建查询条件
-                base_conditions = "LOWER(username) = ? AND service = ? AND timestamp >= ? AND timestamp <= ?"
-                params = [
-                    username.lower(),
-                    service,
-                    day_start.isoformat(),
-                    day_end.isoformat(),
-                ]
-
-                # 如果只统计 premium 线路
-                if premium_only:
-                    premium_lines = settings.PREMIUM_STREAM_BACKEND
-                    if premium_lines:
-                        # 构建线路过滤条件
-                        line_conditions = " OR ".join(
-                            ["line = ?" for _ in premium_lines]
-                        )
-                        base_conditions += f" AND ({line_conditions})"
-                        params.extend(premium_lines)
-                    else:
-                        # 如果没有配置 premium 线路，返回 0
-                        return 0
-
-                # 查询特定服务的指定日期流量
-                query = f"""
-                SELECT COALESCE(SUM(send_bytes), 0) as traffic
-                FROM line_traffic_stats 
-                WHERE {base_conditions}
-                """
-                result = self.cur.execute(query, params).fetchone()
-                return result[0] if result else 0
-            else:
-                # 历史月份数据，从 line_traffic_monthly_stats 表查询
-                # 注意：月度表只有月度总计，无法精确到天，返回 0
-                logger.warning(
-                    f"无法获取历史日期 {date.strftime('%Y-%m-%d')} 的精确日流量数据"
-                )
-                return 0
+            # 从天级汇总表查询
+            base_conditions = "service = ? AND LOWER(username) = ? AND bucket = ?"
+            params = [service, username.lower(), date.strftime("%Y-%m-%d")]
+
+            # 如果只统计 premium 线路
+            if premium_only:
+                premium_lines = settings.PREMIUM_STREAM_BACKEND
+                if premium_lines:
+                    # 构建线路过滤条件
+                    placeholders = ",".join("?" for _ in premium_lines)
+                    base_conditions += f" AND line IN ({placeholders})"
+                    params.extend(premium_lines)
+                else:
+                    # 如果没有配置 premium 线路，返回 0
+                    return 0
+
+            # 查询特定服务的指定日期流量
+            query = f"""
+            SELECT COALESCE(SUM(total_bytes), 0) as traffic
+            FROM line_traffic_daily_stats
+            WHERE {base_conditions}
+            """
+            result = self.cur.execute(query, params).fetchone()
+            return result[0] if result else 0
 
         except Exception as e:
             logger.error(f"Error getting user daily traffic for {username}: {e}")
             return 0
 
-    def get_traffic_statistics(self):
-        """获取全面的流量统计信息，包括今日/本周/本月，按服务类型和线路分类"""
+    def get_daily_traffic_by_user(self, date: str) -> dict:
+        """获取指定日期所有用户的流量消耗
+
+        Args:
+            date: 日期，格式 YYYY-MM-DD
+
+        Returns:
+            {(service, 小写用户名): (总流量, premium 线路流量)}
+        """
+        return self.get_daily_traffic_snapshot(date)[1]
+
+    def get_daily_traffic_snapshot(self, date: str) -> tuple[int, dict]:
+        """获取指定日期所有用户的流量消耗及快照对应的流量记录批次号，用于校准 Redis 中的每日流量计数
+
+        两者在同一条查询中读取，快照恰好包含批次号不大于该值的所有批次
+
+        Args:
+            date: 日期，格式 YYYY-MM-DD
+
+        Returns:
+            (批次号, {(service, 小写用户名): (总流量, premium 线路流量)})，查询失败时批次号为 -1
+        """
+        premium_lines = settings.PREMIUM_STREAM_BACKEND or []
+        premium_case = (
+            f"CASE WHEN line IN ({','.join('?' for _ in premium_lines)}) "
+            "THEN total_bytes ELSE 0 END"
+            if premium_lines
+            else "0"
+        )
         try:
-            now = datetime.now(settings.TZ)
-            today_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
-            week_start = today_start - timedelta(days=now.weekday())
-            month_start = today_start.replace(day=1)
+            # 以批次号为左表，没有流量记录时也返回一行
+            rows = self.cur.execute(
+                f"""
+                WITH seq AS (
+                    SELECT COALESCE(
+                        (SELECT value FROM sequences WHERE name = ?), 0
+                    ) AS seq
+                )
+                SELECT seq.seq, t.service, t.username, t.total, t.premium
+                FROM seq LEFT JOIN (
+                    SELECT service, LOWER(username) AS username,
+                        SUM(total_bytes) AS total, SUM({premium_case}) AS premium
+                    FROM line_traffic_daily_stats
+                    WHERE bucket = ?
+                    GROUP BY service, LOWER(username)
+                ) t
+                """,
+                (TRAFFIC_BATCH_SEQUENCE, *premium_lines, date),
+            ).fetchall()
+            return rows[0][0], {
+                (service, username): (total or 0, premium or 0)
+                for _, service, username, total, premium in rows
+                if service is not None
+            }
+        except Exception as e:
+            logger.error(f"Error getting daily traffic by user for {date}: {e}")
+            return -1, {}
 
-            # 获取所有服务类型的流量统计
-            periods = [
-                ("today", today_start.isoformat()),
-                ("week", week_start.isoformat()),
-                ("month", month_start.isoformat()),
-            ]
+    def load_credit_settlement(
+        self,
+        service: str,
+        durations: dict,
+        traffic_date: str,
+        include_traffic: bool = True,
+    ) -> list[tuple]:
+        """积分结算第一步：暂存观看时长，一次查询关联用户信息、总积分及 premium 线路流量
 
-            result = {}
+        Args:
+            service: 服务类型 (plex/emby)
+            durations: {账户 ID: 观看时长（小时）}
+            traffic_date: 统计流量的日期，格式 YYYY-MM-DD
+            include_traffic: 是否汇总 premium 线路流量，为 False 时流量列为 0
+                （由调用方从 Redis 计数中读取）
 
-            for period_name, start_time in periods:
-                # 查询按服务类型分组的流量统计
-                service_query = """
-                SELECT 
-                    service,
-                    COALESCE(SUM(send_bytes), 0) as total_traffic
-                FROM line_traffic_stats 
-                WHERE timestamp >= ?
-                GROUP BY service
+        Returns:
+            [(账户 ID, tg_id, 用户名, is_premium, 账户积分, 观看时长, 本次观看时长,
+              statistics 中的积分（无记录为 None）, premium 线路流量)]
+        """
+        table, id_col, username_col, credits_col, watched_col = SETTLEMENT_COLUMNS[
+            service
+        ]
+        premium_lines = settings.PREMIUM_STREAM_BACKEND or []
+        premium_case = (
+            f"CASE WHEN line IN ({','.join('?' for _ in premium_lines)}) "
+            "THEN total_bytes ELSE 0 END"
+            if premium_lines
+            else "0"
+        )
+        if include_traffic:
+            traffic_join = f"""
+                LEFT JOIN (
+                    SELECT LOWER(username) AS username, SUM({premium_case}) AS premium
+                    FROM line_traffic_daily_stats
+                    WHERE service = ? AND bucket = ?
+                    GROUP BY LOWER(username)
+                ) t ON t.username = LOWER(a.{username_col})
                 """
-                service_results = self.cur.execute(
-                    service_query, (start_time,)
-                ).fetchall()
-
-                # 查询按线路分组的流量统计
-                line_query = """
-                SELECT 
-                    line,
-                    COALESCE(SUM(send_bytes), 0) as total_traffic
-                FROM line_traffic_stats 
-                WHERE timestamp >= ?
-                GROUP BY line
-                ORDER BY total_traffic DESC
+            traffic_column = "COALESCE(t.premium, 0)"
+            params = (*premium_lines, service, traffic_date)
+        else:
+            traffic_join, traffic_column, params = "", "0", ()
+        self.cur.execute("DROP TABLE IF EXISTS temp.settlement_duration")
+        self.cur.execute(
+            "CREATE TEMP TABLE settlement_duration(account_id PRIMARY KEY, play_duration)"
+        )
+        self.cur.executemany(
+            "INSERT INTO temp.settlement_duration VALUES (?, ?)", durations.items()
+        )
+        try:
+            return self.cur.execute(
+                f"""
+                SELECT a.{id_col}, a.tg_id, a.{username_col}, a.is_premium,
+                       a.{credits_col}, a.{watched_col}, d.play_duration,
+                       s.credits, {traffic_column}
+                FROM temp.settlement_duration d
+                JOIN {table} a ON a.{id_col} = d.account_id
+                LEFT JOIN statistics s ON s.tg_id = a.tg_id
+                {traffic_join}
+                """,
+                params,
+            ).fetchall()
+        finally:
+            self.cur.execute("DROP TABLE temp.settlement_duration")
+
+    def apply_credit_settlement(self, service: str, deltas: list[tuple]):
+        """积分结算第二步：在一个事务中批量写入积分及观看时长变化
+
+        Args:
+            service: 服务类型 (plex/emby)
+            deltas: [(账户 ID, tg_id, 积分写入位置, 积分变化, 新观看时长)]，积分写入位置为
+                account（账户积分）/ statistics（总积分）/ new_statistics（新建总积分记录，
+                并将账户积分转入）
+        """
+        table, id_col, _, credits_col, watched_col = SETTLEMENT_COLUMNS[service]
+        try:
+            self.cur.execute("DROP TABLE IF EXISTS temp.settlement_delta")
+            self.cur.execute(
+                "CREATE TEMP TABLE settlement_delta("
+                "account_id PRIMARY KEY, tg_id, target, credits_delta, watched_time)"
+            )
+            self.cur.executemany(
+                "INSERT INTO temp.settlement_delta VALUES (?, ?, ?, ?, ?)", deltas
+            )
+            # 新建总积分记录，账户积分转入其中
+            self.cur.execute(
+                f"""
+                INSERT INTO statistics (tg_id, donation, credits)
+                SELECT d.tg_id, 0, SUM(COALESCE(a.{credits_col}, 0))
+                FROM temp.settlement_delta d
+                JOIN {table} a ON a.{id_col} = d.account_id
+                WHERE d.target = 'new_statistics'
+                GROUP BY d.tg_id
                 """
-                line_results = self.cur.execute(line_query, (start_time,)).fetchall()
+            )
+            self.cur.execute(
+                """
+                UPDATE statistics SET credits = credits + agg.delta
+                FROM (
+                    SELECT tg_id, SUM(credits_delta) AS delta
+                    FROM temp.settlement_delta
+                    WHERE target != 'account'
+                    GROUP BY tg_id
+                ) agg
+                WHERE statistics.tg_id = agg.tg_id
+                """
+            )
+            self.cur.execute(
+                f"""
+                UPDATE {table} SET
+                    {watched_col} = d.watched_time,
+                    {credits_col} = CASE d.target
+                        WHEN 'account' THEN {credits_col} + d.credits_delta
+                        WHEN 'new_statistics' THEN 0
+                        ELSE {credits_col}
+                    END
+                FROM temp.settlement_delta d
+                WHERE {table}.{id_col} = d.account_id
+                """
+            )
+            self.cur.execute("DROP TABLE temp.settlement_delta")
+        except Exception:
+            self.con.rollback()
+            raise
+        else:
+            self.con.commit()
 
-                # 计算总流量
-                total_query = """
-                SELECT COALESCE(SUM(send_bytes), 0) as total_traffic
-                FROM line_traffic_stats 
-                WHERE timestamp >= ?
+    def get_traffic_statistics(self):
+        """获取全面的流量统计信息，包括今日/本周/本月，按服务类型和线路分类，查询失败时抛出异常"""
+        try:
+            now = datetime.now(settings.TZ)
+            periods = [
+                ("today", now.strftime("%Y-%m-%d")),
+                ("week", (now - timedelta(days=now.weekday())).strftime("%Y-%m-%d")),
+                ("month", now.strftime("%Y-%m-01")),
+            ]
+
+            # 一次性从天级汇总表取出本周/本月内按日期、服务和线路汇总的流量
+            rows = self.cur.execute(
                 """
-                total_traffic = self.cur.execute(total_query, (start_time,)).fetchone()[
-                    0
-                ]
+                SELECT bucket, service, line, SUM(total_bytes) as total_traffic
+                FROM line_traffic_daily_stats
+                WHERE bucket >= ?
+                GROUP BY bucket, service, line
+                """,
+                (min(start for _, start in periods),),
+            ).fetchall()
 
+            known_lines = settings.STREAM_BACKEND + settings.PREMIUM_STREAM_BACKEND
+            result = {}
+
+            for period_name, start_bucket in periods:
                 # 构建期间数据
                 period_data = {
-                    "total": total_traffic,
+                    "total": 0,
                     "emby": 0,
                     "plex": 0,
                     "lines": [],
                 }
+                line_traffic = {}
 
-                for service, traffic in service_results:
+                for bucket, service, line, traffic in rows:
+                    if bucket < start_bucket:
+                        continue
+                    period_data["total"] += traffic
                     if service.lower() == "emby":
-                        period_data["emby"] = traffic
+                        period_data["emby"] += traffic
                     elif service.lower() == "plex":
-                        period_data["plex"] = traffic
+                        period_data["plex"] += traffic
+                    line_traffic[line] = line_traffic.get(line, 0) + traffic
 
                 # 添加线路数据
-                for line, traffic in line_results:
+                for line, traffic in sorted(
+                    line_traffic.items(), key=lambda item: item[1], reverse=True
+                ):
                     # 排除自定义线路
-                    for _line in (
-                        settings.STREAM_BACKEND + settings.PREMIUM_STREAM_BACKEND
-                    ):
+                    for _line in known_lines:
                         if line.lower() in _line.lower():
                             # 只统计已知的线路
                             period_data["lines"].append(
@@ -1763,11 +2263,7 @@ class DB:
 
         except Exception as e:
             logger.error(f"Error getting comprehensive traffic statistics: {e}")
-            return {
-                "today": {"total": 0, "emby": 0, "plex": 0, "lines": []},
-                "week": {"total": 0, "emby": 0, "plex": 0, "lines": []},
-                "month": {"total": 0, "emby": 0, "plex": 0, "lines": []},
-            }
+            raise
 
     def get_plex_traffic_rank(self, start_date=None, end_date=None):
         """获取 Plex 流量排行榜
@@ -1806,31 +2302,34 @@ class DB:
                 if end_date > today_end:
                     end_date = today_end
 
-            # 仅当月数据，从 line_traffic_stats 表查询
+            # 仅当月数据，从天级汇总表查询
             query = """
-            SELECT u.plex_username, lts.user_id, SUM(lts.send_bytes) as total_traffic,
+            SELECT u.plex_username, lds.user_id, SUM(lds.total_bytes) as total_traffic,
                    COALESCE(u.is_premium, 0) as is_premium,
                    u.tg_id
-            FROM line_traffic_stats lts
-            LEFT JOIN user u ON LOWER(lts.username) = LOWER(u.plex_username)
-            WHERE lts.service = 'plex' 
-                AND lts.timestamp >= ?
-                AND lts.timestamp <= ?
-                AND lts.username IS NOT NULL
-                AND lts.username != ''
-            GROUP BY LOWER(lts.username), lts.user_id, u.is_premium, u.tg_id
+            FROM line_traffic_daily_stats lds
+            LEFT JOIN user u ON LOWER(lds.username) = LOWER(u.plex_username)
+            WHERE lds.service = 'plex'
+                AND lds.bucket >= ?
+                AND lds.bucket <= ?
+                AND lds.username != ''
+            GROUP BY LOWER(lds.username), lds.user_id, u.is_premium, u.tg_id
             ORDER BY total_traffic DESC
             LIMIT 50
             """
 
             result = self.cur.execute(
-                query, (start_date.isoformat(), end_date.isoformat())
+                query,
+                (
+                    start_date.astimezone(settings.TZ).strftime("%Y-%m-%d"),
+                    end_date.astimezone(settings.TZ).strftime("%Y-%m-%d"),
+                ),
             ).fetchall()
             return result
 
         except Exception as e:
             logger.error(f"Error getting Plex traffic rank: {e}")
-            return []
+            raise
 
     def get_emby_traffic_rank(self, start_date=None, end_date=None):
         """获取 Emby 流量排行榜
@@ -1870,29 +2369,32 @@ class DB:
                     end_date = today_end
 
             query = """
-            SELECT eu.emby_username, lts.user_id, SUM(lts.send_bytes) as total_traffic,
+            SELECT eu.emby_username, lds.user_id, SUM(lds.total_bytes) as total_traffic,
                    COALESCE(eu.is_premium, 0) as is_premium,
                    eu.tg_id
-            FROM line_traffic_stats lts
-            LEFT JOIN emby_user eu ON LOWER(lts.username) = LOWER(eu.emby_username)
-            WHERE lts.service = 'emby' 
-                AND lts.timestamp >= ?
-                AND lts.timestamp <= ?
-                AND lts.username IS NOT NULL
-                AND lts.username != ''
-            GROUP BY LOWER(lts.username), lts.user_id, eu.is_premium, eu.tg_id
+            FROM line_traffic_daily_stats lds
+            LEFT JOIN emby_user eu ON LOWER(lds.username) = LOWER(eu.emby_username)
+            WHERE lds.service = 'emby'
+                AND lds.bucket >= ?
+                AND lds.bucket <= ?
+                AND lds.username != ''
+            GROUP BY LOWER(lds.username), lds.user_id, eu.is_premium, eu.tg_id
             ORDER BY total_traffic DESC
             LIMIT 50
             """
 
             result = self.cur.execute(
-                query, (start_date.isoformat(), end_date.isoformat())
+                query,
+                (
+                    start_date.astimezone(settings.TZ).strftime("%Y-%m-%d"),
+                    end_date.astimezone(settings.TZ).strftime("%Y-%m-%d"),
+                ),
             ).fetchall()
             return result
 
         except Exception as e:
             logger.error(f"Error getting Emby traffic rank: {e}")
-            return []
+            raise
 
     def aggregate_monthly_traffic_data(
         self, target_month: str = None
@@ -1947,27 +2449,28 @@ class DB:
             else:
                 next_month_start = month_start.replace(month=month_start.month + 1)
 
-            month_start_str = month_start.isoformat()
-            next_month_start_str = next_month_start.isoformat()
-
-            # 聚合查询：按 line, service, username 分组求和
+            # 聚合查询：从天级汇总表按 line, service, username 分组求和
             aggregation_query = """
             SELECT 
                 line,
                 service,
                 username,
-                user_id,
-                SUM(send_bytes) as total_bytes,
-                COUNT(*) as record_count
-            FROM line_traffic_stats 
-            WHERE timestamp >= ? AND timestamp < ?
+                MAX(user_id) as user_id,
+                SUM(total_bytes) as total_bytes,
+                SUM(record_count) as record_count
+            FROM line_traffic_daily_stats
+            WHERE bucket >= ? AND bucket < ?
             GROUP BY line, service, username
-            HAVING SUM(send_bytes) > 0
+            HAVING SUM(total_bytes) > 0
             ORDER BY total_bytes DESC
             """
 
             aggregated_data = self.cur.execute(
-                aggregation_query, (month_start_str, next_month_start_str)
+                aggregation_query,
+                (
+                    month_start.strftime("%Y-%m-%d"),
+                    next_month_start.strftime("%Y-%m-%d"),
+                ),
             ).fetchall()
 
             if not aggregated_data:
@@ -2082,3 +2585,52 @@ class DB:
         except Exception as e:
             logger.error(f"清理月度流量数据失败: {e}")
             return False, f"清理月度流量数据失败: {str(e)}"
+
+
+# 数据库专用线程池，避免 SQLite 查询阻塞事件循环，也不占用其他阻塞任务的线程
+_db_executor = ThreadPoolExecutor(
+    max_workers=settings.DB_POOL_SIZE, thread_name_prefix="db"
+)
+
+
+class AsyncDB:
+    """
+    DB 的异步版本，供 async 路由使用
+
+    DB 的所有方法都可以直接 await，实际在数据库线程池中执行：
+
+        db = AsyncDB()
+        try:
+            rank = await db.get_plex_traffic_rank(start_date)
+        finally:
+            await db.close()
+
+    需要直接使用 cur/con 或连续多次读写的逻辑，用 run() 在同一个线程调用中完成。
+    """
+
+    def __init__(self, db=settings.DATA_PATH / "data.db"):
+        self._db = DB(db)
+
+    async def run(self, func, *args, **kwargs):
+        """在数据库线程池中执行 func(db, *args, **kwargs)"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            _db_executor, partial(func, self._db, *args, **kwargs)
+        )
+
+    def __getattr__(self, name):
+        attr = getattr(self._db, name)
+        if not callable(attr):
+            return attr
+
+        async def method(*args, **kwargs):
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                _db_executor, partial(attr, *args, **kwargs)
+            )
+
+        return method
+
+    async def close(self):
+        """归还连接到连接池"""
+        self._db.close()
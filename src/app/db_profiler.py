@@ -0,0 +1,289 @@
+"""
+SQLite 慢查询统计
+
+开启 DB_PROFILE 后，连接池创建的连接使用 ProfilingConnection，其游标会记录每条
+语句（归一化后）的执行次数、耗时及返回/影响的行数。耗时超过 DB_SLOW_QUERY_MS 的
+语句会记录一次 EXPLAIN QUERY PLAN，若计划中对大表做了全表扫描（SCAN）则标记出来。
+
+汇总结果可通过管理员接口 /api/admin/db/query-report 查看，或定期写入
+query_profile.json 后用命令行查看:
+
+    python -m app.db_profiler --limit 20 --sort total_ms
+"""
+
+import argparse
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+from app.config import settings
+from app.log import logger
+
+QUERY_PROFILE_PATH = settings.DATA_PATH / "query_profile.json"
+# 表行数的缓存时间（秒）
+TABLE_SIZE_TTL = 600
+
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?\b")
+_IN_LIST_RE = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_SPACE_RE = re.compile(r"\s+")
+# EXPLAIN QUERY PLAN 中的全表扫描，如 "SCAN user" / "SCAN TABLE user"（旧版本）
+_SCAN_RE = re.compile(r"^SCAN (?:TABLE )?(\w+)(?! USING (?:COVERING )?INDEX)")
+
+
+def normalize_sql(sql: str) -> str:
+    """去掉字面量及多余空白，使参数不同的同一语句归为一类"""
+    sql = _STRING_RE.sub("?", sql)
+    sql = _NUMBER_RE.sub("?", sql)
+    sql = _IN_LIST_RE.sub("(...)", sql)
+    return _SPACE_RE.sub(" ", sql).strip()
+
+
+class QueryProfiler:
+    """按归一化语句汇总的查询统计"""
+
+    def __init__(self, slow_ms: float, large_table_rows: int):
+        self.slow_ms = slow_ms
+        self.large_table_rows = large_table_rows
+        self._stats: dict[str, dict] = {}
+        self._table_sizes: dict[str, tuple[float, Optional[int]]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, con, sql: str, params, duration: float, rows: int):
+        key = normalize_sql(sql)
+        with self._lock:
+            stat = self._stats.get(key)
+            if stat is None:
+                stat = self._stats[key] = {
+                    "sql": key,
+                    "count": 0,
+                    "total_ms": 0.0,
+                    "max_ms": 0.0,
+                    "rows": 0,
+                    "slow_count": 0,
+                    "plan": None,
+                    "full_scans": [],
+                }
+            duration_ms = duration * 1000
+            stat["count"] += 1
+            stat["total_ms"] += duration_ms
+            stat["max_ms"] = max(stat["max_ms"], duration_ms)
+            stat["rows"] += max(rows, 0)
+            is_slow = duration_ms >= self.slow_ms
+            if is_slow:
+                stat["slow_count"] += 1
+            need_plan = is_slow and stat["plan"] is None and params is not None
+            if need_plan:
+                # 先占位，避免多个线程重复 EXPLAIN
+                stat["plan"] = []
+
+        if not is_slow:
+            return
+        logger.warning(f"慢查询 {duration_ms:.1f}ms, {rows} 行: {key[:200]}")
+        if need_plan:
+            self._capture_plan(con, sql, params, stat)
+
+    def _capture_plan(self, con, sql: str, params, stat: dict):
+        try:
+            # 使用原生游标，避免统计 EXPLAIN 本身
+            cur = sqlite3.Cursor(con)
+            try:
+                plan = [
+                    row[-1] for row in cur.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+                ]
+            finally:
+                cur.close()
+        except sqlite3.Error as e:
+            logger.debug(f"获取查询计划失败: {e}")
+            return
+
+        full_scans = []
+        for detail in plan:
+            match = _SCAN_RE.match(detail)
+            if not match:
+                continue
+            table = match.group(1)
+            size = self._get_table_size(con, table)
+            if size is not None and size >= self.large_table_rows:
+                full_scans.append(table)
+        with self._lock:
+            stat["plan"] = plan
+            stat["full_scans"] = full_scans
+        if full_scans:
+            logger.warning(
+                f"慢查询对大表 {', '.join(full_scans)} 做了全表扫描: {stat['sql'][:200]}"
+            )
+
+    def _get_table_size(self, con, table: str) -> Optional[int]:
+        """表的大致行数（MAX(rowid)），无法获取时返回 None"""
+        cached = self._table_sizes.get(table)
+        if cached and time.monotonic() - cached[0] < TABLE_SIZE_TTL:
+            return cached[1]
+        size = None
+        try:
+            cur = sqlite3.Cursor(con)
+            try:
+                size = cur.execute(f'SELECT MAX(rowid) FROM "{table}"').fetchone()[0]
+            finally:
+                cur.close()
+        except sqlite3.Error:
+            pass
+        self._table_sizes[table] = (time.monotonic(), size or 0)
+        return size
+
+    def report(self, limit: int = 20, sort: str = "total_ms") -> list[dict]:
+        """按指定字段降序返回前 limit 条语句的统计"""
+        with self._lock:
+            stats = [dict(stat) for stat in self._stats.values()]
+        for stat in stats:
+            stat["avg_ms"] = stat["total_ms"] / stat["count"]
+        stats.sort(key=lambda stat: stat.get(sort, 0), reverse=True)
+        return stats[:limit]
+
+    def reset(self):
+        with self._lock:
+            self._stats = {}
+
+    def dump(self, path=QUERY_PROFILE_PATH):
+        """将统计结果写入文件，供命令行查看"""
+        tmp_file = path.with_suffix(".tmp")
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            json.dump(self.report(limit=len(self._stats)), f, ensure_ascii=False)
+        os.replace(tmp_file, path)
+
+
+query_profiler = QueryProfiler(
+    slow_ms=settings.DB_SLOW_QUERY_MS, large_table_rows=settings.DB_LARGE_TABLE_ROWS
+)
+
+
+class ProfilingCursor(sqlite3.Cursor):
+    """
+    记录语句耗时的游标
+
+    SELECT 的耗时包含取回结果的时间：语句在结果取完、执行下一条语句或关闭游标时
+    才计入统计。
+    """
+
+    _pending = None
+
+    def _finish(self):
+        if self._pending is None:
+            return
+        sql, params, elapsed, rows = self._pending
+        self._pending = None
+        if rows == 0 and self.rowcount > 0:
+            # INSERT/UPDATE/DELETE 影响的行数
+            rows = self.rowcount
+        query_profiler.record(self.connection, sql, params, elapsed, rows)
+
+    def _timed(self, func, *args):
+        start = time.perf_counter()
+        try:
+            return func(*args)
+        finally:
+            if self._pending is not None:
+                self._pending[2] += time.perf_counter() - start
+
+    def _start(self, func, sql, params, args):
+        self._finish()
+        self._pending = [sql, params, 0.0, 0]
+        try:
+            self._timed(func, sql, args)
+        except Exception:
+            # 执行失败的语句不计入统计
+            self._pending = None
+            raise
+
+    def execute(self, sql, parameters=()):
+        self._start(super().execute, sql, parameters, parameters)
+        return self
+
+    def executemany(self, sql, seq_of_parameters):
+        # 批量语句不做 EXPLAIN
+        self._start(super().executemany, sql, None, seq_of_parameters)
+        self._finish()
+        return self
+
+    def executescript(self, sql_script):
+        self._finish()
+        return super().executescript(sql_script)
+
+    def fetchone(self):
+        row = self._timed(super().fetchone)
+        if row is None:
+            self._finish()
+        elif self._pending is not None:
+            self._pending[3] += 1
+        return row
+
+    def fetchmany(self, size=None):
+        rows = self._timed(super().fetchmany, size or self.arraysize)
+        if self._pending is not None:
+            self._pending[3] += len(rows)
+        if not rows:
+            self._finish()
+        return rows
+
+    def fetchall(self):
+        rows = self._timed(super().fetchall)
+        if self._pending is not None:
+            self._pending[3] += len(rows)
+        self._finish()
+        return rows
+
+    def __next__(self):
+        row = self.fetchone()
+        if row is None:
+            raise StopIteration
+        return row
+
+    def close(self):
+        self._finish()
+        super().close()
+
+
+class ProfilingConnection(sqlite3.Connection):
+    def cursor(self, factory=ProfilingCursor):
+        return super().cursor(factory)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="查看 SQLite 慢查询统计")
+    parser.add_argument("--limit", type=int, default=20, help="显示的语句数")
+    parser.add_argument(
+        "--sort",
+        default="total_ms",
+        choices=["total_ms", "max_ms", "avg_ms", "count", "rows", "slow_count"],
+        help="排序字段",
+    )
+    parser.add_argument("--path", default=str(QUERY_PROFILE_PATH))
+    args = parser.parse_args()
+
+    try:
+        with open(args.path, encoding="utf-8") as f:
+            stats = json.load(f)
+    except FileNotFoundError:
+        print(f"{args.path} 不存在，请确认已开启 DB_PROFILE 并等待统计写入")
+        return
+    stats.sort(key=lambda stat: stat.get(args.sort, 0), reverse=True)
+
+    print(f"{'count':>8}{'total_ms':>12}{'avg_ms':>10}{'max_ms':>10}{'rows':>10}  sql")
+    for stat in stats[: args.limit]:
+        print(
+            f"{stat['count']:>8}{stat['total_ms']:>12.1f}{stat['avg_ms']:>10.2f}"
+            f"{stat['max_ms']:>10.1f}{stat['rows']:>10}  {stat['sql']}"
+        )
+        if stat["plan"]:
+            for detail in stat["plan"]:
+                print(f"{'':>52}  | {detail}")
+        if stat["full_scans"]:
+            print(f"{'':>52}  ! 全表扫描: {', '.join(stat['full_scans'])}")
+
+
+if __name__ == "__main__":
+    main()
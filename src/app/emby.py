@@ -1,22 +1,162 @@
 #! /usr/bin/env python3
 
+import asyncio
 import json
+import os
 import pickle
+import threading
 from time import time
 from typing import Any, Optional, Union
 
 import aiohttp
-import filelock
 import requests
 from app.cache import emby_api_key_cache
 from app.config import settings
 from app.log import logger
 
 
-class Emby:
-    cache = settings.DATA_PATH / "emby_user_info.cache"
-    cache_lock = filelock.FileLock(str(cache) + ".lock")
+# Emby 用户信息缓存的有效期
+EMBY_USER_INFO_TTL = 7 * 24 * 3600
+# 资料库信息缓存的有效期
+EMBY_LIBRARIES_TTL = 600
+
+# 复用 TCP/TLS 连接
+_http = requests.Session()
+# 资料库信息缓存，同步及异步客户端共用: (过期时间, {资料库名: {"guid", "subfolders_id"}})
+_libraries_cache: tuple[float, Optional[dict]] = (0, None)
+
+
+class EmbyUserInfoCache:
+    """
+    进程内共享的 Emby 用户信息缓存
+
+    数据常驻内存，读取不加锁；写入时原子地重写 JSON 文件（先写临时文件再替换）。
+    首次加载时会把旧版的 pickle 缓存文件转换为 JSON。
+    cache format: {username: {"id", "name", "avatar", "date_created", "added_time"}}
+    """
 
+    def __init__(self, path=settings.DATA_PATH / "emby_user_info.json"):
+        self._path = path
+        self._legacy_path = settings.DATA_PATH / "emby_user_info.cache"
+        self._data: Optional[dict] = None
+        self._lock = threading.Lock()
+
+    def _load(self) -> dict:
+        if self._data is not None:
+            return self._data
+        with self._lock:
+            if self._data is None:
+                data = {}
+                try:
+                    if self._path.exists():
+                        with open(self._path, encoding="utf-8") as f:
+                            data = json.load(f)
+                    elif self._legacy_path.exists():
+                        with open(self._legacy_path, "rb") as f:
+                            data = pickle.load(f)
+                        self._save(data)
+                        logger.info(f"已将 {self._legacy_path} 转换为 {self._path}")
+                except Exception as e:
+                    logger.error(f"Failed to load emby user info cache: {e}")
+                self._data = data
+        return self._data
+
+    def _save(self, data: dict):
+        tmp_file = self._path.with_suffix(".tmp")
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp_file, self._path)
+
+    def get(self, username: str) -> dict:
+        return self._load().get(username, {})
+
+    def get_many(self, usernames) -> dict:
+        """批量获取用户信息，返回 {username: info}，未缓存的用户为空字典"""
+        data = self._load()
+        return {username: data.get(username, {}) for username in usernames}
+
+    def update(self, entries: dict):
+        """更新用户信息并写入文件"""
+        if not entries:
+            return
+        self._load()
+        with self._lock:
+            # 复制后替换，读取方不会看到更新了一半的字典
+            data = {**self._data, **entries}
+            try:
+                self._save(data)
+            except Exception as e:
+                logger.error(f"Failed to save emby user info cache: {e}")
+            self._data = data
+
+
+emby_user_info_cache = EmbyUserInfoCache()
+
+
+def _get_cached_libraries() -> Optional[dict]:
+    expires_at, libraries = _libraries_cache
+    if libraries is not None and time() < expires_at:
+        return libraries
+    return None
+
+
+def _set_cached_libraries(libs: list) -> dict[str, dict[str, Any]]:
+    """解析 /Library/SelectableMediaFolders 的返回结果并写入缓存"""
+    global _libraries_cache
+    libraries = {}
+    for lib in libs:
+        name = lib.get("Name")
+        guid = lib.get("Guid")
+        subfolders = lib.get("SubFolders", [])
+        subfolders_id = [folder.get("Id") for folder in subfolders]
+        libraries.update({name: {"guid": guid, "subfolders_id": subfolders_id}})
+    _libraries_cache = (time() + EMBY_LIBRARIES_TTL, libraries)
+    return libraries
+
+
+def invalidate_libraries_cache():
+    """资料库变动后清除缓存"""
+    global _libraries_cache
+    _libraries_cache = (0, None)
+
+
+def update_policy_libraries(
+    policy: dict, libraries: dict, library: list, grant: bool
+) -> dict:
+    """
+    在用户 policy 中开启或关闭资料库权限
+
+    Args:
+        policy: 用户的 Policy，原地修改
+        libraries: get_libraries() 的返回值
+        library: 资料库名称列表
+        grant: True 为开启，False 为关闭
+    """
+    enabled_folders = policy.get("EnabledFolders")
+    excluded_subfolders = policy.get("ExcludedSubFolders")
+    for lib_name in library:
+        lib = libraries.get(lib_name)
+        if lib is None:
+            logger.warning(f"Emby 资料库 {lib_name} 不存在，跳过")
+            continue
+        guid = lib.get("guid")
+        # 如果已经有（或没有）该资料库的权限，则跳过
+        if (guid in enabled_folders) == grant:
+            continue
+        if grant:
+            enabled_folders.append(guid)
+        else:
+            enabled_folders.remove(guid)
+        for subfolder in lib.get("subfolders_id"):
+            subfolder_id = f"{guid}_{subfolder}"
+            if grant and subfolder_id in excluded_subfolders:
+                excluded_subfolders.remove(subfolder_id)
+            elif not grant and subfolder_id not in excluded_subfolders:
+                excluded_subfolders.append(subfolder_id)
+    return policy
+
+
+class Emby:
     def __init__(
         self,
         base_url: str = settings.EMBY_BASE_URL,
@@ -40,7 +180,7 @@ class Emby:
         }
 
         try:
-            response = requests.post(
+            response = _http.post(
                 url=self.base_url + "/Users/New" + f"?api_key={self.api_token}",
                 data=json.dumps(data),
                 headers=header,
@@ -67,7 +207,7 @@ class Emby:
 
         data = {"Id": emby_id, "NewPw": new_password, "ResetPassword": False}
         try:
-            response = requests.post(
+            response = _http.post(
                 url=self.base_url
                 + f"/Users/{emby_id}/Password"
                 + f"?api_key={self.api_token}",
@@ -88,96 +228,123 @@ class Emby:
     def get_uid_from_username(self, username: str) -> Optional[str]:
         return self.get_user_info_from_username(username).get("id")
 
+    def _build_user_info(self, item: dict) -> dict:
+        """根据 /Users/Query 返回的用户条目生成缓存信息"""
+        user_id = item["Id"]
+        primary_image_tag = item.get("PrimaryImageTag", "")
+        user_avatar = (
+            self.base_url
+            + "/Users/"
+            + user_id
+            + f"/Images/Primary?tag={primary_image_tag}&maxWidth=160&quality=90"
+            if primary_image_tag
+            else ""
+        )
+        return {
+            "id": user_id,
+            "name": item["Name"],
+            "avatar": user_avatar,
+            "date_created": item.get("DateCreated"),
+            "added_time": time(),
+        }
+
     def get_user_info_from_username(
         self, username: str, from_emby=True, is_hidden=settings.EMBY_USER_IS_HIDDEN
     ):
-        cache = {}
-        user_info = {}
-        with self.cache_lock:
-            if self.cache.exists():
-                with open(self.cache, "rb") as f:
-                    cache = pickle.load(f)
-            if username in cache:
-                user_info = cache[username]
-                # 如果缓存中的用户信息未过期，则直接返回
-                if time() - user_info.get("added_time", 0) < 7 * 24 * 3600:
-                    logger.debug(f"Cache hit for {username}: {user_info}")
-                    return user_info
-
-            if not from_emby:
-                # 如果不从 Emby 获取，则直接返回过期信息或者空字典
-                return user_info
-
-            headers = {"accept": "application/json"}
-
-            params = {
-                "IsHidden": str(is_hidden).lower(),
-                "IsDisabled": "false",
-                "Limit": "1",
-                "NameStartsWithOrGreater": username,
-                "api_key": self.api_token,
-            }
+        user_info = emby_user_info_cache.get(username)
+        # 如果缓存中的用户信息未过期，则直接返回
+        if user_info and time() - user_info.get("added_time", 0) < EMBY_USER_INFO_TTL:
+            logger.debug(f"Cache hit for {username}: {user_info}")
+            return user_info
 
-            retry = 3
-            name = None
-            while retry > 0:
-                try:
-                    response = requests.get(
-                        url=self.base_url + "/Users/Query",
-                        params=params,
-                        headers=headers,
-                    )
-
-                    response_json = response.json()
-                    logger.debug(f"{response_json=}")
-
-                    if response.status_code == 200:
-                        if (
-                            response_json.get("Items") is None
-                            or len(response_json["Items"]) == 0
-                        ):
-                            # 用户不存在
-                            return {}
-                        name = response_json["Items"][0]["Name"]
-                        break
-                    response.raise_for_status()
-                except Exception as e:
-                    logger.error(f"Error fetching user ID for {username}: {e}")
-                    retry -= 1
-
-            # 判断用户名是否一致
-            if name != username:
-                return {}
-
-            user_id = response_json["Items"][0]["Id"]
-            primary_image_tag = response_json["Items"][0].get("PrimaryImageTag", "")
-            user_avatar = (
-                self.base_url
-                + "/Users/"
-                + user_id
-                + f"/Images/Primary?tag={primary_image_tag}&maxWidth=160&quality=90"
-                if primary_image_tag
-                else ""
+        if not from_emby:
+            # 如果不从 Emby 获取，则直接返回过期信息或者空字典
+            return user_info
+
+        headers = {"accept": "application/json"}
+
+        params = {
+            "IsHidden": str(is_hidden).lower(),
+            "IsDisabled": "false",
+            "Limit": "1",
+            "NameStartsWithOrGreater": username,
+            "api_key": self.api_token,
+        }
+
+        retry = 3
+        name = None
+        while retry > 0:
+            try:
+                response = _http.get(
+                    url=self.base_url + "/Users/Query",
+                    params=params,
+                    headers=headers,
+                )
+
+                response_json = response.json()
+                logger.debug(f"{response_json=}")
+
+                if response.status_code == 200:
+                    if (
+                        response_json.get("Items") is None
+                        or len(response_json["Items"]) == 0
+                    ):
+                        # 用户不存在
+                        return {}
+                    name = response_json["Items"][0]["Name"]
+                    break
+                response.raise_for_status()
+            except Exception as e:
+                logger.error(f"Error fetching user ID for {username}: {e}")
+                retry -= 1
+
+        # 判断用户名是否一致
+        if name != username:
+            return {}
+
+        user_info = self._build_user_info(response_json["Items"][0])
+        emby_user_info_cache.update({username: user_info})
+        logger.info(f"Updated user info for {username}: {user_info}")
+
+        return user_info
+
+    def refresh_user_info_cache(self) -> int:
+        """
+        通过一次 /Users/Query 请求获取全部用户，批量刷新用户信息缓存
+
+        Returns:
+            刷新的用户数，请求失败返回 -1
+        """
+        try:
+            response = _http.get(
+                url=self.base_url + "/Users/Query",
+                params={"IsDisabled": "false", "api_key": self.api_token},
+                headers={"accept": "application/json"},
             )
-            user_info = {
-                "id": user_id,
-                "name": name,
-                "avatar": user_avatar,
-                "date_created": response_json["Items"][0]["DateCreated"],
-                "added_time": time(),
-            }
-            cache[username] = user_info
-            with open(self.cache, "wb") as f:
-                pickle.dump(cache, f)
-            logger.info(f"Updated user info for {username}: {user_info}")
+            response.raise_for_status()
+            items = response.json().get("Items") or []
+        except Exception as e:
+            logger.error(f"Error fetching emby users: {e}")
+            return -1
 
-            return user_info
+        entries = {item["Name"]: self._build_user_info(item) for item in items}
+        emby_user_info_cache.update(entries)
+        logger.info(f"已刷新 {len(entries)} 个 Emby 用户的信息缓存")
+        return len(entries)
 
     def get_user_avatar_by_username(self, username: str, from_emby=True) -> str:
         """获取用户头像 URL"""
         user_info = self.get_user_info_from_username(username, from_emby)
         return user_info.get("avatar", "")
 
+    @staticmethod
+    def get_user_avatars_by_usernames(usernames) -> dict[str, str]:
+        """从缓存批量获取用户头像 URL，返回 {username: avatar}"""
+        return {
+            username: user_info.get("avatar", "")
+            for username, user_info in emby_user_info_cache.get_many(usernames).items()
+        }
+
     def get_user_total_play_time(self) -> dict[str, str]:
         headers = {"accept": "application/json", "Content-Type": "application/json"}
 
@@ -187,7 +354,7 @@ class Emby:
             "ReplaceUserId": False,
         }
 
-        response = requests.post(
+        response = _http.post(
             url=self.base_url + "/user_usage_stats/submit_custom_query",
             params=params,
             headers=headers,
@@ -205,103 +372,35 @@ class Emby:
         return user_stats
 
     def get_libraries(self) -> dict[str, dict[str, Any]]:
+        libraries = _get_cached_libraries()
+        if libraries is not None:
+            return libraries
+
         headers = {"accept": "application/json"}
         params = {"api_key": self.api_token}
 
-        response = requests.get(
+        response = _http.get(
             url=self.base_url + "/Library/SelectableMediaFolders",
             headers=headers,
             params=params,
         )
+        response.raise_for_status()
+        return _set_cached_libraries(response.json())
 
-        libs = response.json()
-        libraries = {}
-        for lib in libs:
-            name = lib.get("Name")
-            guid = lib.get("Guid")
-            subfolders = lib.get("SubFolders", [])
-            subfolders_id = [folder.get("Id") for folder in subfolders]
-            libraries.update({name: {"guid": guid, "subfolders_id": subfolders_id}})
-
-        return libraries
-
-    def add_user_library(self, user_id, library=settings.NSFW_LIBS):
+    def _update_user_libraries(self, user_id, library: list, grant: bool):
         headers = {"accept": "application/json", "Content-Type": "application/json"}
         params = {"api_key": self.api_token}
 
-        # 先获取该用户的 policy
-        response = requests.get(
-            url=self.base_url + f"/Users/{user_id}", params=params, headers=headers
-        )
-        policy = response.json().get("Policy")
-
-        libraries = self.get_libraries()
-
-        for lib_name in library:
-            lib = libraries.get(lib_name)
-            guid = lib.get("guid")
-            subfolders_id = lib.get("subfolders_id")
-            enabled_folders = policy.get("EnabledFolders")
-            excluded_subfolders = policy.get("ExcludedSubFolders")
-            # 如果已经有该资料库的权限，则跳过
-            if guid in enabled_folders:
-                continue
-            # 增加资料库权限
-            enabled_folders.append(guid)
-            for subfolder in subfolders_id:
-                subfolder_id = f"{guid}_{subfolder}"
-                if subfolder_id in excluded_subfolders:
-                    excluded_subfolders.remove(subfolder_id)
-
-        # 更新权限设置
         try:
-            response = requests.post(
-                url=self.base_url + f"/Users/{user_id}/Policy",
-                data=json.dumps(policy),
-                params=params,
-                headers=headers,
+            # 先获取该用户的 policy
+            response = _http.get(
+                url=self.base_url + f"/Users/{user_id}", params=params, headers=headers
             )
-            if response:
-                if response.status_code in [200, 204]:
-                    return True, "ok"
-                else:
-                    return False, response.text
-            else:
-                return False, "Unknown error"
-        except Exception as e:
-            return False, str(e)
-
-    def remove_user_library(self, user_id, library=settings.NSFW_LIBS):
-        headers = {"accept": "application/json", "Content-Type": "application/json"}
-        params = {"api_key": self.api_token}
-
-        # 先获取该用户的 policy
-        response = requests.get(
-            url=self.base_url + f"/Users/{user_id}", headers=headers, params=params
-        )
-        policy = response.json().get("Policy")
-
-        libraries = self.get_libraries()
-
-        for lib_name in library:
-            lib = libraries.get(lib_name)
-            guid = lib.get("guid")
-            subfolders_id = lib.get("subfolders_id")
-            enabled_folders = policy.get("EnabledFolders")
-            excluded_subfolders = policy.get("ExcludedSubFolders")
-            # 如果没有该资料库的权限，则跳过
-            if guid not in enabled_folders:
-                continue
-            # 更新资料库权限
-            enabled_folders.remove(guid)
-            for subfolder in subfolders_id:
-                subfolder_id = f"{guid}_{subfolder}"
-                if subfolder_id not in excluded_subfolders:
-                    excluded_subfolders.append(subfolder_id)
+            policy = response.json().get("Policy")
+            update_policy_libraries(policy, self.get_libraries(), library, grant)
 
-        # 更新权限设置
-        try:
-            response = requests.post(
+            # 更新权限设置
+            response = _http.post(
                 url=self.base_url + f"/Users/{user_id}/Policy",
                 data=json.dumps(policy),
                 params=params,
@@ -317,13 +416,19 @@ class Emby:
         except Exception as e:
             return False, str(e)
 
+    def add_user_library(self, user_id, library=settings.NSFW_LIBS):
+        return self._update_user_libraries(user_id, library, grant=True)
+
+    def remove_user_library(self, user_id, library=settings.NSFW_LIBS):
+        return self._update_user_libraries(user_id, library, grant=False)
+
     def __get_url(self, url) -> list:
         headers = {
             "accept": "application/json",
             "X-Emby-Token": self.api_token,
         }
         try:
-            res = requests.get(url, headers=headers)
+            res = _http.get(url, headers=headers)
             res.raise_for_status()
         except requests.RequestException as e:
             logger.error(f"Failed to get {url}: {e}")
@@ -396,7 +501,7 @@ class Emby:
         data = {"Username": username, "Pw": password}
 
         try:
-            response = requests.post(
+            response = _http.post(
                 url=self.base_url + "/Users/AuthenticateByName",
                 headers=headers,
                 json=data,
@@ -421,34 +526,261 @@ class Emby:
             logger.error(f"Emby用户 {username} 认证时发生错误: {str(e)}")
             return False, None
 
+
+class AsyncEmby:
+    """
+    异步 Emby API 客户端
+
+    所有请求复用同一个 aiohttp 会话（keep-alive 连接池），批量操作的并发数
+    受 settings.EMBY_API_CONCURRENCY 限制。会话与所在事件循环绑定，
+    请通过 get_async_emby() 获取当前线程的实例。
+    """
+
+    AUTHORIZATION = (
+        'MediaBrowser Token="", UserId="", Client="PMSManageBot", Device="Linux", '
+        'DeviceId="4729AEE7-110E-4B0F-9DC3-E7E461C6E5DA", Version="1.0.0.0"'
+    )
+
+    def __init__(
+        self,
+        base_url: str = settings.EMBY_BASE_URL,
+        api_token: str = settings.EMBY_API_TOKEN,
+        concurrency: int = settings.EMBY_API_CONCURRENCY,
+    ) -> None:
+        self.base_url = base_url.rstrip("/")
+        self.api_token = api_token
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._libraries_lock = asyncio.Lock()
+
+    async def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=settings.EMBY_API_CONCURRENCY * 2,
+                keepalive_timeout=30,
+                enable_cleanup_closed=True,
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=30, connect=5),
+                headers={"accept": "application/json"},
+            )
+        return self._session
+
+    async def _request(self, method: str, path: str, **kwargs):
+        """发送请求，返回 (状态码, 响应内容)，JSON 响应会被解析"""
+        params = kwargs.pop("params", None) or {}
+        params.setdefault("api_key", self.api_token)
+        session = await self._get_session()
+        async with self._semaphore:
+            async with session.request(
+                method, self.base_url + path, params=params, **kwargs
+            ) as response:
+                if response.content_type == "application/json":
+                    return response.status, await response.json()
+                return response.status, await response.text()
+
+    async def close(self):
+        if self._session and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    async def get_users(self) -> list:
+        try:
+            status, data = await self._request("GET", "/Users/Query")
+            if status == 200:
+                return data.get("Items", [])
+            logger.error(f"Failed to get emby users: {status}, {data}")
+        except Exception as e:
+            logger.error(f"Failed to get emby users: {e}")
+        return []
+
+    async def get_libraries(self) -> dict[str, dict[str, Any]]:
+        libraries = _get_cached_libraries()
+        if libraries is not None:
+            return libraries
+        # 缓存失效时只有一个协程请求 Emby，其余等待结果
+        async with self._libraries_lock:
+            libraries = _get_cached_libraries()
+            if libraries is not None:
+                return libraries
+            status, data = await self._request("GET", "/Library/SelectableMediaFolders")
+            if status != 200:
+                raise RuntimeError(f"Failed to get emby libraries: {status}, {data}")
+            return _set_cached_libraries(data)
+
+    async def _update_user_libraries(self, user_id, library: list, grant: bool):
+        try:
+            # 先获取该用户的 policy
+            status, data = await self._request("GET", f"/Users/{user_id}")
+            if status != 200:
+                return False, str(data)
+            policy = update_policy_libraries(
+                data.get("Policy"), await self.get_libraries(), library, grant
+            )
+            # 更新权限设置
+            status, data = await self._request(
+                "POST", f"/Users/{user_id}/Policy", json=policy
+            )
+            if status in [200, 204]:
+                return True, "ok"
+            return False, str(data) or "Unknown error"
+        except Exception as e:
+            return False, str(e)
+
+    async def add_user_library(self, user_id, library=settings.NSFW_LIBS):
+        return await self._update_user_libraries(user_id, library, grant=True)
+
+    async def remove_user_library(self, user_id, library=settings.NSFW_LIBS):
+        return await self._update_user_libraries(user_id, library, grant=False)
+
+    async def update_all_users_library(
+        self, library: Union[str, list], grant: bool = True
+    ) -> dict[str, tuple[bool, str]]:
+        """
+        并发更新所有用户的资料库权限
+
+        Returns:
+            {用户名: (是否成功, 信息)}
+        """
+        if isinstance(library, str):
+            library = [library]
+        users = [
+            user
+            for user in await self.get_users()
+            if user.get("Name", "").lower() not in ["ggbond", "huahua"]
+        ]
+        # 预先加载资料库信息，避免各任务同时请求
+        await self.get_libraries()
+        results = await asyncio.gather(
+            *[
+                self._update_user_libraries(user.get("Id"), library, grant)
+                for user in users
+            ]
+        )
+        failed = 0
+        for user, (flag, msg) in zip(users, results):
+            if not flag:
+                failed += 1
+                logger.error(f"更新 Emby 用户 {user.get('Name')} 资料库权限失败: {msg}")
+        logger.info(
+            f"已更新 {len(users) - failed}/{len(users)} 个 Emby 用户的资料库权限"
+        )
+        return {user.get("Name"): result for user, result in zip(users, results)}
+
+    async def get_uid_from_username(self, username: str) -> Optional[str]:
+        """从用户信息缓存获取用户 ID，缓存未命中时在线程池中查询"""
+        return (
+            await asyncio.to_thread(
+                Emby(self.base_url, self.api_token).get_user_info_from_username,
+                username,
+            )
+        ).get("id")
+
+    async def change_user_password(self, emby_id, new_password: str) -> bool:
+        """修改用户密码"""
+        data = {"Id": emby_id, "NewPw": new_password, "ResetPassword": False}
+        try:
+            status, text = await self._request(
+                "POST", f"/Users/{emby_id}/Password", json=data
+            )
+            if status in [200, 204]:
+                return True
+            logger.error(f"Error changing password for {emby_id}: {status}/{text}")
+        except Exception as e:
+            logger.error(f"Error changing password for {emby_id}: {e}")
+        return False
+
+    async def add_user(
+        self,
+        username: str,
+        password: str,
+        user_template: str = settings.EMBY_USER_TEMPLATE,
+    ) -> tuple[bool, str]:
+        data = {
+            "Name": username,
+            "CopyFromUserId": await self.get_uid_from_username(user_template),
+            "UserCopyOptions": ["UserPolicy"],
+        }
+        try:
+            status, result = await self._request("POST", "/Users/New", json=data)
+            if status != 200:
+                return False, str(result) or "Unknown error"
+            emby_id = result["Id"]
+            # 修改密码
+            if await self.change_user_password(emby_id, new_password=password):
+                return True, emby_id
+            return False, "Failed to change user password"
+        except Exception as e:
+            return False, str(e)
+
+    async def authenticate_user(
+        self, username: str, password: str
+    ) -> tuple[bool, Optional[str]]:
+        """
+        验证Emby用户的用户名和密码
+        返回 (是否验证成功, 用户ID) 的元组
+        """
+        try:
+            status, data = await self._request(
+                "POST",
+                "/Users/AuthenticateByName",
+                params={"api_key": ""},
+                headers={"X-Emby-Authorization": self.AUTHORIZATION},
+                json={"Username": username, "Pw": password},
+            )
+            if status != 200:
+                logger.warning(f"Emby用户 {username} 认证失败：{status} - {data}")
+                return False, None
+            user_id = data.get("User", {}).get("Id")
+            if user_id:
+                logger.info(f"Emby用户 {username} 认证成功")
+                return True, user_id
+            logger.warning(f"Emby用户 {username} 认证失败：无法获取用户ID")
+        except Exception as e:
+            logger.error(f"Emby用户 {username} 认证时发生错误: {str(e)}")
+        return False, None
+
     async def get_emby_username_from_api_key(self, api_key: str) -> Optional[str]:
         """
         请求 Emby API 获取用户名
         """
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(
-                    f"{self.base_url.rstrip('/')}/Sessions?api_key={api_key}"
-                ) as response:
-                    response.raise_for_status()
-                    if response.status == 200:
-                        sessions = await response.json()
-                        usernames = set()
-                        for session in sessions:
-                            if "UserName" in session:
-                                usernames.add(session["UserName"].lower())
-                        if len(usernames) == 1:
-                            # 只有一个用户名才认为是有效的
-                            username = str(usernames.pop()).lower()
-                            logger.info(f"Got username from api_key: {username}")
-                            emby_api_key_cache.put(api_key, username)
-                            return username
-                        else:
-                            logger.info("Multi usernames found, maybe admin, skip")
-                    else:
-                        logger.error(
-                            f"Failed to get username: {response.status}, {await response.text()}"
-                        )
+            status, sessions = await self._request(
+                "GET", "/Sessions", params={"api_key": api_key}
+            )
+            if status != 200:
+                logger.error(f"Failed to get username: {status}, {sessions}")
+                return None
+            usernames = {
+                session["UserName"].lower()
+                for session in sessions
+                if "UserName" in session
+            }
+            if len(usernames) == 1:
+                # 只有一个用户名才认为是有效的
+                username = usernames.pop()
+                logger.info(f"Got username from api_key: {username}")
+                emby_api_key_cache.put(api_key, username)
+                return username
+            logger.info("Multi usernames found, maybe admin, skip")
         except Exception as e:
             logger.error(f"Error fetching Emby username: {e}")
         return None
+
+
+# 每个线程（事件循环）一个客户端
+_thread_local_async_emby = threading.local()
+
+
+def get_async_emby() -> AsyncEmby:
+    if not hasattr(_thread_local_async_emby, "client"):
+        _thread_local_async_emby.client = AsyncEmby()
+    return _thread_local_async_emby.client
+
+
+async def close_async_emby():
+    """关闭当前线程的异步客户端"""
+    client = getattr(_thread_local_async_emby, "client", None)
+    if client is not None:
+        await client.close()
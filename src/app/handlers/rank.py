@@ -1,8 +1,15 @@
 from app.config import settings
 from app.db import DB
 from app.emby import Emby
+from app.leaderboard import (
+    credits_leaderboard,
+    donation_leaderboard,
+    emby_watched_time_leaderboard,
+    get_leaderboard_rank,
+    plex_watched_time_leaderboard,
+)
 from app.log import logger
-from app.utils.utils import get_user_name_from_tg_id, send_message
+from app.utils.utils import get_user_names_from_tg_ids, send_message
 from telegram import Update
 from telegram.ext import CommandHandler, ContextTypes
 
@@ -10,12 +17,11 @@ from telegram.ext import CommandHandler, ContextTypes
 # 积分榜
 async def credits_rank(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     chat_id = update._effective_chat.id
-    _db = DB()
-    res = _db.get_credits_rank()
+    res, _ = get_leaderboard_rank(credits_leaderboard, 30)
+    names = get_user_names_from_tg_ids(int(tg_id) for tg_id, _ in res)
     rank = [
-        f"{i}. {get_user_name_from_tg_id(info[0])}: {info[1]:.2f}"
-        for i, info in enumerate(res, 1)
-        if i <= 30
+        f"{i}. {names[int(tg_id)]}: {credits:.2f}"
+        for i, (tg_id, credits) in enumerate(res, 1)
     ]
 
     body_text = """
@@ -35,12 +41,11 @@ async def credits_rank(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
 # 捐赠榜
 async def donation_rank(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     chat_id = update._effective_chat.id
-    _db = DB()
-    res = _db.get_donation_rank()
+    res, _ = get_leaderboard_rank(donation_leaderboard, 100, min_score=0)
+    names = get_user_names_from_tg_ids(int(tg_id) for tg_id, _ in res)
     rank = [
-        f"{i}. {get_user_name_from_tg_id(info[0])}: {info[1]:.2f}"
-        for i, info in enumerate(res, 1)
-        if info[1] > 0
+        f"{i}. {names[int(tg_id)]}: {donation:.2f}"
+        for i, (tg_id, donation) in enumerate(res, 1)
     ]
 
     body_text = """
@@ -60,16 +65,23 @@ async def donation_rank(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
 # 观看时长榜
 async def watched_time_rank(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     chat_id = update._effective_chat.id
+    res, _ = get_leaderboard_rank(plex_watched_time_leaderboard, 15)
+    emby_res, _ = get_leaderboard_rank(emby_watched_time_leaderboard, 15)
     _db = DB()
-    res = _db.get_plex_watched_time_rank()
+    try:
+        plex_users = _db.get_plex_rank_info_by_ids([int(m) for m, _ in res])
+        emby_users = _db.get_emby_rank_info_by_ids([m for m, _ in emby_res])
+    finally:
+        _db.close()
     rank = [
-        f"{i}. {info[2]}: {info[3]:.2f}" for i, info in enumerate(res, 1) if i <= 15
+        f"{i}. {plex_users[int(plex_id)][1]}: {watched_time:.2f}"
+        for i, (plex_id, watched_time) in enumerate(res, 1)
+        if int(plex_id) in plex_users
     ]
-    emby_res = _db.get_emby_watched_time_rank()
     emby_rank = [
-        f"{i}. {info[1]}: {info[2]:.2f}"
-        for i, info in enumerate(emby_res, 1)
-        if i <= 15
+        f"{i}. {emby_users[emby_id][1]}: {watched_time:.2f}"
+        for i, (emby_id, watched_time) in enumerate(emby_res, 1)
+        if emby_id in emby_users
     ]
     body_text = """
 <strong>观看时长榜 (Hour)</strong>
@@ -0,0 +1,209 @@
+"""
+基于 Redis 有序集合的排行榜
+
+积分、捐赠、Plex/Emby 观看时长排行分别保存在一个 ZSET 中，由写入对应字段的代码
+在数据库提交后同步更新，启动时及定时任务中以数据库为准全量重建。
+读取排行时一次往返即可得到前 N 名及当前用户自己的排名。
+"""
+
+import traceback
+from typing import Callable, Optional
+
+from app.log import logger
+from app.redis import Redis
+
+
+class Leaderboard:
+    def __init__(self, name: str, loader: Callable, db: int = 0):
+        """
+        初始化排行榜
+
+        Args:
+            name: 排行榜名称，Redis 键为 leaderboard:{name}
+            loader: 接收 DB 实例，返回全量数据 {成员: 分数} 的函数
+            db: Redis 数据库编号
+        """
+        self.name = name
+        self.key = f"leaderboard:{name}"
+        # 记录最近一次重建的成员数，排行榜为空时也能判断已经建立
+        self.built_key = f"leaderboard:{name}:built"
+        self.loader = loader
+        self.redis_client = Redis(db=db).get_connection()
+
+    def update(self, scores: dict):
+        """
+        设置成员分数（不存在则新增）
+
+        Args:
+            scores: {成员: 分数}
+        """
+        scores = {str(member): score for member, score in scores.items() if member}
+        if not scores:
+            return
+        try:
+            self.redis_client.zadd(self.key, scores)
+        except Exception as e:
+            logger.error(f"更新排行榜 {self.name} 失败: {e}")
+
+    def incr(self, member, amount: float):
+        """
+        增减已有成员的分数，成员不存在时忽略（由全量重建补齐）
+        """
+        try:
+            self.redis_client.zadd(self.key, {str(member): amount}, xx=True, incr=True)
+        except Exception as e:
+            logger.error(f"更新排行榜 {self.name} 失败: {e}")
+
+    def rebuild(self, scores: dict):
+        """
+        以给定数据全量重建排行榜，重建过程中读取方看到的始终是完整的旧数据或新数据
+
+        Args:
+            scores: {成员: 分数}
+        """
+        tmp_key = f"{self.key}:rebuilding"
+        pipeline = self.redis_client.pipeline(transaction=True)
+        pipeline.delete(tmp_key)
+        scores = {str(member): score for member, score in scores.items() if member}
+        if scores:
+            pipeline.zadd(tmp_key, scores)
+            pipeline.rename(tmp_key, self.key)
+        else:
+            pipeline.delete(self.key)
+        pipeline.set(self.built_key, len(scores))
+        pipeline.execute()
+
+    def rebuild_from_db(self, db=None):
+        """
+        以数据库为准全量重建排行榜
+
+        Args:
+            db: DB 实例，不传入时临时创建
+
+        Returns:
+            重建后的成员数
+        """
+        from app.db import DB
+
+        _db = db or DB()
+        try:
+            scores = self.loader(_db)
+        finally:
+            if db is None:
+                _db.close()
+        self.rebuild(scores)
+        return len(scores)
+
+    def get_rank(
+        self,
+        limit: Optional[int] = None,
+        member=None,
+        min_score: Optional[float] = None,
+    ) -> tuple[list[tuple[str, float]], Optional[tuple[int, float]]]:
+        """
+        获取前 N 名及指定成员的排名
+
+        Args:
+            limit: 返回的名次数量，为 None 时返回全部
+            member: 需要查询排名的成员（一般为当前用户）
+            min_score: 只统计分数大于该值的成员
+
+        Returns:
+            ([(成员, 分数), ...], (排名, 分数) 或 None)，排名从 1 开始
+        """
+        min_ = f"({min_score}" if min_score is not None else "-inf"
+
+        pipeline = self.redis_client.pipeline(transaction=False)
+        if limit is None:
+            pipeline.zrevrangebyscore(self.key, "+inf", min_, withscores=True)
+        else:
+            pipeline.zrevrangebyscore(
+                self.key, "+inf", min_, start=0, num=limit, withscores=True
+            )
+        if member is not None:
+            pipeline.zscore(self.key, str(member))
+            pipeline.zrevrank(self.key, str(member))
+        results = pipeline.execute()
+
+        own = None
+        if member is not None:
+            score, rank = results[1], results[2]
+            if score is not None and (min_score is None or score > min_score):
+                own = (rank + 1, score)
+        return results[0], own
+
+    def exists(self) -> bool:
+        """
+        排行榜是否已经建立：有重建标记，且标记的成员数为 0 或数据仍在
+        （数据被淘汰而标记仍在时视为未建立）
+        """
+        pipeline = self.redis_client.pipeline(transaction=False)
+        pipeline.get(self.built_key)
+        pipeline.exists(self.key)
+        built, exists = pipeline.execute()
+        if built is None:
+            return False
+        return bool(exists) or int(built) == 0
+
+
+# 积分榜，成员为 tg_id
+credits_leaderboard = Leaderboard(
+    "credits",
+    lambda db: {row[0]: row[1] or 0 for row in db.get_credits_rank()},
+)
+# 捐赠榜，成员为 tg_id
+donation_leaderboard = Leaderboard(
+    "donation",
+    lambda db: {row[0]: row[1] or 0 for row in db.get_donation_rank()},
+)
+# Plex 观看时长榜，成员为 plex_id
+plex_watched_time_leaderboard = Leaderboard(
+    "plex_watched_time",
+    lambda db: {row[0]: row[3] or 0 for row in db.get_plex_watched_time_rank()},
+)
+# Emby 观看时长榜，成员为 emby_id
+emby_watched_time_leaderboard = Leaderboard(
+    "emby_watched_time",
+    lambda db: {row[0]: row[2] or 0 for row in db.get_emby_watched_time_rank()},
+)
+
+LEADERBOARDS = (
+    credits_leaderboard,
+    donation_leaderboard,
+    plex_watched_time_leaderboard,
+    emby_watched_time_leaderboard,
+)
+
+
+def rebuild_leaderboards():
+    """以数据库为准全量重建所有排行榜"""
+    from app.db import DB
+
+    _db = DB()
+    try:
+        counts = {board.name: board.rebuild_from_db(_db) for board in LEADERBOARDS}
+        logger.info(f"排行榜重建完成：{counts}")
+    except Exception as e:
+        logger.error(f"重建排行榜失败: {e}")
+        logger.error(traceback.format_exc())
+    finally:
+        _db.close()
+
+
+def get_leaderboard_rank(
+    leaderboard: Leaderboard,
+    limit: Optional[int] = None,
+    member=None,
+    min_score: Optional[float] = None,
+):
+    """
+    读取排行榜，排行榜尚未建立（如 Redis 数据丢失）时先从数据库重建该排行榜
+
+    参数及返回值同 Leaderboard.get_rank
+    """
+    if not leaderboard.exists():
+        try:
+            leaderboard.rebuild_from_db()
+        except Exception as e:
+            logger.error(f"重建排行榜 {leaderboard.name} 失败: {e}")
+    return leaderboard.get_rank(limit, member, min_score)
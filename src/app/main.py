@@ -3,17 +3,25 @@ import datetime
 import threading
 from copy import copy
 
+from app.cache import migrate_cache_namespaces
 from app.config import settings
+from app.db import init_db
+from app.db_profiler import query_profiler
 from app.handlers.rank import *
 from app.handlers.start import *
 from app.handlers.status import *
 from app.handlers.user import *
+from app.leaderboard import rebuild_leaderboards
 from app.log import logger
+from app.notifier import run_notification_dispatcher
 from app.premium import check_premium_expiring_soon, check_premium_expiry
 from app.scheduler import Scheduler
+from app.traffic import run_traffic_log_consumer
 from app.update_db import (
+    cleanup_traffic_rollups,
     finish_expired_auctions_job,
     monthly_traffic_data_migration,
+    reconcile_user_daily_traffic,
     rewrite_users_credits_to_redis,
     update_credits,
     update_line_traffic_stats,
@@ -143,16 +151,62 @@ def add_init_scheduler_job():
     )
     logger.info("添加定时任务：每天早上 09:00 检查即将过期的 Premium 用户")
 
-    # 每 1min 处理一次线路流量统计
+    # 常驻服务限速发送发件箱中的通知消息
     scheduler.add_async_job(
-        func=update_line_traffic_stats,
+        func=run_notification_dispatcher,
+        trigger="date",
+        id="notification_dispatcher",
+        replace_existing=True,
+        max_instances=1,
+    )
+    logger.info("添加常驻任务：发送通知消息")
+
+    if settings.TRAFFIC_CONSUMER_ENABLE:
+        # 常驻消费者实时处理线路流量统计
+        scheduler.add_async_job(
+            func=run_traffic_log_consumer,
+            trigger="date",
+            id="traffic_log_consumer",
+            replace_existing=True,
+            max_instances=1,
+        )
+        logger.info("添加常驻任务：实时消费线路流量日志")
+    else:
+        # 每 1min 处理一次线路流量统计
+        scheduler.add_async_job(
+            func=update_line_traffic_stats,
+            trigger="cron",
+            id="update_line_traffic_stats",
+            replace_existing=True,
+            max_instances=1,
+            minute="*/1",  # 每 1 分钟执行一次
+        )
+        logger.info("添加定时任务：每 1 分钟更新线路流量统计信息")
+
+    # 每天凌晨 2:00 清理过期的分钟/小时级流量汇总数据 (同步任务)
+    scheduler.add_sync_job(
+        func=cleanup_traffic_rollups,
+        trigger="cron",
+        id="cleanup_traffic_rollups",
+        replace_existing=True,
+        max_instances=1,
+        hour=2,
+        minute=0,
+    )
+    logger.info("添加定时任务：每天凌晨 02:00 清理过期的流量汇总数据")
+
+    # 每 1h 以数据库为准校准一次用户每日流量计数 (同步任务)
+    scheduler.add_sync_job(
+        func=reconcile_user_daily_traffic,
         trigger="cron",
-        id="update_line_traffic_stats",
+        id="reconcile_user_daily_traffic",
         replace_existing=True,
         max_instances=1,
-        minute="*/1",  # 每 1 分钟执行一次
+        minute=30,
+        next_run_time=datetime.datetime.now(settings.TZ)
+        + datetime.timedelta(seconds=30),  # 启动后执行一次
     )
-    logger.info("添加定时任务：每 1 分钟更新线路流量统计信息")
+    logger.info("添加定时任务：每 1 小时校准用户每日流量计数")
 
     # 每 5min 更新一次积分信息
     scheduler.add_sync_job(
@@ -165,6 +219,17 @@ def add_init_scheduler_job():
     )
     logger.info("添加定时任务：每 5 分钟更新用户积分信息")
 
+    # 每 1h 以数据库为准重建一次排行榜，兜底直接修改数据库等未同步的写入 (同步任务)
+    scheduler.add_sync_job(
+        func=rebuild_leaderboards,
+        trigger="cron",
+        id="rebuild_leaderboards",
+        replace_existing=True,
+        max_instances=1,
+        minute=45,
+    )
+    logger.info("添加定时任务：每 1 小时重建排行榜")
+
     # 每 1h 更新一次用户信息
     scheduler.add_sync_job(
         func=write_user_info_cache,
@@ -191,16 +256,41 @@ def add_init_scheduler_job():
     )
     logger.info("添加定时任务：每月 1 号凌晨 1:00 执行月度流量数据迁移聚合")
 
+    if settings.DB_PROFILE:
+        # 每 5 分钟保存一次慢查询统计，供命令行查看
+        scheduler.add_sync_job(
+            func=query_profiler.dump,
+            trigger="interval",
+            id="dump_query_profile",
+            replace_existing=True,
+            max_instances=1,
+            minutes=5,
+        )
+        logger.info("添加定时任务：每 5 分钟保存慢查询统计")
+
 
 if __name__ == "__main__":
     logger.info("启动 PMSManageBot 服务...")
 
+    # 初始化数据库（建表及迁移只在启动时执行一次）
+    init_db()
+    # 以数据库为准重建排行榜
+    rebuild_leaderboards()
+    # 将旧格式的缓存键迁移到 HASH
+    migrate_cache_namespaces()
+
     # 启动定时任务
     logger.info("启动调度器...")
     add_init_scheduler_job()
 
     # 初始化 Telegram Bot 应用
-    application = ApplicationBuilder().token(settings.TG_API_TOKEN).build()
+    application = (
+        ApplicationBuilder()
+        .token(settings.TG_API_TOKEN)
+        .base_url(f"{settings.TG_API_BASE_URL}/bot")
+        .base_file_url(f"{settings.TG_API_BASE_URL}/file/bot")
+        .build()
+    )
 
     # 注册处理程序
     local_vars = copy(locals())
@@ -0,0 +1,350 @@
+"""
+进程内指标统计，以 Prometheus 文本格式输出（WebApp 的 /metrics 接口）
+
+Bot、调度器和 WebApp 运行在同一个进程中，所有指标都记录在本模块的注册表里：
+- Counter: 只增不减的计数
+- Histogram: 耗时分布
+- Gauge: 在抓取时通过回调函数取值（如 Redis 队列长度）
+"""
+
+import bisect
+import threading
+import time
+from abc import ABC, abstractmethod
+from functools import wraps
+from types import FunctionType
+from typing import Callable, Optional
+
+from app.log import logger
+
+# 默认的耗时分桶（秒）
+DEFAULT_BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1,
+    2.5,
+    5,
+    10,
+    30,
+    60,
+)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labelnames: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric(ABC):
+    type = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        registry.register(self)
+
+    def _label_values(self, labels: dict) -> tuple:
+        return tuple(labels.get(name, "") for name in self.labelnames)
+
+    def render(self) -> list[str]:
+        return [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type}",
+            *self._samples(),
+        ]
+
+    @abstractmethod
+    def _samples(self) -> list[str]:
+        """各样本行"""
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._label_values(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self) -> list[str]:
+        with self._lock:
+            values = dict(self._values)
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in values.items()
+        ]
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple = (),
+        buckets: tuple = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # {标签值: [各分桶计数..., 总数, 总和]}
+        self._values: dict[tuple, list] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._label_values(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            data = self._values.get(key)
+            if data is None:
+                data = self._values[key] = [0] * (len(self.buckets) + 2)
+            if index < len(self.buckets):
+                data[index] += 1
+            data[-2] += 1
+            data[-1] += value
+
+    def time(self, **labels):
+        """计时上下文管理器"""
+        return _Timer(self, labels)
+
+    def _samples(self) -> list[str]:
+        with self._lock:
+            values = {key: list(data) for key, data in self._values.items()}
+        samples = []
+        for key, data in values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, data):
+                cumulative += count
+                labels = _format_labels(
+                    self.labelnames, key, f'le="{_format_value(float(bound))}"'
+                )
+                samples.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key, 'le="+Inf"')
+            samples.append(f"{self.name}_bucket{labels} {data[-2]}")
+            labels = _format_labels(self.labelnames, key)
+            samples.append(f"{self.name}_count{labels} {data[-2]}")
+            samples.append(f"{self.name}_sum{labels} {_format_value(float(data[-1]))}")
+        return samples
+
+
+class _Timer:
+    def __init__(self, histogram: Histogram, labels: dict):
+        self._histogram = histogram
+        self._labels = labels
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self._histogram.observe(time.perf_counter() - self._start, **self._labels)
+
+
+class Gauge(Metric):
+    """抓取时调用回调函数取值，回调返回 {标签值元组: 值} 或单个数值"""
+
+    type = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple = (),
+        callback: Optional[Callable] = None,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.callback = callback
+
+    def _samples(self) -> list[str]:
+        try:
+            values = self.callback()
+        except Exception as e:
+            logger.warning(f"获取指标 {self.name} 失败: {e}")
+            return []
+        if not isinstance(values, dict):
+            values = {(): values}
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in values.items()
+        ]
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: dict[str, Metric] = {}
+
+    def register(self, metric: Metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"指标 {metric.name} 已存在")
+        self._metrics[metric.name] = metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+
+def render_metrics() -> str:
+    """以 Prometheus 文本格式输出所有指标"""
+    return registry.render()
+
+
+def timed_methods(histogram: Histogram, label: str = "method", exclude=()):
+    """
+    类装饰器：记录类中所有公开方法的耗时
+
+    Args:
+        histogram: 记录耗时的直方图
+        label: 方法名对应的标签名
+        exclude: 不记录的方法名
+    """
+
+    def wrap(name, func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - start, **{label: name})
+
+        return wrapper
+
+    def decorator(cls):
+        for name, attr in list(vars(cls).items()):
+            if (
+                name.startswith("_")
+                or name in exclude
+                or not isinstance(attr, FunctionType)
+            ):
+                continue
+            setattr(cls, name, wrap(name, attr))
+        return cls
+
+    return decorator
+
+
+### 指标定义 ###
+http_request_duration_seconds = Histogram(
+    "http_request_duration_seconds",
+    "WebApp 请求耗时",
+    ("method", "route", "status"),
+)
+db_query_duration_seconds = Histogram(
+    "db_query_duration_seconds", "DB 方法执行耗时", ("method",)
+)
+scheduler_job_duration_seconds = Histogram(
+    "scheduler_job_duration_seconds",
+    "定时任务执行耗时",
+    ("job",),
+    buckets=(0.01, 0.1, 0.5, 1, 5, 10, 30, 60, 300, 900, 3600),
+)
+scheduler_job_lag_seconds = Histogram(
+    "scheduler_job_lag_seconds",
+    "定时任务实际开始时间与计划时间之差",
+    ("job",),
+)
+scheduler_job_runs_total = Counter(
+    "scheduler_job_runs_total", "定时任务执行次数", ("job", "outcome")
+)
+redis_round_trips_total = Counter(
+    "redis_round_trips_total",
+    "Redis 往返次数（管道按一次计算）",
+    ("db", "command"),
+)
+telegram_messages_total = Counter(
+    "telegram_messages_total", "Telegram 通知发送结果", ("outcome",)
+)
+
+
+def _traffic_queue_backlog():
+    from app.cache import stream_traffic_cache
+    from app.traffic import TRAFFIC_LOG_QUEUE
+
+    return stream_traffic_cache.redis_client.llen(TRAFFIC_LOG_QUEUE)
+
+
+def _notification_outbox_backlog():
+    from app.notifier import get_notification_stats
+
+    stats = get_notification_stats()
+    return {("pending",): stats["pending"], ("processing",): stats["processing"]}
+
+
+Gauge(
+    "traffic_log_queue_length",
+    "待处理的流量日志数量",
+    callback=_traffic_queue_backlog,
+)
+Gauge(
+    "notification_outbox_length",
+    "Telegram 通知发件箱积压数量",
+    ("state",),
+    callback=_notification_outbox_backlog,
+)
+
+
+def instrument_scheduler(scheduler):
+    """通过 APScheduler 事件记录任务的执行耗时、延迟及结果"""
+    from apscheduler.events import (
+        EVENT_JOB_ERROR,
+        EVENT_JOB_EXECUTED,
+        EVENT_JOB_MISSED,
+        EVENT_JOB_SUBMITTED,
+    )
+
+    # {(job_id, 计划执行时间): 提交时的时间戳}
+    started: dict = {}
+
+    def on_submitted(event):
+        now = time.time()
+        for run_time in event.scheduled_run_times:
+            started[(event.job_id, run_time)] = now
+            scheduler_job_lag_seconds.observe(
+                max(0.0, now - run_time.timestamp()), job=event.job_id
+            )
+
+    def on_finished(event):
+        if event.code == EVENT_JOB_MISSED:
+            scheduler_job_runs_total.inc(job=event.job_id, outcome="missed")
+            return
+        start = started.pop((event.job_id, event.scheduled_run_time), None)
+        if start is not None:
+            scheduler_job_duration_seconds.observe(
+                time.time() - start, job=event.job_id
+            )
+        outcome = "error" if event.exception else "success"
+        scheduler_job_runs_total.inc(job=event.job_id, outcome=outcome)
+
+    scheduler.add_listener(on_submitted, EVENT_JOB_SUBMITTED)
+    scheduler.add_listener(
+        on_finished, EVENT_JOB_EXECUTED | EVENT_JOB_ERROR | EVENT_JOB_MISSED
+    )
@@ -0,0 +1,243 @@
+"""
+Telegram 通知发送队列
+
+调用方通过 enqueue_message 将消息写入 Redis 发件箱后立即返回，
+常驻的 NotificationDispatcher 并发地从发件箱取出消息发送：
+- 全局限速（默认 25 条/秒，低于 Telegram 约 30 条/秒的上限）
+- 同一会话的两条消息间隔不少于 1 秒
+- 收到 429 时按 retry_after 暂停所有发送后重试
+- 发送中的消息记录在各进程自己的 processing 列表中，进程重启后放回发件箱
+"""
+
+import asyncio
+import json
+import uuid
+from typing import Optional
+
+import aiohttp
+
+from app.config import settings
+from app.log import logger
+from app.metrics import telegram_messages_total
+from app.redis import AsyncRedis, Redis
+from app.utils.utils import AsyncRateLimiter, get_thread_safe_session
+from app.worker import (
+    beat,
+    default_worker_name,
+    heartbeat,
+    processing_key,
+    recover_processing,
+    run_forever,
+)
+
+NOTIFICATION_DB = 0
+NOTIFICATION_OUTBOX = "tg_notification_outbox"
+NOTIFICATION_STATS_KEY = f"{NOTIFICATION_OUTBOX}:stats"
+# Telegram 对同一会话的发送频率限制
+PER_CHAT_INTERVAL = 1.0
+
+# 写入发件箱及读取统计共用的连接（连接池在首次使用时才建立连接）
+_redis_client = Redis(db=NOTIFICATION_DB).get_connection()
+
+
+def enqueue_message(chat_id, text: str, **kwargs) -> bool:
+    """
+    将消息放入发件箱，由 NotificationDispatcher 异步发送
+
+    Args:
+        chat_id: Telegram chat ID
+        text: 消息内容
+        **kwargs: sendMessage 的其他参数，如 parse_mode、disable_notification
+
+    Returns:
+        bool: 是否成功放入发件箱
+    """
+    if not chat_id or not text or not text.strip():
+        logger.warning(f"忽略无效的通知消息: chat_id={chat_id}")
+        return False
+    message = json.dumps(
+        {
+            "id": uuid.uuid4().hex,
+            "chat_id": chat_id,
+            "text": text.strip(),
+            "params": kwargs,
+        },
+        ensure_ascii=False,
+    )
+    try:
+        _redis_client.rpush(NOTIFICATION_OUTBOX, message)
+        return True
+    except Exception as e:
+        logger.error(f"通知消息放入发件箱失败: chat_id={chat_id}, error: {e}")
+        return False
+
+
+def get_notification_stats() -> dict:
+    """获取发件箱积压数量及累计发送统计"""
+    pipeline = _redis_client.pipeline(transaction=False)
+    pipeline.llen(NOTIFICATION_OUTBOX)
+    pipeline.hgetall(NOTIFICATION_STATS_KEY)
+    pending, stats = pipeline.execute()
+    processing = sum(
+        _redis_client.llen(key)
+        for key in _redis_client.scan_iter(match=f"{NOTIFICATION_OUTBOX}:processing:*")
+    )
+    return {
+        "pending": pending,
+        "processing": processing,
+        **{key: int(value) for key, value in stats.items()},
+    }
+
+
+class NotificationDispatcher:
+    """常驻的通知发送服务"""
+
+    def __init__(
+        self,
+        name: Optional[str] = None,
+        concurrency: int = settings.TG_NOTIFY_CONCURRENCY,
+        rate: float = settings.TG_NOTIFY_RATE_LIMIT,
+        token: str = settings.TG_API_TOKEN,
+        max_retries: int = 5,
+        block_timeout: int = 5,
+    ):
+        self.name = name or default_worker_name()
+        self.url = f"{settings.TG_API_BASE_URL}/bot{token}/sendMessage"
+        self.max_retries = max_retries
+        self.block_timeout = block_timeout
+        self.redis_client = AsyncRedis(db=NOTIFICATION_DB).get_connection()
+        self.processing_key = processing_key(NOTIFICATION_OUTBOX, self.name)
+        self._limiter = AsyncRateLimiter(rate)
+        # 同时发送的消息数，达到上限后暂停拉取
+        self._slots = asyncio.Semaphore(concurrency)
+        self._tasks: set[asyncio.Task] = set()
+        self._stopping = asyncio.Event()
+        # 各会话下一次允许发送的时间
+        self._chat_next_time: dict = {}
+        # 收到 429 后暂停发送直到该时间
+        self._paused_until = 0.0
+        self.stats = {"sent": 0, "failed": 0, "retried": 0, "rate_limited": 0}
+
+    async def recover(self) -> int:
+        """将上次运行及已退出的发送服务遗留在 processing 列表中的消息放回发件箱头部"""
+        recovered = await recover_processing(
+            self.redis_client, NOTIFICATION_OUTBOX, self.name
+        )
+        if recovered:
+            logger.info(f"已将 {recovered} 条未发送的通知放回发件箱")
+        return recovered
+
+    async def _wait_turn(self, chat_id):
+        """等待会话间隔、429 暂停及全局限速"""
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        next_time = max(self._chat_next_time.get(chat_id, 0.0), now)
+        self._chat_next_time[chat_id] = next_time + PER_CHAT_INTERVAL
+        if next_time > now:
+            await asyncio.sleep(next_time - now)
+        while (delay := self._paused_until - loop.time()) > 0:
+            await asyncio.sleep(delay)
+        await self._limiter.wait()
+
+    async def _count(self, field: str):
+        self.stats[field] += 1
+        telegram_messages_total.inc(outcome=field)
+        try:
+            await self.redis_client.hincrby(NOTIFICATION_STATS_KEY, field, 1)
+        except Exception as e:
+            logger.debug(f"更新通知统计失败: {e}")
+
+    async def send(self, chat_id, text: str, **params) -> bool:
+        """发送单条消息，网络错误及 429 时重试"""
+        session = await get_thread_safe_session()
+        data = {"chat_id": chat_id, "text": text, **params}
+        for attempt in range(self.max_retries):
+            await self._wait_turn(chat_id)
+            try:
+                async with session.post(self.url, data=data) as response:
+                    result = await response.json(content_type=None)
+                if response.status == 429:
+                    retry_after = result.get("parameters", {}).get("retry_after", 1)
+                    loop_time = asyncio.get_running_loop().time()
+                    self._paused_until = max(
+                        self._paused_until, loop_time + retry_after
+                    )
+                    logger.warning(f"发送通知触发限流，暂停 {retry_after} 秒")
+                    await self._count("rate_limited")
+                    continue
+                if result.get("ok"):
+                    logger.debug(f"通知发送成功: {chat_id}")
+                    return True
+                # 其他错误（如用户屏蔽了机器人）重试也无法成功
+                logger.warning(f"发送通知到 {chat_id} 失败: {result}")
+                return False
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                logger.warning(
+                    f"发送通知到 {chat_id} 时网络错误 ({attempt + 1}/{self.max_retries}): {e}"
+                )
+                await self._count("retried")
+                await asyncio.sleep(min(2**attempt, 10))
+        return False
+
+    async def _process(self, raw: str):
+        try:
+            try:
+                message = json.loads(raw)
+                sent = await self.send(
+                    message["chat_id"], message["text"], **message.get("params", {})
+                )
+            except Exception as e:
+                logger.error(f"处理通知消息时发生错误: {e}")
+                sent = False
+            await self._count("sent" if sent else "failed")
+            await self.redis_client.lrem(self.processing_key, 1, raw)
+        finally:
+            self._slots.release()
+
+    async def run(self):
+        """持续发送发件箱中的消息，直到调用 stop()"""
+        logger.info(f"通知发送服务 {self.name} 启动")
+        # 先登记心跳，其他发送服务启动时不会回收本服务发送中的消息
+        await beat(self.redis_client, NOTIFICATION_OUTBOX, self.name)
+        heartbeat_task = asyncio.create_task(
+            heartbeat(self.redis_client, NOTIFICATION_OUTBOX, self.name)
+        )
+        try:
+            await self.recover()
+            while not self._stopping.is_set():
+                await self._slots.acquire()
+                try:
+                    raw = await self.redis_client.blmove(
+                        NOTIFICATION_OUTBOX,
+                        self.processing_key,
+                        self.block_timeout,
+                        "LEFT",
+                        "RIGHT",
+                    )
+                except Exception as e:
+                    self._slots.release()
+                    logger.error(f"读取通知发件箱失败: {e}")
+                    await asyncio.sleep(1)
+                    continue
+                if raw is None:
+                    self._slots.release()
+                    continue
+                task = asyncio.create_task(self._process(raw))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+        finally:
+            # 异常退出时同样等待发送中的消息完成，避免重启后重复发送
+            if self._tasks:
+                await asyncio.gather(*self._tasks, return_exceptions=True)
+            heartbeat_task.cancel()
+            await asyncio.gather(heartbeat_task, return_exceptions=True)
+        logger.info(f"通知发送服务 {self.name} 已停止: {self.stats}")
+
+    def stop(self):
+        """停止拉取新消息，等待发送中的消息完成后退出"""
+        self._stopping.set()
+
+
+async def run_notification_dispatcher():
+    """启动通知发送服务（用于调度器一次性任务），异常退出后自动重启"""
+    await run_forever(NotificationDispatcher(), "通知发送服务")
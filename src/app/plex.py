@@ -2,6 +2,8 @@
 
 import logging
 import pickle
+import threading
+import time
 from typing import Optional, Union
 
 import filelock
@@ -12,6 +14,29 @@ from plexapi.myplex import Section
 from plexapi.server import PlexServer
 
 
+# Plex 用户目录的刷新间隔（秒）
+PLEX_USER_DIRECTORY_TTL = 600
+# 查找用户未命中时强制刷新用户目录的最短间隔（秒）
+PLEX_USER_DIRECTORY_MISS_REFRESH_INTERVAL = 30
+
+
+class PlexUserDirectory:
+    """Plex 用户目录快照，按 id、邮箱、用户名建立索引，创建后不再修改"""
+
+    def __init__(self, users: list):
+        self.users = users
+        self.refreshed_at = time.monotonic()
+        self.by_id = {user.id: (user.username, user) for user in users}
+        self.by_email = {user.email: (user.id, user) for user in users}
+        self.by_email_lower = {
+            user.email.lower(): (user.id, user) for user in users if user.email
+        }
+        self.by_username = {user.username: user for user in users}
+
+    def is_expired(self, ttl: int = PLEX_USER_DIRECTORY_TTL) -> bool:
+        return time.monotonic() - self.refreshed_at > ttl
+
+
 class Plex:
     """class Plex"""
 
@@ -26,48 +51,119 @@ class Plex:
         self.plex_server = PlexServer(baseurl=base_url, token=token)
         self.my_plex_account = self.plex_server.myPlexAccount()
         self.plex_server_name = self.plex_server.friendlyName
-        self.users = []
+        self._directory: Optional[PlexUserDirectory] = None
+        self._refresh_lock = threading.Lock()
+        self._refreshing = False
+        # 用户列表已变化，查找未命中时不受刷新间隔限制
+        self._users_invalidated = False
 
     def get_libraries(self) -> list:
         return [section.title for section in self.plex_server.library.sections()]
 
+    def refresh_users(self) -> PlexUserDirectory:
+        """从 Plex 拉取用户列表并替换用户目录"""
+        users = [user for user in self.my_plex_account.users()]
+        users.append(self.my_plex_account)
+        self._directory = PlexUserDirectory(users)
+        logger.debug(f"Plex 用户目录已刷新，共 {len(users)} 个用户")
+        return self._directory
+
+    def _refresh_in_background(self):
+        try:
+            self.refresh_users()
+        except Exception as e:
+            logger.error(f"刷新 Plex 用户目录失败: {e}")
+            # 连接可能已失效，下次获取客户端时重新连接
+            reset_plex(self)
+        finally:
+            self._refreshing = False
+
+    @property
+    def directory(self) -> PlexUserDirectory:
+        """
+        获取用户目录：首次访问时同步加载，过期后继续返回旧数据并在后台刷新
+        """
+        directory = self._directory
+        if directory is None:
+            with self._refresh_lock:
+                if self._directory is None:
+                    try:
+                        self.refresh_users()
+                    except Exception:
+                        reset_plex(self)
+                        raise
+                return self._directory
+        if directory.is_expired():
+            with self._refresh_lock:
+                if not self._refreshing:
+                    self._refreshing = True
+                    threading.Thread(
+                        target=self._refresh_in_background, daemon=True
+                    ).start()
+        return directory
+
+    def _refresh_on_miss(self) -> Optional[PlexUserDirectory]:
+        """
+        查找用户未命中时同步刷新用户目录（如刚接受邀请的用户），
+        目录刷新后 PLEX_USER_DIRECTORY_MISS_REFRESH_INTERVAL 秒内不重复刷新
+
+        Returns:
+            刷新后的用户目录，本次未刷新时返回 None
+        """
+        with self._refresh_lock:
+            if not self._users_invalidated and not self._directory.is_expired(
+                PLEX_USER_DIRECTORY_MISS_REFRESH_INTERVAL
+            ):
+                return None
+            self._users_invalidated = False
+            try:
+                return self.refresh_users()
+            except Exception as e:
+                logger.error(f"刷新 Plex 用户目录失败: {e}")
+                reset_plex(self)
+                return None
+
+    def invalidate_users(self):
+        """用户列表已变化（如发送了邀请），下次查找未命中时立即刷新用户目录"""
+        self._users_invalidated = True
+
+    def _lookup(self, index: str, key):
+        """在用户目录的指定索引中查找，未命中时刷新一次后重试"""
+        value = getattr(self.directory, index).get(key)
+        if value is None:
+            directory = self._refresh_on_miss()
+            if directory is not None:
+                value = getattr(directory, index).get(key)
+        return value
+
     def get_users(self):
-        if self.users:
-            return self.users
-        self.users = [user for user in self.my_plex_account.users()]
-        self.users.append(self.my_plex_account)
-        return self.users
+        return self.directory.users
 
     @property
     def users_by_email(self):
-        users_by_email = {}
-        for user in self.get_users():
-            users_by_email[user.email] = (user.id, user)
-        return users_by_email
+        return self.directory.by_email
 
     @property
     def users_by_id(self):
-        users_by_id = {}
-        for user in self.get_users():
-            users_by_id[user.id] = (user.username, user)
-        return users_by_id
+        return self.directory.by_id
 
     @property
     def users_info(self):
-        users_info = {}
-        for user in self.get_users():
-            users_info[user.username] = user
-        return users_info
+        return self.directory.by_username
 
     def get_user_id_by_email(self, email: str) -> int:
         """get user's id by email"""
-        _user = self.users_by_email.get(email, None)
+        _user = self._lookup("by_email_lower", email.lower()) if email else None
         if not _user:
             return 0
         return _user[0]
 
+    def get_user_by_username(self, username: str):
+        """get user by username"""
+        return self._lookup("by_username", username)
+
     def get_username_by_user_id(self, user_id):
-        _user = self.users_by_id.get(user_id, None)
+        _user = self._lookup("by_id", user_id)
         if not _user:
             return ""
         return _user[0]
@@ -76,8 +172,7 @@ class Plex:
     def get_user_avatar_by_username(cls, username: str) -> str:
         """get user's avatar by username"""
         if not cls.cache.exists():
-            plex = cls()
-            user_avatars = plex.update_all_user_avatars()
+            user_avatars = get_plex().update_all_user_avatars()
         else:
             with cls.cache_lock:
                 with open(cls.cache, "rb") as f:
@@ -131,9 +226,14 @@ class Plex:
 
     def update_user_shared_libs(self, user_id, libs: list):
         """update shared libraries with specified user by id"""
-        self.my_plex_account.updateFriend(
-            self.my_plex_account.user(user_id), self.plex_server, sections=libs
-        )
+        try:
+            self.my_plex_account.updateFriend(
+                self.my_plex_account.user(user_id), self.plex_server, sections=libs
+            )
+        except Exception:
+            # 连接可能已失效，下次获取客户端时重新连接
+            reset_plex(self)
+            raise
 
     def invite_friend(self, user, libs=None):
         try:
@@ -146,6 +246,7 @@ class Plex:
             logging.error(e)
             return False
         else:
+            self.invalidate_users()
             return True
 
     def add_shared_libs_for_all_users(self, add_sections: Union[str, list]):
@@ -191,11 +292,8 @@ class Plex:
                     user_email = username
                 else:
                     # 如果不是邮箱格式，尝试根据用户名找到对应的邮箱
-                    user_email = None
-                    for user in self.get_users():
-                        if hasattr(user, "username") and user.username == username:
-                            user_email = user.email
-                            break
+                    user = self.get_user_by_username(username)
+                    user_email = user.email if user else None
 
                     if not user_email:
                         logger.warning(f"无法找到Plex用户名 {username} 对应的邮箱")
@@ -238,7 +336,7 @@ class Plex:
             if response.status_code == 200:
                 data = response.json()
                 username = data.get("username")
-                userinfo = self.users_info.get(username)
+                userinfo = self.get_user_by_username(username)
                 if userinfo:
                     user_id = userinfo.id
                     logger.info(f"Plex 用户 {username} 通过 Token 认证成功")
@@ -248,6 +346,11 @@ class Plex:
                     return False, None
         except Exception as e:
             logger.error(f"使用 Token 验证 Plex 用户时发生错误: {str(e)}")
+            if isinstance(e, requests.RequestException) and not isinstance(
+                e, requests.HTTPError
+            ):
+                # 无法连接 Plex 服务器，下次获取客户端时重新连接
+                reset_plex(self)
             return False, None
 
     def authenticate_user(
@@ -266,3 +369,33 @@ class Plex:
         else:
             logger.error("必须提供用户名和密码或 API Token 进行验证")
             return False, None
+
+
+_plex: Optional[Plex] = None
+_plex_lock = threading.Lock()
+
+
+def get_plex() -> Plex:
+    """
+    获取进程内共享的 Plex 客户端
+
+    首次调用时建立连接，连接失败时抛出异常，下次调用会重新尝试连接
+    """
+    global _plex
+    if _plex is None:
+        with _plex_lock:
+            if _plex is None:
+                _plex = Plex()
+    return _plex
+
+
+def reset_plex(client: Optional[Plex] = None):
+    """丢弃共享的 Plex 客户端，下次调用 get_plex 时重新连接
+
+    Args:
+        client: 仅当共享客户端仍是该实例时才丢弃，避免误丢弃已重新建立的连接
+    """
+    global _plex
+    with _plex_lock:
+        if client is None or _plex is client:
+            _plex = None
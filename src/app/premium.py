@@ -13,10 +13,10 @@ from app.cache import (
 from app.config import settings
 from app.db import DB
 from app.log import logger
+from app.notifier import enqueue_message
 from app.utils.utils import (
     get_user_name_from_tg_id,
     is_binded_premium_line,
-    send_message_by_url,
 )
 
 
@@ -48,7 +48,7 @@ async def check_premium_expiry():
                     logger.info(
                         f"用户 {user_name} ({user['username']}) 的 {user['service']} Premium 线路未绑定，跳过解绑"
                     )
-                    await send_message_by_url(
+                    enqueue_message(
                         user["tg_id"],
                         f"您的 {user['service']} Premium 已过期，到期时间为 {user['expiry_time']}。当前线路绑定线路为: {line}。请重新解锁 Premium 以继续使用高级功能。",
                     )
@@ -60,7 +60,7 @@ async def check_premium_expiry():
 
                 # 发送通知消息
                 message = f"您的 {user['service']} Premium 已过期，到期时间为 {user['expiry_time']}。已自动解绑 Premium 线路，当前线路为: {new_line}。请重新解锁 Premium 以继续使用高级功能。"
-                await send_message_by_url(user["tg_id"], message)
+                enqueue_message(user["tg_id"], message)
 
             logger.info(f"已更新 {updated_count} 个用户的 Premium 状态")
         else:
@@ -89,7 +89,7 @@ async def check_premium_expiring_soon(days: int = 3):
                 )
                 # 发送通知消息
                 message = f"您的 {user['service']} Premium 将在 {user['days_remaining']} 天后过期，到期时间为 {user['expiry_time']}。"
-                await send_message_by_url(user["tg_id"], message)
+                enqueue_message(user["tg_id"], message)
         else:
             logger.debug(f"未发现 {days} 天内即将过期的 Premium 用户")
 
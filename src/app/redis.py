@@ -1,5 +1,49 @@
 import redis
+import redis.asyncio
 from app.config import settings
+from app.metrics import redis_round_trips_total
+
+
+def _db_label(client) -> str:
+    return str(client.connection_pool.connection_kwargs.get("db", 0))
+
+
+class _Pipeline(redis.client.Pipeline):
+    def execute(self, raise_on_error: bool = True):
+        redis_round_trips_total.inc(db=_db_label(self), command="PIPELINE")
+        return super().execute(raise_on_error)
+
+
+class _Client(redis.Redis):
+    """统计往返次数的 Redis 客户端"""
+
+    def execute_command(self, *args, **options):
+        redis_round_trips_total.inc(db=_db_label(self), command=args[0])
+        return super().execute_command(*args, **options)
+
+    def pipeline(self, transaction=True, shard_hint=None) -> _Pipeline:
+        return _Pipeline(
+            self.connection_pool, self.response_callbacks, transaction, shard_hint
+        )
+
+
+class _AsyncPipeline(redis.asyncio.client.Pipeline):
+    async def execute(self, raise_on_error: bool = True):
+        redis_round_trips_total.inc(db=_db_label(self), command="PIPELINE")
+        return await super().execute(raise_on_error)
+
+
+class _AsyncClient(redis.asyncio.Redis):
+    """统计往返次数的 asyncio Redis 客户端"""
+
+    async def execute_command(self, *args, **options):
+        redis_round_trips_total.inc(db=_db_label(self), command=args[0])
+        return await super().execute_command(*args, **options)
+
+    def pipeline(self, transaction=True, shard_hint=None) -> _AsyncPipeline:
+        return _AsyncPipeline(
+            self.connection_pool, self.response_callbacks, transaction, shard_hint
+        )
 
 
 class Redis:
@@ -18,7 +62,34 @@ class Redis:
             password=password,
             decode_responses=decode_responses,
         )
-        self.client = redis.Redis(connection_pool=self._pool)
+        self.client = _Client(connection_pool=self._pool)
+
+    def get_connection(self):
+        return self.client
+
+    def get_pool(self):
+        return self._pool
+
+
+class AsyncRedis:
+    """asyncio 版本的 Redis 连接，用于阻塞式读取等长连接场景"""
+
+    def __init__(
+        self,
+        db: int = 0,
+        host=settings.REDIS_HOST,
+        port=settings.REDIS_PORT,
+        password=settings.REDIS_PASSWORD,
+        decode_responses=True,
+    ):
+        self._pool = redis.asyncio.ConnectionPool(
+            db=db,
+            host=host,
+            port=port,
+            password=password,
+            decode_responses=decode_responses,
+        )
+        self.client = _AsyncClient(connection_pool=self._pool)
 
     def get_connection(self):
         return self.client
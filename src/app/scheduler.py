@@ -1,4 +1,5 @@
 from app.config import settings
+from app.metrics import instrument_scheduler
 from app.utils.utils import SingletonMeta
 from apscheduler.executors.asyncio import AsyncIOExecutor
 from apscheduler.executors.pool import ThreadPoolExecutor
@@ -18,6 +19,7 @@ class Scheduler(metaclass=SingletonMeta):
         self.scheduler = AsyncIOScheduler(
             jobstores=self.jobstores, executors=self.executors, timezone=settings.TZ
         )
+        instrument_scheduler(self.scheduler)
 
         self.start()
 
@@ -0,0 +1,435 @@
+"""
+线路流量日志处理：解析 filebeat 投递的 nginx stream 日志并写入数据库
+
+提供两种消费方式：
+- update_db.update_line_traffic_stats: 定时任务，每分钟批量取出一批日志
+- TrafficLogConsumer: 常驻消费者，阻塞读取队列，写入成功后才确认
+"""
+
+import argparse
+import asyncio
+import json
+import re
+from datetime import datetime
+from typing import Optional
+from urllib.parse import parse_qs, urlparse
+
+from app.cache import (
+    emby_api_key_cache,
+    get_cached_user_daily_traffic,
+    incr_user_daily_traffic,
+    invalidate_user_daily_traffic,
+    plex_token_cache,
+)
+from app.config import settings
+from app.db import DB
+from app.emby import get_async_emby
+from app.log import logger
+from app.redis import AsyncRedis
+from app.worker import (
+    beat,
+    default_worker_name,
+    heartbeat,
+    processing_key,
+    recover_processing,
+    run_forever,
+)
+
+# nginx 访问日志格式: IP - - [时间] "方法 URL 协议" 状态码 字节数 "引用"
+_NGINX_LOG_PATTERN = re.compile(
+    r"(\S+) - - \[([^\]]+)\] \"(\S+) ([^\"]+) ([^\"]+)\" (\d+) (\d+) \"([^\"]*)\""
+)
+_STREAM_URL_PATTERN = re.compile(r"[Oo]riginal\.|[Ss]tream\.?")
+TRAFFIC_LOG_QUEUE = "filebeat_nginx_stream_logs"
+TRAFFIC_LOG_DB = 15
+
+
+def parse_traffic_log(raw_log) -> Optional[dict]:
+    """
+    解析单条 filebeat 流量日志
+
+    Returns:
+        包含 line/service/token/send_bytes/timestamp 的字典，无需统计的日志返回 None
+    """
+    # 解析 JSON 日志
+    if isinstance(raw_log, bytes):
+        raw_log = raw_log.decode("utf-8")
+    log_data = json.loads(raw_log)
+
+    # 提取时间戳
+    timestamp = log_data.get("@timestamp", "")
+    # 提取后端服务器信息（线路）
+    backend = log_data.get("backend", "")
+    # 解析 message 字段中的 nginx 访问日志
+    message = log_data.get("message", "")
+
+    match = _NGINX_LOG_PATTERN.match(message)
+    if not match:
+        logger.warning(f"无法解析日志格式: {message}")
+        return None
+
+    # 提取需要的字段
+    access_time = match.group(2)
+    url = match.group(4)
+    status_code = int(match.group(6))
+    bytes_sent = int(match.group(7))
+
+    # 只处理成功的请求 (2xx 状态码)
+    if status_code < 200 or status_code >= 300:
+        return None
+
+    if not url.startswith("/stream") and not _STREAM_URL_PATTERN.search(url):
+        # 只处理 /stream 路径的请求
+        # 或者包含 "Original." 的请求（兼容下 emby 反代）
+        logger.debug(f"跳过非流媒体请求: {url}")
+        return None
+
+    # 解析 URL 获取服务信息
+    query_params = parse_qs(urlparse(url).query)
+
+    # 检查服务和 token
+    service_list = query_params.get("service")
+    token_list = query_params.get("token")
+    line_list = query_params.get("line")
+    if not service_list or not token_list:
+        if query_params.get("api_key"):
+            # 兼容 emby 反代
+            logger.warning(f"缺少必要的参数 service 或 token，但发现 api_key: {url}")
+            service_list = ["emby"]
+            token_list = query_params.get("api_key")
+        else:
+            # 如果没有 service 或 token，跳过此条记录
+            logger.warning(f"缺少必要的参数 service 或 token: {url}")
+            return None
+
+    # 优先使用 line 参数，如果没有则使用 backend
+    # line 可能是自定义线路，仍会统计到，只是在线路流量统计中不会显示
+    backend = line_list[0] if line_list else backend
+    if not backend:
+        logger.warning(f"缺少 backend 信息: {url}")
+        return None
+
+    # 转换时间格式为 ISO 格式
+    try:
+        # 将 nginx 时间格式转换为 datetime 对象
+        # 格式: 23/Jun/2025:15:43:03 +0000
+        dt = datetime.strptime(access_time, "%d/%b/%Y:%H:%M:%S %z").astimezone(
+            settings.TZ
+        )
+        formatted_timestamp = dt.isoformat()
+    except ValueError:
+        # 如果解析失败，使用原始的 @timestamp
+        formatted_timestamp = (
+            datetime.fromisoformat(timestamp).astimezone(settings.TZ).isoformat()
+            if timestamp
+            else ""
+        )
+
+    return {
+        "line": backend,
+        "service": service_list[0],
+        "token": token_list[0],
+        "send_bytes": bytes_sent,
+        "timestamp": formatted_timestamp,
+    }
+
+
+async def resolve_traffic_usernames(records: list[dict]) -> dict[tuple, str]:
+    """
+    批量解析 token 对应的用户名
+
+    每个 token 缓存各使用一次 MGET，Emby 缓存未命中的 api_key 再并发请求 Emby
+
+    Returns:
+        {(service, token): username}
+    """
+    tokens = {"plex": set(), "emby": set()}
+    for record in records:
+        if record["service"] in tokens:
+            tokens[record["service"]].add(record["token"])
+
+    usernames = {}
+    for service, cache in (("plex", plex_token_cache), ("emby", emby_api_key_cache)):
+        for token, username in cache.get_many(tokens[service]).items():
+            usernames[(service, token)] = username
+
+    # 尝试通过 api key 获取用户名
+    missing_emby_tokens = [
+        token for token in tokens["emby"] if ("emby", token) not in usernames
+    ]
+    if missing_emby_tokens:
+        emby = get_async_emby()
+        results = await asyncio.gather(
+            *[
+                emby.get_emby_username_from_api_key(token)
+                for token in missing_emby_tokens
+            ]
+        )
+        for token, username in zip(missing_emby_tokens, results):
+            if username:
+                usernames[("emby", token)] = username
+
+    return usernames
+
+
+def _write_traffic_entries(records: list[dict], usernames: dict) -> Optional[int]:
+    """
+    将解析后的日志在单个事务中写入数据库（在工作线程中执行）
+
+    Returns:
+        写入的记录数，写入失败返回 None
+    """
+    _db = DB()
+    try:
+        user_id_maps = {
+            service: _db.get_user_id_map(service) for service in ("plex", "emby")
+        }
+
+        entries = []
+        for record in records:
+            service, token = record["service"], record["token"]
+            username = usernames.get((service, token))
+            # 如果无法获取到用户信息，跳过此条记录
+            if not username:
+                logger.warning(f"无法找到 token 对应的用户名: {token}")
+                continue
+            user_id = user_id_maps.get(service, {}).get(username.lower())
+            entries.append(
+                (
+                    record["line"],
+                    record["send_bytes"],
+                    service,
+                    username,
+                    user_id,
+                    record["timestamp"],
+                )
+            )
+
+        # 存储到数据库
+        seq = _db.create_line_traffic_entries(entries)
+        if seq is None:
+            return None
+    finally:
+        _db.close()
+
+    # 数据库写入成功后再累加 Redis 计数，计数失败不影响入库
+    if entries:
+        try:
+            incr_user_daily_traffic(seq, entries)
+        except Exception as e:
+            logger.error(f"累加用户每日流量计数失败: {e}")
+            # 计数已不完整，下次校准前回退到数据库查询
+            try:
+                invalidate_user_daily_traffic(
+                    {entry[5][:10] for entry in entries if entry[5]}
+                )
+            except Exception as e:
+                logger.error(f"取消用户每日流量计数的校准标记失败: {e}")
+    return len(entries)
+
+
+def get_user_daily_traffic(
+    db: DB, username: str, service: str, date: Optional[datetime] = None
+) -> dict:
+    """
+    获取用户指定日期的流量消耗，优先读取 Redis 计数，未命中时回退到数据库查询
+
+    Returns:
+        {"total": 总流量, "premium": premium 线路流量}
+    """
+    date = (date or datetime.now(settings.TZ)).astimezone(settings.TZ)
+    try:
+        cached = get_cached_user_daily_traffic(
+            service, username, date.strftime("%Y-%m-%d")
+        )
+        if cached is not None:
+            return cached
+    except Exception as e:
+        logger.warning(f"读取用户每日流量计数失败，回退到数据库查询: {e}")
+
+    return {
+        "total": db.get_user_daily_traffic(username, service, date),
+        "premium": db.get_user_daily_traffic(
+            username, service, date, premium_only=True
+        ),
+    }
+
+
+async def ingest_traffic_logs(values: list) -> Optional[int]:
+    """
+    解析并写入一批原始流量日志
+
+    无法解析或无需统计的日志会被直接丢弃；数据库写入在线程中执行，不阻塞事件循环
+
+    Returns:
+        写入的记录数，写入失败返回 None（调用方负责将日志放回队列）
+    """
+    records = []
+    for raw_log in values:
+        try:
+            record = parse_traffic_log(raw_log)
+        except json.JSONDecodeError as e:
+            logger.error(f"JSON 解析错误: {e}, 原始数据: {raw_log}")
+            continue
+        except Exception as e:
+            logger.error(f"处理日志时发生错误: {e}, 原始数据: {raw_log}")
+            continue
+        if record:
+            records.append(record)
+
+    if not records:
+        return 0
+
+    usernames = await resolve_traffic_usernames(records)
+    return await asyncio.to_thread(_write_traffic_entries, records, usernames)
+
+
+class TrafficLogConsumer:
+    """
+    常驻的流量日志消费者
+
+    使用 BLMOVE 将日志原子地移动到消费者自己的 processing 列表中，
+    写入数据库成功后再从 processing 列表删除（确认），失败则放回主队列。
+    多个消费者同时运行时每条日志只会被一个消费者取到，不会重复统计；
+    默认名称包含主机名和进程号，各进程的 processing 列表互不相同。
+    启动时将自己及已退出（心跳过期）的消费者遗留的未确认日志放回主队列。
+    """
+
+    def __init__(
+        self,
+        name: Optional[str] = None,
+        batch_size: int = settings.REDIS_LINE_TRAFFIC_STATS_HANDLE_SIZE,
+        concurrency: int = settings.TRAFFIC_CONSUMER_CONCURRENCY,
+        block_timeout: int = 5,
+    ):
+        self.name = name or default_worker_name()
+        self.batch_size = batch_size
+        self.block_timeout = block_timeout
+        self.redis_client = AsyncRedis(db=TRAFFIC_LOG_DB).get_connection()
+        self.processing_key = processing_key(TRAFFIC_LOG_QUEUE, self.name)
+        # 同时处理的批次数，达到上限后暂停拉取，形成背压
+        self._slots = asyncio.Semaphore(concurrency)
+        self._tasks: set[asyncio.Task] = set()
+        self._stopping = asyncio.Event()
+        self.stats = {"batches": 0, "processed": 0, "acked": 0, "requeued": 0}
+
+    async def recover(self) -> int:
+        """将上次运行及已退出的消费者遗留在 processing 列表中的日志放回主队列头部"""
+        recovered = await recover_processing(
+            self.redis_client, TRAFFIC_LOG_QUEUE, self.name
+        )
+        if recovered:
+            logger.info(f"已将 {recovered} 条未确认的流量日志放回队列")
+        return recovered
+
+    async def _fetch_batch(self) -> list:
+        """阻塞等待第一条日志，再非阻塞地取出同一批次的剩余日志"""
+        first = await self.redis_client.blmove(
+            TRAFFIC_LOG_QUEUE,
+            self.processing_key,
+            self.block_timeout,
+            "LEFT",
+            "RIGHT",
+        )
+        if first is None:
+            return []
+        pipeline = self.redis_client.pipeline(transaction=False)
+        for _ in range(self.batch_size - 1):
+            pipeline.lmove(TRAFFIC_LOG_QUEUE, self.processing_key, "LEFT", "RIGHT")
+        rest = await pipeline.execute()
+        return [first] + [value for value in rest if value is not None]
+
+    async def _ack(self, values: list):
+        pipeline = self.redis_client.pipeline(transaction=False)
+        for value in values:
+            pipeline.lrem(self.processing_key, 1, value)
+        await pipeline.execute()
+        self.stats["acked"] += len(values)
+
+    async def _requeue(self, values: list):
+        pipeline = self.redis_client.pipeline(transaction=True)
+        for value in values:
+            pipeline.lrem(self.processing_key, 1, value)
+        pipeline.lpush(TRAFFIC_LOG_QUEUE, *reversed(values))
+        await pipeline.execute()
+        self.stats["requeued"] += len(values)
+
+    async def _process(self, values: list):
+        try:
+            try:
+                processed = await ingest_traffic_logs(values)
+            except Exception as e:
+                logger.error(f"处理流量日志批次时发生错误: {e}")
+                processed = None
+            if processed is None:
+                await self._requeue(values)
+                logger.error(f"写入流量日志失败，已将 {len(values)} 条日志放回队列")
+                # 避免数据库异常时反复空转
+                await asyncio.sleep(1)
+                return
+            await self._ack(values)
+            self.stats["batches"] += 1
+            self.stats["processed"] += processed
+            logger.debug(f"成功处理了 {processed}/{len(values)} 条流量日志")
+        finally:
+            self._slots.release()
+
+    async def run(self):
+        """持续消费流量日志队列，直到调用 stop()"""
+        logger.info(f"流量日志消费者 {self.name} 启动")
+        # 先登记心跳，其他消费者启动时不会回收本消费者处理中的日志
+        await beat(self.redis_client, TRAFFIC_LOG_QUEUE, self.name)
+        heartbeat_task = asyncio.create_task(
+            heartbeat(self.redis_client, TRAFFIC_LOG_QUEUE, self.name)
+        )
+        try:
+            await self.recover()
+            while not self._stopping.is_set():
+                await self._slots.acquire()
+                try:
+                    values = await self._fetch_batch()
+                except Exception as e:
+                    self._slots.release()
+                    logger.error(f"读取流量日志队列失败: {e}")
+                    await asyncio.sleep(1)
+                    continue
+                if not values:
+                    self._slots.release()
+                    continue
+                task = asyncio.create_task(self._process(values))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+        finally:
+            # 异常退出时同样等待处理中的批次完成，重启后再回收未确认的日志
+            if self._tasks:
+                await asyncio.gather(*self._tasks, return_exceptions=True)
+            heartbeat_task.cancel()
+            await asyncio.gather(heartbeat_task, return_exceptions=True)
+        logger.info(f"流量日志消费者 {self.name} 已停止: {self.stats}")
+
+    def stop(self):
+        """停止拉取新日志，等待处理中的批次完成后退出"""
+        self._stopping.set()
+
+
+async def run_traffic_log_consumer():
+    """启动流量日志消费者（用于调度器一次性任务），异常退出后自动重启"""
+    await run_forever(TrafficLogConsumer(), "流量日志消费者")
+
+
+if __name__ == "__main__":
+    # 额外的消费者进程: python -m app.traffic --name worker-2
+    parser = argparse.ArgumentParser(description="流量日志消费者")
+    parser.add_argument(
+        "--name",
+        default=None,
+        help="消费者名称，需在各进程间唯一，默认为 主机名-进程号",
+    )
+    parser.add_argument("--concurrency", type=int, default=None)
+    args = parser.parse_args()
+
+    consumer = TrafficLogConsumer(
+        name=args.name,
+        concurrency=args.concurrency or settings.TRAFFIC_CONSUMER_CONCURRENCY,
+    )
+    asyncio.run(run_forever(consumer, "流量日志消费者"))
@@ -1,14 +1,13 @@
 import asyncio
 import json
-import re
 from datetime import datetime, timedelta
-from time import time
-from urllib.parse import parse_qs, urlparse
+from time import perf_counter, time
+from typing import Union
 from uuid import NAMESPACE_URL, uuid3
 
 from app.cache import (
-    emby_api_key_cache,
-    plex_token_cache,
+    get_cached_daily_premium_traffic,
+    set_user_daily_traffic,
     stream_traffic_cache,
     user_credits_cache,
     user_info_cache,
@@ -16,9 +15,19 @@ from app.cache import (
 from app.config import settings
 from app.db import DB
 from app.emby import Emby
+from app.leaderboard import (
+    credits_leaderboard,
+    emby_watched_time_leaderboard,
+    plex_watched_time_leaderboard,
+)
 from app.log import logger
-from app.plex import Plex
+from app.notifier import enqueue_message
+from app.plex import get_plex
 from app.tautulli import Tautulli
+from app.traffic import (
+    TRAFFIC_LOG_QUEUE,
+    ingest_traffic_logs,
+)
 from app.utils.utils import (
     get_user_name_from_tg_id,
     get_user_total_duration,
@@ -26,255 +35,240 @@ from app.utils.utils import (
 )
 
 
-def update_plex_credits():
-    """更新积分及观看时长"""
-    logger.info("开始更新 Plex 用户积分及观看时长")
-    _db = DB()
-    notification_tasks = []
+def _traffic_cost(premium_traffic: int, is_premium) -> tuple[int, float]:
+    """计算超出每日 premium 流量限额的部分及其消耗的积分"""
+    traffic_exceed = premium_traffic - (
+        settings.USER_TRAFFIC_LIMIT
+        if not is_premium
+        else settings.PREMIUM_USER_TRAFFIC_LIMIT
+    )
+    traffic_cost_credits = 0
+    if traffic_exceed > 0:
+        traffic_cost_credits = round(
+            (traffic_exceed / (10 * 1024 * 1024 * 1024))
+            * settings.CREDITS_COST_PER_10GB,
+            2,
+        )
+    return traffic_exceed, traffic_cost_credits
+
+
+def _load_settlement_rows(
+    db: DB, service: str, durations: dict, traffic_date: str
+) -> list[tuple]:
+    """载入结算数据，premium 线路流量优先读取 Redis 中的每日流量计数，该日期未校准时由数据库汇总"""
+    rows = db.load_credit_settlement(
+        service, durations, traffic_date, include_traffic=False
+    )
     try:
-        # 获取一天内的观看时长
-        duration = get_user_total_duration(
-            Tautulli().get_home_stats(
-                1, "duration", len(Plex().users_by_id), "top_users"
-            )
+        premium_traffic = get_cached_daily_premium_traffic(
+            service, [row[2] for row in rows], traffic_date
         )
-        # update credits and watched_time
-        res = _db.cur.execute("select plex_id from user")
-        users = res.fetchall()
-        for user in users:
-            plex_id = user[0]
-            play_duration = round(min(float(duration.get(plex_id, 0)), 24), 2)
-            if play_duration == 0:
-                continue
+    except Exception as e:
+        logger.warning(f"读取用户每日流量计数失败，回退到数据库查询: {e}")
+        premium_traffic = None
+    if premium_traffic is None:
+        return db.load_credit_settlement(service, durations, traffic_date)
+    return [
+        (*row[:-1], premium_traffic.get(str(row[2] or "").lower(), 0)) for row in rows
+    ]
+
+
+def settle_credits(service: str, durations: dict, dry_run: bool = False) -> list:
+    """
+    按观看时长结算积分：一次查询载入所有相关用户，计算各用户的积分变化后批量写入
+
+    Args:
+        service: 服务类型 (plex/emby)
+        durations: plex 为 {plex_id: 昨日观看时长}，emby 为 {emby_id: 累计观看时长}，单位小时
+        dry_run: 只计算不写入数据库
+
+    Returns:
+        每个用户的积分变化明细列表
+    """
+    traffic_date = (datetime.now(settings.TZ) - timedelta(days=1)).strftime("%Y-%m-%d")
+    _db = DB()
+    try:
+        rows = _load_settlement_rows(_db, service, durations, traffic_date)
+        report, deltas = [], []
+        # 同一 tg 用户的多个账户依次累加到同一条总积分上
+        stats_credits = {}
+        for (
+            account_id,
+            tg_id,
+            username,
+            is_premium,
+            account_credits,
+            watched_time_init,
+            duration,
+            tg_credits,
+            premium_traffic,
+        ) in rows:
+            if service == "plex":
+                play_duration = duration
+                watched_time = watched_time_init + play_duration
+            else:
+                # Emby 返回的是累计观看时长
+                play_duration = duration - watched_time_init
+                watched_time = duration
             # 最大记 8h
             credits_inc = min(play_duration, 8)
-            res = _db.cur.execute(
-                "SELECT credits,watched_time,tg_id,plex_username,is_premium FROM user WHERE plex_id=?",
-                (plex_id,),
-            ).fetchone()
-            if not res:
-                continue
-            watched_time_init = res[1]
-            tg_id = res[2]
-            plex_username = res[3]
-            is_premium = res[4]
-            # 获取用户昨日的流量使用情况
-            traffic_usage = _db.get_user_daily_traffic(
-                plex_username,
-                "plex",
-                date=datetime.now(settings.TZ) - timedelta(days=1),
-                premium_only=True,
-            )
-            traffic_usage_exceed = traffic_usage - (
-                settings.USER_TRAFFIC_LIMIT
-                if not is_premium
-                else settings.PREMIUM_USER_TRAFFIC_LIMIT
+            traffic_exceed, traffic_cost_credits = _traffic_cost(
+                premium_traffic, is_premium
             )
-            traffic_cost_credits = 0
-            if traffic_usage_exceed > 0:
-                traffic_cost_credits = round(
-                    (traffic_usage_exceed / (10 * 1024 * 1024 * 1024))
-                    * settings.CREDITS_COST_PER_10GB,
-                    2,
-                )
+            credits_delta = credits_inc - traffic_cost_credits
+
             if not tg_id:
-                credits_init = res[0]
-                credits = credits_init + credits_inc - traffic_cost_credits
-                watched_time = watched_time_init + play_duration
-                _db.cur.execute(
-                    "UPDATE user SET credits=?,watched_time=? WHERE plex_id=?",
-                    (credits, watched_time, plex_id),
-                )
+                target = "account"
+                credits = account_credits + credits_delta
+            elif tg_id in stats_credits or tg_credits is not None:
+                target = "statistics"
+                credits = stats_credits.get(tg_id, tg_credits) + credits_delta
             else:
-                credits_init = _db.cur.execute(
-                    "SELECT credits FROM statistics WHERE tg_id=?", (tg_id,)
-                ).fetchone()[0]
-                credits = credits_init + credits_inc - traffic_cost_credits
-                watched_time = watched_time_init + play_duration
-                _db.cur.execute(
-                    "UPDATE user SET watched_time=? WHERE plex_id=?",
-                    (watched_time, plex_id),
-                )
-                _db.cur.execute(
-                    "UPDATE statistics SET credits=? WHERE tg_id=?", (credits, tg_id)
-                )
-                if play_duration > 0:
-                    # 需要发送通知
-                    notification_tasks.append(
-                        (
-                            tg_id,
-                            f"""
-Plex 观看积分更新通知
-====================
-
-新增观看时长: {round(play_duration, 2)} 小时
-新增观看积分：{round(credits_inc, 2)}
-Premium 流量使用情况：{round(traffic_usage / (1024 * 1024 * 1024), 2)} GB
-超出每日流量限额：{max(round(traffic_usage_exceed / (1024 * 1024 * 1024), 2), 0)} GB
-流量消耗积分：{round(traffic_cost_credits, 2)}
-
-积分变化：{round(credits_inc - traffic_cost_credits, 2)}
+                # statistics 表中没有数据，新建记录并转入账户积分
+                target = "new_statistics"
+                credits = (account_credits or 0) + credits_delta
+            if target != "account":
+                stats_credits[tg_id] = credits
+
+            deltas.append((account_id, tg_id, target, credits_delta, watched_time))
+            report.append(
+                {
+                    "service": service,
+                    "account_id": account_id,
+                    "tg_id": tg_id,
+                    "username": username,
+                    "play_duration": play_duration,
+                    "watched_time": watched_time,
+                    "credits_inc": credits_inc,
+                    "premium_traffic": premium_traffic,
+                    "traffic_exceed": traffic_exceed,
+                    "traffic_cost_credits": traffic_cost_credits,
+                    "credits_delta": credits_delta,
+                    "credits": credits,
+                }
+            )
+            logger.info(
+                f"{'[dry-run] ' if dry_run else ''}更新 {service} 用户 {username} ({account_id}) 的积分和观看时长: "
+                f"新增观看时长 {round(play_duration, 2)} 小时，新增观看积分 {round(credits_inc, 2)}, 流量消耗积分 {round(traffic_cost_credits, 2)}"
+            )
 
---------------------
+        if dry_run or not deltas:
+            return report
+        _db.apply_credit_settlement(service, deltas)
+    finally:
+        _db.close()
 
-当前总积分：{round(credits, 2)}
-当前总观看时长：{round(watched_time, 2)} 小时
+    # 同步到排行榜
+    credits_leaderboard.update(stats_credits)
+    watched_time_scores = {row["account_id"]: row["watched_time"] for row in report}
+    if service == "plex":
+        plex_watched_time_leaderboard.update(watched_time_scores)
+    else:
+        emby_watched_time_leaderboard.update(watched_time_scores)
+    return report
 
-====================""",
-                        )
-                    )
 
-            logger.info(
-                f"更新 Plex 用户 {plex_username} ({plex_id}) 的积分和观看时长: "
-                f"新增观看时长 {round(play_duration, 2)} 小时，新增观看积分 {round(credits_inc, 2)}, 流量消耗积分 {round(traffic_cost_credits, 2)}"
+def update_plex_credits(dry_run: bool = False) -> tuple[bool, Union[list, str]]:
+    """更新 Plex 积分及观看时长，返回 (是否成功, 积分变化明细或失败原因)"""
+    logger.info("开始更新 Plex 用户积分及观看时长")
+    try:
+        # 获取一天内的观看时长
+        duration = get_user_total_duration(
+            Tautulli().get_home_stats(
+                1, "duration", len(get_plex().users_by_id), "top_users"
             )
-
+        )
+        durations = {
+            plex_id: round(min(float(play_duration), 24), 2)
+            for plex_id, play_duration in duration.items()
+        }
+        report = settle_credits(
+            "plex",
+            {k: v for k, v in durations.items() if v != 0},
+            dry_run=dry_run,
+        )
     except Exception as e:
         logger.error(f"更新 Plex 用户积分及观看时长失败: {e}")
-        for chat_id in settings.TG_ADMIN_CHAT_ID:
-            notification_tasks.append(
-                (
-                    chat_id,
-                    f"更新 Plex 用户积分及观看时长失败: {e}",
-                )
-            )
-        return notification_tasks
-    else:
-        _db.con.commit()
-        logger.info("Plex 用户积分及观看时长更新完成")
-        return notification_tasks
-    finally:
-        _db.close()
+        return False, str(e)
+    logger.info(f"Plex 用户积分及观看时长更新完成，共 {len(report)} 个用户")
+    return True, report
 
 
-def update_emby_credits():
-    """更新 emby 积分及观看时长"""
+def update_emby_credits(dry_run: bool = False) -> tuple[bool, Union[list, str]]:
+    """更新 Emby 积分及观看时长，返回 (是否成功, 积分变化明细或失败原因)"""
     logger.info("开始更新 Emby 用户积分及观看时长")
-    # 获取所有用户的观看时长
-    emby = Emby()
-    _db = DB()
-    notification_tasks = []
     try:
-        duration = emby.get_user_total_play_time()
-        # 获取数据库中的观看时长信息
-        users = _db.cur.execute(
-            "select emby_id, tg_id, emby_watched_time, emby_credits, emby_username, is_premium from emby_user"
-        ).fetchall()
-        for user in users:
-            playduration = round(float(duration.get(user[0], 0)) / 3600, 2)
-            if playduration == 0:
-                continue
-            # 最大记 8
-            credits_inc = min(playduration - user[2], 8)
-            emby_username, is_premium = user[4], user[5]
-            # 获取用户昨日的流量使用情况
-            traffic_usage = _db.get_user_daily_traffic(
-                emby_username,
-                "emby",
-                date=datetime.now(settings.TZ) - timedelta(days=1),
-                premium_only=True,
-            )
-            traffic_usage_exceed = traffic_usage - (
-                settings.USER_TRAFFIC_LIMIT
-                if not is_premium
-                else settings.PREMIUM_USER_TRAFFIC_LIMIT
-            )
-            traffic_cost_credits = 0
-            if traffic_usage_exceed > 0:
-                traffic_cost_credits = round(
-                    (traffic_usage_exceed / (10 * 1024 * 1024 * 1024))
-                    * settings.CREDITS_COST_PER_10GB,
-                    2,
-                )
+        # 获取所有用户的累计观看时长
+        duration = Emby().get_user_total_play_time()
+        durations = {
+            emby_id: round(float(play_time) / 3600, 2)
+            for emby_id, play_time in duration.items()
+        }
+        report = settle_credits(
+            "emby",
+            {k: v for k, v in durations.items() if v != 0},
+            dry_run=dry_run,
+        )
+    except Exception as e:
+        logger.error(f"更新 Emby 用户积分及观看时长失败: {e}")
+        return False, str(e)
+    logger.info(f"Emby 用户积分及观看时长更新完成，共 {len(report)} 个用户")
+    return True, report
 
-            if not user[1]:
-                _credits = user[3] + credits_inc - traffic_cost_credits
-                _db.cur.execute(
-                    "UPDATE emby_user SET emby_watched_time=?,emby_credits=? WHERE emby_id=?",
-                    (playduration, _credits, user[0]),
-                )
-            else:
-                stats_info = _db.get_stats_by_tg_id(user[1])
-                # statistics 表中有数据
-                if stats_info:
-                    credits_init = stats_info[2]
-                    _credits = credits_init + credits_inc - traffic_cost_credits
-                    _db.update_user_credits(_credits, tg_id=user[1])
-                else:
-                    # 清空 emby_user 表中积分信息
-                    _db.update_user_credits(0, emby_id=user[0])
-                    # 在 statistic 表中增加用户数据
-                    _credits = user[3] + credits_inc - traffic_cost_credits
-                    _db.add_user_data(user[1], credits=_credits)
-                # 更新 emby_user 表中观看时间
-                _db.cur.execute(
-                    "UPDATE emby_user SET emby_watched_time=? WHERE emby_id=?",
-                    (playduration, user[0]),
-                )
-                if (playduration - user[2]) > 0:
-                    # 需要发送消息通知
-                    notification_tasks.append(
-                        (
-                            user[1],
-                            f"""
-Emby 观看积分更新通知
+
+def format_settlement_notice(row: dict) -> str:
+    """根据积分变化明细生成通知消息"""
+    gb = 1024 * 1024 * 1024
+    return f"""
+{"Plex" if row["service"] == "plex" else "Emby"} 观看积分更新通知
 ====================
 
-新增观看时长: {round(playduration - user[2], 2)} 小时
-新增观看积分：{round(credits_inc, 2)}
-Premium 流量使用情况：{round(traffic_usage / (1024 * 1024 * 1024), 2)} GB
-超出每日流量限额：{max(round(traffic_usage_exceed / (1024 * 1024 * 1024), 2), 0)} GB
-流量消耗积分：{round(traffic_cost_credits, 2)}
+新增观看时长: {round(row["play_duration"], 2)} 小时
+新增观看积分：{round(row["credits_inc"], 2)}
+Premium 流量使用情况：{round(row["premium_traffic"] / gb, 2)} GB
+超出每日流量限额：{max(round(row["traffic_exceed"] / gb, 2), 0)} GB
+流量消耗积分：{round(row["traffic_cost_credits"], 2)}
 
-积分变化：{round(credits_inc - traffic_cost_credits, 2)}
+积分变化：{round(row["credits_delta"], 2)}
 
 --------------------
 
-当前总积分：{round(_credits, 2)}
-当前总观看时长：{round(playduration, 2)} 小时
+当前总积分：{round(row["credits"], 2)}
+当前总观看时长：{round(row["watched_time"], 2)} 小时
 
-====================""",
-                        )
-                    )
-
-            logger.info(
-                f"更新 Emby 用户 {emby_username} ({user[0]}) 的积分和观看时长: "
-                f"新增观看时长 {round(playduration - user[2], 2)} 小时，新增观看积分 {round(credits_inc, 2)}, 流量消耗积分 {round(traffic_cost_credits, 2)}"
-            )
-    except Exception as e:
-        logger.error(f"更新 Emby 用户积分及观看时长失败: {e}")
-        for chat_id in settings.TG_ADMIN_CHAT_ID:
-            notification_tasks.append(
-                (
-                    chat_id,
-                    f"更新 Emby 用户积分及观看时长失败: {e}",
-                )
-            )
-        return notification_tasks
-    else:
-        _db.con.commit()
-        logger.info("Emby 用户积分及观看时长更新完成")
-        return notification_tasks
-    finally:
-        _db.close()
+===================="""
 
 
 async def update_credits():
     """更新 Plex 和 Emby 用户积分及观看时长"""
-    notification_tasks = update_plex_credits()
-    notification_tasks.extend(update_emby_credits())
-    for tg_id, text in notification_tasks:
-        # 发送通知消息，静默模式
-        await send_message_by_url(chat_id=tg_id, text=text, disable_notification=True)
-        await asyncio.sleep(1)
+    for service, settle in (
+        ("Plex", update_plex_credits),
+        ("Emby", update_emby_credits),
+    ):
+        success, report = await asyncio.to_thread(settle)
+        if not success:
+            for chat_id in settings.TG_ADMIN_CHAT_ID:
+                enqueue_message(
+                    chat_id, f"更新 {service} 用户积分及观看时长失败: {report}"
+                )
+            continue
+        for row in report:
+            # 只通知绑定了 tg 且有新增观看时长的用户，静默模式
+            if row["tg_id"] and row["play_duration"] > 0:
+                enqueue_message(
+                    row["tg_id"],
+                    format_settlement_notice(row),
+                    disable_notification=True,
+                )
 
 
 def update_plex_info():
     """更新 plex 用户信息"""
     _db = DB()
-    _plex = Plex()
+    _plex = get_plex()
     try:
-        users = _plex.users_by_id
+        # 每日任务直接刷新用户目录，不使用缓存的数据
+        users = _plex.refresh_users().by_id
         for uid, user in users.items():
             email = user[1].email
             username = user[0]
@@ -311,7 +305,7 @@ def update_plex_info():
 def update_all_lib():
     """更新用户资料库权限状态"""
     _db = DB()
-    _plex = Plex()
+    _plex = get_plex()
     try:
         users = _plex.users_by_email
         all_libs = _plex.get_libraries()
@@ -339,13 +333,14 @@ def update_watched_time():
     """更新用户观看时长"""
     duration = get_user_total_duration(
         Tautulli().get_home_stats(
-            36500, "duration", len(Plex().users_by_id), "top_users"
+            36500, "duration", len(get_plex().users_by_id), "top_users"
         )
     )
     _db = DB()
     try:
         res = _db.cur.execute("select plex_id from user")
         users = res.fetchall()
+        watched_time_scores = {}
         for user in users:
             plex_id = user[0]
             watched_time = duration.get(plex_id, 0)
@@ -353,11 +348,13 @@ def update_watched_time():
                 "UPDATE user SET watched_time=? WHERE plex_id=?",
                 (watched_time, plex_id),
             )
+            watched_time_scores[plex_id] = watched_time
 
     except Exception as e:
         print(e)
     else:
         _db.con.commit()
+        plex_watched_time_leaderboard.update(watched_time_scores)
     finally:
         _db.close()
 
@@ -367,14 +364,13 @@ def add_all_plex_user():
 
     duration = get_user_total_duration(
         Tautulli().get_home_stats(
-            36500, "duration", len(Plex().users_by_id), "top_users"
+            36500, "duration", len(get_plex().users_by_id), "top_users"
         )
     )
-    _plex = Plex()
-    users = [user for user in _plex.my_plex_account.users()]
-    users.append(_plex.my_plex_account)
+    _plex = get_plex()
+    users = _plex.refresh_users().users
     _db = DB()
-    all_libs = Plex().get_libraries()
+    all_libs = _plex.get_libraries()
     try:
         _existing_users = _db.cur.execute("select plex_id from user").fetchall()
         existing_users = [user[0] for user in _existing_users]
@@ -423,6 +419,7 @@ def update_donation_credits(old_multiplier, new_multiplier):
             "SELECT tg_id, donation, credits FROM statistics WHERE donation > 0"
         ).fetchall()
 
+        credits_scores = {}
         for tg_id, donation, credits in donations:
             # 计算新的积分
             new_credits = round(
@@ -433,11 +430,13 @@ def update_donation_credits(old_multiplier, new_multiplier):
                 "UPDATE statistics SET credits = ? WHERE tg_id = ?",
                 (new_credits, tg_id),
             )
+            credits_scores[tg_id] = new_credits
             logger.info(
                 f"用户 {tg_id} 捐赠：{donation}, 更新积分: {credits} -> {new_credits}"
             )
 
         db.con.commit()
+        credits_leaderboard.update(credits_scores)
     except Exception as e:
         logger.error(str(e))
     finally:
@@ -498,16 +497,16 @@ async def finish_expired_auctions_job():
         finished_auctions = db.finish_expired_auctions()
         # 通知用户
         for autction in finished_auctions:
-            await send_message_by_url(
+            enqueue_message(
                 autction.get("winner_id"),
                 f"恭喜你，竞拍 {autction['title']} 获胜！最终出价为 {autction['final_price']} 积分",
             )
             if not autction.get("credits_reduced", False):
                 # 如果未扣除积分，通知管理员
                 for chat_id in settings.TG_ADMIN_CHAT_ID:
-                    await send_message_by_url(
-                        chat_id=chat_id,
-                        text=f"用户 {autction.get('winner_id')} 在竞拍 {autction['title']} 中获胜，但未扣除积分。",
+                    enqueue_message(
+                        chat_id,
+                        f"用户 {autction.get('winner_id')} 在竞拍 {autction['title']} 中获胜，但未扣除积分。",
                     )
         return finished_auctions
     except Exception as e:
@@ -604,178 +603,95 @@ async def monthly_traffic_data_migration():
         db.close()
 
 
+def cleanup_traffic_rollups():
+    """清理过期的分钟级和小时级流量汇总数据"""
+    _db = DB()
+    try:
+        minute_deleted, hour_deleted = _db.cleanup_traffic_rollups()
+        logger.info(
+            f"已清理 {minute_deleted} 条分钟级、{hour_deleted} 条小时级流量汇总数据"
+        )
+    except Exception as e:
+        logger.error(f"清理流量汇总数据失败: {e}")
+    finally:
+        _db.close()
+
+
+def reconcile_user_daily_traffic(days: int = 2):
+    """
+    以数据库为准校准 Redis 中最近几天的用户每日流量计数
+
+    Args:
+        days: 校准的天数（含今日），默认校准今日和昨日
+    """
+    _db = DB()
+    try:
+        today = datetime.now(settings.TZ)
+        for offset in range(days):
+            date = (today - timedelta(days=offset)).strftime("%Y-%m-%d")
+            seq, counters = _db.get_daily_traffic_snapshot(date)
+            if seq < 0:
+                continue
+            set_user_daily_traffic(date, seq, counters)
+            logger.info(f"已校准 {date} 的用户流量计数，共 {len(counters)} 个用户")
+    except Exception as e:
+        logger.error(f"校准用户每日流量计数失败: {e}")
+    finally:
+        _db.close()
+
+
 async def update_line_traffic_stats(
     count: int = settings.REDIS_LINE_TRAFFIC_STATS_HANDLE_SIZE,
 ):
     """
     更新线路的流量数据
+
+    每次从 redis 中取出 count 条日志，整批解析后在单个事务中写入数据库
+
+    Returns:
+        dict: 本次处理的统计信息（取出条数、写入条数、耗时、速率及队列积压）
     """
+    start = perf_counter()
 
     # 每次从 redis 中取出指定数量的数据
-    values = stream_traffic_cache.redis_client.lpop(
-        "filebeat_nginx_stream_logs", count=count
-    )
+    values = stream_traffic_cache.redis_client.lpop(TRAFFIC_LOG_QUEUE, count=count)
 
     if not values:
         logger.info("没有新的流量日志数据")
         return
 
-    _db = DB()
     processed_count = 0
-
     try:
-        for raw_log in values:
-            try:
-                # 解析 JSON 日志
-                if isinstance(raw_log, bytes):
-                    raw_log = raw_log.decode("utf-8")
-
-                log_data = json.loads(raw_log)
-
-                # 提取时间戳
-                timestamp = log_data.get("@timestamp", "")
-
-                # 提取后端服务器信息（线路）
-                backend = log_data.get("backend", "")
-
-                # 解析 message 字段中的 nginx 访问日志
-                message = log_data.get("message", "")
-
-                # 使用正则表达式解析 nginx 访问日志格式
-                # 格式: IP - - [时间] "方法 URL 协议" 状态码 字节数 "引用"
-                log_pattern = r"(\S+) - - \[([^\]]+)\] \"(\S+) ([^\"]+) ([^\"]+)\" (\d+) (\d+) \"([^\"]*)\""
-                match = re.match(log_pattern, message)
-
-                if not match:
-                    logger.warning(f"无法解析日志格式: {message}")
-                    continue
-
-                # 提取需要的字段
-                access_time = match.group(2)
-                url = match.group(4)
-                status_code = int(match.group(6))
-                bytes_sent = int(match.group(7))
-
-                # 只处理成功的请求 (2xx 状态码)
-                if status_code < 200 or status_code >= 300:
-                    continue
-
-                if not url.startswith("/stream") and not re.search(
-                    r"[Oo]riginal\.|[Ss]tream\.?", url
-                ):
-                    # 只处理 /stream 路径的请求
-                    # 或者包含 "Original." 的请求（兼容下 emby 反代）
-                    logger.debug(f"跳过非流媒体请求: {url}")
-                    continue
-
-                # 解析 URL 获取服务信息
-                parsed_url = urlparse(url)
-                query_params = parse_qs(parsed_url.query)
-
-                # 检查服务和 token
-                service_list = query_params.get("service")
-                token_list = query_params.get("token")
-                line_list = query_params.get("line")
-                if not service_list or not token_list:
-                    if query_params.get("api_key"):
-                        # 兼容 emby 反代
-                        logger.warning(
-                            f"缺少必要的参数 service 或 token，但发现 api_key: {url}"
-                        )
-                        service_list = ["emby"]
-                        token_list = query_params.get("api_key")
-                    else:
-                        # 如果没有 service 或 token，跳过此条记录
-                        logger.warning(f"缺少必要的参数 service 或 token: {url}")
-                        continue
-
-                service = service_list[0]
-                token = token_list[0]
-                # 优先使用 line 参数，如果没有则使用 backend
-                # line 可能是自定义线路，仍会统计到，只是在线路流量统计中不会显示
-                backend = line_list[0] if line_list else backend
-                if not backend:
-                    logger.warning(f"缺少 backend 信息: {url}")
-                    continue
-
-                username = None
-                user_id = None
-
-                if service == "plex":
-                    username = plex_token_cache.get(token)
-                    if username:
-                        user_result = _db.cur.execute(
-                            "SELECT plex_id FROM user WHERE LOWER(plex_username)=?",
-                            (username.lower(),),
-                        ).fetchone()
-                        if user_result:
-                            user_id = user_result[0]
-                elif service == "emby":
-                    username = emby_api_key_cache.get(token)
-                    if username:
-                        user_result = _db.cur.execute(
-                            "SELECT emby_id FROM emby_user WHERE LOWER(emby_username)=?",
-                            (username.lower(),),
-                        ).fetchone()
-                        if user_result:
-                            user_id = user_result[0]
-                    else:
-                        # 尝试通过 api key 获取用户名
-                        emby = Emby()
-                        username = await emby.get_emby_username_from_api_key(token)
-
-                # 如果无法获取到用户信息，跳过此条记录
-                if not username:
-                    logger.warning(f"无法找到 token 对应的用户名: {token}")
-                    continue
-
-                # 转换时间格式为 ISO 格式
-                try:
-                    # 将 nginx 时间格式转换为 datetime 对象
-                    # 格式: 23/Jun/2025:15:43:03 +0000
-                    dt = datetime.strptime(
-                        access_time, "%d/%b/%Y:%H:%M:%S %z"
-                    ).astimezone(settings.TZ)
-                    formatted_timestamp = dt.isoformat()
-                except ValueError:
-                    # 如果解析失败，使用原始的 @timestamp
-                    formatted_timestamp = (
-                        datetime.fromisoformat(timestamp)
-                        .astimezone(settings.TZ)
-                        .isoformat()
-                        if timestamp
-                        else ""
-                    )
-
-                # 存储到数据库
-                success = _db.create_line_traffic_entry(
-                    line=backend,
-                    send_bytes=bytes_sent,
-                    service=service,
-                    username=username,
-                    user_id=user_id,
-                    timestamp=formatted_timestamp,
-                )
-
-                if success:
-                    logger.info(
-                        f"成功处理日志: line={backend}, service={service}, user={username}, bytes={bytes_sent}, time={formatted_timestamp}"
-                    )
-                    processed_count += 1
-
-            except json.JSONDecodeError as e:
-                logger.error(f"JSON 解析错误: {e}, 原始数据: {raw_log}")
-                continue
-            except Exception as e:
-                logger.error(f"处理日志时发生错误: {e}, 原始数据: {raw_log}")
-                continue
-
-        logger.info(f"成功处理了 {processed_count} 条流量日志")
-
+        processed = await ingest_traffic_logs(values)
     except Exception as e:
         logger.error(f"更新线路流量统计时发生错误: {e}")
-    finally:
-        _db.close()
+        processed = None
+    if processed is None:
+        # 解析、查询用户或写入失败时将原始日志放回队列头部，等待下次处理
+        try:
+            stream_traffic_cache.redis_client.lpush(
+                TRAFFIC_LOG_QUEUE, *reversed(values)
+            )
+            logger.error(f"处理流量日志失败，已将 {len(values)} 条日志放回队列")
+        except Exception as e:
+            logger.error(f"将 {len(values)} 条流量日志放回队列失败: {e}")
+    else:
+        processed_count = processed
+
+    elapsed = perf_counter() - start
+    backlog = stream_traffic_cache.redis_client.llen(TRAFFIC_LOG_QUEUE)
+    stats = {
+        "popped": len(values),
+        "processed": processed_count,
+        "elapsed": round(elapsed, 3),
+        "rows_per_sec": round(processed_count / elapsed, 1) if elapsed else 0,
+        "backlog": backlog,
+    }
+    logger.info(
+        f"成功处理了 {processed_count}/{len(values)} 条流量日志，"
+        f"耗时 {stats['elapsed']}s（{stats['rows_per_sec']} 条/秒），队列剩余 {backlog} 条"
+    )
+    return stats
 
 
 def rewrite_users_credits_to_redis():
@@ -787,6 +703,7 @@ def rewrite_users_credits_to_redis():
         # 从 statistics 表中获取所有用户的积分信息
         stats = _db.cur.execute("SELECT tg_id, credits FROM statistics").fetchall()
         user_stats = {tg_id: credits for tg_id, credits in stats}
+        entries = {}
         # 获取 Plex 用户信息
         plex_users = _db.cur.execute(
             "SELECT plex_id, tg_id, credits, plex_username FROM user"
@@ -800,7 +717,7 @@ def rewrite_users_credits_to_redis():
             plex_username = user[3]
             if tg_id:
                 credits = user_stats.get(tg_id, 0)
-            user_credits_cache.put(f"plex:{plex_username.lower()}", credits)
+            entries[f"plex:{plex_username.lower()}"] = credits
         # 获取 Emby 用户信息
         emby_users = _db.cur.execute(
             "SELECT emby_id, tg_id, emby_credits, emby_username FROM emby_user"
@@ -811,7 +728,9 @@ def rewrite_users_credits_to_redis():
             emby_username = user[3]
             if tg_id:
                 credits = user_stats.get(tg_id, 0)
-            user_credits_cache.put(f"emby:{emby_username.lower()}", credits)
+            entries[f"emby:{emby_username.lower()}"] = credits
+        written = user_credits_cache.put_many(entries, skip_unchanged=True)
+        logger.debug(f"用户积分缓存：{len(entries)} 个用户，更新 {written} 个")
     except Exception as e:
         logger.error(f"检查用户积分时发生错误: {e}")
     finally:
@@ -824,6 +743,7 @@ def write_user_info_cache():
     """
     _db = DB()
     try:
+        entries = {}
         # 获取 Plex 用户信息
         plex_users = _db.cur.execute(
             "SELECT plex_id, tg_id, plex_username, plex_email, is_premium FROM user"
@@ -838,17 +758,14 @@ def write_user_info_cache():
             plex_email = user[3]
             is_premium = user[4]
             if plex_username:
-                user_info_cache.put(
-                    f"plex:{plex_username.lower()}",
-                    json.dumps(
-                        {
-                            "plex_id": plex_id,
-                            "tg_id": tg_id,
-                            "plex_username": plex_username,
-                            "plex_email": plex_email,
-                            "is_premium": is_premium,
-                        }
-                    ),
+                entries[f"plex:{plex_username.lower()}"] = json.dumps(
+                    {
+                        "plex_id": plex_id,
+                        "tg_id": tg_id,
+                        "plex_username": plex_username,
+                        "plex_email": plex_email,
+                        "is_premium": is_premium,
+                    }
                 )
         # 获取 Emby 用户信息
         emby_users = _db.cur.execute(
@@ -860,17 +777,16 @@ def write_user_info_cache():
             emby_username = user[2]
             is_premium = user[3]
             if emby_username:
-                user_info_cache.put(
-                    f"emby:{emby_username.lower()}",
-                    json.dumps(
-                        {
-                            "emby_id": emby_id,
-                            "tg_id": tg_id,
-                            "emby_username": emby_username,
-                            "is_premium": is_premium,
-                        }
-                    ),
+                entries[f"emby:{emby_username.lower()}"] = json.dumps(
+                    {
+                        "emby_id": emby_id,
+                        "tg_id": tg_id,
+                        "emby_username": emby_username,
+                        "is_premium": is_premium,
+                    }
                 )
+        written = user_info_cache.put_many(entries, skip_unchanged=True)
+        logger.debug(f"用户信息缓存：{len(entries)} 个用户，更新 {written} 个")
     except Exception as e:
         logger.error(f"写入用户信息缓存时发生错误: {e}")
     finally:
@@ -878,9 +794,23 @@ def write_user_info_cache():
 
 
 if __name__ == "__main__":
-    update_plex_credits()
-    update_plex_info()
+    # 预览积分结算: python -m app.update_db --dry-run
+    import argparse
+
+    parser = argparse.ArgumentParser(description="积分结算")
+    parser.add_argument("--dry-run", action="store_true", help="只输出积分变化明细")
+    args = parser.parse_args()
+    for success, report in (
+        update_plex_credits(dry_run=args.dry_run),
+        update_emby_credits(dry_run=args.dry_run),
+    ):
+        if not success:
+            print(f"积分结算失败: {report}")
+            continue
+        for row in report:
+            print(json.dumps(row, ensure_ascii=False))
+    if not args.dry_run:
+        update_plex_info()
     # add_all_plex_user()
-    update_emby_credits()
     # 测试流量统计更新
     # update_line_traffic_stats()
@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 
 import asyncio
+import os
 import pickle
 import threading
 from time import time
@@ -12,6 +13,7 @@ from app.config import settings
 from app.db import DB
 from app.emby import Emby
 from app.log import logger
+from app.metrics import telegram_messages_total
 from telegram.ext import ContextTypes
 
 
@@ -124,7 +126,7 @@ async def send_message_by_url(
     if not token:
         raise ValueError("token cannot be empty")
 
-    url = f"https://api.telegram.org/bot{token}/sendMessage"
+    url = f"{settings.TG_API_BASE_URL}/bot{token}/sendMessage"
     data = {"chat_id": chat_id, "text": text.strip()}
     data.update(kwargs)
 
@@ -145,9 +147,11 @@ async def send_message_by_url(
                     logger.info(
                         f"Message sent successfully to {chat_id}: {data.get('text')}"
                     )
+                    telegram_messages_total.inc(outcome="sent")
                     return True
                 else:
                     logger.warning(f"Telegram API returned error: {result}")
+                    telegram_messages_total.inc(outcome="failed")
                     return False
 
         except (
@@ -163,6 +167,7 @@ async def send_message_by_url(
                 logger.error(
                     f"Failed to send message to {chat_id} after {max_retries} attempts: {e}"
                 )
+                telegram_messages_total.inc(outcome="failed")
                 return False
 
         except Exception as e:
@@ -174,6 +179,7 @@ async def send_message_by_url(
                 logger.error(
                     f"Failed to send message to {chat_id} after {max_retries} attempts: {e}"
                 )
+                telegram_messages_total.inc(outcome="failed")
                 return False
 
         # Exponential backoff for retries
@@ -211,57 +217,82 @@ def caculate_credits_fund(unlock_time, unlock_credits: int):
         return 0
 
 
-def get_user_info_from_tg_id(chat_id: int, token=settings.TG_API_TOKEN):
-    """Get telegram user's info
+class TgUserInfoCache:
+    """
+    Telegram 用户信息的进程内缓存
+
+    缓存文件由 refresh_tg_user_info 定期重写，这里只在文件 mtime 变化时重新加载，
+    其余时间每次查询只需一次 stat
     cache format: {tg_id: {"first_name": first_name, "username": username, "added": timestamp}}
     """
-    cache_file = settings.TG_USER_INFO_CACHE_PATH
-    cache = {}
-    if not cache_file.exists():
-        logger.warning(f"Not found {settings.TG_USER_INFO_CACHE_PATH}")
-        return {}
-    with open(cache_file, "rb") as f:
-        cache = pickle.load(f)
-    return cache.get(chat_id, {})
-
-
-async def get_tg_user_photo_url(tg_id: int, token: str = settings.TG_API_TOKEN):
-    """获取 Telegram 头像"""
-    session = await get_thread_safe_session()
-    retry = 5
-    while retry > 0:
+
+    def __init__(self, path=settings.TG_USER_INFO_CACHE_PATH):
+        self._path = path
+        self._mtime = None
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def _load(self) -> dict:
         try:
-            # 获取用户头像
-            async with session.get(
-                f"https://api.telegram.org/bot{token}/getUserProfilePhotos?user_id={tg_id}&limit=1",
-            ) as photos_response:
-                photo_url = None
-                if photos_response.status == 200:
-                    photos_data = await photos_response.json()
-                    if photos_data.get("result", {}).get("total_count", 0) > 0:
-                        photo_file_id = photos_data["result"]["photos"][0][0]["file_id"]
-
-                        # 获取文件路径
-                        async with session.get(
-                            f"https://api.telegram.org/bot{token}/getFile?file_id={photo_file_id}",
-                        ) as file_response:
-                            if file_response.status == 200:
-                                file_data = await file_response.json()
-                                if file_data.get("ok"):
-                                    file_path = file_data["result"]["file_path"]
-                                    photo_url = f"https://api.telegram.org/file/bot{token}/{file_path}"
-
-            return photo_url
-        except Exception:
-            logger.error(f"Error: failed to get photo for {tg_id}, retrying...")
-            await asyncio.sleep(1)
-            retry -= 1
-    return None
+            mtime = self._path.stat().st_mtime_ns
+        except FileNotFoundError:
+            logger.warning(f"Not found {self._path}")
+            self._mtime, self._data = None, {}
+            return self._data
+
+        if mtime != self._mtime:
+            with self._lock:
+                if mtime != self._mtime:
+                    try:
+                        with open(self._path, "rb") as f:
+                            self._data = pickle.load(f)
+                        self._mtime = mtime
+                    except Exception as e:
+                        # 读取失败时继续使用旧数据，下次查询再重试
+                        logger.error(f"Failed to load {self._path}: {e}")
+        return self._data
+
+    def get(self, tg_id: int) -> dict:
+        return self._load().get(tg_id, {})
+
+    def get_many(self, tg_ids) -> dict:
+        """批量获取用户信息，返回 {tg_id: info}，未缓存的用户为空字典"""
+        data = self._load()
+        return {tg_id: data.get(tg_id, {}) for tg_id in tg_ids}
+
+    def get_all(self) -> dict:
+        """获取全部用户信息的副本"""
+        return dict(self._load())
+
+
+tg_user_info_cache = TgUserInfoCache()
+
+
+def get_user_info_from_tg_id(chat_id: int, token=settings.TG_API_TOKEN):
+    """Get telegram user's info"""
+    return tg_user_info_cache.get(chat_id)
+
+
+def get_users_info_from_tg_ids(chat_ids, token=settings.TG_API_TOKEN) -> dict:
+    """批量获取 telegram 用户信息，返回 {tg_id: info}"""
+    return tg_user_info_cache.get_many(chat_ids)
+
+
+def _get_user_name(chat_id: int, user_info: dict):
+    return user_info.get("first_name") or user_info.get("username") or chat_id
 
 
 def get_user_name_from_tg_id(chat_id: int, token=settings.TG_API_TOKEN):
     user_info = get_user_info_from_tg_id(chat_id, token=token)
-    return user_info.get("first_name") or user_info.get("username") or chat_id
+    return _get_user_name(chat_id, user_info)
+
+
+def get_user_names_from_tg_ids(chat_ids, token=settings.TG_API_TOKEN) -> dict:
+    """批量获取用户名，返回 {tg_id: name}"""
+    return {
+        chat_id: _get_user_name(chat_id, user_info)
+        for chat_id, user_info in get_users_info_from_tg_ids(chat_ids).items()
+    }
 
 
 def get_user_avatar_from_tg_id(chat_id: int, token=settings.TG_API_TOKEN):
@@ -270,91 +301,245 @@ def get_user_avatar_from_tg_id(chat_id: int, token=settings.TG_API_TOKEN):
     return user_info.get("photo_url")
 
 
-async def refresh_tg_user_info(token: str = settings.TG_API_TOKEN):
-    """刷新用户信息"""
+class AsyncRateLimiter:
+    """异步限速器，保证请求之间的最小间隔不低于 1/rate 秒"""
+
+    def __init__(self, rate: float):
+        self._interval = 1 / rate
+        self._next_time = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self):
+        async with self._lock:
+            now = asyncio.get_running_loop().time()
+            delay = self._next_time - now
+            self._next_time = max(now, self._next_time) + self._interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+async def _tg_api_get(
+    session: aiohttp.ClientSession,
+    limiter: AsyncRateLimiter,
+    url: str,
+    max_retries: int = 5,
+    raw: bool = False,
+    **params,
+):
+    """
+    请求 Telegram Bot API，遇到 429 时按 retry_after 等待后重试
+
+    Args:
+        raw: 是否直接返回响应内容（用于下载文件）
+
+    Returns:
+        Bot API 返回的 result（raw 时为 bytes），失败返回 None
+    """
+    for _ in range(max_retries):
+        await limiter.wait()
+        try:
+            async with session.get(url, params=params) as response:
+                if raw:
+                    if response.status == 200:
+                        return await response.read()
+                    logger.error(f"Error: failed to download {url}: {response.status}")
+                    return None
+
+                data = await response.json(content_type=None)
+                if response.status == 429:
+                    retry_after = data.get("parameters", {}).get("retry_after", 1)
+                    logger.warning(f"Telegram API 限流，{retry_after} 秒后重试")
+                    await asyncio.sleep(retry_after)
+                    continue
+                if not data.get("ok"):
+                    logger.error(
+                        f"Error: telegram api {url.rsplit('/', 1)[-1]} failed: "
+                        f"{data.get('description')}, params: {params}"
+                    )
+                    return None
+                return data.get("result")
+        except Exception as e:
+            logger.error(f"Error: {e}, retrying in 1 seconds...")
+            await asyncio.sleep(1)
+    return None
+
+
+async def _fetch_tg_user_info(
+    session: aiohttp.ClientSession,
+    limiter: AsyncRateLimiter,
+    tg_id: int,
+    old_info: dict,
+    token: str,
+) -> Optional[tuple[dict, Optional[bytes]]]:
+    """
+    获取单个用户的资料和头像，头像的 file_unique_id 未变化时不重新下载
+
+    Returns:
+        (user_info, avatar)，avatar 为 None 表示无需更新头像文件；获取失败返回 None
+    """
+    api_url = f"{settings.TG_API_BASE_URL}/bot{token}"
+    chat = await _tg_api_get(session, limiter, f"{api_url}/getChat", chat_id=tg_id)
+    if chat is None:
+        return None
+
+    user_info = {
+        "first_name": chat.get("first_name"),
+        "username": chat.get("username"),
+        "added": time(),
+    }
+    avatar = None
+    photos = await _tg_api_get(
+        session, limiter, f"{api_url}/getUserProfilePhotos", user_id=tg_id, limit=1
+    )
+    if photos and photos.get("total_count", 0) > 0:
+        photo = photos["photos"][0][0]
+        photo_path = settings.TG_USER_PROFILE_CACHE_PATH / f"{tg_id}.jpg"
+        if (
+            old_info.get("photo_file_unique_id") == photo["file_unique_id"]
+            and photo_path.exists()
+        ):
+            # 头像未变化
+            user_info["photo_file_unique_id"] = photo["file_unique_id"]
+        else:
+            file = await _tg_api_get(
+                session, limiter, f"{api_url}/getFile", file_id=photo["file_id"]
+            )
+            if file:
+                avatar = await _tg_api_get(
+                    session,
+                    limiter,
+                    f"{settings.TG_API_BASE_URL}/file/bot{token}/{file['file_path']}",
+                    raw=True,
+                )
+            if avatar:
+                user_info["photo_file_unique_id"] = photo["file_unique_id"]
+        # 下载失败且没有旧头像文件时不设置地址，前端显示默认头像
+        if avatar or photo_path.exists():
+            user_info["photo_url"] = (
+                f"{settings.WEBAPP_URL.strip('/')}/pics/{tg_id}.jpg"
+            )
+    return user_info, avatar
+
+
+def _write_tg_user_info(cache: dict, avatars: dict):
+    """写入头像文件，并原子地重写用户信息缓存文件"""
+    for tg_id, avatar in avatars.items():
+        with open(settings.TG_USER_PROFILE_CACHE_PATH / f"{tg_id}.jpg", "wb") as f:
+            f.write(avatar)
+    with filelock.FileLock(str(settings.TG_USER_INFO_CACHE_PATH) + ".lock"):
+        # 先写临时文件再替换，避免读取方读到写了一半的文件
+        tmp_file = settings.TG_USER_INFO_CACHE_PATH.with_suffix(".tmp")
+        with open(tmp_file, "wb") as f:
+            pickle.dump(cache, f)
+        os.replace(tmp_file, settings.TG_USER_INFO_CACHE_PATH)
+
+
+async def refresh_tg_user_info(
+    token: str = settings.TG_API_TOKEN,
+    concurrency: int = settings.TG_REFRESH_CONCURRENCY,
+    batch_size: int = 50,
+) -> dict:
+    """
+    刷新用户信息
+
+    缓存只加载一次，以有限并发获取过期（超过 7 天）的用户资料，
+    每 batch_size 个用户批量写入一次头像和缓存文件
+
+    Returns:
+        dict: 刷新统计（总数、跳过、成功、失败、头像更新/未变化数）
+    """
+    stats = {
+        "total": 0,
+        "skipped": 0,
+        "refreshed": 0,
+        "failed": 0,
+        "avatars_updated": 0,
+        "avatars_unchanged": 0,
+    }
     try:
-        cache_file_lock = filelock.FileLock(
-            str(settings.TG_USER_INFO_CACHE_PATH) + ".lock"
-        )
-        cache = {}
         db = DB()
+        try:
+            # 从 statistics 表获取所有用户
+            tg_ids = [
+                row[0]
+                for row in db.cur.execute("SELECT tg_id FROM statistics").fetchall()
+            ]
+        finally:
+            db.close()
+
+        cache = tg_user_info_cache.get_all()
+        # 缓存保留 7 天
+        stale_ids = [
+            tg_id
+            for tg_id in tg_ids
+            if time() - cache.get(tg_id, {}).get("added", 0) > 7 * 24 * 3600
+        ]
+        stats["total"] = len(tg_ids)
+        stats["skipped"] = len(tg_ids) - len(stale_ids)
+        logger.info(
+            f"开始刷新 Telegram 用户信息: 共 {len(tg_ids)} 个用户，"
+            f"{len(stale_ids)} 个需要刷新"
+        )
+        if not stale_ids:
+            return stats
+
         session = await get_thread_safe_session()
+        limiter = AsyncRateLimiter(settings.TG_API_RATE_LIMIT)
+        semaphore = asyncio.Semaphore(concurrency)
 
-        # 从 statistics 表获取所有用户
-        stats_users = db.cur.execute("SELECT tg_id FROM statistics").fetchall()
-        stats_users = [user[0] for user in stats_users]
-
-        for tg_id in stats_users:
-            if settings.TG_USER_INFO_CACHE_PATH.exists():
-                with open(settings.TG_USER_INFO_CACHE_PATH, "rb") as f:
-                    cache = pickle.load(f)
-            # 缓存保留 7 天
-            if tg_id in cache:
-                if time() - cache.get(tg_id).get("added") <= 7 * 24 * 3600:
-                    logger.info(
-                        f"{cache.get(tg_id).get('username')}({tg_id}) info is not expired, skip"
-                    )
-                    continue
-            retry = 10
-            while retry > 0:
-                try:
-                    async with session.get(
-                        url=f"https://api.telegram.org/bot{token}/getChat?chat_id={tg_id}",
-                    ) as response:
-                        if response.status != 200:
-                            logger.error(f"Error: failed to get info. for {tg_id}")
-                            break
-                        result = (await response.json()).get("result", {})
-                except Exception as e:
-                    logger.error(f"Error: {e}, retrying in 1 seconds...")
-                    await asyncio.sleep(1)
-                    retry -= 1
-                    continue
-                else:
-                    break
-
-            if retry == 0:
-                continue
-
-            user_info = {
-                "first_name": result.get("first_name"),
-                "username": result.get("username"),
-                "added": time(),
-            }
-            # 获取用户 photo url
-            photo_url = await get_tg_user_photo_url(tg_id, token=token)
-            if photo_url:
-                # 下载头像到本地
-                photo_path = settings.TG_USER_PROFILE_CACHE_PATH / f"{tg_id}.jpg"
-                try:
-                    async with session.get(
-                        photo_url,
-                    ) as response:
-                        if response.status == 200:
-                            content = await response.read()
-                            with open(photo_path, "wb") as f:
-                                f.write(content)
-                except Exception as e:
-                    logger.error(f"Error: {e}")
-                user_info["photo_url"] = (
-                    f"{settings.WEBAPP_URL.strip('/')}/pics/{tg_id}.jpg"
+        async def fetch(tg_id: int):
+            async with semaphore:
+                return tg_id, await _fetch_tg_user_info(
+                    session, limiter, tg_id, cache.get(tg_id, {}), token
+                )
+
+        pending_avatars = {}
+        pending_count = 0
+        done = 0
+        for task in asyncio.as_completed([fetch(tg_id) for tg_id in stale_ids]):
+            tg_id, result = await task
+            done += 1
+            if result is None:
+                stats["failed"] += 1
+            else:
+                user_info, avatar = result
+                cache[tg_id] = user_info
+                stats["refreshed"] += 1
+                pending_count += 1
+                if avatar:
+                    pending_avatars[tg_id] = avatar
+                    stats["avatars_updated"] += 1
+                elif "photo_file_unique_id" in user_info:
+                    stats["avatars_unchanged"] += 1
+                logger.debug(
+                    f"Updated tg user info: {user_info.get('username')}({tg_id})"
+                )
+
+            if pending_count >= batch_size or (
+                done == len(stale_ids) and pending_count
+            ):
+                await asyncio.to_thread(
+                    _write_tg_user_info, dict(cache), pending_avatars
+                )
+                pending_avatars, pending_count = {}, 0
+                logger.info(
+                    f"Telegram 用户信息刷新进度: {done}/{len(stale_ids)}, {stats}"
                 )
-            # add cache
-            cache.update({tg_id: user_info})
-            logger.info(f"Updated tg user info: {user_info.get('username')}({tg_id})")
-            with cache_file_lock:
-                with open(settings.TG_USER_INFO_CACHE_PATH, "wb") as f:
-                    pickle.dump(cache, f)
     except Exception as e:
         logger.error(f"Refresh user tg info failed: {e}")
-    finally:
-        db.close()
+
+    logger.info(f"Telegram 用户信息刷新完成: {stats}")
+    return stats
 
 
 def refresh_emby_user_info():
     """刷新 emby user info"""
     emby = Emby()
-    # 获取所有的 emby 用户名
+    # 一次请求批量刷新全部用户
+    if emby.refresh_user_info_cache() >= 0:
+        return
+
+    # 批量刷新失败时逐个获取
     try:
         db = DB()
 
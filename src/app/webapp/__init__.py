@@ -1,9 +1,11 @@
+import hmac
 import secrets
 from pathlib import Path
 
 from app.config import settings
 from app.log import logger
-from app.webapp.middlewares import TelegramAuthMiddleware
+from app.metrics import render_metrics
+from app.webapp.middlewares import MetricsMiddleware, TelegramAuthMiddleware
 from app.webapp.routers import rankings_router, system_router, user_router
 from app.webapp.routers.activities.auction import router as auction_router
 from app.webapp.routers.activities.luckywheel import router as luckywheel_router
@@ -11,8 +13,9 @@ from app.webapp.routers.admin import router as admin_router
 from app.webapp.routers.invitation import router as invitation_router
 from app.webapp.routers.premium import router as premium_router
 from app.webapp.startup.lifespan import lifespan
-from fastapi import FastAPI
+from fastapi import FastAPI, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.concurrency import run_in_threadpool
 from fastapi.staticfiles import StaticFiles
 from starlette.middleware.sessions import SessionMiddleware
 
@@ -44,6 +47,8 @@ app.add_middleware(
 
 # 添加 Telegram 认证中间件
 app.add_middleware(TelegramAuthMiddleware)
+# 请求耗时统计（最外层，包含认证耗时）
+app.add_middleware(MetricsMiddleware)
 
 
 # 健康检查端点
@@ -53,6 +58,26 @@ async def health_check():
     return {"status": "ok", "message": "PMSManageBot is running"}
 
 
+# Prometheus 指标
+@app.get("/metrics", include_in_schema=False)
+async def metrics(request: Request):
+    """
+    以 Prometheus 文本格式输出运行指标
+
+    需设置 WEBAPP_METRICS_TOKEN 并以 Bearer token 访问，未设置时返回 404
+    """
+    if not settings.WEBAPP_METRICS_TOKEN:
+        return Response(status_code=404)
+    authorization = request.headers.get("authorization", "")
+    if not hmac.compare_digest(
+        authorization, f"Bearer {settings.WEBAPP_METRICS_TOKEN}"
+    ):
+        return Response(status_code=401)
+    # 队列长度等指标需要查询 Redis，在线程池中执行
+    content = await run_in_threadpool(render_metrics)
+    return Response(content=content, media_type="text/plain; version=0.0.4")
+
+
 # 注册路由
 app.include_router(user_router)
 app.include_router(rankings_router)
@@ -1,11 +1,24 @@
 import hashlib
 import hmac
 import json
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Optional
 
 from app.config import settings
 from app.webapp.schemas import TelegramUser
 from fastapi import HTTPException, Request, status
 
+MOCK_INIT_DATA_HASH = "mock_hash_for_development"
+
+
+@lru_cache(maxsize=1)
+def _get_secret_key(token: str) -> bytes:
+    """由 bot token 派生的 HMAC 密钥，只需计算一次"""
+    return hmac.new(b"WebAppData", token.encode(), digestmod=hashlib.sha256).digest()
+
 
 def verify_telegram_data(data: dict) -> bool:
     """验证来自 Telegram WebApp 的数据"""
@@ -20,19 +33,83 @@ def verify_telegram_data(data: dict) -> bool:
     data_check_string = "\n".join([f"{k}={data_check[k]}" for k in data_check_keys])
 
     # 计算 HMAC-SHA-256 签名
-    secret_key = hmac.new(
-        b"WebAppData", settings.TG_API_TOKEN.encode(), digestmod=hashlib.sha256
-    ).digest()
     calculated_hash = hmac.new(
-        secret_key, data_check_string.encode(), digestmod=hashlib.sha256
+        _get_secret_key(settings.TG_API_TOKEN),
+        data_check_string.encode(),
+        digestmod=hashlib.sha256,
     ).hexdigest()
 
     # 验证哈希
-    return calculated_hash == received_hash
+    return hmac.compare_digest(calculated_hash, received_hash)
+
+
+def is_init_data_expired(data: dict, max_age: int = None) -> bool:
+    """initData 的 auth_date 是否超过有效期"""
+    max_age = settings.WEBAPP_INIT_DATA_MAX_AGE if max_age is None else max_age
+    if max_age <= 0:
+        return False
+    try:
+        return time.time() - int(data.get("auth_date", 0)) > max_age
+    except ValueError:
+        return True
+
+
+def parse_telegram_user(data: dict) -> Optional[TelegramUser]:
+    """解析 initData 中的用户信息，缺失或格式错误时返回 None"""
+    try:
+        return TelegramUser(**json.loads(data["user"]))
+    except Exception:
+        return None
+
+
+class VerifiedInitDataCache:
+    """
+    已验证的 initData 缓存（LRU），以 hash 为键
+
+    同一个 WebApp 会话的每个请求都携带相同的 initData，命中缓存时无需重新解析
+    和计算 HMAC。命中时会比较原始 initData，hash 相同但内容不同的请求不会通过。
+    """
+
+    def __init__(self, capacity: int = 4096):
+        self.capacity = capacity
+        self._data: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, init_data: str, received_hash: str):
+        """返回 (initData 字典, TelegramUser)，未命中或已过期返回 None"""
+        with self._lock:
+            item = self._data.get(received_hash)
+            if item is None:
+                return None
+            raw, expires_at, data, user = item
+            if raw != init_data:
+                return None
+            if expires_at is not None and expires_at < time.time():
+                del self._data[received_hash]
+                return None
+            self._data.move_to_end(received_hash)
+            return data, user
+
+    def put(self, init_data: str, data: dict, user: Optional[TelegramUser]):
+        max_age = settings.WEBAPP_INIT_DATA_MAX_AGE
+        expires_at = int(data.get("auth_date", 0)) + max_age if max_age > 0 else None
+        with self._lock:
+            self._data[data["hash"]] = (init_data, expires_at, data, user)
+            self._data.move_to_end(data["hash"])
+            while len(self._data) > self.capacity:
+                self._data.popitem(last=False)
+
+
+verified_init_data_cache = VerifiedInitDataCache()
 
 
 def get_telegram_user(request: Request) -> TelegramUser:
     """从请求中获取和验证 Telegram 用户数据"""
+    # 认证中间件已解析的用户
+    user = getattr(request.state, "telegram_user", None)
+    if user is not None:
+        return user
+
     try:
         # 从请求头中获取 telegram user 信息
         user_data = request.state.telegram_data.get("user")
@@ -41,15 +118,7 @@ def get_telegram_user(request: Request) -> TelegramUser:
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="缺少 Telegram 用户数据",
             )
-
-        # 检查是否是模拟数据
-        if request.state.telegram_data.get("hash") == "mock_hash_for_development":
-            # 开发环境模拟数据，直接解析JSON
-            user_dict = json.loads(user_data)
-            return TelegramUser(**user_dict)
-        else:
-            # 正常的Telegram数据
-            return TelegramUser(**json.loads(user_data))
+        return TelegramUser(**json.loads(user_data))
 
     except HTTPException:
         raise
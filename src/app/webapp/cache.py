@@ -0,0 +1,186 @@
+"""
+WebApp 接口响应缓存
+
+在路由上声明缓存时间即可缓存读多写少接口的 JSON 响应，并返回 ETag，
+客户端携带 If-None-Match 重复请求且内容未变化时直接返回 304。
+
+用法:
+    @router.get("/stats")
+    @require_telegram_auth
+    @cache_response(ttl=60)
+    async def get_stats(request: Request, user: TelegramUser = Depends(...)):
+        ...
+
+查询失败时路由返回的兜底数据不应被缓存，可在返回前调用 skip_response_cache()；
+返回 {"success": False, ...} 的响应也不会被缓存。
+"""
+
+import hashlib
+import json
+import threading
+import time
+from contextvars import ContextVar
+from functools import wraps
+from typing import Optional
+
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+
+from app.config import settings
+from app.log import uvicorn_logger as logger
+from app.redis import Redis
+
+_skip_cache: ContextVar[bool] = ContextVar("response_cache_skip", default=False)
+
+
+def skip_response_cache():
+    """标记当前请求的响应不写入缓存（如查询失败后返回的兜底数据）"""
+    _skip_cache.set(True)
+
+
+class LocalResponseCacheBackend:
+    """进程内缓存后端"""
+
+    def __init__(self, capacity: int = 1024):
+        self.capacity = capacity
+        self._data: dict[str, tuple[float, str]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        item = self._data.get(key)
+        if item is None or item[0] < time.monotonic():
+            return None
+        return item[1]
+
+    def set(self, key: str, value: str, ttl: int):
+        with self._lock:
+            if len(self._data) >= self.capacity:
+                # 先清理过期条目，仍然超出容量时淘汰最早写入的条目
+                now = time.monotonic()
+                self._data = {k: v for k, v in self._data.items() if v[0] >= now}
+                while len(self._data) >= self.capacity:
+                    self._data.pop(next(iter(self._data)))
+            self._data[key] = (time.monotonic() + ttl, value)
+
+    def clear(self):
+        with self._lock:
+            self._data = {}
+
+
+class RedisResponseCacheBackend:
+    """Redis 缓存后端，多个进程共享"""
+
+    def __init__(self, db: int = 0, key_prefix: str = "response:"):
+        self.redis_client = Redis(db=db).get_connection()
+        self._key_prefix = key_prefix
+
+    def get(self, key: str) -> Optional[str]:
+        return self.redis_client.get(f"{self._key_prefix}{key}")
+
+    def set(self, key: str, value: str, ttl: int):
+        self.redis_client.set(f"{self._key_prefix}{key}", value, ex=ttl)
+
+    def clear(self):
+        pipeline = self.redis_client.pipeline()
+        for key in self.redis_client.scan_iter(match=f"{self._key_prefix}*"):
+            pipeline.delete(key)
+        pipeline.execute()
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_response_cache_backend():
+    """根据配置获取缓存后端，未启用时返回 None"""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                backend = settings.WEBAPP_RESPONSE_CACHE.lower()
+                if backend == "redis":
+                    _backend = RedisResponseCacheBackend()
+                elif backend == "local":
+                    _backend = LocalResponseCacheBackend()
+                else:
+                    _backend = False
+    return _backend or None
+
+
+def _make_cache_key(request: Request, user=None) -> str:
+    query = "&".join(f"{k}={v}" for k, v in sorted(request.query_params.multi_items()))
+    key = f"{request.url.path}?{query}"
+    if user is not None:
+        key += f"#user:{user.id}"
+    return key
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # 比较时忽略弱校验前缀
+    tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return etag.removeprefix("W/") in tags
+
+
+def cache_response(ttl: int, vary_by_user: bool = False):
+    """
+    缓存接口的 JSON 响应并支持 ETag / If-None-Match
+
+    Args:
+        ttl: 缓存时间（秒）
+        vary_by_user: 响应内容是否因用户而异（如包含 is_self 标记），
+            为 True 时按 Telegram 用户分别缓存
+    """
+
+    def decorator(func):
+        @wraps(func)
+        async def wrapper(*args, **kwargs):
+            request: Optional[Request] = kwargs.get("request")
+            backend = get_response_cache_backend()
+            if request is None or backend is None:
+                return await func(*args, **kwargs)
+
+            key = _make_cache_key(request, kwargs.get("user") if vary_by_user else None)
+            body = None
+            try:
+                body = backend.get(key)
+            except Exception as e:
+                logger.warning(f"读取响应缓存失败: {key}, error: {e}")
+
+            if body is None:
+                token = _skip_cache.set(False)
+                try:
+                    result = await func(*args, **kwargs)
+                    skip = _skip_cache.get()
+                finally:
+                    _skip_cache.reset(token)
+                # 路由自行构造的响应不缓存
+                if isinstance(result, Response):
+                    return result
+                body = json.dumps(
+                    jsonable_encoder(result), ensure_ascii=False, separators=(",", ":")
+                )
+                # 兜底数据和失败响应不缓存，避免错误结果在缓存时间内一直返回
+                if isinstance(result, dict) and result.get("success") is False:
+                    skip = True
+                if not skip:
+                    try:
+                        backend.set(key, body, ttl)
+                    except Exception as e:
+                        logger.warning(f"写入响应缓存失败: {key}, error: {e}")
+
+            etag = f'W/"{hashlib.sha1(body.encode()).hexdigest()}"'
+            # 要求客户端每次都携带 If-None-Match 重新校验
+            headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+            if _etag_matches(request.headers.get("if-none-match"), etag):
+                return Response(status_code=304, headers=headers)
+            return Response(
+                content=body, media_type="application/json", headers=headers
+            )
+
+        return wrapper
+
+    return decorator
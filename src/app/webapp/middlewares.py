@@ -1,59 +1,154 @@
+import json
+import time
+import urllib.parse
 from functools import wraps
 
 from app.log import logger
-from app.webapp.auth import verify_telegram_data
+from app.metrics import http_request_duration_seconds
+from app.webapp.auth import (
+    MOCK_INIT_DATA_HASH,
+    is_init_data_expired,
+    parse_telegram_user,
+    verified_init_data_cache,
+    verify_telegram_data,
+)
 from fastapi import HTTPException, Request, status
 from fastapi.security import HTTPBearer
-from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.types import ASGIApp, Receive, Scope, Send
 
 security = HTTPBearer()
 
 
-class TelegramAuthMiddleware(BaseHTTPMiddleware):
-    """Telegram WebApp 认证中间件"""
+class TelegramAuthMiddleware:
+    """
+    Telegram WebApp 认证中间件（纯 ASGI 实现）
 
-    async def dispatch(self, request: Request, call_next):
-        # 获取Telegram initData
-        init_data = request.headers.get("X-Telegram-Init-Data")
-        logger.debug(f"{init_data=}")
+    验证通过后将 initData 字典及解析出的 TelegramUser 分别放入
+    request.state.telegram_data 和 request.state.telegram_user。
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        init_data = None
+        for name, value in scope["headers"]:
+            if name == b"x-telegram-init-data":
+                init_data = value.decode("latin-1")
+                break
 
         if not init_data:
             # 如果请求不包含 initData，可能是公开API或静态资源请求，正常放行
-            return await call_next(request)
+            return await self.app(scope, receive, send)
 
-        # 解析并验证 initData
         try:
-            # 解析 url 编码的 query string 格式的 initData
-            import urllib.parse
-
-            data_dict = dict(urllib.parse.parse_qsl(init_data))
-
-            # 在开发环境中，允许模拟认证数据
-            is_mock_data = data_dict.get("hash") == "mock_hash_for_development"
-
-            if is_mock_data:
-                logger.info("使用开发环境模拟认证数据")
-                # 创建模拟的用户数据
-                request.state.telegram_data = data_dict
-            else:
-                # 验证数据
-                if not verify_telegram_data(data_dict):
-                    logger.warning(f"无效的 Telegram initData: {init_data[:100]}...")
-                    raise HTTPException(
-                        status_code=status.HTTP_401_UNAUTHORIZED,
-                        detail="无效的 Telegram 认证数据",
-                    )
-
-                # 将验证过的用户数据添加到请求状态
-                request.state.telegram_data = data_dict
-
-            # 继续处理请求
-            return await call_next(request)
+            result = self._authenticate(init_data)
         except Exception as e:
             logger.error(f"处理 Telegram initData 时出错: {str(e)}")
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="无法处理 Telegram 认证数据",
+            return await self._reject(
+                send, status.HTTP_400_BAD_REQUEST, "无法处理 Telegram 认证数据"
+            )
+        if result is None:
+            return await self._reject(
+                send, status.HTTP_401_UNAUTHORIZED, "无效的 Telegram 认证数据"
+            )
+
+        state = scope.setdefault("state", {})
+        state["telegram_data"], state["telegram_user"] = result
+        return await self.app(scope, receive, send)
+
+    @staticmethod
+    def _authenticate(init_data: str):
+        """验证 initData，返回 (initData 字典, TelegramUser)，验证失败返回 None"""
+        # 同一会话的后续请求直接命中缓存
+        received_hash = init_data.rpartition("hash=")[2].split("&", 1)[0]
+        cached = verified_init_data_cache.get(init_data, received_hash)
+        if cached is not None:
+            return cached
+
+        # 解析 url 编码的 query string 格式的 initData
+        data_dict = dict(urllib.parse.parse_qsl(init_data))
+
+        # 在开发环境中，允许模拟认证数据
+        if data_dict.get("hash") == MOCK_INIT_DATA_HASH:
+            logger.info("使用开发环境模拟认证数据")
+            return data_dict, parse_telegram_user(data_dict)
+
+        if not verify_telegram_data(data_dict):
+            logger.warning(f"无效的 Telegram initData: {init_data[:100]}...")
+            return None
+        if is_init_data_expired(data_dict):
+            logger.warning(
+                f"Telegram initData 已过期: auth_date={data_dict.get('auth_date')}"
+            )
+            return None
+
+        user = parse_telegram_user(data_dict)
+        verified_init_data_cache.put(init_data, data_dict, user)
+        return data_dict, user
+
+    @staticmethod
+    async def _reject(send: Send, status_code: int, detail: str):
+        body = json.dumps({"detail": detail}, ensure_ascii=False).encode()
+        await send(
+            {
+                "type": "http.response.start",
+                "status": status_code,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode()),
+                ],
+            }
+        )
+        await send({"type": "http.response.body", "body": body})
+
+
+class MetricsMiddleware:
+    """记录每个路由（按路径模板）的请求耗时"""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        # {endpoint: 路径模板}，首次请求时根据路由表生成
+        self._templates: dict = None
+
+    def _route_template(self, scope: Scope) -> str:
+        if self._templates is None:
+            self._templates = {}
+            for route in scope["app"].routes:
+                endpoint = getattr(route, "endpoint", None) or getattr(
+                    route, "app", None
+                )
+                path = getattr(route, "path", "")
+                # 挂载的静态文件等子应用
+                if not hasattr(route, "endpoint"):
+                    path = f"{path}/*"
+                self._templates[endpoint] = path
+        return self._templates.get(scope.get("endpoint"), "<unmatched>")
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            http_request_duration_seconds.observe(
+                time.perf_counter() - start,
+                method=scope["method"],
+                route=self._route_template(scope),
+                status=status_code,
             )
 
 
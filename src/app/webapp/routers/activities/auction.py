@@ -1,7 +1,8 @@
+import asyncio
 from datetime import datetime, timedelta
 
 from app.config import settings
-from app.db import DB
+from app.db import AsyncDB
 from app.log import uvicorn_logger as logger
 from app.update_db import finish_expired_auctions_job
 from app.utils.utils import get_user_name_from_tg_id, send_message_by_url
@@ -20,6 +21,8 @@ from app.webapp.schemas import (
 )
 from fastapi import APIRouter, Depends, HTTPException, Request, status
 
+_bid_lock = asyncio.Lock()
+
 router = APIRouter(prefix="/auction", tags=["auction"])
 
 
@@ -30,8 +33,8 @@ async def get_auction_list(
 ):
     """获取竞拍列表"""
     try:
-        db = DB()
-        auctions_data = db.get_active_auctions()
+        db = AsyncDB()
+        auctions_data = await db.get_active_auctions()
 
         auctions = []
         for auction_data in auctions_data:
@@ -59,7 +62,7 @@ async def get_auction_list(
         )
     finally:
         if "db" in locals():
-            db.close()
+            await db.close()
 
 
 @router.get("/stats", response_model=AuctionStatsResponse)
@@ -72,8 +75,8 @@ async def get_auction_stats(
         # 检查管理员权限
         check_admin_permission(current_user)
 
-        db = DB()
-        stats = db.get_auction_stats()
+        db = AsyncDB()
+        stats = await db.get_auction_stats()
 
         return AuctionStatsResponse(
             total_auctions=stats["total_auctions"],
@@ -91,7 +94,7 @@ async def get_auction_stats(
         )
     finally:
         if "db" in locals():
-            db.close()
+            await db.close()
 
 
 @router.get("/{auction_id}", response_model=AuctionDetailResponse)
@@ -103,8 +106,8 @@ async def get_auction_detail(
 ):
     """获取竞拍详情"""
     try:
-        db = DB()
-        auction_data = db.get_auction_by_id(auction_id)
+        db = AsyncDB()
+        auction_data = await db.get_auction_by_id(auction_id)
 
         if not auction_data:
             raise HTTPException(
@@ -127,7 +130,7 @@ async def get_auction_detail(
         )
 
         # 获取最近的出价记录
-        bids_data = db.get_auction_bids(auction_id, limit=10)
+        bids_data = await db.get_auction_bids(auction_id, limit=10)
         recent_bids = []
         for bid_data in bids_data:
             bid = {
@@ -148,7 +151,7 @@ async def get_auction_detail(
         )
 
         # 获取用户最高出价
-        user_highest_bid = db.get_user_highest_bid(auction_id, current_user.id)
+        user_highest_bid = await db.get_user_highest_bid(auction_id, current_user.id)
 
         return AuctionDetailResponse(
             auction=auction,
@@ -166,7 +169,7 @@ async def get_auction_detail(
         )
     finally:
         if "db" in locals():
-            db.close()
+            await db.close()
 
 
 @router.post("/create")
@@ -181,14 +184,14 @@ async def create_auction(
         # 检查管理员权限
         check_admin_permission(current_user)
 
-        db = DB()
+        db = AsyncDB()
 
         # 计算结束时间
         end_time = datetime.now() + timedelta(hours=request_data.duration_hours)
         end_timestamp = int(end_time.timestamp())
 
         # 创建竞拍
-        auction_id = db.create_auction(
+        auction_id = await db.create_auction(
             title=request_data.title,
             description=request_data.description,
             starting_price=request_data.starting_price,
@@ -219,7 +222,7 @@ async def create_auction(
         )
     finally:
         if "db" in locals():
-            db.close()
+            await db.close()
 
 
 @router.post("/bid", response_model=PlaceBidResponse)
@@ -230,89 +233,92 @@ async def place_bid(
     current_user: TelegramUser = Depends(get_telegram_user),
 ):
     """出价"""
-    try:
-        db = DB()
+    # 校验当前价格到写入出价需要串行执行，避免并发出价覆盖
+    async with _bid_lock:
+        try:
+            db = AsyncDB()
+
+            # 检查竞拍是否存在
+            auction_data = await db.get_auction_by_id(bid_request.auction_id)
+            if not auction_data:
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND, detail="竞拍不存在"
+                )
 
-        # 检查竞拍是否存在
-        auction_data = db.get_auction_by_id(bid_request.auction_id)
-        if not auction_data:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND, detail="竞拍不存在"
-            )
+            # 检查竞拍是否活跃且未过期
+            if not auction_data["is_active"]:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST, detail="竞拍已结束"
+                )
 
-        # 检查竞拍是否活跃且未过期
-        if not auction_data["is_active"]:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST, detail="竞拍已结束"
-            )
+            import time
 
-        import time
+            if auction_data["end_time"] <= int(time.time()):
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST, detail="竞拍已过期"
+                )
 
-        if auction_data["end_time"] <= int(time.time()):
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST, detail="竞拍已过期"
-            )
+            # 检查用户不能对自己创建的竞拍出价
+            if auction_data["created_by"] == current_user.id:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="不能对自己创建的竞拍出价",
+                )
 
-        # 检查用户不能对自己创建的竞拍出价
-        if auction_data["created_by"] == current_user.id:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="不能对自己创建的竞拍出价",
-            )
+            # 检查出价是否高于当前价格
+            if bid_request.bid_amount <= auction_data["current_price"]:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail=f"出价必须高于当前价格 {auction_data['current_price']}",
+                )
 
-        # 检查出价是否高于当前价格
-        if bid_request.bid_amount <= auction_data["current_price"]:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"出价必须高于当前价格 {auction_data['current_price']}",
-            )
+            # 检查用户积分是否足够
+            user_credits_result = await db.get_user_credits(current_user.id)
+            if not user_credits_result[0]:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="无法获取用户积分信息",
+                )
 
-        # 检查用户积分是否足够
-        user_credits_result = db.get_user_credits(current_user.id)
-        if not user_credits_result[0]:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST, detail="无法获取用户积分信息"
-            )
+            user_credits = user_credits_result[1]
+            if user_credits < bid_request.bid_amount:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail=f"积分不足，当前积分: {user_credits}，需要: {bid_request.bid_amount}",
+                )
 
-        user_credits = user_credits_result[1]
-        if user_credits < bid_request.bid_amount:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"积分不足，当前积分: {user_credits}，需要: {bid_request.bid_amount}",
+            # 出价
+            success = await db.place_bid(
+                bid_request.auction_id, current_user.id, bid_request.bid_amount
             )
 
-        # 出价
-        success = db.place_bid(
-            bid_request.auction_id, current_user.id, bid_request.bid_amount
-        )
+            if success:
+                # 暂时不扣除积分，只在竞拍结束且获胜时才扣除
+                logger.info(
+                    f"用户 {get_user_name_from_tg_id(current_user.id)} 对竞拍 {bid_request.auction_id} 出价 {bid_request.bid_amount}"
+                )
 
-        if success:
-            # 暂时不扣除积分，只在竞拍结束且获胜时才扣除
-            logger.info(
-                f"用户 {get_user_name_from_tg_id(current_user.id)} 对竞拍 {bid_request.auction_id} 出价 {bid_request.bid_amount}"
-            )
+                return PlaceBidResponse(
+                    success=True,
+                    message="出价成功",
+                    current_price=bid_request.bid_amount,
+                    user_credits=user_credits,
+                )
+            else:
+                raise HTTPException(
+                    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="出价失败"
+                )
 
-            return PlaceBidResponse(
-                success=True,
-                message="出价成功",
-                current_price=bid_request.bid_amount,
-                user_credits=user_credits,
-            )
-        else:
+        except HTTPException:
+            raise
+        except Exception as e:
+            logger.error(f"出价失败: {e}")
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="出价失败"
             )
-
-    except HTTPException:
-        raise
-    except Exception as e:
-        logger.error(f"出价失败: {e}")
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="出价失败"
-        )
-    finally:
-        if "db" in locals():
-            db.close()
+        finally:
+            if "db" in locals():
+                await db.close()
 
 
 @router.post("/finish-expired")
@@ -361,10 +367,10 @@ async def get_all_auctions_admin(
         # 检查管理员权限
         check_admin_permission(current_user)
 
-        db = DB()
+        db = AsyncDB()
         offset = (page - 1) * limit
 
-        auctions_data = db.get_all_auctions(
+        auctions_data = await db.get_all_auctions(
             status=status_filter, limit=limit, offset=offset
         )
 
@@ -398,7 +404,7 @@ async def get_all_auctions_admin(
         )
     finally:
         if "db" in locals():
-            db.close()
+            await db.close()
 
 
 @router.put("/admin/{auction_id}")
@@ -414,10 +420,10 @@ async def update_auction_admin(
         # 检查管理员权限
         check_admin_permission(current_user)
 
-        db = DB()
+        db = AsyncDB()
 
         # 检查竞拍是否存在
-        existing_auction = db.get_auction_by_id(auction_id)
+        existing_auction = await db.get_auction_by_id(auction_id)
         if not existing_auction:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND, detail="竞拍不存在"
@@ -435,7 +441,7 @@ async def update_auction_admin(
             new_end_time = datetime.now() + timedelta(hours=update_data.duration_hours)
             update_dict["end_time"] = int(new_end_time.timestamp())
 
-        success = db.update_auction(auction_id, update_dict)
+        success = await db.update_auction(auction_id, update_dict)
 
         if success:
             logger.info(
@@ -456,7 +462,7 @@ async def update_auction_admin(
         )
     finally:
         if "db" in locals():
-            db.close()
+            await db.close()
 
 
 @router.delete("/admin/{auction_id}")
@@ -471,16 +477,16 @@ async def delete_auction_admin(
         # 检查管理员权限
         check_admin_permission(current_user)
 
-        db = DB()
+        db = AsyncDB()
 
         # 检查竞拍是否存在
-        existing_auction = db.get_auction_by_id(auction_id)
+        existing_auction = await db.get_auction_by_id(auction_id)
         if not existing_auction:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND, detail="竞拍不存在"
             )
 
-        success = db.delete_auction(auction_id)
+        success = await db.delete_auction(auction_id)
 
         if success:
             logger.info(
@@ -501,7 +507,7 @@ async def delete_auction_admin(
         )
     finally:
         if "db" in locals():
-            db.close()
+            await db.close()
 
 
 @router.post("/admin/{auction_id}/finish")
@@ -516,10 +522,10 @@ async def finish_auction_admin(
         # 检查管理员权限
         check_admin_permission(current_user)
 
-        db = DB()
+        db = AsyncDB()
 
         # 检查竞拍是否存在且处于活跃状态
-        existing_auction = db.get_auction_by_id(auction_id)
+        existing_auction = await db.get_auction_by_id(auction_id)
         if not existing_auction:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND, detail="竞拍不存在"
@@ -530,7 +536,7 @@ async def finish_auction_admin(
                 status_code=status.HTTP_400_BAD_REQUEST, detail="竞拍已结束"
             )
 
-        success, winner = db.finish_auction_by_id(auction_id)
+        success, winner = await db.finish_auction_by_id(auction_id)
 
         if success:
             logger.info(
@@ -568,7 +574,7 @@ async def finish_auction_admin(
         )
     finally:
         if "db" in locals():
-            db.close()
+            await db.close()
 
 
 @router.get("/admin/{auction_id}/bids")
@@ -584,16 +590,16 @@ async def get_auction_bids_admin(
         # 检查管理员权限
         check_admin_permission(current_user)
 
-        db = DB()
+        db = AsyncDB()
 
         # 检查竞拍是否存在
-        existing_auction = db.get_auction_by_id(auction_id)
+        existing_auction = await db.get_auction_by_id(auction_id)
         if not existing_auction:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND, detail="竞拍不存在"
             )
 
-        bids_data = db.get_auction_bids(auction_id, limit=limit)
+        bids_data = await db.get_auction_bids(auction_id, limit=limit)
 
         bids = []
         for bid_data in bids_data:
@@ -620,7 +626,7 @@ async def get_auction_bids_admin(
         )
     finally:
         if "db" in locals():
-            db.close()
+            await db.close()
 
 
 @router.get("/admin/user/{user_id}/history")
@@ -636,8 +642,8 @@ async def get_user_auction_history_admin(
         # 检查管理员权限
         check_admin_permission(current_user)
 
-        db = DB()
-        auctions_data = db.get_user_auction_history(user_id, limit=limit)
+        db = AsyncDB()
+        auctions_data = await db.get_user_auction_history(user_id, limit=limit)
 
         auctions = []
         for auction_data in auctions_data:
@@ -667,7 +673,7 @@ async def get_user_auction_history_admin(
         )
     finally:
         if "db" in locals():
-            db.close()
+            await db.close()
 
 
 @router.get("/admin/detailed-stats")
@@ -683,8 +689,10 @@ async def get_detailed_auction_stats_admin(
         # 检查管理员权限
         check_admin_permission(current_user)
 
-        db = DB()
-        stats = db.get_detailed_auction_stats(start_date=start_date, end_date=end_date)
+        db = AsyncDB()
+        stats = await db.get_detailed_auction_stats(
+            start_date=start_date, end_date=end_date
+        )
 
         return stats
 
@@ -697,4 +705,4 @@ async def get_detailed_auction_stats_admin(
         )
     finally:
         if "db" in locals():
-            db.close()
+            await db.close()
@@ -1,10 +1,14 @@
+import asyncio
 import json
+import math
 import re
 import secrets
 import time
+from functools import lru_cache
+from typing import Optional
 
 from app.cache import lucky_wheel_config_cache
-from app.db import DB
+from app.db import AsyncDB, DB
 from app.log import logger
 from app.premium import update_premium_status
 from app.update_db import add_redeem_code
@@ -22,6 +26,8 @@ from app.webapp.schemas.luckywheel import (
 from fastapi import APIRouter, Depends, HTTPException, Request, status
 from fastapi.responses import JSONResponse
 
+_spin_lock = asyncio.Lock()
+
 router = APIRouter(prefix="/luckywheel", tags=["幸运大转盘"])
 
 # 默认转盘配置
@@ -53,6 +59,7 @@ class RandomnessConfig:
     PROTECTION_THRESHOLD = 2.0
     # 保护系数：用于调整低概率奖品的实际中奖率
     PROTECTION_FACTOR = 1.2
+    # 以下两项为兼容旧配置保留：抽奖直接使用系统熵源（SystemRandom），不再混合种子
     # 是否启用时间种子混合
     USE_TIME_SEED_MIXING = True
     # 是否启用用户ID种子混合
@@ -89,20 +96,29 @@ class RandomnessConfig:
         )
 
 
+@lru_cache(maxsize=8)
+def _parse_wheel_config(config_str: str) -> LuckyWheelConfig:
+    return LuckyWheelConfig(**json.loads(config_str))
+
+
+def _get_wheel_config_str() -> str:
+    """获取转盘配置的 JSON 字符串"""
+    config_str = lucky_wheel_config_cache.get("config")
+    if not config_str:
+        # 如果没有配置，使用默认配置并保存到Redis
+        save_wheel_config(DEFAULT_WHEEL_CONFIG)
+        config_str = DEFAULT_WHEEL_CONFIG.model_dump_json()
+    return config_str
+
+
 def get_wheel_config() -> LuckyWheelConfig:
     """获取转盘配置"""
     try:
-        config_str = lucky_wheel_config_cache.get("config")
-        if config_str:
-            config_dict = json.loads(config_str)
-            return LuckyWheelConfig(**config_dict)
-        else:
-            # 如果没有配置，使用默认配置并保存到Redis
-            save_wheel_config(DEFAULT_WHEEL_CONFIG)
-            return DEFAULT_WHEEL_CONFIG
+        # 配置内容未变化时不重复解析，返回副本以免调用方修改缓存的对象
+        return _parse_wheel_config(_get_wheel_config_str()).model_copy()
     except Exception as e:
         logger.error(f"获取转盘配置失败: {e}")
-        return DEFAULT_WHEEL_CONFIG
+        return DEFAULT_WHEEL_CONFIG.model_copy()
 
 
 def save_wheel_config(config: LuckyWheelConfig):
@@ -279,77 +295,81 @@ async def spin_wheel(
     request: Request, current_user: TelegramUser = Depends(get_telegram_user)
 ):
     """转动转盘"""
-    try:
-        db = DB()
-        user_id = current_user.id
+    # 积分读取到扣减需要串行执行，避免并发请求重复扣分
+    async with _spin_lock:
+        try:
+            db = AsyncDB()
+            user_id = current_user.id
 
-        # 获取转盘配置
-        config = get_wheel_config()
+            # 获取转盘配置
+            config = get_wheel_config()
 
-        # 获取用户当前积分
-        flag, current_credits = db.get_user_credits(user_id)
-        if not flag:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND, detail=current_credits
-            )
+            # 获取用户当前积分
+            flag, current_credits = await db.get_user_credits(user_id)
+            if not flag:
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND, detail=current_credits
+                )
 
-        # 检查积分是否足够
-        if current_credits < config.min_credits_required:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"积分不足，需要至少 {config.min_credits_required} 积分才能参与",
-            )
+            # 检查积分是否足够
+            if current_credits < config.min_credits_required:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail=f"积分不足，需要至少 {config.min_credits_required} 积分才能参与",
+                )
 
-        # 扣除参与费用
-        new_credits = current_credits - config.cost_credits
-        db.update_user_credits(credits=new_credits, tg_id=user_id)
-
-        # 选择中奖奖品 - 使用增强版随机选择器
-        winner = random_select_winner(config.items, user_id=user_id)
-
-        # 如果中奖奖品是邀请码，判断是否需要生成特权邀请码
-        gen_privileged_code = False
-        if "邀请码" in winner.name and config.gen_privileged_code:
-            gen_privileged_code = True
-            # 生成后立马关闭生成特权邀请码
-            config.gen_privileged_code = False
-            save_wheel_config(config)
-
-        # 更新奖励，计算积分变化
-        credits_change = calculate_credits_change(
-            winner.name,
-            new_credits,
-            tg_id=user_id,
-            gen_privileged_code=gen_privileged_code,
-        )
+            # 扣除参与费用
+            new_credits = current_credits - config.cost_credits
+            await db.update_user_credits(credits=new_credits, tg_id=user_id)
+
+            # 选择中奖奖品，抽样器按配置内容缓存，配置未变化时直接抽取
+            winner = get_wheel_sampler().sample()
+
+            # 如果中奖奖品是邀请码，判断是否需要生成特权邀请码
+            gen_privileged_code = False
+            if "邀请码" in winner.name and config.gen_privileged_code:
+                gen_privileged_code = True
+                # 生成后立马关闭生成特权邀请码
+                config.gen_privileged_code = False
+                save_wheel_config(config)
+
+            # 更新奖励，计算积分变化
+            credits_change = calculate_credits_change(
+                winner.name,
+                new_credits,
+                tg_id=user_id,
+                gen_privileged_code=gen_privileged_code,
+            )
 
-        # 更新用户积分
-        final_credits = new_credits + credits_change
-        if final_credits < 0:
-            final_credits = 0  # 积分不能为负数
+            # 更新用户积分
+            final_credits = new_credits + credits_change
+            if final_credits < 0:
+                final_credits = 0  # 积分不能为负数
 
-        db.update_user_credits(credits=final_credits, tg_id=user_id)
+            await db.update_user_credits(credits=final_credits, tg_id=user_id)
 
-        # 记录转盘统计数据
-        db.add_wheel_spin_record(user_id, winner.name, credits_change)
+            # 记录转盘统计数据
+            await db.add_wheel_spin_record(user_id, winner.name, credits_change)
 
-        logger.info(
-            f"用户 {get_user_name_from_tg_id(user_id)} 转盘结果: {winner.name}, 积分变化: {credits_change}, 最终积分: {final_credits}"
-        )
+            logger.info(
+                f"用户 {get_user_name_from_tg_id(user_id)} 转盘结果: {winner.name}, 积分变化: {credits_change}, 最终积分: {final_credits}"
+            )
 
-        return LuckyWheelSpinResult(
-            item=winner, credits_change=credits_change, current_credits=final_credits
-        )
+            return LuckyWheelSpinResult(
+                item=winner,
+                credits_change=credits_change,
+                current_credits=final_credits,
+            )
 
-    except HTTPException:
-        raise
-    except Exception as e:
-        logger.error(f"转盘操作失败: {e}")
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="转盘操作失败"
-        )
-    finally:
-        db.close()
+        except HTTPException:
+            raise
+        except Exception as e:
+            logger.error(f"转盘操作失败: {e}")
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="转盘操作失败"
+            )
+        finally:
+            await db.close()
 
 
 @router.get("/user-status")
@@ -359,14 +379,14 @@ async def get_user_status(
 ):
     """获取用户转盘参与状态"""
     try:
-        db = DB()
+        db = AsyncDB()
         user_id = current_user.id
 
         # 获取转盘配置
         config = get_wheel_config()
 
         # 获取用户当前积分
-        flag, current_credits = db.get_user_credits(user_id)
+        flag, current_credits = await db.get_user_credits(user_id)
         if not flag:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND, detail=current_credits
@@ -387,18 +407,26 @@ async def get_user_status(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="获取用户状态失败"
         )
     finally:
-        db.close()
+        await db.close()
+
+
+# 上次应用到 RandomnessConfig 的配置 (原始字符串, 解析结果)
+_applied_randomness_config: tuple[Optional[str], dict] = (None, {})
 
 
 def get_randomness_config_from_redis() -> dict:
     """从Redis获取随机性配置"""
+    global _applied_randomness_config
     try:
         config_str = lucky_wheel_config_cache.get("randomness_config")
         if config_str:
+            if config_str == _applied_randomness_config[0]:
+                return dict(_applied_randomness_config[1])
             config_dict = json.loads(config_str)
             # 更新类配置
             RandomnessConfig.from_dict(config_dict)
-            return config_dict
+            _applied_randomness_config = (config_str, config_dict)
+            return dict(config_dict)
         else:
             # 如果没有配置，使用默认配置并保存到Redis
             default_config = RandomnessConfig.to_dict()
@@ -438,122 +466,170 @@ def save_randomness_config(config_dict: dict):
         )
 
 
-def random_select_winner(
-    items: list[LuckyWheelItem], user_id: int = None
-) -> LuckyWheelItem:
+class AliasSampler:
     """
-    增强版随机选择器，提供更好的随机性和公平性
-
-    Args:
-        items: 奖品列表
-        user_id: 用户ID，用于增强随机性
+    Vose 别名法加权抽样器
 
-    Returns:
-        选中的奖品
+    构建时把权重整理为两张长度为 n 的表，每次抽取只需一个随机数：
+    随机选一列，再按该列的概率决定取本列还是其别名，耗时与奖品数量无关
     """
-    if not items:
-        raise ValueError("奖品列表不能为空")
 
-    # 从Redis加载最新配置
-    get_randomness_config_from_redis()
+    def __init__(self, items: list, weights: list[float]):
+        if not items or len(items) != len(weights):
+            raise ValueError("奖品与权重数量不一致")
+        total = sum(weights)
+        if total <= 0:
+            raise ValueError("权重总和必须大于0")
+
+        n = len(items)
+        self.items = items
+        # 归一化后的实际中奖概率
+        self.probabilities = [weight / total for weight in weights]
+
+        self._prob = [1.0] * n
+        self._alias = list(range(n))
+        scaled = [p * n for p in self.probabilities]
+        small = [i for i, p in enumerate(scaled) if p < 1.0]
+        large = [i for i, p in enumerate(scaled) if p >= 1.0]
+        while small and large:
+            less, more = small.pop(), large.pop()
+            self._prob[less] = scaled[less]
+            self._alias[less] = more
+            scaled[more] -= 1.0 - scaled[less]
+            (small if scaled[more] < 1.0 else large).append(more)
+        # 剩余的列只差浮点误差，概率视为 1
+
+        self._random = secrets.SystemRandom()
+
+    def sample(self):
+        """抽取一个奖品"""
+        x = self._random.random() * len(self._prob)
+        column = int(x)
+        if x - column < self._prob[column]:
+            return self.items[column]
+        return self.items[self._alias[column]]
+
+
+def create_sampler(items: list[LuckyWheelItem]) -> AliasSampler:
+    """
+    按当前随机性配置为奖品列表构建抽样器
 
-    # 过滤有效奖品
+    概率为 0 的奖品不参与抽奖；启用保护时，概率低于阈值的奖品权重乘以保护系数
+    """
     valid_items = [item for item in items if item.probability > 0]
     if not valid_items:
         raise ValueError("没有有效的奖品（概率必须大于0）")
 
-    # 创建增强的随机数生成器
-    secure_random = secrets.SystemRandom()
-
-    # 如果启用了时间种子混合，使用当前时间的纳秒数作为额外熵源
-    if RandomnessConfig.USE_TIME_SEED_MIXING:
-        import time
-
-        time_entropy = int(time.time_ns() % 1000000)
-        # 使用时间熵影响随机种子
-        secure_random.seed(time_entropy)
-
-    # 计算调整后的概率（保护低概率奖品）
-    adjusted_items = []
-    if RandomnessConfig.USE_WEIGHTED_PROTECTION:
-        for item in valid_items:
-            adjusted_prob = item.probability
-            # 对低概率奖品进行保护
-            if item.probability < RandomnessConfig.PROTECTION_THRESHOLD:
-                adjusted_prob *= RandomnessConfig.PROTECTION_FACTOR
-            adjusted_items.append((item, adjusted_prob))
-    else:
-        adjusted_items = [(item, item.probability) for item in valid_items]
-
-    # 计算总概率
-    total_probability = sum(prob for _, prob in adjusted_items)
+    weights = []
+    for item in valid_items:
+        weight = item.probability
+        if (
+            RandomnessConfig.USE_WEIGHTED_PROTECTION
+            and item.probability < RandomnessConfig.PROTECTION_THRESHOLD
+        ):
+            weight *= RandomnessConfig.PROTECTION_FACTOR
+        weights.append(weight)
+    return AliasSampler(valid_items, weights)
+
+
+@lru_cache(maxsize=8)
+def _build_wheel_sampler(
+    config_str: str,
+    use_weighted_protection: bool,
+    protection_threshold: float,
+    protection_factor: float,
+) -> AliasSampler:
+    # 保护参数只用作缓存键，构建时读取的 RandomnessConfig 与之一致
+    return create_sampler(_parse_wheel_config(config_str).items)
+
+
+def get_wheel_sampler() -> AliasSampler:
+    """
+    获取当前转盘配置的抽样器
 
-    # 生成随机数
-    if RandomnessConfig.USE_USER_SEED_MIXING and user_id:
-        # 使用用户ID增强随机性
-        user_entropy = (
-            hash(str(user_id) + str(secure_random.randint(1, 1000000))) % 1000000
-        )
-        random_value = (
-            secure_random.uniform(0, total_probability) + user_entropy / 1000000
-        ) % total_probability
-    else:
-        random_value = secure_random.uniform(0, total_probability)
+    以配置的 JSON 字符串和保护参数为版本缓存，任一配置保存后（近缓存随即失效）
+    下一次抽奖才重新构建；转盘配置读取失败时使用默认配置
+    """
+    try:
+        config_str = _get_wheel_config_str()
+    except Exception as e:
+        logger.error(f"获取转盘配置失败: {e}")
+        config_str = DEFAULT_WHEEL_CONFIG.model_dump_json()
+    get_randomness_config_from_redis()
+    return _build_wheel_sampler(
+        config_str,
+        RandomnessConfig.USE_WEIGHTED_PROTECTION,
+        RandomnessConfig.PROTECTION_THRESHOLD,
+        RandomnessConfig.PROTECTION_FACTOR,
+    )
 
-    # 选择获奖奖品
-    accumulated_probability = 0.0
-    for item, adjusted_prob in adjusted_items:
-        accumulated_probability += adjusted_prob
-        if random_value < accumulated_probability:
-            return item
 
-    # 保护措施
-    return adjusted_items[-1][0]
+def _chi_square_p_value(chi_square: float, degrees_of_freedom: int) -> float:
+    """卡方分布的右尾概率（Wilson-Hilferty 近似）"""
+    if degrees_of_freedom <= 0:
+        return 1.0
+    k = degrees_of_freedom
+    z = ((chi_square / k) ** (1 / 3) - (1 - 2 / (9 * k))) / math.sqrt(2 / (9 * k))
+    return 0.5 * math.erfc(z / math.sqrt(2))
 
 
 def get_randomness_stats(items: list[LuckyWheelItem], iterations: int = 10000) -> dict:
     """
     获取随机性统计信息，用于测试和验证随机算法的公平性
 
+    期望中奖率为抽样器的实际概率（已计入低概率奖品保护），并用卡方拟合优度检验
+    整体分布，p 值过小说明抽样结果与配置不符
+
     Args:
         items: 奖品列表
         iterations: 测试迭代次数
 
     Returns:
-        包含统计信息的字典
+        包含统计信息的字典，每个奖品的统计在 "items" 中
     """
     if not items or iterations <= 0:
         return {}
 
-    # 统计每个奖品的中奖次数
-    win_counts = {item.name: 0 for item in items}
+    get_randomness_config_from_redis()
+    try:
+        sampler = create_sampler(items)
+    except ValueError:
+        return {}
 
+    # 统计每个奖品的中奖次数
+    win_counts = [0] * len(sampler.items)
+    index_of = {id(item): i for i, item in enumerate(sampler.items)}
     for _ in range(iterations):
-        try:
-            winner = random_select_winner(items)
-            win_counts[winner.name] += 1
-        except Exception:
-            continue
+        win_counts[index_of[id(sampler.sample())]] += 1
 
-    # 计算实际中奖率和期望中奖率
-    total_probability = sum(item.probability for item in items if item.probability > 0)
+    total_probability = sum(item.probability for item in sampler.items)
     stats = {}
+    chi_square = 0.0
+    for item, probability, win_count in zip(
+        sampler.items, sampler.probabilities, win_counts
+    ):
+        expected_count = probability * iterations
+        chi_square += (win_count - expected_count) ** 2 / expected_count
+
+        actual_rate = (win_count / iterations) * 100
+        expected_rate = probability * 100
+        deviation = abs(actual_rate - expected_rate)
+        stats[item.name] = {
+            "configured_rate": round(item.probability / total_probability * 100, 2),
+            "expected_rate": round(expected_rate, 2),
+            "actual_rate": round(actual_rate, 2),
+            "deviation": round(deviation, 2),
+            "win_count": win_count,
+            "is_fair": deviation < 1.0,  # 偏差小于1%认为是公平的
+        }
 
-    for item in items:
-        if item.probability > 0:
-            actual_rate = (win_counts[item.name] / iterations) * 100
-            expected_rate = (item.probability / total_probability) * 100
-            deviation = abs(actual_rate - expected_rate)
-
-            stats[item.name] = {
-                "expected_rate": round(expected_rate, 2),
-                "actual_rate": round(actual_rate, 2),
-                "deviation": round(deviation, 2),
-                "win_count": win_counts[item.name],
-                "is_fair": deviation < 1.0,  # 偏差小于1%认为是公平的
-            }
-
-    return stats
+    degrees_of_freedom = len(sampler.items) - 1
+    return {
+        "items": stats,
+        "chi_square": round(chi_square, 4),
+        "degrees_of_freedom": degrees_of_freedom,
+        "p_value": round(_chi_square_p_value(chi_square, degrees_of_freedom), 4),
+    }
 
 
 @router.get("/randomness-stats")
@@ -575,7 +651,8 @@ async def get_randomness_statistics(
         randomness_config = get_randomness_config_from_redis()
 
         # 生成统计信息
-        stats = get_randomness_stats(config.items, iterations)
+        result = get_randomness_stats(config.items, iterations)
+        stats = result.get("items", {})
 
         # 计算平均偏差
         deviations = [stat["deviation"] for stat in stats.values()]
@@ -583,8 +660,11 @@ async def get_randomness_statistics(
             round(sum(deviations) / len(deviations), 2) if deviations else 0
         )
 
-        # 判断整体公平性
-        overall_fairness = all(stat["is_fair"] for stat in stats.values())
+        # 判断整体公平性：各奖品偏差均小于 1%，且卡方检验未拒绝（p >= 0.001）
+        overall_fairness = (
+            all(stat["is_fair"] for stat in stats.values())
+            and result.get("p_value", 1.0) >= 0.001
+        )
 
         return {
             "iterations": iterations,
@@ -593,6 +673,9 @@ async def get_randomness_statistics(
             "average_deviation": average_deviation,
             "overall_fairness": overall_fairness,
             "stats": stats,
+            "chi_square": result.get("chi_square"),
+            "degrees_of_freedom": result.get("degrees_of_freedom"),
+            "p_value": result.get("p_value"),
             "config": randomness_config,
             "timestamp": str(int(time.time() * 1000)),  # 添加时间戳
         }
@@ -679,8 +762,8 @@ async def get_wheel_statistics(
         # 检查管理员权限
         check_admin_permission(current_user)
 
-        db = DB()
-        stats = db.get_wheel_stats()
+        db = AsyncDB()
+        stats = await db.get_wheel_stats()
 
         return stats
 
@@ -693,7 +776,7 @@ async def get_wheel_statistics(
         )
     finally:
         if "db" in locals():
-            db.close()
+            await db.close()
 
 
 @router.get("/user-activity-stats")
@@ -703,11 +786,11 @@ async def get_user_activity_stats(
 ):
     """获取用户个人活动统计数据"""
     try:
-        db = DB()
+        db = AsyncDB()
         user_id = current_user.id
 
         # 获取用户转盘统计数据
-        stats = db.get_user_wheel_stats(user_id)
+        stats = await db.get_user_wheel_stats(user_id)
 
         return {"success": True, "data": stats}
 
@@ -718,4 +801,4 @@ async def get_user_activity_stats(
             detail="获取用户活动统计失败",
         )
     finally:
-        db.close()
+        await db.close()
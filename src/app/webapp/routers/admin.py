@@ -9,7 +9,9 @@ from app.cache import (
 )
 from app.config import settings
 from app.db import DB
+from app.db_profiler import query_profiler
 from app.log import uvicorn_logger as logger
+from app.notifier import enqueue_message
 from app.utils.utils import (
     get_user_name_from_tg_id,
     is_binded_premium_line,
@@ -76,6 +78,37 @@ async def get_admin_settings(
         raise HTTPException(status_code=500, detail="获取设置失败")
 
 
+@router.get("/db/query-report")
+@require_telegram_auth
+async def get_db_query_report(
+    request: Request,
+    limit: int = 20,
+    sort: str = "total_ms",
+    user: TelegramUser = Depends(get_telegram_user),
+):
+    """获取慢查询统计（需开启 DB_PROFILE）"""
+    check_admin_permission(user)
+
+    return {
+        "enabled": settings.DB_PROFILE,
+        "slow_query_ms": query_profiler.slow_ms,
+        "queries": query_profiler.report(limit=limit, sort=sort),
+    }
+
+
+@router.delete("/db/query-report", response_model=BaseResponse)
+@require_telegram_auth
+async def reset_db_query_report(
+    request: Request, user: TelegramUser = Depends(get_telegram_user)
+):
+    """清空慢查询统计"""
+    check_admin_permission(user)
+
+    query_profiler.reset()
+    logger.info(f"管理员 {user.username or user.id} 清空了慢查询统计")
+    return BaseResponse(success=True, message="已清空慢查询统计")
+
+
 @router.post("/settings/plex-register")
 @require_telegram_auth
 async def set_plex_register(
@@ -261,7 +294,7 @@ async def unbind_emby_premium_free():
                 emby_user_defined_line_cache.delete(str(emby_username).lower())
             # 发送通知给用户
             if tg_id:
-                await send_message_by_url(
+                enqueue_message(
                     chat_id=tg_id,
                     text=f"通知：高级线路开放通道已关闭，您绑定的线路已切换为 `{last_line or 'AUTO'}`",
                     parse_mode="markdownv2",
@@ -309,7 +342,7 @@ async def unbind_plex_premium_free():
                 plex_user_defined_line_cache.delete(str(plex_username).lower())
             # 发送通知给用户
             if tg_id:
-                await send_message_by_url(
+                enqueue_message(
                     chat_id=tg_id,
                     text=f"通知：高级线路开放通道已关闭，您绑定的线路已切换为 `{last_line or 'AUTO'}`",
                     parse_mode="markdownv2",
@@ -362,7 +395,7 @@ async def handle_free_premium_lines_change(removed_lines: list | set):
                 emby_user_defined_line_cache.delete(str(emby_username).lower())
             # 发送通知给用户
             if tg_id:
-                await send_message_by_url(
+                enqueue_message(
                     chat_id=tg_id,
                     text=f"通知：线路 `{emby_line}` 已不再免费开放，您的 Emby 绑定线路已切换为 `{last_line or 'AUTO'}`",
                     parse_mode="markdownv2",
@@ -396,7 +429,7 @@ async def handle_free_premium_lines_change(removed_lines: list | set):
                 plex_user_defined_line_cache.delete(str(plex_username).lower())
             # 发送通知给用户
             if tg_id:
-                await send_message_by_url(
+                enqueue_message(
                     chat_id=tg_id,
                     text=f"通知：线路 `{plex_line}` 已不再开放，您绑定的 Plex 线路已切换为 `{last_line or 'AUTO'}`",
                     parse_mode="markdownv2",
@@ -426,7 +459,7 @@ async def unbind_specified_line_for_all_users(line: str):
                 emby_last_user_defined_line_cache.delete(str(emby_username).lower())
                 # 发送通知给用户
                 if tg_id:
-                    await send_message_by_url(
+                    enqueue_message(
                         chat_id=tg_id,
                         text=f"通知：您绑定的 Emby 线路 `{line}` 已被管理员下线，已切换为 `AUTO`",
                         parse_mode="markdownv2",
@@ -443,7 +476,7 @@ async def unbind_specified_line_for_all_users(line: str):
                 plex_last_user_defined_line_cache.delete(str(plex_username).lower())
                 # 发送通知给用户
                 if tg_id:
-                    await send_message_by_url(
+                    enqueue_message(
                         chat_id=tg_id,
                         text=f"通知：您绑定的 Plex 线路 `{line}` 已被管理员下线，已切换为 `AUTO`",
                         parse_mode="markdownv2",
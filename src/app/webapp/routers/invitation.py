@@ -3,9 +3,9 @@ from uuid import NAMESPACE_URL, uuid3
 
 from app.config import settings
 from app.db import DB
-from app.emby import Emby
+from app.emby import get_async_emby
 from app.log import uvicorn_logger as logger
-from app.plex import Plex
+from app.plex import get_plex
 from app.utils.utils import get_user_name_from_tg_id, send_message_by_url
 from app.webapp.auth import get_telegram_user
 from app.webapp.middlewares import require_telegram_auth
@@ -205,10 +205,10 @@ async def redeem_plex_code(
             code_owner = res[1]
 
             # 实例化 Plex 对象
-            _plex = Plex()
+            _plex = get_plex()
 
             # 检查该用户是否已经被邀请
-            if email in _plex.users_by_email:
+            if _plex.get_user_id_by_email(email):
                 return RedeemResponse(
                     success=False, message="该邮箱账户已被邀请，请使用其他邮箱"
                 )
@@ -334,16 +334,16 @@ async def redeem_emby_code(
             code_owner = res[1]
 
             # 检查该用户是否存在
-            _emby = Emby()
+            _emby = get_async_emby()
             if _db.get_emby_info_by_emby_username(
                 username
-            ) or _emby.get_uid_from_username(username):
+            ) or await _emby.get_uid_from_username(username):
                 return RedeemResponse(
                     success=False, message="该用户名已存在，请使用其他用户名"
                 )
 
             # 创建用户
-            flag, msg = _emby.add_user(username=username, password=password)
+            flag, msg = await _emby.add_user(username=username, password=password)
             if not flag:
                 return RedeemResponse(success=False, message=f"创建用户失败: {msg}")
 
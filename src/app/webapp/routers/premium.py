@@ -10,6 +10,7 @@ from app.log import uvicorn_logger as logger
 from app.premium import update_premium_status
 from app.utils.utils import get_user_name_from_tg_id
 from app.webapp.auth import get_telegram_user
+from app.webapp.cache import cache_response
 from app.webapp.middlewares import require_telegram_auth
 from app.webapp.schemas import BaseResponse, TelegramUser
 from fastapi import APIRouter, Body, Depends, HTTPException, Request
@@ -178,6 +179,7 @@ async def get_premium_statistics(
 
 @router.get("/line-traffic-stats")
 @require_telegram_auth
+@cache_response(ttl=60)
 async def get_premium_line_traffic_stats(
     request: Request,
     user: TelegramUser = Depends(get_telegram_user),
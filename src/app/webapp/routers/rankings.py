@@ -1,12 +1,21 @@
+import asyncio
 from datetime import datetime
 
 from app.config import settings
-from app.db import DB
+from app.db import AsyncDB
 from app.emby import Emby
+from app.leaderboard import (
+    credits_leaderboard,
+    donation_leaderboard,
+    emby_watched_time_leaderboard,
+    get_leaderboard_rank,
+    plex_watched_time_leaderboard,
+)
 from app.log import uvicorn_logger as logger
 from app.plex import Plex
-from app.utils.utils import get_user_avatar_from_tg_id, get_user_name_from_tg_id
+from app.utils.utils import get_user_names_from_tg_ids, get_users_info_from_tg_ids
 from app.webapp.auth import get_telegram_user
+from app.webapp.cache import cache_response, skip_response_cache
 from app.webapp.middlewares import require_telegram_auth
 from app.webapp.schemas import TelegramUser
 from fastapi import APIRouter, Depends, HTTPException, Query, Request
@@ -16,181 +25,240 @@ router = APIRouter(prefix="/api", tags=["rankings"])
 
 @router.get("/rankings/credits")
 @require_telegram_auth
+@cache_response(ttl=60, vary_by_user=True)
 async def get_credits_rankings(
-    request: Request, user: TelegramUser = Depends(get_telegram_user)
+    request: Request,
+    user: TelegramUser = Depends(get_telegram_user),
+    limit: int = Query(None, ge=1, description="返回的名次数量，默认返回全部"),
 ):
     """获取积分排行榜数据"""
     logger.info(f"{user.username or user.first_name or user.id} 开始获取积分排行榜数据")
 
-    db = DB()
     try:
         credits_rankings = []
+        self_rank = None
         try:
             logger.debug("正在查询积分排行")
-            credits_data = db.get_credits_rank()
+            credits_data, own = await asyncio.to_thread(
+                get_leaderboard_rank,
+                credits_leaderboard,
+                limit,
+                user.id,
+            )
             if credits_data:
+                # 批量获取用户名和头像
+                tg_ids = [int(tg_id) for tg_id, _ in credits_data]
+                names = get_user_names_from_tg_ids(tg_ids)
+                users_info = get_users_info_from_tg_ids(tg_ids)
                 credits_rankings = [
                     {
-                        "name": get_user_name_from_tg_id(info[0]),
-                        "credits": info[1],
-                        "avatar": get_user_avatar_from_tg_id(info[0]),
-                        "is_self": info[0] == user.id,  # tg_id 比较
+                        "name": names[tg_id],
+                        "credits": score,
+                        "avatar": users_info[tg_id].get("photo_url"),
+                        "is_self": tg_id == user.id,  # tg_id 比较
                     }
-                    for info in credits_data
-                    if info[0] not in settings.TG_ADMIN_CHAT_ID
+                    for tg_id, (_, score) in zip(tg_ids, credits_data)
                 ]
+            if own:
+                self_rank = {"rank": own[0], "credits": own[1]}
         except Exception as e:
             logger.error(f"获取积分排行失败: {str(e)}")
+            skip_response_cache()
 
         logger.info(
             f"{user.username or user.first_name or user.id} 获取积分排行榜数据成功"
         )
-        return {"credits_rank": credits_rankings}
+        return {"credits_rank": credits_rankings, "self_rank": self_rank}
     except Exception as e:
         logger.error(f"获取积分排行榜数据时发生未预期的错误: {str(e)}")
         raise HTTPException(status_code=500, detail="获取积分排行榜数据失败")
-    finally:
-        db.close()
-        logger.debug("数据库连接已关闭")
 
 
 @router.get("/rankings/donation")
 @require_telegram_auth
+@cache_response(ttl=60, vary_by_user=True)
 async def get_donation_rankings(
-    request: Request, user: TelegramUser = Depends(get_telegram_user)
+    request: Request,
+    user: TelegramUser = Depends(get_telegram_user),
+    limit: int = Query(None, ge=1, description="返回的名次数量，默认返回全部"),
 ):
     """获取捐赠排行榜数据"""
     logger.info(f"{user.username or user.first_name or user.id} 开始获取捐赠排行榜数据")
 
-    db = DB()
     try:
         donation_rankings = []
+        self_rank = None
         try:
             logger.debug("正在查询捐赠排行")
-            donation_data = db.get_donation_rank()
+            donation_data, own = await asyncio.to_thread(
+                get_leaderboard_rank, donation_leaderboard, limit, user.id, 0
+            )
             if donation_data:
+                # 批量获取用户名和头像
+                tg_ids = [int(tg_id) for tg_id, _ in donation_data]
+                names = get_user_names_from_tg_ids(tg_ids)
+                users_info = get_users_info_from_tg_ids(tg_ids)
                 donation_rankings = [
                     {
-                        "name": get_user_name_from_tg_id(info[0]),
-                        "donation": info[1],
-                        "avatar": get_user_avatar_from_tg_id(info[0]),
-                        "is_self": info[0] == user.id,  # tg_id 比较
+                        "name": names[tg_id],
+                        "donation": score,
+                        "avatar": users_info[tg_id].get("photo_url"),
+                        "is_self": tg_id == user.id,  # tg_id 比较
                     }
-                    for info in donation_data
-                    if info[1] > 0
+                    for tg_id, (_, score) in zip(tg_ids, donation_data)
                 ]
+            if own:
+                self_rank = {"rank": own[0], "donation": own[1]}
         except Exception as e:
             logger.error(f"获取捐赠排行失败: {str(e)}")
+            skip_response_cache()
 
         logger.info(
             f"{user.username or user.first_name or user.id} 获取捐赠排行榜数据成功"
         )
-        return {"donation_rank": donation_rankings}
+        return {"donation_rank": donation_rankings, "self_rank": self_rank}
     except Exception as e:
         logger.error(f"获取捐赠排行榜数据时发生未预期的错误: {str(e)}")
         raise HTTPException(status_code=500, detail="获取捐赠排行榜数据失败")
-    finally:
-        db.close()
-        logger.debug("数据库连接已关闭")
 
 
 @router.get("/rankings/watched-time/plex")
 @require_telegram_auth
+@cache_response(ttl=60, vary_by_user=True)
 async def get_plex_watched_time_rankings(
-    request: Request, user: TelegramUser = Depends(get_telegram_user)
+    request: Request,
+    user: TelegramUser = Depends(get_telegram_user),
+    limit: int = Query(None, ge=1, description="返回的名次数量，默认返回全部"),
 ):
     """获取Plex观看时长排行榜数据"""
     logger.info(
         f"{user.username or user.first_name or user.id} 开始获取Plex观看时长排行榜数据"
     )
 
-    db = DB()
+    db = AsyncDB()
     try:
         watched_time_rank_plex = []
+        self_rank = None
         try:
             logger.debug("正在查询Plex播放时长排行")
-            plex_watch_time_data = db.get_plex_watched_time_rank()
+            plex_info = await db.get_plex_info_by_tg_id(user.id)
+            plex_watch_time_data, own = await asyncio.to_thread(
+                get_leaderboard_rank,
+                plex_watched_time_leaderboard,
+                limit,
+                plex_info[0] if plex_info else None,
+                0,
+            )
             if plex_watch_time_data:
-                watched_time_rank_plex = [
-                    {
-                        "name": info[2],
-                        "watched_time": info[3],
-                        "avatar": Plex.get_user_avatar_by_username(info[2]),
-                        "is_premium": bool(info[4])
-                        if len(info) > 4 and info[4] is not None
-                        else False,
-                        "is_self": info[1] == user.id,  # tg_id 比较
-                    }
-                    for info in plex_watch_time_data
-                    if info[3] > 0
-                ]
+                plex_ids = [int(plex_id) for plex_id, _ in plex_watch_time_data]
+                users = await db.get_plex_rank_info_by_ids(plex_ids)
+                for plex_id, (_, watched_time) in zip(plex_ids, plex_watch_time_data):
+                    if plex_id not in users:
+                        continue
+                    tg_id, plex_username, is_premium = users[plex_id]
+                    watched_time_rank_plex.append(
+                        {
+                            "name": plex_username,
+                            "watched_time": watched_time,
+                            "avatar": Plex.get_user_avatar_by_username(plex_username),
+                            "is_premium": bool(is_premium),
+                            "is_self": tg_id == user.id,  # tg_id 比较
+                        }
+                    )
+            if own:
+                self_rank = {"rank": own[0], "watched_time": own[1]}
         except Exception as e:
             logger.error(f"获取Plex播放时长排行失败: {str(e)}")
+            skip_response_cache()
 
         logger.info(
             f"{user.username or user.first_name or user.id} 获取Plex观看时长排行榜数据成功"
         )
-        return {"watched_time_rank_plex": watched_time_rank_plex}
+        return {
+            "watched_time_rank_plex": watched_time_rank_plex,
+            "self_rank": self_rank,
+        }
     except Exception as e:
         logger.error(f"获取Plex观看时长排行榜数据时发生未预期的错误: {str(e)}")
         raise HTTPException(status_code=500, detail="获取Plex观看时长排行榜数据失败")
     finally:
-        db.close()
+        await db.close()
         logger.debug("数据库连接已关闭")
 
 
 @router.get("/rankings/watched-time/emby")
 @require_telegram_auth
+@cache_response(ttl=60, vary_by_user=True)
 async def get_emby_watched_time_rankings(
-    request: Request, user: TelegramUser = Depends(get_telegram_user)
+    request: Request,
+    user: TelegramUser = Depends(get_telegram_user),
+    limit: int = Query(None, ge=1, description="返回的名次数量，默认返回全部"),
 ):
     """获取Emby观看时长排行榜数据"""
     logger.info(
         f"{user.username or user.first_name or user.id} 开始获取Emby观看时长排行榜数据"
     )
 
-    db = DB()
+    db = AsyncDB()
     try:
         watched_time_rank_emby = []
-        emby = Emby()
+        self_rank = None
         try:
             logger.debug("正在查询Emby播放时长排行")
-            emby_watch_time_data = db.get_emby_watched_time_rank()
+            emby_info = await db.get_emby_info_by_tg_id(user.id)
+            emby_watch_time_data, own = await asyncio.to_thread(
+                get_leaderboard_rank,
+                emby_watched_time_leaderboard,
+                limit,
+                emby_info[1] if emby_info else None,
+                0,
+            )
             if emby_watch_time_data:
-                watched_time_rank_emby = [
-                    {
-                        "name": info[1],
-                        "watched_time": info[2],
-                        "avatar": emby.get_user_avatar_by_username(
-                            info[1], from_emby=False
-                        ),
-                        "is_premium": bool(info[3])
-                        if len(info) > 3 and info[3] is not None
-                        else False,
-                        "is_self": info[4] == user.id
-                        if len(info) > 4
-                        else False,  # tg_id 比较
-                    }
-                    for info in emby_watch_time_data
-                    if info[2] > 0
-                ]
+                users = await db.get_emby_rank_info_by_ids(
+                    [emby_id for emby_id, _ in emby_watch_time_data]
+                )
+                avatars = Emby.get_user_avatars_by_usernames(
+                    users[emby_id][1]
+                    for emby_id, _ in emby_watch_time_data
+                    if emby_id in users
+                )
+                for emby_id, watched_time in emby_watch_time_data:
+                    if emby_id not in users:
+                        continue
+                    tg_id, emby_username, is_premium = users[emby_id]
+                    watched_time_rank_emby.append(
+                        {
+                            "name": emby_username,
+                            "watched_time": watched_time,
+                            "avatar": avatars[emby_username],
+                            "is_premium": bool(is_premium),
+                            "is_self": tg_id == user.id,  # tg_id 比较
+                        }
+                    )
+            if own:
+                self_rank = {"rank": own[0], "watched_time": own[1]}
         except Exception as e:
             logger.error(f"获取Emby播放时长排行失败: {str(e)}")
+            skip_response_cache()
 
         logger.info(
             f"{user.username or user.first_name or user.id} 获取Emby观看时长排行榜数据成功"
         )
-        return {"watched_time_rank_emby": watched_time_rank_emby}
+        return {
+            "watched_time_rank_emby": watched_time_rank_emby,
+            "self_rank": self_rank,
+        }
     except Exception as e:
         logger.error(f"获取Emby观看时长排行榜数据时发生未预期的错误: {str(e)}")
         raise HTTPException(status_code=500, detail="获取Emby观看时长排行榜数据失败")
     finally:
-        db.close()
+        await db.close()
         logger.debug("数据库连接已关闭")
 
 
 @router.get("/rankings/traffic/plex")
 @require_telegram_auth
+@cache_response(ttl=60, vary_by_user=True)
 async def get_plex_traffic_rankings(
     request: Request,
     user: TelegramUser = Depends(get_telegram_user),
@@ -207,7 +275,7 @@ async def get_plex_traffic_rankings(
         f"{user.username or user.first_name or user.id} 开始获取 Plex 流量排行榜数据 (日期范围: {start_date} - {end_date})"
     )
 
-    db = DB()
+    db = AsyncDB()
     try:
         # 解析日期参数
         parsed_start_date = None
@@ -238,7 +306,7 @@ async def get_plex_traffic_rankings(
             logger.debug(
                 f"正在查询 Plex 流量排行 (日期范围: {parsed_start_date} - {parsed_end_date})"
             )
-            plex_traffic_data = db.get_plex_traffic_rank(
+            plex_traffic_data = await db.get_plex_traffic_rank(
                 parsed_start_date, parsed_end_date
             )
             if plex_traffic_data:
@@ -259,6 +327,7 @@ async def get_plex_traffic_rankings(
                 ]
         except Exception as e:
             logger.error(f"获取 Plex 流量排行失败: {str(e)}")
+            skip_response_cache()
 
         logger.info(
             f"{user.username or user.first_name or user.id} 获取 Plex 流量排行榜数据成功"
@@ -268,12 +337,13 @@ async def get_plex_traffic_rankings(
         logger.error(f"获取 Plex 流量排行榜数据时发生未预期的错误: {str(e)}")
         raise HTTPException(status_code=500, detail="获取 Plex 流量排行榜数据失败")
     finally:
-        db.close()
+        await db.close()
         logger.debug("数据库连接已关闭")
 
 
 @router.get("/rankings/traffic/emby")
 @require_telegram_auth
+@cache_response(ttl=60, vary_by_user=True)
 async def get_emby_traffic_rankings(
     request: Request,
     user: TelegramUser = Depends(get_telegram_user),
@@ -290,7 +360,7 @@ async def get_emby_traffic_rankings(
         f"{user.username or user.first_name or user.id} 开始获取 Emby 流量排行榜数据 (日期范围: {start_date} - {end_date})"
     )
 
-    db = DB()
+    db = AsyncDB()
     try:
         # 解析日期参数
         parsed_start_date = None
@@ -317,22 +387,22 @@ async def get_emby_traffic_rankings(
                 )
 
         traffic_rank_emby = []
-        emby = Emby()
         try:
             logger.debug(
                 f"正在查询 Emby 流量排行 (日期范围: {parsed_start_date} - {parsed_end_date})"
             )
-            emby_traffic_data = db.get_emby_traffic_rank(
+            emby_traffic_data = await db.get_emby_traffic_rank(
                 parsed_start_date, parsed_end_date
             )
             if emby_traffic_data:
+                avatars = Emby.get_user_avatars_by_usernames(
+                    info[0] for info in emby_traffic_data
+                )
                 traffic_rank_emby = [
                     {
                         "name": info[0],  # username
                         "traffic": info[2],  # total_traffic
-                        "avatar": emby.get_user_avatar_by_username(
-                            info[0], from_emby=False
-                        ),
+                        "avatar": avatars[info[0]],
                         "is_premium": bool(info[3])
                         if info[3] is not None
                         else False,  # is_premium
@@ -345,6 +415,7 @@ async def get_emby_traffic_rankings(
                 ]
         except Exception as e:
             logger.error(f"获取 Emby 流量排行失败: {str(e)}")
+            skip_response_cache()
 
         logger.info(
             f"{user.username or user.first_name or user.id} 获取 Emby 流量排行榜数据成功"
@@ -354,5 +425,5 @@ async def get_emby_traffic_rankings(
         logger.error(f"获取 Emby 流量排行榜数据时发生未预期的错误: {str(e)}")
         raise HTTPException(status_code=500, detail="获取 Emby 流量排行榜数据失败")
     finally:
-        db.close()
+        await db.close()
         logger.debug("数据库连接已关闭")
@@ -2,6 +2,7 @@ from app.config import settings
 from app.db import DB
 from app.log import uvicorn_logger as logger
 from app.webapp.auth import get_telegram_user
+from app.webapp.cache import cache_response
 from app.webapp.middlewares import require_telegram_auth
 from app.webapp.schemas import TelegramUser
 from fastapi import APIRouter, Depends, HTTPException, Request
@@ -11,6 +12,7 @@ router = APIRouter(prefix="/api/system", tags=["system"])
 
 @router.get("/stats")
 @require_telegram_auth
+@cache_response(ttl=60)
 async def get_system_stats(
     request: Request, user: TelegramUser = Depends(get_telegram_user)
 ):
@@ -87,6 +89,7 @@ async def get_system_status():
 
 @router.get("/traffic-overview")
 @require_telegram_auth
+@cache_response(ttl=60)
 async def get_traffic_overview(
     request: Request, user: TelegramUser = Depends(get_telegram_user)
 ):
@@ -9,11 +9,12 @@ from app.cache import (
     plex_user_defined_line_cache,
 )
 from app.config import settings
-from app.db import DB
-from app.emby import Emby
+from app.db import AsyncDB, DB
+from app.emby import Emby, get_async_emby
 from app.log import uvicorn_logger as logger
-from app.plex import Plex
+from app.plex import get_plex
 from app.tautulli import Tautulli
+from app.traffic import get_user_daily_traffic
 from app.utils.utils import (
     caculate_credits_fund,
     get_user_info_from_tg_id,
@@ -57,7 +58,7 @@ async def get_user_info(
     # 从数据库获取更多用户信息
     logger.info(f"开始获取用户 {user_name or user_id} 的详细信息")
     # 连接数据库
-    db = DB()
+    db = AsyncDB()
     try:
         tg_id = user_id
         is_admin = False
@@ -68,14 +69,11 @@ async def get_user_info(
         # 获取Plex信息
         try:
             logger.debug(f"正在查询用户 {get_user_name_from_tg_id(tg_id)} 的Plex信息")
-            plex_info = db.get_plex_info_by_tg_id(tg_id)
+            plex_info = await db.get_plex_info_by_tg_id(tg_id)
             if plex_info:
-                # 获取今日流量消耗
-                daily_traffic = db.get_user_daily_traffic(plex_info[4], "plex")
-                # 获取今日 Premium 线路流量消耗
-                daily_premium_traffic = db.get_user_daily_traffic(
-                    plex_info[4], "plex", premium_only=True
-                )
+                # 获取今日流量消耗及 Premium 线路流量消耗
+                daily = await db.run(get_user_daily_traffic, plex_info[4], "plex")
+                daily_traffic, daily_premium_traffic = daily["total"], daily["premium"]
 
                 user_info.plex_info = {
                     "username": plex_info[4],
@@ -103,14 +101,11 @@ async def get_user_info(
         # 获取Emby信息
         try:
             logger.debug(f"正在查询用户 {get_user_name_from_tg_id(tg_id)} 的 Emby 信息")
-            emby_info = db.get_emby_info_by_tg_id(tg_id)
+            emby_info = await db.get_emby_info_by_tg_id(tg_id)
             if emby_info:
-                # 获取今日流量消耗
-                daily_traffic = db.get_user_daily_traffic(emby_info[0], "emby")
-                # 获取今日 Premium 线路流量消耗
-                daily_premium_traffic = db.get_user_daily_traffic(
-                    emby_info[0], "emby", premium_only=True
-                )
+                # 获取今日流量消耗及 Premium 线路流量消耗
+                daily = await db.run(get_user_daily_traffic, emby_info[0], "emby")
+                daily_traffic, daily_premium_traffic = daily["total"], daily["premium"]
 
                 user_info.emby_info = {
                     "username": emby_info[0],
@@ -143,7 +138,7 @@ async def get_user_info(
         # 获取统计信息
         try:
             logger.debug(f"正在查询用户 {get_user_name_from_tg_id(tg_id)} 的统计信息")
-            stats_info = db.get_stats_by_tg_id(tg_id)
+            stats_info = await db.get_stats_by_tg_id(tg_id)
             if stats_info:
                 user_info.credits = stats_info[2]
                 user_info.donation = stats_info[1]
@@ -162,7 +157,7 @@ async def get_user_info(
             logger.debug(
                 f"正在查询用户 {get_user_name_from_tg_id(tg_id)} 的Overseerr信息"
             )
-            overseerr_info = db.get_overseerr_info_by_tg_id(tg_id)
+            overseerr_info = await db.get_overseerr_info_by_tg_id(tg_id)
             if overseerr_info:
                 user_info.overseerr_info = {
                     "user_id": overseerr_info[0],
@@ -183,7 +178,7 @@ async def get_user_info(
         # 获取邀请码
         try:
             logger.debug(f"正在查询用户 {get_user_name_from_tg_id(tg_id)} 的邀请码")
-            codes = db.get_invitation_code_by_owner(tg_id)
+            codes = await db.get_invitation_code_by_owner(tg_id)
             if codes:
                 user_info.invitation_codes = codes
                 logger.debug(
@@ -202,7 +197,7 @@ async def get_user_info(
         logger.error(f"获取用户信息时发生未预期的错误: {str(e)}")
         raise HTTPException(status_code=500, detail="获取用户信息失败")
     finally:
-        db.close()
+        await db.close()
         logger.debug("数据库连接已关闭")
 
 
@@ -229,7 +224,7 @@ async def bind_plex_account(
                 success=False, message="您已绑定 Plex 账户，请勿重复操作"
             )
 
-        _plex = Plex()
+        _plex = get_plex()
         plex_id = _plex.get_user_id_by_email(email)
 
         # 用户不存在
@@ -351,9 +346,8 @@ async def bind_emby_account(
                 success=False, message="您已绑定 Emby 账户，请勿重复操作"
             )
 
-        emby = Emby()
         # 检查emby用户是否存在
-        uid = emby.get_uid_from_username(emby_username)
+        uid = await get_async_emby().get_uid_from_username(emby_username)
         if not uid:
             logger.warning(f"无法找到 Emby 用户 {emby_username}")
             return BaseResponse(success=False, message=f"用户 {emby_username} 不存在")
@@ -675,7 +669,7 @@ async def nsfw_operation(
                 credits -= settings.UNLOCK_CREDITS
 
                 # 更新权限
-                _plex = Plex()
+                _plex = get_plex()
                 try:
                     _plex.update_user_shared_libs(plex_id, _plex.get_libraries())
                 except Exception:
@@ -712,8 +706,7 @@ async def nsfw_operation(
                 credits -= settings.UNLOCK_CREDITS
 
                 # 更新权限
-                _emby = Emby()
-                flag, msg = _emby.add_user_library(user_id=emby_id)
+                flag, msg = await get_async_emby().add_user_library(user_id=emby_id)
                 if not flag:
                     raise HTTPException(status_code=500, detail=f"更新权限失败: {msg}")
 
@@ -751,7 +744,7 @@ async def nsfw_operation(
                 credits += credits_fund
 
                 # 更新权限
-                _plex = Plex()
+                _plex = get_plex()
                 sections = _plex.get_libraries()
                 for section in settings.NSFW_LIBS:
                     if section in sections:
@@ -791,8 +784,7 @@ async def nsfw_operation(
                 credits += credits_fund
 
                 # 更新权限
-                _emby = Emby()
-                flag, msg = _emby.remove_user_library(user_id=emby_id)
+                flag, msg = await get_async_emby().remove_user_library(user_id=emby_id)
                 if not flag:
                     raise HTTPException(status_code=500, detail=f"更新权限失败: {msg}")
 
@@ -1139,8 +1131,7 @@ async def _auth_bind_emby_line(
     )
 
     # 验证 Emby 用户名和密码
-    emby = Emby()
-    auth_success, emby_id = emby.authenticate_user(username, password)
+    auth_success, emby_id = await get_async_emby().authenticate_user(username, password)
     if not auth_success:
         logger.warning(f"Emby用户 {username} 认证失败")
         return BaseResponse(success=False, message="用户名或密码错误")
@@ -1204,7 +1195,7 @@ async def _auth_bind_plex_line(
     )
 
     # 验证Plex用户名和密码
-    plex = Plex()
+    plex = get_plex()
     auth_success, plex_id = plex.authenticate_user(
         username=username, password=password, token=token
     )
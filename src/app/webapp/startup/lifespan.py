@@ -1,5 +1,7 @@
 from contextlib import asynccontextmanager
 
+from app.db import get_pool, init_db
+from app.emby import close_async_emby
 from app.log import logger
 from app.utils.utils import cleanup_http_resources
 from fastapi import FastAPI
@@ -9,8 +11,12 @@ from fastapi import FastAPI
 async def lifespan(app: FastAPI):
     try:
         logger.info("Application startup")
+        init_db()
         yield
     finally:
         # 清理全局 HTTP 资源
         await cleanup_http_resources()
+        await close_async_emby()
+        # 关闭数据库连接池中的空闲连接
+        get_pool().close_all()
         logger.info("Application shutdown")
@@ -0,0 +1,86 @@
+"""
+基于 Redis 列表的常驻队列消费者公共逻辑
+
+消费者用 BLMOVE 把任务移到自己的 processing 列表（{queue}:processing:{name}），
+处理完成后再删除。为避免多个消费者互相放回对方处理中的任务：
+- 默认名称包含主机名和进程号，同一主机上的多个进程互不相同
+- 运行期间定期续期 {queue}:worker:{name} 心跳键
+- 启动时只回收自己的 processing 列表，以及心跳已过期（进程已退出）的消费者遗留的列表
+"""
+
+import asyncio
+import os
+import socket
+
+from app.log import logger
+
+# 心跳键的有效期（秒），超过该时间未续期的消费者视为已退出
+WORKER_HEARTBEAT_TTL = 60
+# 常驻任务异常退出后的重启间隔（秒）
+WORKER_RESTART_DELAY = 5
+
+
+def default_worker_name() -> str:
+    """进程级唯一的消费者名称：主机名-进程号"""
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+def processing_key(queue: str, name: str) -> str:
+    return f"{queue}:processing:{name}"
+
+
+def heartbeat_key(queue: str, name: str) -> str:
+    return f"{queue}:worker:{name}"
+
+
+async def beat(redis_client, queue: str, name: str):
+    """写入（续期）一次心跳键"""
+    await redis_client.set(heartbeat_key(queue, name), 1, ex=WORKER_HEARTBEAT_TTL)
+
+
+async def heartbeat(redis_client, queue: str, name: str):
+    """定期续期心跳键，直到任务被取消；取消时删除心跳键"""
+    try:
+        while True:
+            await asyncio.sleep(WORKER_HEARTBEAT_TTL / 3)
+            try:
+                await beat(redis_client, queue, name)
+            except Exception as e:
+                logger.warning(f"续期消费者 {name} 的心跳失败: {e}")
+    except asyncio.CancelledError:
+        try:
+            await redis_client.delete(heartbeat_key(queue, name))
+        except Exception:
+            pass
+        raise
+
+
+async def recover_processing(redis_client, queue: str, name: str) -> int:
+    """
+    将未确认的任务放回队列头部
+
+    回收自己的 processing 列表，以及心跳已过期的其他消费者遗留的列表；
+    仍在运行的消费者的列表不受影响
+    """
+    own_key = processing_key(queue, name)
+    prefix = processing_key(queue, "")
+    recovered = 0
+    async for key in redis_client.scan_iter(match=f"{prefix}*"):
+        if key != own_key and await redis_client.exists(
+            heartbeat_key(queue, key[len(prefix) :])
+        ):
+            continue
+        while await redis_client.lmove(key, queue, "RIGHT", "LEFT"):
+            recovered += 1
+    return recovered
+
+
+async def run_forever(worker, description: str):
+    """运行常驻消费者，异常退出后等待片刻重新启动，正常停止时返回"""
+    while True:
+        try:
+            await worker.run()
+            return
+        except Exception as e:
+            logger.error(f"{description}异常退出，{WORKER_RESTART_DELAY} 秒后重启: {e}")
+            await asyncio.sleep(WORKER_RESTART_DELAY)
@@ -0,0 +1,117 @@
+import random
+from collections import Counter
+
+import pytest
+
+from app.webapp.routers.activities.luckywheel import (
+    AliasSampler,
+    RandomnessConfig,
+    _chi_square_p_value,
+    create_sampler,
+)
+from app.webapp.schemas.luckywheel import LuckyWheelItem
+
+
+def _items(*probabilities):
+    return [
+        LuckyWheelItem(name=f"item{i}", probability=probability)
+        for i, probability in enumerate(probabilities)
+    ]
+
+
+def _seeded(sampler: AliasSampler, seed: int = 20240101) -> AliasSampler:
+    sampler._random = random.Random(seed)
+    return sampler
+
+
+def _table_probabilities(sampler: AliasSampler) -> list[float]:
+    """由别名表反推每个奖品的中奖概率"""
+    n = len(sampler._prob)
+    result = [0.0] * n
+    for column in range(n):
+        result[column] += sampler._prob[column] / n
+        result[sampler._alias[column]] += (1.0 - sampler._prob[column]) / n
+    return result
+
+
+@pytest.fixture
+def randomness_config():
+    saved = RandomnessConfig.to_dict()
+    yield RandomnessConfig
+    RandomnessConfig.from_dict(saved)
+
+
+def test_alias_table_matches_weights():
+    sampler = AliasSampler(["a", "b", "c", "d"], [0.5, 3, 10, 86.5])
+
+    assert _table_probabilities(sampler) == pytest.approx(sampler.probabilities)
+    assert sampler.probabilities == pytest.approx([0.005, 0.03, 0.1, 0.865])
+
+
+def test_goodness_of_fit(randomness_config):
+    randomness_config.USE_WEIGHTED_PROTECTION = False
+    items = _items(1, 4, 10, 25, 60)
+    sampler = _seeded(create_sampler(items))
+
+    iterations = 50000
+    counts = Counter(sampler.sample().name for _ in range(iterations))
+
+    chi_square = sum(
+        (counts[item.name] - probability * iterations) ** 2 / (probability * iterations)
+        for item, probability in zip(sampler.items, sampler.probabilities)
+    )
+    assert _chi_square_p_value(chi_square, len(items) - 1) > 0.001
+
+
+def test_zero_probability_items_are_excluded(randomness_config):
+    randomness_config.USE_WEIGHTED_PROTECTION = False
+    items = _items(0, 50, 0, 50)
+    sampler = _seeded(create_sampler(items))
+
+    assert [item.name for item in sampler.items] == ["item1", "item3"]
+    assert sampler.probabilities == pytest.approx([0.5, 0.5])
+    drawn = {sampler.sample().name for _ in range(1000)}
+    assert drawn == {"item1", "item3"}
+
+
+def test_all_zero_probabilities_rejected():
+    with pytest.raises(ValueError):
+        create_sampler(_items(0, 0))
+
+
+def test_single_item_always_wins(randomness_config):
+    item = _items(0.5)[0]
+    sampler = _seeded(create_sampler([item]))
+
+    assert sampler.probabilities == [1.0]
+    assert all(sampler.sample() is item for _ in range(100))
+
+
+def test_weights_not_summing_to_100_are_normalized(randomness_config):
+    randomness_config.USE_WEIGHTED_PROTECTION = False
+    sampler = create_sampler(_items(5, 5, 10))
+
+    assert sampler.probabilities == pytest.approx([0.25, 0.25, 0.5])
+    assert _table_probabilities(sampler) == pytest.approx([0.25, 0.25, 0.5])
+
+
+def test_protection_factor_applied(randomness_config):
+    randomness_config.USE_WEIGHTED_PROTECTION = True
+    randomness_config.PROTECTION_THRESHOLD = 2.0
+    randomness_config.PROTECTION_FACTOR = 1.5
+    sampler = create_sampler(_items(1, 99))
+
+    # 低于阈值的奖品权重 1 * 1.5，其余保持不变
+    assert sampler.probabilities == pytest.approx([1.5 / 100.5, 99 / 100.5])
+
+    randomness_config.USE_WEIGHTED_PROTECTION = False
+    assert create_sampler(_items(1, 99)).probabilities == pytest.approx([0.01, 0.99])
+
+
+def test_invalid_weights_rejected():
+    with pytest.raises(ValueError):
+        AliasSampler(["a", "b"], [1.0])
+    with pytest.raises(ValueError):
+        AliasSampler([], [])
+    with pytest.raises(ValueError):
+        AliasSampler(["a"], [0.0])